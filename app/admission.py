@@ -0,0 +1,387 @@
+"""
+受け付け制御モジュール
+OCR・Gemini APIの処理（/upload）とカレンダーの登録ジョブ（/register）の同時実行数を、
+プロセスごとと、ホストの全ワーカーで合わせた数の両方で制限します。
+
+上限に達している場合は、プロセスごとに ADMISSION_QUEUE_SIZE 件まで、最大 ADMISSION_QUEUE_TIMEOUT 秒だけ
+空きを待ちます。それを超えるリクエストはすぐに AdmissionRejected を送出し、503（Retry-After付き）で応答します。
+以前はgunicornの中で処理を待ち続け、120秒のタイムアウトで原因のわからないまま失敗していました。
+
+空きを待つ処理はユーザー（GoogleアカウントのOAuthのsub）ごとの待ち行列に入れ、処理の大きさ
+（PDFのページ数や登録する予定の件数）を費用とする deficit round robin で、空いた枠を順に割り当てます。
+1人のユーザーがページ数の多いPDFを続けてアップロードしても、他のユーザーの1ページのプリントは
+そのユーザーの順番が来るたびに割り当てられます。同じユーザーの処理の中では費用の小さいものから割り当てます。
+1人のユーザーが同時に実行できる処理は、ホスト全体で ADMISSION_USER_LIMIT 件までです。
+
+ホスト全体の上限とユーザーごとの上限は、ADMISSION_LOCK_DIR の枠ごとのファイルに対するロック（flock）で数えます。
+ロックはプロセスが終了すると解放されるため、ワーカーが強制終了されても枠が残りません。
+ロックのファイルを共有しない別のホスト（コンテナ）は、それぞれで上限を数えます。
+待ち行列はプロセスごとのため、ワーカーをまたいだ割り当ての順序は公平とは限りません。
+"""
+import fcntl
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from app.config import (
+    ADMISSION_ENABLED, ADMISSION_UPLOAD_PROCESS_LIMIT, ADMISSION_UPLOAD_GLOBAL_LIMIT,
+    ADMISSION_REGISTRATION_PROCESS_LIMIT, ADMISSION_REGISTRATION_GLOBAL_LIMIT,
+    ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER, ADMISSION_LOCK_DIR,
+    ADMISSION_FAIR_SCHEDULING, ADMISSION_USER_LIMIT, ADMISSION_USER_QUEUE_SIZE
+)
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# ホスト全体の枠の空きを確認する間隔（秒）
+GLOBAL_POLL_INTERVAL = 0.05
+# deficit round robin で、ユーザーの順番が来るたびに加える費用
+QUANTUM = 1
+# ユーザーごとの枠のロックのファイルを分ける数（ユーザーの識別子のハッシュで振り分ける）
+USER_LOCK_BUCKETS = 1024
+
+
+class AdmissionRejected(Exception):
+    """
+    同時実行数が上限に達していて、リクエストを受け付けられない場合の例外
+    """
+
+    def __init__(self, name, reason, retry_after):
+        super().__init__(f"{name}の同時実行数が上限に達しています（{reason}）")
+        self.name = name
+        # queue_full: 待ち行列がいっぱい, user_queue_full: ユーザーの待ち行列がいっぱい, timeout: 待っても空かなかった
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    受け付けた処理の実行枠（処理が終わったら release する。別のスレッドから解放してもよい）
+    """
+
+    def __init__(self, admission, fds):
+        self._admission = admission
+        self._fds = fds
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._admission._release(self._fds)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class _NoopTicket:
+    """
+    受け付け制御が無効な場合の実行枠
+    """
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_TICKET = _NoopTicket()
+
+
+class _Waiter:
+    """
+    空きを待っている処理（ユーザーの待ち行列の中では費用の小さい順、同じ費用は到着順）
+    """
+    __slots__ = ('user', 'cost', 'seq', 'event', 'fds')
+
+    def __init__(self, user, cost, seq):
+        self.user = user
+        self.cost = cost
+        self.seq = seq
+        self.event = threading.Event()
+        self.fds = None  # 割り当てられたホスト全体とユーザーの枠のロック
+
+    def __lt__(self, other):
+        return (self.cost, self.seq) < (other.cost, other.seq)
+
+
+def _close(fd):
+    if fd >= 0:
+        os.close(fd)  # ロックはファイルを閉じると解放される
+
+
+class Admission:
+    """
+    1種類の処理の同時実行数を制限し、空きを待つ処理をユーザーごとに公平に割り当てるクラス
+    """
+
+    def __init__(self, name, process_limit, global_limit, queue_size=ADMISSION_QUEUE_SIZE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, retry_after=ADMISSION_RETRY_AFTER,
+                 lock_dir=ADMISSION_LOCK_DIR, enabled=ADMISSION_ENABLED, fair=ADMISSION_FAIR_SCHEDULING,
+                 user_limit=ADMISSION_USER_LIMIT, user_queue_size=ADMISSION_USER_QUEUE_SIZE):
+        """
+        初期化
+
+        Args:
+            name: 処理の名前（メトリクスとロックのファイル名に使う）
+            process_limit: プロセスごとの同時実行数の上限
+            global_limit: ホスト全体の同時実行数の上限（0の場合は制限しない）
+            queue_size: 空きを待つ処理の数の上限（プロセスごと）
+            queue_timeout: 空きを待つ秒数の上限
+            retry_after: 断ったときに再送信までの目安として返す秒数
+            lock_dir: ホスト全体とユーザーごとの枠のロックのファイルを置くディレクトリ
+            enabled: 無効な場合は制限しない
+            fair: ユーザーごとに公平に割り当てるか（無効な場合は到着順に割り当て、ユーザーごとの上限もない）
+            user_limit: 1人のユーザーが同時に実行できる処理の数（ホスト全体、0の場合は制限しない）
+            user_queue_size: 1人のユーザーが空きを待てる処理の数（プロセスごと）
+        """
+        self.name = name
+        self.process_limit = process_limit
+        self.global_limit = global_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.lock_dir = lock_dir
+        self.enabled = enabled
+        self.fair = fair
+        self.user_limit = user_limit
+        self.user_queue_size = user_queue_size
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_process_state(self):
+        """
+        プロセスごとの枠と待ち行列を用意する（fork後の子プロセスでは作り直す）
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._running = 0
+                self._waiting = 0
+                self._queues = {}      # ユーザー -> 待っている _Waiter のヒープ
+                self._ring = deque()   # 待っている処理のあるユーザー（先頭が現在の順番）
+                self._deficit = {}     # ユーザー -> 割り当てられる費用の残り
+                self._visited = False  # 先頭のユーザーに今回の順番の QUANTUM を加えたか
+                self._seq = itertools.count()
+                if self.global_limit > 0 or (self.fair and self.user_limit > 0):
+                    os.makedirs(self.lock_dir, exist_ok=True)
+                self._pid = os.getpid()
+
+    def _lock_slot(self, prefix, limit):
+        """
+        prefix の枠のファイルのうち、空いているものを1つロックする
+
+        Returns:
+            ロックしたファイルのディスクリプタ（空きがない場合はNone）
+        """
+        # 待っているプロセスが同じ順に枠を試さないよう、開始位置をずらす
+        offset = random.randrange(limit)
+        for i in range(limit):
+            path = os.path.join(self.lock_dir, f"{prefix}-{(offset + i) % limit}.lock")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def _try_global(self):
+        """
+        ホスト全体の枠を1つ取る（上限がない場合は-1、空きがない場合はNone）
+        """
+        if self.global_limit <= 0:
+            return -1
+        return self._lock_slot(self.name, self.global_limit)
+
+    def _try_user(self, user):
+        """
+        ユーザーの枠を1つ取る（上限がない場合は-1、ユーザーが上限まで実行している場合はNone）
+        """
+        if user is None or self.user_limit <= 0:
+            return -1
+        bucket = int(hashlib.sha1(user.encode('utf-8')).hexdigest()[:8], 16) % USER_LOCK_BUCKETS
+        return self._lock_slot(f"{self.name}-user{bucket}", self.user_limit)
+
+    def _enqueue(self, waiter):
+        queue = self._queues.get(waiter.user)
+        if queue is None:
+            queue = self._queues[waiter.user] = []
+            self._ring.append(waiter.user)
+        heapq.heappush(queue, waiter)
+        self._waiting += 1
+
+    def _drop_user(self, user):
+        """
+        待っている処理がなくなったユーザーを順番から外す
+        """
+        del self._queues[user]
+        self._deficit.pop(user, None)
+        if self._ring[0] == user:
+            self._visited = False
+        self._ring.remove(user)
+
+    def _remove(self, waiter):
+        """
+        待ちきれなかった処理を待ち行列から外す
+        """
+        queue = self._queues[waiter.user]
+        queue.remove(waiter)
+        heapq.heapify(queue)
+        self._waiting -= 1
+        if not queue:
+            self._drop_user(waiter.user)
+
+    def _next_waiter(self):
+        """
+        deficit round robin で次に割り当てる処理を選ぶ（self._lock を保持して呼び出す）
+
+        順番が来たユーザーに QUANTUM を加え、そのユーザーの最も費用の小さい処理が残りの費用に収まれば割り当てます。
+        収まらなければ次のユーザーに順番を回すため、費用の大きい処理は他のユーザーの処理より少ない頻度で割り当てられます。
+        上限まで実行しているユーザーは飛ばし、残りの費用もためません。
+
+        Returns:
+            (_Waiter, ユーザーの枠のロック)（割り当てられる処理がない場合は (None, None)）
+        """
+        ring = self._ring
+        blocked = set()
+        while ring and len(blocked) < len(ring):
+            user = ring[0]
+            if user not in blocked:
+                queue = self._queues[user]
+                if not self._visited:
+                    self._deficit[user] = self._deficit.get(user, 0) + QUANTUM
+                    self._visited = True
+                if queue[0].cost <= self._deficit[user]:
+                    user_fd = self._try_user(user)
+                    if user_fd is not None:
+                        waiter = heapq.heappop(queue)
+                        self._deficit[user] -= waiter.cost
+                        self._waiting -= 1
+                        if not queue:
+                            self._drop_user(user)
+                        return waiter, user_fd
+                    blocked.add(user)
+                    self._deficit[user] = 0
+            ring.rotate(-1)
+            self._visited = False
+        return None, None
+
+    def _dispatch(self):
+        """
+        空いている枠を待っている処理に割り当てる（self._lock を保持して呼び出す）
+        """
+        while self._running < self.process_limit and self._ring:
+            global_fd = self._try_global()
+            if global_fd is None:
+                return
+            waiter, user_fd = self._next_waiter()
+            if waiter is None:
+                _close(global_fd)
+                return
+            self._running += 1
+            waiter.fds = (global_fd, user_fd)
+            waiter.event.set()
+
+    def _reject(self, reason):
+        metrics.increment(f"admission.{self.name}.rejected")
+        metrics.increment(f"admission.{self.name}.rejected.{reason}")
+        logger.warning(f"{self.name}の同時実行数が上限に達したため、リクエストを断りました（{reason}）")
+        raise AdmissionRejected(self.name, reason, self.retry_after)
+
+    def acquire(self, user=None, cost=1):
+        """
+        実行枠を取る（空きがない場合は待ち行列に入り、最大 queue_timeout 秒待つ）
+
+        Args:
+            user: 処理を依頼したユーザーの識別子（Noneの場合は識別できないユーザーとしてまとめて扱う）
+            cost: 処理の大きさ（1以上。PDFのページ数など）
+
+        Returns:
+            Ticket（処理が終わったら release するか、with文で使う）
+
+        Raises:
+            AdmissionRejected: 待ち行列がいっぱいの場合や、待っても空かなかった場合
+        """
+        if not self.enabled:
+            return _NOOP_TICKET
+        self._ensure_process_state()
+        started = time.monotonic()
+        if not self.fair:
+            user, cost = None, 1
+        waiter = _Waiter(user, max(1, cost), next(self._seq))
+
+        with self._lock:
+            self._enqueue(waiter)
+            self._dispatch()
+            if not waiter.event.is_set():
+                if self._waiting > self.queue_size:
+                    self._remove(waiter)
+                    self._reject('queue_full')
+                if user is not None and len(self._queues[user]) > self.user_queue_size:
+                    self._remove(waiter)
+                    self._reject('user_queue_full')
+
+        # 他のプロセスが解放した枠はわからないため、ホスト全体やユーザーごとの上限がある場合は定期的に確認する
+        poll = self.global_limit > 0 or (self.fair and self.user_limit > 0)
+        deadline = started + self.queue_timeout
+        while not waiter.event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                waiter.event.wait(min(remaining, GLOBAL_POLL_INTERVAL) if poll else remaining)
+                if poll and not waiter.event.is_set():
+                    with self._lock:
+                        self._dispatch()
+                continue
+            with self._lock:
+                if waiter.event.is_set():
+                    break
+                self._remove(waiter)
+            self._reject('timeout')
+
+        metrics.increment(f"admission.{self.name}.admitted")
+        metrics.observe(f"admission.{self.name}.wait_ms", (time.monotonic() - started) * 1000)
+        return Ticket(self, waiter.fds)
+
+    def _release(self, fds):
+        for fd in fds:
+            _close(fd)
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    def snapshot(self):
+        """
+        このプロセスの実行中・待機中の数を返す（/metrics 用）
+        """
+        data = {'running': 0, 'waiting': 0, 'waiting_users': 0, 'process_limit': self.process_limit,
+                'global_limit': self.global_limit, 'user_limit': self.user_limit if self.fair else 0}
+        if not self.enabled or self._pid != os.getpid():
+            return data
+        with self._lock:
+            data.update(running=self._running, waiting=self._waiting, waiting_users=len(self._ring))
+        return data
+
+
+# OCR・Gemini APIの処理（アップロード1件の処理全体。費用はPDFのページ数）
+upload_admission = Admission('upload', ADMISSION_UPLOAD_PROCESS_LIMIT, ADMISSION_UPLOAD_GLOBAL_LIMIT)
+# カレンダーの登録ジョブ（実行中と実行待ちを合わせた数。費用は予定を並行して登録する回数）
+registration_admission = Admission(
+    'registration', ADMISSION_REGISTRATION_PROCESS_LIMIT, ADMISSION_REGISTRATION_GLOBAL_LIMIT
+)
@@ -0,0 +1,169 @@
+"""
+静的ファイルモジュール
+アプリの起動時に app/static のファイルを内容のハッシュを含む名前でコピーし（ビルド手順は不要）、
+CSS・JavaScriptなどのテキストはgzipとbrotliで圧縮したファイルも作成します。
+
+テンプレートでは asset_url('css/style.css') で /assets/css/style.<ハッシュ>.css のURLを出力し、
+このURLには1年間変更しない（immutable）ことを示す Cache-Control を付けて返します。
+内容が変わればURLも変わるため、ブラウザーは再訪時に静的ファイルを確認のリクエストも送らずにキャッシュから読み込み、
+syncワーカーを静的ファイルの配信に使いません。
+圧縮したファイルは、Accept-Encoding に応じて br、gzip の順に選んで返します（リクエストごとに圧縮しない）。
+
+コピーは内容のハッシュで名前が決まるため、既に存在するファイルは作り直しません。
+gunicornの --preload では親プロセスで一度だけ作成し、preloadしない場合に複数のワーカーが同時に作成しても同じ内容になります。
+以前のデプロイのファイルは削除しないため、古いページを表示中のブラウザーも以前のURLで読み込めます。
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+
+from flask import abort, request, send_file, url_for
+
+from app.config import ASSET_PIPELINE_ENABLED, ASSET_BUILD_DIR, ASSET_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+# URLに含める内容のハッシュ（SHA-256の16進数）の長さ
+HASH_LENGTH = 12
+# 圧縮したファイルを作成する拡張子（画像などは既に圧縮されているため作成しない）
+COMPRESSIBLE_EXTENSIONS = frozenset(['.css', '.js', '.svg', '.json', '.txt', '.map'])
+# 圧縮しても転送量がほとんど変わらない小さなファイルは圧縮しない
+MIN_COMPRESS_BYTES = 256
+# Accept-Encoding ごとの圧縮したファイルの拡張子（先にあるものを優先する）
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# 論理パス（static からの相対パス） -> ハッシュを含むパス
+_manifest = {}
+# ハッシュを含むパス -> 作成した圧縮ファイルの Content-Encoding の集合
+_variants = {}
+
+
+def _brotli_compress(content):
+    """
+    brotliで圧縮する（brotliがインストールされていない場合はNone）
+    """
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(content, quality=11)
+
+
+def _write(build_dir, rel_path, content):
+    """
+    ファイルを書き出す（既に存在する場合は内容がハッシュで決まっているため書き直さない）
+    """
+    path = os.path.join(build_dir, rel_path)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def build_assets(static_folder, build_dir):
+    """
+    静的ファイルを内容のハッシュを含む名前でコピーし、圧縮したファイルを作成する
+
+    Args:
+        static_folder: 静的ファイルのフォルダー
+        build_dir: コピーを書き出すフォルダー
+
+    Returns:
+        ({論理パス: ハッシュを含むパス}, {ハッシュを含むパス: 圧縮したファイルの Content-Encoding の集合})
+    """
+    manifest, variants = {}, {}
+    brotli_missing = False
+    for directory, dirnames, filenames in os.walk(static_folder):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.startswith('.'):
+                continue
+            source = os.path.join(directory, filename)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+            stem, ext = os.path.splitext(logical)
+            built = f"{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+            _write(build_dir, built, content)
+
+            encodings = set()
+            if ext.lower() in COMPRESSIBLE_EXTENSIONS and len(content) >= MIN_COMPRESS_BYTES:
+                for encoding, suffix in ENCODINGS:
+                    if os.path.exists(os.path.join(build_dir, built + suffix)):
+                        encodings.add(encoding)
+                        continue
+                    if encoding == 'gzip':
+                        # 同じ内容から同じファイルを作成するよう、ヘッダーの時刻は0にする
+                        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+                    else:
+                        compressed = _brotli_compress(content)
+                        brotli_missing = brotli_missing or compressed is None
+                    if compressed is not None and len(compressed) < len(content):
+                        _write(build_dir, built + suffix, compressed)
+                        encodings.add(encoding)
+            manifest[logical] = built
+            variants[built] = encodings
+    if brotli_missing:
+        logger.info("brotliがインストールされていないため、brotliで圧縮したファイルは作成しません")
+    return manifest, variants
+
+
+def asset_url(filename):
+    """
+    静的ファイルのURLを返す（テンプレートから呼び出す。コピーがない場合は通常の /static のURL）
+
+    Args:
+        filename: static からの相対パス（例: 'css/style.css'）
+    """
+    built = _manifest.get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=built)
+
+
+def serve_asset(filename):
+    """
+    ハッシュを含む名前の静的ファイルを、圧縮したファイルがあればそれを選んで返す
+    """
+    if filename not in _variants:
+        abort(404)
+    path = os.path.join(ASSET_BUILD_DIR, filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in ENCODINGS:
+        if candidate in _variants[filename] and request.accept_encodings[candidate] > 0:
+            encoding = candidate
+            path += suffix
+            break
+
+    response = send_file(path, mimetype=mimetype, max_age=ASSET_MAX_AGE, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if _variants[filename]:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """
+    静的ファイルのコピーを作成し、/assets のルートとテンプレートの asset_url を登録する
+    （無効な場合や作成に失敗した場合は、asset_url は通常の /static のURLを返す）
+    """
+    global _manifest, _variants
+
+    if ASSET_PIPELINE_ENABLED:
+        try:
+            _manifest, _variants = build_assets(app.static_folder, ASSET_BUILD_DIR)
+            logger.info(f"静的ファイルのコピーを作成しました: {len(_manifest)}件 ({ASSET_BUILD_DIR})")
+        except OSError as e:
+            logger.error(f"静的ファイルのコピーの作成中にエラーが発生しました: {e}")
+            _manifest, _variants = {}, {}
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
+    app.add_template_global(asset_url)
@@ -0,0 +1,73 @@
+"""
+非同期実行サポートモジュール
+ブロッキングするGoogle APIクライアントの呼び出しをプロセス共有のスレッドプールで実行し、
+登録ジョブ（app/registration.py）から await できるようにします
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import ASYNC_IO_THREADS
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    上流API呼び出し用のスレッドプールを返す（プロセスごとに1つ）
+    fork後の子プロセスでは新しく作り直す
+    """
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=ASYNC_IO_THREADS,
+                    thread_name_prefix='upstream'
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    ブロッキングする関数をスレッドプールで実行し、結果を待つ
+    トレースのスパンが呼び出し元のリクエストに紐づくよう、コンテキスト変数を引き継ぐ
+
+    Args:
+        func: 実行する関数
+        *args, **kwargs: 関数に渡す引数
+
+    Returns:
+        関数の戻り値
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+async def gather_limited(coroutines, limit):
+    """
+    同時実行数を制限してコルーチンを並行実行する
+
+    Args:
+        coroutines: 実行するコルーチンのリスト
+        limit: 同時に実行する最大数
+
+    Returns:
+        各コルーチンの結果のリスト（入力と同じ順序）
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(c) for c in coroutines))
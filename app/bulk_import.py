@@ -0,0 +1,414 @@
+"""
+一括取り込みモジュール
+フォルダー内のプリント（PDF・画像）をまとめて読み取り、抽出した予定をJSONLと .ics ファイルに書き出します。
+学期分のプリントをWebの画面から1件ずつアップロードする代わりに、import_prints.py から実行します。
+
+ファイルはスレッドプール（--processes を指定した場合はプロセスプール）で並行して処理し、
+Vision APIとGemini APIの同時呼び出し数はそれぞれセマフォで制限します（プロセスプールでは全プロセスで共有）。
+読み取りの前に、Webのアップロードと同じ検証（app.upload_validation）で処理できないファイルを除外します。
+
+処理したファイルは1件ごとに結果のJSONLに追記し、このファイルをチェックポイントとして使います。
+中断した後に同じ出力先で再実行すると、内容（SHA-256）が変わっていない処理済みのファイルは読み取らずに飛ばし、
+失敗したファイルだけを読み取り直します。カレンダーへの登録も、登録したファイルと登録に失敗した予定を記録し、
+再実行時には未登録のファイルと失敗した予定だけを登録します。
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from app.config import (
+    ALLOWED_EXTENSIONS, MAX_CONTENT_LENGTH, RECURRENCE_DETECTION_ENABLED, REGISTRATION_CONCURRENCY,
+    BULK_IMPORT_WORKERS, BULK_IMPORT_OCR_CONCURRENCY, BULK_IMPORT_LLM_CONCURRENCY, BULK_IMPORT_REGISTER_BATCH
+)
+from app.recurrence import collapse_recurring
+from app.tracing import start_trace, end_trace, set_attribute
+from app.upload_validation import validate_upload, UploadRejected
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# 読み取りの結果（ok: 予定を抽出した, empty: 予定がなかった, rejected: 検証で除外した, failed: 失敗した）
+# 再実行時には failed のファイルだけを読み取り直す
+OK, EMPTY, REJECTED, FAILED = 'ok', 'empty', 'rejected', 'failed'
+DONE_STATUSES = (OK, EMPTY, REJECTED)
+
+# 上流APIの同時呼び出し数を制限するセマフォ（ワーカーの初期化時に設定する）
+Limits = namedtuple('Limits', ['ocr', 'llm'])
+_limits = None
+
+
+def init_worker(ocr_limit, llm_limit):
+    """
+    ワーカー（スレッドプールでは呼び出し元のプロセス）のセマフォを設定する
+    """
+    global _limits
+    _limits = Limits(ocr_limit, llm_limit)
+
+
+def find_prints(root):
+    """
+    フォルダー内の処理できる拡張子のファイルを探す
+
+    Returns:
+        root からの相対パスのリスト（名前順）
+    """
+    paths = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        for filename in sorted(filenames):
+            if '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS:
+                paths.append(os.path.relpath(os.path.join(directory, filename), root))
+    return paths
+
+
+def file_digest(path):
+    """
+    ファイルの内容のSHA-256を返す
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_checkpoint(path):
+    """
+    結果のJSONLを読み込む（中断時に書きかけだった最後の行は飛ばす）
+
+    Returns:
+        ({(相対パス, SHA-256): 読み取りの結果}, {登録したファイルの (相対パス, SHA-256): 登録に失敗した予定の位置の集合})
+    """
+    extracted, registered = {}, {}
+    if not os.path.exists(path):
+        return extracted, registered
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            key = (record.get('path'), record.get('sha256'))
+            if record.get('type') == 'extracted':
+                extracted[key] = record
+            elif record.get('type') == 'registered':
+                # 失敗した予定を登録し直した記録は、前の記録を置き換える
+                registered[key] = set(record.get('failed_events', []))
+    return extracted, registered
+
+
+def append_record(f, record):
+    """
+    結果を1行追記し、中断しても失われないようにディスクに書き出す
+    """
+    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def process_print(root, rel_path, digest, work_dir):
+    """
+    1件のファイルを検証し、OCRとGemini APIで予定を抽出する（ワーカーで実行する）
+
+    Args:
+        root: 取り込むフォルダー
+        rel_path: root からの相対パス
+        digest: ファイルの内容のSHA-256
+        work_dir: 前処理した画像を書き出す作業フォルダー
+
+    Returns:
+        結果のJSONLに書き込む読み取りの結果
+    """
+    from app.services import get_ocr_processor, get_text_analyzer
+
+    record = {'type': 'extracted', 'path': rel_path, 'sha256': digest, 'status': FAILED,
+              'pages': 0, 'events': [], 'ocr_wait_ms': 0.0, 'ocr_ms': 0.0, 'llm_wait_ms': 0.0, 'llm_ms': 0.0}
+    path = os.path.join(root, rel_path)
+    started = time.perf_counter()
+    start_trace('bulk import', path=rel_path)
+    try:
+        with open(path, 'rb') as f:
+            content = f.read(MAX_CONTENT_LENGTH + 1)
+        if len(content) > MAX_CONTENT_LENGTH:
+            raise UploadRejected('too_large', f"ファイルが大きすぎます（最大{MAX_CONTENT_LENGTH // 1024 // 1024}MB）")
+        info = validate_upload(io.BytesIO(content), rel_path.rsplit('.', 1)[1].lower())
+        del content
+        record['pages'] = info.pages or 1
+
+        ocr_processor, text_analyzer = get_ocr_processor(), get_text_analyzer()
+        if not ocr_processor or not text_analyzer:
+            raise RuntimeError('OCRサービスまたはテキスト解析サービスが設定されていません')
+
+        # 画像の前処理はAPIを呼び出さないため、セマフォの外で行う（前処理した画像は作業フォルダーに書き出す）
+        ocr_path = path
+        if info.kind != 'pdf':
+            ocr_path = ocr_processor.preprocess_image(
+                path, os.path.join(work_dir, f"{uuid.uuid4().hex}.{rel_path.rsplit('.', 1)[1].lower()}")
+            )
+        waited = time.perf_counter()
+        try:
+            with _limits.ocr:
+                called = time.perf_counter()
+                if info.kind == 'pdf':
+                    extracted_text, layout = ocr_processor.process_pdf_layout(ocr_path)
+                else:
+                    extracted_text, layout = ocr_processor.process_image_layout(ocr_path)
+        finally:
+            if ocr_path != path:
+                os.remove(ocr_path)
+        record['ocr_wait_ms'] = (called - waited) * 1000
+        record['ocr_ms'] = (time.perf_counter() - called) * 1000
+        if not extracted_text:
+            # OCRのエラーは空のテキストとして返るため、再実行時に読み取り直す
+            record['reason'] = 'no_text'
+            return record
+
+        waited = time.perf_counter()
+        with _limits.llm:
+            called = time.perf_counter()
+            events = text_analyzer.extract_events(extracted_text, layout=layout)
+        record['llm_wait_ms'] = (called - waited) * 1000
+        record['llm_ms'] = (time.perf_counter() - called) * 1000
+
+        # Webのアップロードと同じく、毎週・毎月の同じ予定は繰り返し予定1件にまとめる
+        if RECURRENCE_DETECTION_ENABLED:
+            events = collapse_recurring(events).events
+        record.update(status=OK if events else EMPTY, events=events, extracted_text=extracted_text)
+        set_attribute('events', len(events))
+        return record
+    except UploadRejected as e:
+        record.update(status=REJECTED, reason=e.reason, error=str(e))
+        return record
+    except Exception as e:
+        logger.error(f"{rel_path} の処理中にエラーが発生しました: {e}")
+        record.update(reason='error', error=str(e))
+        return record
+    finally:
+        record['ms'] = (time.perf_counter() - started) * 1000
+        metrics.increment(f"bulk_import.{record['status']}")
+        end_trace(None if record['status'] != FAILED else record.get('error') or record.get('reason'))
+
+
+def extract_all(root, pending, checkpoint, workers, ocr_concurrency, llm_concurrency, processes=0):
+    """
+    ファイルを並行して読み取り、1件終わるごとに結果をチェックポイントに追記する
+
+    Args:
+        root: 取り込むフォルダー
+        pending: 読み取る (相対パス, SHA-256) のリスト
+        checkpoint: 追記モードで開いた結果のJSONL
+        workers: 並行して処理するファイルの数（processes を指定した場合は使わない）
+        ocr_concurrency: Vision APIの同時呼び出し数の上限
+        llm_concurrency: Gemini APIの同時呼び出し数の上限
+        processes: 0より大きい場合は、このプロセス数のプロセスプールで処理する
+
+    Returns:
+        読み取りの結果のリスト（終わった順）
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bulk-import-') as work_dir:
+        if processes > 0:
+            # セマフォはfork前に作成し、全プロセスで共有する（サービスは各プロセスで作り直される）
+            ctx = multiprocessing.get_context('fork')
+            executor = ProcessPoolExecutor(
+                max_workers=processes, mp_context=ctx, initializer=init_worker,
+                initargs=(ctx.BoundedSemaphore(ocr_concurrency), ctx.BoundedSemaphore(llm_concurrency))
+            )
+        else:
+            init_worker(threading.BoundedSemaphore(ocr_concurrency), threading.BoundedSemaphore(llm_concurrency))
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-import')
+        with executor:
+            futures = [executor.submit(process_print, root, rel_path, digest, work_dir)
+                       for rel_path, digest in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                append_record(checkpoint, record)
+                results.append(record)
+                logger.info(f"[{done}/{len(pending)}] {record['path']}: {record['status']} "
+                            f"（予定{len(record['events'])}件, {record['ms']:.0f}ms）")
+    return results
+
+
+def register_all(records, checkpoint, calendar_service, credentials_dict, calendar_id,
+                 batch_size=BULK_IMPORT_REGISTER_BATCH, registered=None):
+    """
+    未登録のファイルの予定と、前回登録に失敗した予定をバッチごとにカレンダーに登録し、
+    登録したファイルと失敗した予定の位置をチェックポイントに追記する
+
+    バッチはファイル単位でまとめるため、予定の件数が batch_size を超えるファイルは1件で1バッチになります。
+    登録の途中で中断した場合は、そのバッチのファイルを再実行時にもう一度登録します。
+
+    Args:
+        records: 予定を抽出したファイルの読み取りの結果のリスト（status が ok のもの）
+        checkpoint: 追記モードで開いた結果のJSONL
+        calendar_service: CalendarService
+        credentials_dict: 認証情報の辞書（CalendarService.credentials_to_dict の形式）
+        calendar_id: 登録先のカレンダーID（予定に calendar_id がない場合）
+        batch_size: 一度に登録する予定の件数の目安
+        registered: load_checkpoint で読み込んだ登録済みのファイル（登録に失敗した予定だけを登録し直す）
+
+    Returns:
+        (登録した予定の件数, 失敗した予定の件数)
+    """
+    from app.registration import register_events
+
+    registered = registered or {}
+    # (読み取りの結果, 登録する予定の位置のリスト)
+    pending = []
+    for record in records:
+        key = (record['path'], record['sha256'])
+        positions = sorted(registered[key]) if key in registered else list(range(len(record['events'])))
+        if positions:
+            pending.append((record, positions))
+    if not pending:
+        return 0, 0
+
+    calendar_service.build_service(calendar_service.credentials_from_dict(credentials_dict))
+    batches, batch = [], []
+    for record, positions in pending:
+        if batch and sum(len(p) for _, p in batch) + len(positions) > batch_size:
+            batches.append(batch)
+            batch = []
+        batch.append((record, positions))
+    if batch:
+        batches.append(batch)
+
+    created = failed = 0
+    for number, batch in enumerate(batches, 1):
+        events = [dict(record['events'][position]) for record, positions in batch for position in positions]
+        results = asyncio.run(register_events(
+            calendar_service, calendar_id, events, lambda index, result: None, REGISTRATION_CONCURRENCY
+        ))
+        offset = 0
+        for record, positions in batch:
+            file_results = results[offset:offset + len(positions)]
+            offset += len(positions)
+            failed_events = [position for position, result in zip(positions, file_results) if not result['success']]
+            errors = sorted({result['error'] for result in file_results if not result['success']})
+            append_record(checkpoint, {'type': 'registered', 'path': record['path'], 'sha256': record['sha256'],
+                                       'calendar_id': calendar_id, 'created': len(positions) - len(failed_events),
+                                       'failed': len(failed_events), 'failed_events': failed_events,
+                                       'errors': errors})
+            created += len(positions) - len(failed_events)
+            failed += len(failed_events)
+        logger.info(f"[{number}/{len(batches)}] {len(events)}件の予定を登録しました")
+    return created, failed
+
+
+def write_ics(path, records, calendar_name):
+    """
+    予定を抽出したファイルの予定を1つの .ics ファイルに書き出す（ファイルの名前順）
+    """
+    from app.ics import generate_ics
+
+    events = (event for record in sorted(records, key=lambda r: r['path']) for event in record['events'])
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in generate_ics(events, calendar_name):
+            f.write(chunk)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def print_summary(found, skipped, results, elapsed, registration=None, registration_seconds=0.0):
+    """
+    処理件数とスループットを出力する
+    """
+    by_status = {status: [r for r in results if r['status'] == status] for status in (OK, EMPTY, REJECTED, FAILED)}
+    read = [r for r in results if r['status'] in (OK, EMPTY)]
+    pages = sum(r['pages'] for r in read)
+    events = sum(len(r['events']) for r in results)
+    minutes = elapsed / 60 if elapsed else 0
+    print(f"files={found} skipped={skipped} processed={len(results)} "
+          + ' '.join(f"{status}={len(items)}" for status, items in by_status.items()))
+    print(f"pages={pages} events={events} elapsed={elapsed:.1f}s "
+          f"files/min={len(read) / minutes if minutes else 0:.1f} pages/min={pages / minutes if minutes else 0:.1f}")
+    # wait はセマフォの空きを待った時間（長い場合は --ocr-concurrency / --llm-concurrency が律速している）
+    print(f"{'stage':<10}{'p50 ms':>9}{'p95 ms':>9}{'wait p50':>10}{'wait p95':>10}")
+    for stage, key, wait_key in (('file', 'ms', None), ('ocr', 'ocr_ms', 'ocr_wait_ms'), ('llm', 'llm_ms', 'llm_wait_ms')):
+        values = [r[key] for r in read]
+        waits = [r[wait_key] for r in read] if wait_key else []
+        print(f"{stage:<10}{_percentile(values, 50):>9.0f}{_percentile(values, 95):>9.0f}"
+              f"{_percentile(waits, 50):>10.0f}{_percentile(waits, 95):>10.0f}")
+    for record in by_status[REJECTED] + by_status[FAILED]:
+        print(f"  {record['status']:<9}{record['path']}: {record.get('error') or record.get('reason')}")
+    if registration is not None:
+        created, failed = registration
+        print(f"registered={created} failed={failed} elapsed={registration_seconds:.1f}s "
+              f"events/s={created / registration_seconds if registration_seconds else 0:.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='フォルダー内のプリントをまとめて読み取り、予定を書き出す')
+    parser.add_argument('directory', help='取り込むフォルダー（サブフォルダーも含む）')
+    parser.add_argument('--output', default='bulk_import.jsonl',
+                        help='結果のJSONL（チェックポイントを兼ねる。同じパスで再実行すると続きから処理する）')
+    parser.add_argument('--ics', help='抽出したすべての予定を書き出す .ics ファイル')
+    parser.add_argument('--calendar-name', default='学校プリント', help='.ics ファイルのカレンダー名')
+    parser.add_argument('--workers', type=int, default=BULK_IMPORT_WORKERS, help='並行して処理するファイルの数')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='スレッドの代わりにこのプロセス数のプロセスプールで処理する（画像の前処理が多い場合）')
+    parser.add_argument('--ocr-concurrency', type=int, default=BULK_IMPORT_OCR_CONCURRENCY,
+                        help='Vision APIの同時呼び出し数の上限')
+    parser.add_argument('--llm-concurrency', type=int, default=BULK_IMPORT_LLM_CONCURRENCY,
+                        help='Gemini APIの同時呼び出し数の上限')
+    parser.add_argument('--register', metavar='CALENDAR_ID', help='抽出した予定をこのカレンダーに登録する')
+    parser.add_argument('--credentials', help='登録に使う認証情報のJSON（token・refresh_token・client_id などを含む）')
+    parser.add_argument('--batch-size', type=int, default=BULK_IMPORT_REGISTER_BATCH, help='一度に登録する予定の件数の目安')
+    parser.add_argument('--verbose', action='store_true', help='ファイルごとの進捗とアプリケーションのログを出力する')
+    args = parser.parse_args(argv)
+
+    if args.register and not args.credentials:
+        parser.error('--register には --credentials が必要です')
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s [%(levelname)s] %(name)s - %(message)s')
+
+    found = find_prints(args.directory)
+    keys = [(rel_path, file_digest(os.path.join(args.directory, rel_path))) for rel_path in found]
+    extracted, registered = load_checkpoint(args.output)
+    pending = [key for key in keys if key not in extracted or extracted[key]['status'] not in DONE_STATUSES]
+
+    started = time.perf_counter()
+    with open(args.output, 'a', encoding='utf-8') as checkpoint:
+        results = extract_all(args.directory, pending, checkpoint, args.workers,
+                              args.ocr_concurrency, args.llm_concurrency, args.processes)
+        elapsed = time.perf_counter() - started
+        for record in results:
+            extracted[(record['path'], record['sha256'])] = record
+
+        # 現在のフォルダーにあるファイル（内容が変わっていないもの）の結果だけを書き出し・登録する
+        extracted_ok = [extracted[key] for key in keys if key in extracted and extracted[key]['status'] == OK]
+        if args.ics:
+            write_ics(args.ics, extracted_ok, args.calendar_name)
+
+        registration, registration_seconds = None, 0.0
+        if args.register:
+            from app.services import get_calendar_service
+            calendar_service = get_calendar_service()
+            if not calendar_service:
+                raise SystemExit('カレンダーサービスが設定されていません（GOOGLE_CLIENT_ID・GOOGLE_CLIENT_SECRET を確認してください）')
+            with open(args.credentials, encoding='utf-8') as f:
+                credentials_dict = json.load(f)
+            registration_started = time.perf_counter()
+            registration = register_all(extracted_ok, checkpoint, calendar_service, credentials_dict,
+                                        args.register, args.batch_size, registered)
+            registration_seconds = time.perf_counter() - registration_started
+
+    print_summary(len(found), len(found) - len(pending), results, elapsed, registration, registration_seconds)
+    if any(record['status'] == FAILED for record in results) or (registration and registration[1]):
+        raise SystemExit(1)
@@ -1,17 +1,115 @@
 """
 Google Calendar API連携モジュール
 """
+import importlib
 import logging
 import os
+import threading
 from datetime import datetime, timedelta
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 import json
 
+from app.tracing import traced, set_attribute, mark_error
+from app.async_support import run_blocking
+
 logger = logging.getLogger(__name__)
 
+# Calendar API v3のディスカバリドキュメント（プロセス内で一度だけ読み込む）
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+def get_discovery_document():
+    """
+    Calendar API v3のディスカバリドキュメントを返す
+    
+    build()はサービス構築のたびにライブラリ同梱のJSONを読み込んで解析するため、
+    解析済みのドキュメントを保持して使い回す。接続を持たないデータなので、
+    gunicornの--preload時はfork前に読み込んでワーカー間で共有できる
+    
+    Returns:
+        ディスカバリドキュメント（dict）
+    """
+    global _discovery_document
+    
+    if _discovery_document is None:
+        with _discovery_lock:
+            if _discovery_document is None:
+                from googleapiclient import discovery_cache
+                _discovery_document = json.loads(discovery_cache.get_static_doc('calendar', 'v3'))
+    return _discovery_document
+
+def build_event_body(event_data):
+    """
+    抽出・編集されたイベント情報をGoogle Calendar APIのイベント形式に変換する
+    （ICSファイルの出力でも同じ規則を使う）
+    
+    終日イベントの終了日は翌日とし、時間指定イベントはAsia/Tokyoの日時とする
+    recurrence を持つ予定は繰り返し予定として1件で登録する
+    
+    Args:
+        event_data: イベント情報
+        
+    Returns:
+        Calendar APIのイベントリソース
+    """
+    event = {
+        'summary': event_data['title'],
+        'description': event_data.get('description', ''),
+        'location': event_data.get('location', '')
+    }
+    
+    # all_dayフィールドが文字列の場合、booleanに変換
+    if isinstance(event_data.get('all_day'), str):
+        event_data['all_day'] = event_data['all_day'].lower() == 'true'
+    
+    # 終日イベントかどうかで日付の設定方法を変える
+    if event_data.get('all_day', True):
+        # 終日イベントの場合はdate形式で設定
+        start_date = event_data['start_date']
+        end_date = event_data.get('end_date', start_date)
+        
+        # 終日イベントはGoogleカレンダーAPIでは終了日が翌日になるので調整
+        # （実際のカレンダー表示では元の日付で表示）
+        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+        end_date_obj = end_date_obj + timedelta(days=1)
+        end_date = end_date_obj.strftime('%Y-%m-%d')
+        
+        event['start'] = {'date': start_date}
+        event['end'] = {'date': end_date}
+    else:
+        # 時間指定イベントはdateTime形式で設定
+        start_date = event_data['start_date']
+        end_date = event_data.get('end_date', start_date)
+        
+        # 時間情報の確認
+        start_time = event_data.get('start_time')
+        end_time = event_data.get('end_time')
+        
+        # 時間情報が不完全な場合のデフォルト設定
+        if not start_time:
+            start_time = '00:00'
+        if not end_time:
+            # 終了時間がない場合は開始時間の1時間後をデフォルトにする
+            if start_time:
+                start_time_obj = datetime.strptime(start_time, '%H:%M')
+                end_time_obj = start_time_obj + timedelta(hours=1)
+                end_time = end_time_obj.strftime('%H:%M')
+            else:
+                end_time = '01:00'  # デフォルトの終了時間
+        
+        # タイムゾーン設定（日本時間）
+        tz = 'Asia/Tokyo'
+        start_datetime = f"{start_date}T{start_time}:00"
+        end_datetime = f"{end_date}T{end_time}:00"
+        
+        event['start'] = {'dateTime': start_datetime, 'timeZone': tz}
+        event['end'] = {'dateTime': end_datetime, 'timeZone': tz}
+    
+    # 繰り返し予定（RRULEとEXDATEの行）
+    if event_data.get('recurrence'):
+        event['recurrence'] = list(event_data['recurrence'])
+    
+    return event
+
 class CalendarService:
     def __init__(self, client_id, client_secret, redirect_uri, scopes):
         """
@@ -27,8 +125,39 @@ class CalendarService:
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self.scopes = scopes
-        self.credentials = None
-        self.service = None
+        # 認証情報とサービスはリクエストごとに異なるため、スレッドごとに保持する
+        self._local = threading.local()
+    
+    def warm_up(self, timeout):
+        """
+        使用時に読み込むモジュールとディスカバリドキュメントを準備し、サービスを一度構築しておく
+        （Calendar APIの接続はユーザーの認証情報ごとに作られるため、事前に接続はしない）
+        
+        Args:
+            timeout: 未使用（他のサービスとの互換性のため）
+        """
+        # 使用時に読み込むモジュールを先に読み込む
+        importlib.import_module('google.oauth2.credentials')
+        importlib.import_module('google_auth_oauthlib.flow')
+        from googleapiclient.discovery import build_from_document
+        import httplib2
+        build_from_document(get_discovery_document(), http=httplib2.Http())
+    
+    @property
+    def credentials(self):
+        return getattr(self._local, 'credentials', None)
+    
+    @credentials.setter
+    def credentials(self, value):
+        self._local.credentials = value
+    
+    @property
+    def service(self):
+        return getattr(self._local, 'service', None)
+    
+    @service.setter
+    def service(self, value):
+        self._local.service = value
     
     def get_auth_url(self):
         """
@@ -37,6 +166,8 @@ class CalendarService:
         Returns:
             認証URL
         """
+        from google_auth_oauthlib.flow import Flow  # 起動時間短縮のため使用時に読み込む
+        
         try:
             # クライアントシークレットファイルを使用してフローを作成
             client_secrets_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'credentials', 'client_secret.json')
@@ -83,6 +214,7 @@ class CalendarService:
             logger.error(f"認証情報取得中にエラーが発生しました: {e}")
             raise
     
+    @traced('calendar.build_service')
     def build_service(self, credentials):
         """
         認証情報からCalendarサービスを構築する
@@ -93,9 +225,11 @@ class CalendarService:
         Returns:
             Calendarサービス
         """
+        from googleapiclient.discovery import build_from_document  # 起動時間短縮のため使用時に読み込む
+        
         try:
             self.credentials = credentials
-            self.service = build('calendar', 'v3', credentials=credentials)
+            self.service = build_from_document(get_discovery_document(), credentials=credentials)
             logger.info("Google Calendar APIサービスの構築に成功しました")
             return self.service
         
@@ -103,19 +237,25 @@ class CalendarService:
             logger.error(f"Calendar APIサービス構築中にエラーが発生しました: {e}")
             raise
     
-    def get_calendar_list(self):
+    @traced('calendar.get_calendar_list')
+    def get_calendar_list(self, service=None, http=None):
         """
         ユーザーのカレンダーリストを取得する
         
+        Args:
+            service: 使用するCalendarサービス（Noneの場合は現在のスレッドのサービス）
+            http: リクエストに使用するHTTPオブジェクト（並行実行時に指定）
+            
         Returns:
             カレンダー情報のリスト
         """
-        if not self.service:
+        service = service or self.service
+        if not service:
             logger.error("Calendar APIサービスが初期化されていません")
             return []
         
         try:
-            calendar_list = self.service.calendarList().list().execute()
+            calendar_list = service.calendarList().list().execute(http=http)
             calendars = calendar_list.get('items', [])
             
             # 必要な情報のみ抽出
@@ -130,98 +270,81 @@ class CalendarService:
                 })
             
             logger.info(f"{len(result)}件のカレンダーを取得しました")
+            set_attribute('calendars', len(result))
             return result
         
         except Exception as e:
             logger.error(f"カレンダーリスト取得中にエラーが発生しました: {e}")
+            mark_error(e)
             return []
     
-    def create_event(self, calendar_id, event_data):
+    @traced('calendar.create_event')
+    def create_event(self, calendar_id, event_data, service=None, http=None):
         """
         カレンダーにイベントを作成する
         
         Args:
             calendar_id: イベントを作成するカレンダーID
             event_data: イベント情報
+            service: 使用するCalendarサービス（Noneの場合は現在のスレッドのサービス）
+            http: リクエストに使用するHTTPオブジェクト（並行実行時に指定）
             
         Returns:
             作成されたイベント情報
         """
-        if not self.service:
+        service = service or self.service
+        if not service:
             logger.error("Calendar APIサービスが初期化されていません")
             return None
         
         try:
             # デバッグ用にイベントデータをログ出力
-            logger.debug(f"イベント作成データ: {event_data}")
+            # ペイロードの文字列化はDEBUGが有効な場合のみ行われる
+            logger.debug("イベント作成データ: %s", event_data)
             
             # イベントデータの整形
-            event = {
-                'summary': event_data['title'],
-                'description': event_data.get('description', ''),
-                'location': event_data.get('location', '')
-            }
-            
-            # all_dayフィールドが文字列の場合、booleanに変換
-            if isinstance(event_data.get('all_day'), str):
-                event_data['all_day'] = event_data['all_day'].lower() == 'true'
-            
-            # 終日イベントかどうかで日付の設定方法を変える
-            if event_data.get('all_day', True):
-                # 終日イベントの場合はdate形式で設定
-                start_date = event_data['start_date']
-                end_date = event_data.get('end_date', start_date)
-                
-                # 終日イベントはGoogleカレンダーAPIでは終了日が翌日になるので調整
-                # （実際のカレンダー表示では元の日付で表示）
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-                end_date_obj = end_date_obj + timedelta(days=1)
-                end_date = end_date_obj.strftime('%Y-%m-%d')
-                
-                event['start'] = {'date': start_date}
-                event['end'] = {'date': end_date}
-            else:
-                # 時間指定イベントはdateTime形式で設定
-                start_date = event_data['start_date']
-                end_date = event_data.get('end_date', start_date)
-                
-                # 時間情報の確認
-                start_time = event_data.get('start_time')
-                end_time = event_data.get('end_time')
-                
-                # 時間情報が不完全な場合のデフォルト設定
-                if not start_time:
-                    start_time = '00:00'
-                if not end_time:
-                    # 終了時間がない場合は開始時間の1時間後をデフォルトにする
-                    if start_time:
-                        start_time_obj = datetime.strptime(start_time, '%H:%M')
-                        end_time_obj = start_time_obj + timedelta(hours=1)
-                        end_time = end_time_obj.strftime('%H:%M')
-                    else:
-                        end_time = '01:00'  # デフォルトの終了時間
-                
-                # タイムゾーン設定（日本時間）
-                tz = 'Asia/Tokyo'
-                start_datetime = f"{start_date}T{start_time}:00"
-                end_datetime = f"{end_date}T{end_time}:00"
-                
-                event['start'] = {'dateTime': start_datetime, 'timeZone': tz}
-                event['end'] = {'dateTime': end_datetime, 'timeZone': tz}
+            event = build_event_body(event_data)
             
             # イベント作成APIの呼び出し前にデバッグログ
-            logger.debug(f"Googleカレンダーに送信するイベントデータ: {event}")
+            logger.debug("Googleカレンダーに送信するイベントデータ: %s", event)
             
             # イベント作成APIの呼び出し
-            created_event = self.service.events().insert(calendarId=calendar_id, body=event).execute()
+            set_attribute('calendar_id', calendar_id)
+            created_event = service.events().insert(calendarId=calendar_id, body=event).execute(http=http)
             
             logger.info(f"イベントが作成されました: {created_event['id']}")
+            set_attribute('event_id', created_event['id'])
             return created_event
         
         except Exception as e:
             logger.error(f"イベント作成中にエラーが発生しました: {e}")
             logger.error(f"問題のあるイベントデータ: {event_data}")
+            mark_error(e)
+            return None
+    
+    def _new_http(self):
+        """
+        並行実行用に認証済みのHTTPオブジェクトを作成する
+        （httplib2.Httpはスレッドセーフではないため、呼び出しごとに作成する）
+        """
+        if self.credentials is None:
             return None
+        import google_auth_httplib2
+        import httplib2
+        return google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+    
+    async def get_calendar_list_async(self):
+        """
+        get_calendar_listの非同期版
+        """
+        return await run_blocking(self.get_calendar_list, self.service, self._new_http())
+    
+    async def create_event_async(self, calendar_id, event_data):
+        """
+        create_eventの非同期版
+        呼び出し元スレッドのサービスを引き継ぎ、呼び出しごとに独立したHTTP接続で実行する
+        """
+        return await run_blocking(self.create_event, calendar_id, event_data, self.service, self._new_http())
     
     def batch_create_events(self, calendar_id, event_data_list):
         """
@@ -327,6 +450,24 @@ class CalendarService:
             logger.error(f"イベントデータのバリデーション中にエラーが発生しました: {e}")
             return False
     
+    def user_id_from_credentials(self, credentials):
+        """
+        認証情報のIDトークンからGoogleアカウントの識別子（sub）を取り出す
+        
+        IDトークンはトークンエンドポイントからTLSで直接受け取ったものなので、署名の検証は省略する
+        
+        Args:
+            credentials: 認証コードから取得した認証情報
+            
+        Returns:
+            アカウントの識別子（IDトークンがない場合はNone）
+        """
+        id_token = getattr(credentials, 'id_token', None)
+        if not id_token:
+            return None
+        from google.auth import jwt
+        return jwt.decode(id_token, verify=False).get('sub')
+    
     def credentials_to_dict(self, credentials):
         """
         認証情報をJSON保存用の辞書に変換する
@@ -356,6 +497,8 @@ class CalendarService:
         Returns:
             復元された認証情報
         """
+        from google.oauth2.credentials import Credentials  # 起動時間短縮のため使用時に読み込む
+        
         return Credentials(
             token=credentials_dict['token'],
             refresh_token=credentials_dict['refresh_token'],
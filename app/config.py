@@ -2,6 +2,7 @@
 アプリケーション設定
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # .envファイルから環境変数を読み込む
@@ -25,6 +26,14 @@ SCOPES = [
     'openid'
 ]
 
+# API記録・再生設定（record: レスポンスを記録、replay: 記録から再生、空: 通常動作）
+API_RECORDING_MODE = os.getenv('API_RECORDING_MODE', '').lower()
+FIXTURE_CORPUS_DIR = os.getenv(
+    'FIXTURE_CORPUS_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'corpus')
+)
+FIXTURE_CORPUS_VERSION = os.getenv('FIXTURE_CORPUS_VERSION', 'v1')
+
 # アプリケーション設定
 SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key')
 DEBUG = os.getenv('FLASK_ENV', 'development') == 'development'
@@ -33,10 +42,94 @@ DEBUG = os.getenv('FLASK_ENV', 'development') == 'development'
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
+# アップロード検証（保存する前にヘッダーだけを読んで拒否する）
+UPLOAD_MAX_IMAGE_PIXELS = int(os.getenv('UPLOAD_MAX_IMAGE_PIXELS', '60000000'))  # 画像の画素数の上限（解凍爆弾対策）
+UPLOAD_MAX_IMAGE_SIDE = int(os.getenv('UPLOAD_MAX_IMAGE_SIDE', '12000'))  # 画像の長辺の画素数の上限
+PDF_MAX_PAGES = 5  # PDFのページ数の上限
+
+# アップロードにGoogleアカウントでのログインを必須にするか
+# （falseの場合、ログインしていないユーザーは予定をICSファイルとして書き出せる）
+REQUIRE_LOGIN_FOR_UPLOAD = os.getenv('REQUIRE_LOGIN_FOR_UPLOAD', 'true').lower() == 'true'
 
 # API設定
 API_TIMEOUT = 30  # API呼び出しのタイムアウト（秒）
 
+# 確認ページの設定（予定はページごとに /api/events から読み込む）
+CONFIRM_PAGE_SIZE = int(os.getenv('CONFIRM_PAGE_SIZE', '20'))
+EVENTS_API_MAX_LIMIT = 100  # /api/events で1回に返す予定の件数の上限
+
+# 行事予定表の読み取り設定（表形式のページは単語の配置から直接予定を組み立てる）
+TABLE_PARSER_ENABLED = os.getenv('TABLE_PARSER_ENABLED', 'true').lower() == 'true'
+TABLE_MIN_ROWS = int(os.getenv('TABLE_MIN_ROWS', '5'))  # 表とみなす日付の行数の下限
+TABLE_SKIP_LLM_COVERAGE = float(os.getenv('TABLE_SKIP_LLM_COVERAGE', '0.8'))  # 表の単語の割合がこれ以上ならGemini APIを呼ばない
+TABLE_EVENT_CONFIDENCE = float(os.getenv('TABLE_EVENT_CONFIDENCE', '0.8'))  # 表から読み取った予定の確信度
+
+# 繰り返し予定の検出設定（同じ予定が毎週・毎月並んでいる場合は繰り返し予定1件にまとめて登録する）
+RECURRENCE_DETECTION_ENABLED = os.getenv('RECURRENCE_DETECTION_ENABLED', 'true').lower() == 'true'
+RECURRENCE_MIN_OCCURRENCES = int(os.getenv('RECURRENCE_MIN_OCCURRENCES', '4'))  # まとめる予定の件数の下限
+RECURRENCE_MIN_COVERAGE = float(os.getenv('RECURRENCE_MIN_COVERAGE', '0.75'))  # 繰り返しの回数のうち実際に予定がある割合の下限（残りは除外日にする）
+
+# Geminiモデルの振り分け設定（高速なモデルで先に抽出し、結果が基準を満たさない場合だけ上位モデルで抽出し直す）
+MODEL_ROUTING_ENABLED = os.getenv('MODEL_ROUTING_ENABLED', 'true').lower() == 'true'
+GEMINI_FAST_MODEL = os.getenv('GEMINI_FAST_MODEL', 'gemini-1.5-flash')
+GEMINI_PRO_MODEL = os.getenv('GEMINI_PRO_MODEL', 'gemini-1.5-pro')
+ROUTING_MIN_CONFIDENCE = float(os.getenv('ROUTING_MIN_CONFIDENCE', '0.7'))  # これより確信度の低い予定があれば上位モデルへ
+ROUTING_MAX_INVALID_RATIO = float(os.getenv('ROUTING_MAX_INVALID_RATIO', '0'))  # バリデーションに失敗した予定の割合の上限
+ROUTING_MAX_TEXT_CHARS = int(os.getenv('ROUTING_MAX_TEXT_CHARS', '4000'))  # これより長いテキストは最初から上位モデルへ
+ROUTING_MAX_SCHEDULE_LINES = int(os.getenv('ROUTING_MAX_SCHEDULE_LINES', '30'))  # 日程の手がかりのある行がこれより多い場合も同様
+
+# プロンプトの事前絞り込みの設定（予定に関係する行と前後の行だけをGemini APIに送る）
+# 有効にする前に benchmarks.bench_prefilter でフィクスチャコーパスの再現率を確認すること
+PREFILTER_ENABLED = os.getenv('PREFILTER_ENABLED', 'false').lower() == 'true'
+PREFILTER_CONTEXT_LINES = int(os.getenv('PREFILTER_CONTEXT_LINES', '1'))  # 手がかりのある行の前後に残す行数
+PREFILTER_HEAD_LINES = int(os.getenv('PREFILTER_HEAD_LINES', '3'))  # 先頭から必ず残す行数（表題・発行日など）
+PREFILTER_MIN_SCORE = int(os.getenv('PREFILTER_MIN_SCORE', '2'))  # 手がかりのある行とみなす点数の下限
+PREFILTER_MIN_CHARS = int(os.getenv('PREFILTER_MIN_CHARS', '500'))  # これより短いテキストは絞り込まない
+
+# 上流APIの非同期呼び出しの設定（登録ジョブのCalendar API呼び出しに使用）
+ASYNC_IO_THREADS = int(os.getenv('ASYNC_IO_THREADS', '32'))  # 上流API呼び出しに使うスレッド数（プロセスごと）
+
+# バックグラウンド登録の設定（/register は登録をジョブとして開始してすぐに応答し、進捗は結果ページで確認する）
+REGISTRATION_WORKERS = int(os.getenv('REGISTRATION_WORKERS', '4'))  # 同時に実行する登録ジョブの数（プロセスごと）
+REGISTRATION_CONCURRENCY = int(os.getenv('REGISTRATION_CONCURRENCY', '4'))  # 1つのジョブで並行して行う予定の登録数
+REGISTRATION_POLL_INTERVAL_MS = int(os.getenv('REGISTRATION_POLL_INTERVAL_MS', '1000'))  # 結果ページが進捗を確認する間隔
+REGISTRATION_STALL_SECONDS = float(os.getenv('REGISTRATION_STALL_SECONDS', '120'))  # 進捗がこの秒数ない登録は中断されたとみなす
+
+# 一括取り込みの設定（import_prints.py でフォルダー内のプリントをまとめて読み取る）
+BULK_IMPORT_WORKERS = int(os.getenv('BULK_IMPORT_WORKERS', '8'))  # 並行して処理するファイルの数
+BULK_IMPORT_OCR_CONCURRENCY = int(os.getenv('BULK_IMPORT_OCR_CONCURRENCY', '4'))  # Vision APIの同時呼び出し数の上限
+BULK_IMPORT_LLM_CONCURRENCY = int(os.getenv('BULK_IMPORT_LLM_CONCURRENCY', '4'))  # Gemini APIの同時呼び出し数の上限
+BULK_IMPORT_REGISTER_BATCH = int(os.getenv('BULK_IMPORT_REGISTER_BATCH', '50'))  # 一度に登録する予定の件数の目安（登録の再開の単位）
+
+# 受け付け制御の設定（OCR・Gemini APIの処理と登録ジョブの同時実行数を制限し、超えた分は503で断る）
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_UPLOAD_PROCESS_LIMIT = int(os.getenv('ADMISSION_UPLOAD_PROCESS_LIMIT', '4'))  # 同時に処理するアップロードの数（プロセスごと）
+ADMISSION_UPLOAD_GLOBAL_LIMIT = int(os.getenv('ADMISSION_UPLOAD_GLOBAL_LIMIT', '8'))  # 同時に処理するアップロードの数（ホスト全体）
+ADMISSION_REGISTRATION_PROCESS_LIMIT = int(os.getenv('ADMISSION_REGISTRATION_PROCESS_LIMIT', '8'))  # 実行中・実行待ちの登録ジョブの数（プロセスごと）
+ADMISSION_REGISTRATION_GLOBAL_LIMIT = int(os.getenv('ADMISSION_REGISTRATION_GLOBAL_LIMIT', '16'))  # 実行中・実行待ちの登録ジョブの数（ホスト全体）
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '4'))  # 空きを待つリクエストの数の上限（プロセスごと）
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))  # 空きを待つ秒数の上限
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '5'))  # 断ったときに Retry-After で返す秒数
+ADMISSION_FAIR_SCHEDULING = os.getenv('ADMISSION_FAIR_SCHEDULING', 'true').lower() == 'true'  # 空きを待つ処理をユーザーごとに公平に割り当てる（falseの場合は到着順）
+ADMISSION_USER_LIMIT = int(os.getenv('ADMISSION_USER_LIMIT', '2'))  # 1人のユーザーが同時に実行できる処理の数（ホスト全体、0の場合は制限しない）
+ADMISSION_USER_QUEUE_SIZE = int(os.getenv('ADMISSION_USER_QUEUE_SIZE', '2'))  # 1人のユーザーが空きを待てる処理の数（プロセスごと）
+ADMISSION_LOCK_DIR = os.getenv('ADMISSION_LOCK_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'admission'
+)
+
+# 静的ファイルの設定（起動時に内容のハッシュを含む名前でコピーし、圧縮したファイルと長期間のキャッシュで配信する）
+ASSET_PIPELINE_ENABLED = os.getenv('ASSET_PIPELINE_ENABLED', 'true').lower() == 'true'
+ASSET_BUILD_DIR = os.getenv('ASSET_BUILD_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'assets'
+)
+ASSET_MAX_AGE = int(os.getenv('ASSET_MAX_AGE', str(365 * 24 * 3600)))  # ハッシュを含むURLのキャッシュの有効期間（秒）
+
+# ウォームアップの設定（ワーカー起動時に外部APIへの接続を準備し、完了後に /readyz が成功する）
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', '10'))  # 接続確認のタイムアウト（秒）
+WARMUP_RETRY_INTERVAL = float(os.getenv('WARMUP_RETRY_INTERVAL', '5'))  # 失敗時の再試行間隔（秒）
+KEEPALIVE_INTERVAL = float(os.getenv('KEEPALIVE_INTERVAL', '240'))  # アイドル中の接続確認の間隔（秒、0で無効）
+
 # キャッシュの設定
 CACHE_TIMEOUT = 300  # キャッシュのタイムアウト（秒）
 
@@ -44,6 +137,17 @@ CACHE_TIMEOUT = 300  # キャッシュのタイムアウト（秒）
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
 
+# トレース設定
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', 'true').lower() == 'true'
+TRACE_SLOW_REQUEST_MS = float(os.getenv('TRACE_SLOW_REQUEST_MS', '0'))  # 0の場合は低速リクエストのダンプを行わない
+
+# メモリプロファイリングの設定（tracemallocで処理段階ごとのメモリ確保のピークを記録する。計測中は処理が遅くなる）
+MEMORY_PROFILING_ENABLED = os.getenv('MEMORY_PROFILING_ENABLED', 'false').lower() == 'true'
+MEMORY_PROFILING_FRAMES = int(os.getenv('MEMORY_PROFILING_FRAMES', '10'))  # 確保した場所として記録する呼び出し元の深さ
+MEMORY_SAMPLE_INTERVAL_MS = float(os.getenv('MEMORY_SAMPLE_INTERVAL_MS', '20'))  # 確保した場所を記録するための確認間隔
+MEMORY_REPORT_MIN_KB = int(os.getenv('MEMORY_REPORT_MIN_KB', '20480'))  # ピークがこれ以上のリクエストは確保した場所を出力する
+MEMORY_REPORT_TOP_SITES = int(os.getenv('MEMORY_REPORT_TOP_SITES', '10'))  # 出力する確保した場所の件数
+
 # アプリケーションのURLベース（リダイレクトに使用）
 APP_BASE_URL = os.getenv('APP_BASE_URL', 'http://localhost:3501')
 
@@ -51,6 +155,26 @@ APP_BASE_URL = os.getenv('APP_BASE_URL', 'http://localhost:3501')
 SESSION_TYPE = 'filesystem'
 PERMANENT_SESSION_LIFETIME = 3600  # 1時間
 
+# 予定ストア設定（抽出結果をジョブごとに保存し、セッションにはジョブIDだけを保持する）
+EVENT_STORE_PATH = os.getenv('EVENT_STORE_PATH') or os.path.join(
+    tempfile.gettempdir(), 'school_print_events.sqlite3'
+)
+
+# 登録履歴の設定（登録結果はセッションではなく履歴ストアに保存する）
+HISTORY_STORE_PATH = os.getenv('HISTORY_STORE_PATH') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'history.sqlite3'
+)
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+
+# プリント索引の設定（撮り直した同じプリントは前回のOCRテキストと予定を再利用する）
+PRINT_DEDUP_ENABLED = os.getenv('PRINT_DEDUP_ENABLED', 'true').lower() == 'true'
+PRINT_INDEX_PATH = os.getenv('PRINT_INDEX_PATH') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'prints.sqlite3'
+)
+PRINT_INDEX_TTL_DAYS = float(os.getenv('PRINT_INDEX_TTL_DAYS', '30'))  # 再利用するプリントの保持日数
+PRINT_DEDUP_MAX_DISTANCE = int(os.getenv('PRINT_DEDUP_MAX_DISTANCE', '12'))  # 候補とするdHash（64ビット）のハミング距離の上限
+PRINT_DEDUP_MAX_DIFFERENCE = float(os.getenv('PRINT_DEDUP_MAX_DIFFERENCE', '11'))  # 同じプリントとみなす縮小画像の画素の差の平均の上限（0～255）
+
 # 確保すべきアップロードディレクトリの確認と作成
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
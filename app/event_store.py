@@ -0,0 +1,187 @@
+"""
+予定ストアモジュール
+抽出結果（OCRテキストと予定）をジョブごとにSQLiteへ保存し、
+確認ページでの編集を予定1件単位で更新します（セッションにはジョブIDだけを保持します）
+
+各予定はバージョン番号を持ち、更新時に編集前のバージョンを指定すると
+他のタブなどで先に更新されていた場合は VersionConflict になります（楽観的排他制御）。
+"""
+import json
+import logging
+import time
+import uuid
+
+from app.sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class VersionConflict(Exception):
+    """
+    更新しようとした予定が、指定したバージョンより後に更新されていた場合の例外
+    """
+
+    def __init__(self, event, version):
+        super().__init__(f"予定は他の操作で更新されています（現在のバージョン: {version}）")
+        self.event = event
+        self.version = version
+
+
+class EventStore(SQLiteStore):
+    """
+    ジョブごとの予定をSQLiteに保持するクラス
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        extracted_text TEXT NOT NULL,
+        file_path TEXT,
+        upload_hash TEXT,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+    CREATE TABLE IF NOT EXISTS events (
+        job_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        version INTEGER NOT NULL DEFAULT 1,
+        data TEXT NOT NULL,
+        PRIMARY KEY (job_id, idx)
+    );
+    """
+
+    def __init__(self, path, ttl=3600):
+        """
+        初期化
+
+        Args:
+            path: SQLiteのデータベースファイルのパス
+            ttl: ジョブを保持する秒数（これより古いジョブは新しいジョブの作成時に削除する）
+        """
+        super().__init__(path)
+        self.ttl = ttl
+
+    def create_job(self, extracted_text, events, file_path=None, upload_hash=None):
+        """
+        抽出結果を保存する
+
+        Args:
+            extracted_text: OCRで抽出されたテキスト
+            events: 予定のリスト
+            file_path: アップロードされたファイルのパス
+            upload_hash: アップロードされたファイルのSHA-256
+
+        Returns:
+            ジョブID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM events WHERE job_id IN (SELECT job_id FROM jobs WHERE created_at < ?)',
+                         (now - self.ttl,))
+            conn.execute('DELETE FROM jobs WHERE created_at < ?', (now - self.ttl,))
+            conn.execute('INSERT INTO jobs (job_id, extracted_text, file_path, upload_hash, created_at) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (job_id, extracted_text, file_path, upload_hash, now))
+            conn.executemany('INSERT INTO events (job_id, idx, data) VALUES (?, ?, ?)',
+                             [(job_id, i, json.dumps(event, ensure_ascii=False)) for i, event in enumerate(events)])
+        return job_id
+
+    def get_job(self, job_id):
+        """
+        ジョブの情報を返す
+
+        Returns:
+            {'extracted_text', 'file_path', 'upload_hash', 'event_count'} の辞書（存在しない場合はNone）
+        """
+        if not job_id:
+            return None
+        row = self._connect().execute(
+            'SELECT extracted_text, file_path, upload_hash, (SELECT COUNT(*) FROM events WHERE job_id = ?) '
+            'FROM jobs WHERE job_id = ? AND created_at >= ?',
+            (job_id, job_id, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'extracted_text': row[0], 'file_path': row[1], 'upload_hash': row[2], 'event_count': row[3]}
+
+    def list_events(self, job_id, offset=0, limit=None):
+        """
+        ジョブの予定を順番どおりに返す
+
+        Args:
+            job_id: ジョブID
+            offset: 先頭から読み飛ばす件数
+            limit: 返す件数の上限（省略時はすべて）
+
+        Returns:
+            (予定のリスト, バージョンのリスト)（i番目の予定のインデックスは offset + i）
+        """
+        rows = self._connect().execute(
+            'SELECT data, version FROM events WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?',
+            (job_id, offset, -1 if limit is None else limit)
+        ).fetchall()
+        return [json.loads(data) for data, _ in rows], [version for _, version in rows]
+
+    def get_event(self, job_id, index):
+        """
+        予定1件とそのバージョンを返す
+
+        Returns:
+            (予定, バージョン)（存在しない場合は (None, None)）
+        """
+        row = self._connect().execute(
+            'SELECT data, version FROM events WHERE job_id = ? AND idx = ?', (job_id, index)
+        ).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def update_event(self, job_id, index, fields, expected_version=None, validate=None):
+        """
+        予定1件の項目を更新する（他の予定は読み書きしない）
+
+        Args:
+            job_id: ジョブID
+            index: 予定のインデックス
+            fields: 更新する項目の辞書
+            expected_version: 編集前のバージョン（省略時は読み取った時点のバージョン）
+            validate: 更新後の予定を検証する関数（(is_valid, errors) を返す）
+
+        Returns:
+            (更新後の予定, 新しいバージョン, エラーのリスト)
+            （検証に失敗した場合は保存せず、バージョンはNone。予定が存在しない場合は (None, None, None)）
+
+        Raises:
+            VersionConflict: 予定が指定したバージョンより後に更新されていた場合
+        """
+        event, version = self.get_event(job_id, index)
+        if event is None:
+            return None, None, None
+        if expected_version is not None and int(expected_version) != version:
+            raise VersionConflict(event, version)
+
+        event.update(fields)
+        if validate is not None:
+            is_valid, errors = validate(event)
+            if not is_valid:
+                return event, None, errors
+
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE events SET data = ?, version = version + 1 WHERE job_id = ? AND idx = ? AND version = ?',
+                (json.dumps(event, ensure_ascii=False), job_id, index, version)
+            )
+        if cursor.rowcount == 0:
+            # 読み取ってから書き込むまでの間に他のリクエストが更新した
+            current, current_version = self.get_event(job_id, index)
+            raise VersionConflict(current, current_version)
+        return event, version + 1, []
+
+    def delete_job(self, job_id):
+        """
+        ジョブと予定を削除する
+        """
+        with self._connect() as conn:
+            conn.execute('DELETE FROM events WHERE job_id = ?', (job_id,))
+            conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
@@ -0,0 +1,76 @@
+"""
+予定の検証モジュール
+抽出された予定の必須項目と日付・時刻の形式を検証します
+
+Google SDKを読み込まないため、gunicornの --preload では親プロセスで読み込み、
+コンパイル済みの正規表現をワーカー間で共有します（app/services.py の preload_shared_state）。
+"""
+import re
+from datetime import datetime
+
+# バリデーションで使う正規表現
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+TIME_PATTERN = re.compile(r'^\d{2}:\d{2}$')
+
+
+def validate_event(event):
+    """
+    抽出されたイベント情報のバリデーションを行う
+
+    Args:
+        event: バリデーションするイベント情報（all_day・end_dateが無い場合は既定値を書き込む）
+
+    Returns:
+        バリデーション結果（True/False）とエラーメッセージ
+    """
+    errors = []
+
+    # 必須フィールドのチェック
+    required_fields = ['title', 'start_date']
+    for field in required_fields:
+        if field not in event or not event[field]:
+            errors.append(f"{field}は必須項目です")
+
+    # 日付フォーマットのチェック
+    date_fields = ['start_date', 'end_date']
+    for field in date_fields:
+        if field in event and event[field]:
+            if not DATE_PATTERN.match(event[field]):
+                errors.append(f"{field}は'YYYY-MM-DD'形式である必要があります")
+            else:
+                try:
+                    datetime.strptime(event[field], '%Y-%m-%d')
+                except ValueError:
+                    errors.append(f"{field}が無効な日付です")
+
+    # 時間フォーマットのチェック
+    time_fields = ['start_time', 'end_time']
+    for field in time_fields:
+        if field in event and event[field]:
+            if not TIME_PATTERN.match(event[field]):
+                errors.append(f"{field}は'HH:MM'形式である必要があります")
+            else:
+                try:
+                    datetime.strptime(event[field], '%H:%M')
+                except ValueError:
+                    errors.append(f"{field}が無効な時間です")
+
+    # 終了日付のチェック（開始日付以降であること）
+    if 'end_date' in event and event['end_date'] and 'start_date' in event and event['start_date']:
+        try:
+            start = datetime.strptime(event['start_date'], '%Y-%m-%d')
+            end = datetime.strptime(event['end_date'], '%Y-%m-%d')
+            if end < start:
+                errors.append("終了日は開始日以降である必要があります")
+        except ValueError:
+            # 日付フォーマットのエラーは上記で既にチェック済み
+            pass
+
+    # オプションフィールドのデフォルト値設定
+    if 'all_day' not in event:
+        event['all_day'] = 'start_time' not in event or not event['start_time']
+
+    if 'end_date' not in event or not event['end_date']:
+        event['end_date'] = event['start_date']
+
+    return len(errors) == 0, errors
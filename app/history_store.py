@@ -0,0 +1,198 @@
+"""
+登録履歴ストアモジュール
+カレンダーへの登録結果を1件ずつ簡潔な記録としてSQLiteに保存し、
+登録結果ページと履歴ページから参照できるようにします
+
+Calendar APIが返す予定の全体は保存せず、予定ID・カレンダーID・htmlLink・
+アップロードされたファイルのハッシュ・登録日時と、表示に使う項目だけを保存します。
+履歴ページは登録1回ごとの集計（batches）だけを読むため、登録した予定の件数によらず表示時間は一定です。
+
+登録はバックグラウンドのジョブとして行われるため、1件登録するごとに結果と進捗（done）を書き込みます。
+ワーカープロセスをまたいで進捗を確認できるよう、進捗はプロセス内ではなくこのストアに保持します。
+"""
+import time
+from collections import namedtuple
+
+from app.config import REGISTRATION_STALL_SECONDS
+from app.sqlite_store import SQLiteStore
+
+RegistrationRecord = namedtuple('RegistrationRecord', [
+    'job_id', 'registered_at', 'upload_hash', 'calendar_id', 'calendar_name', 'event_id', 'html_link',
+    'title', 'start_date', 'start_time', 'all_day', 'location', 'error', 'recurrence'
+])
+
+# 登録の状態
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+INTERRUPTED = 'interrupted'  # 進捗が REGISTRATION_STALL_SECONDS 以上ない（ワーカーの再起動などで中断された）
+
+# 履歴ページに表示する予定名の件数
+TITLES_IN_SUMMARY = 5
+
+_RECORD_COLUMNS = ('calendar_id, calendar_name, event_id, html_link, title, start_date, start_time, '
+                   'all_day, location, error, recurrence')
+
+
+def _record_row(result):
+    """
+    登録結果1件を registrations の列の値に変換する
+    """
+    event = result['original_data']
+    created = result.get('event') or {}
+    return (
+        result['calendar_id'], event.get('calendar_name'), created.get('id'), created.get('htmlLink'),
+        event.get('title'), event.get('start_date'), event.get('start_time'),
+        int(bool(event.get('all_day'))), event.get('location'),
+        None if result['success'] else result.get('error') or 'イベントの作成に失敗しました',
+        event.get('recurrence_label') if event.get('recurrence') else None
+    )
+
+
+class HistoryStore(SQLiteStore):
+    """
+    登録履歴をSQLiteに保持するクラス
+    """
+
+    SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS batches (
+        batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        owner TEXT,
+        job_id TEXT NOT NULL,
+        registered_at REAL NOT NULL,
+        upload_hash TEXT,
+        total INTEGER NOT NULL,
+        succeeded INTEGER NOT NULL,
+        first_date TEXT,
+        last_date TEXT,
+        titles TEXT,
+        status TEXT NOT NULL DEFAULT '{COMPLETED}',
+        done INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS batches_job ON batches (job_id);
+    CREATE INDEX IF NOT EXISTS batches_owner ON batches (owner, registered_at);
+    CREATE TABLE IF NOT EXISTS registrations (
+        batch_id INTEGER NOT NULL,
+        idx INTEGER NOT NULL,
+        calendar_id TEXT,
+        calendar_name TEXT,
+        event_id TEXT,
+        html_link TEXT,
+        title TEXT,
+        start_date TEXT,
+        start_time TEXT,
+        all_day INTEGER,
+        location TEXT,
+        error TEXT,
+        recurrence TEXT,
+        PRIMARY KEY (batch_id, idx)
+    );
+    """
+
+    def start(self, owner, job_id, upload_hash, events):
+        """
+        登録を開始する（結果は add_result で1件ずつ追加する）
+
+        Args:
+            owner: 登録するユーザーの識別子（GoogleアカウントのsubまたはNone）
+            job_id: 抽出結果のジョブID
+            upload_hash: アップロードされたファイルのSHA-256
+            events: 登録する予定のリスト
+
+        Returns:
+            登録のID（batch_id）
+        """
+        dates = sorted(e['start_date'] for e in events if e.get('start_date'))
+        titles = '、'.join(e.get('title') or '' for e in events[:TITLES_IN_SUMMARY])
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO batches (owner, job_id, registered_at, upload_hash, total, succeeded, done, status, '
+                'updated_at, first_date, last_date, titles) VALUES (?, ?, ?, ?, ?, 0, 0, ?, ?, ?, ?, ?)',
+                (owner, job_id, now, upload_hash, len(events), RUNNING, now,
+                 dates[0] if dates else None, dates[-1] if dates else None, titles)
+            )
+        return cursor.lastrowid
+
+    def add_result(self, batch_id, index, result):
+        """
+        登録結果を1件追加し、進捗を更新する
+
+        Args:
+            batch_id: 登録のID
+            index: 登録する予定のリストでの位置
+            result: 登録結果（{'success', 'event', 'calendar_id', 'original_data', 'error'}）
+        """
+        with self._connect() as conn:
+            conn.execute(f"INSERT INTO registrations (batch_id, idx, {_RECORD_COLUMNS}) "
+                         f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (batch_id, index) + _record_row(result))
+            conn.execute('UPDATE batches SET done = done + 1, succeeded = succeeded + ?, updated_at = ? '
+                         'WHERE batch_id = ?', (int(bool(result['success'])), time.time(), batch_id))
+
+    def finish(self, batch_id, error=None):
+        """
+        登録を終了する
+
+        Args:
+            batch_id: 登録のID
+            error: 登録全体が失敗した場合のエラーメッセージ
+        """
+        with self._connect() as conn:
+            conn.execute('UPDATE batches SET status = ?, error = ?, updated_at = ? WHERE batch_id = ?',
+                         (FAILED if error else COMPLETED, error, time.time(), batch_id))
+
+    def progress(self, job_id, after=0, limit=None):
+        """
+        ジョブの最後の登録の進捗と結果を返す（同じ抽出結果を登録し直した場合は最後の登録のみ）
+
+        Args:
+            job_id: 抽出結果のジョブID
+            after: 取得済みの結果の件数（登録が終わった順で、これより後の結果だけを返す）
+            limit: 返す結果の件数の上限（省略時はすべて。0の場合は進捗だけを返す）
+
+        Returns:
+            (登録したユーザーの識別子, {'status', 'total', 'done', 'succeeded', 'error', 'records'})
+            （記録がない場合は (None, None)。records は RegistrationRecord のリストで登録が終わった順）
+        """
+        conn = self._connect()
+        batch = conn.execute(
+            'SELECT batch_id, owner, registered_at, upload_hash, status, total, done, succeeded, error, updated_at '
+            'FROM batches WHERE job_id = ? ORDER BY batch_id DESC LIMIT 1', (job_id,)
+        ).fetchone()
+        if batch is None:
+            return None, None
+        batch_id, owner, registered_at, upload_hash, status, total, done, succeeded, error, updated_at = batch
+        if status == COMPLETED:
+            done = total
+        elif status == RUNNING and (updated_at or registered_at) < time.time() - REGISTRATION_STALL_SECONDS:
+            status = INTERRUPTED
+        rows = conn.execute(
+            f"SELECT {_RECORD_COLUMNS} FROM registrations WHERE batch_id = ? ORDER BY rowid LIMIT ? OFFSET ?",
+            (batch_id, -1 if limit is None else limit, after)
+        ).fetchall()
+        return owner, {
+            'status': status, 'total': total, 'done': done, 'succeeded': succeeded, 'error': error,
+            'records': [RegistrationRecord(job_id, registered_at, upload_hash, *row) for row in rows]
+        }
+
+    def history(self, owner, offset=0, limit=20):
+        """
+        ユーザーの登録履歴を新しい順に返す（登録1回ごとに1件）
+
+        Returns:
+            (履歴の合計件数, [{'job_id', 'registered_at', 'upload_hash', 'total', 'succeeded',
+              'first_date', 'last_date', 'titles', 'status'}, ...])
+        """
+        conn = self._connect()
+        total = conn.execute('SELECT COUNT(*) FROM batches WHERE owner = ?', (owner,)).fetchone()[0]
+        rows = conn.execute(
+            'SELECT job_id, registered_at, upload_hash, total, succeeded, first_date, last_date, titles, status '
+            'FROM batches WHERE owner = ? ORDER BY registered_at DESC LIMIT ? OFFSET ?',
+            (owner, limit, offset)
+        ).fetchall()
+        keys = ('job_id', 'registered_at', 'upload_hash', 'total', 'succeeded', 'first_date', 'last_date', 'titles',
+                'status')
+        return total, [dict(zip(keys, row)) for row in rows]
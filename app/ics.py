@@ -0,0 +1,173 @@
+"""
+iCalendar出力モジュール
+選択された予定をRFC 5545形式の .ics ファイルとして出力します
+Calendar APIを呼び出さずに、Googleカレンダーへの登録と同じ日付・時刻の規則で予定を書き出します
+"""
+import hashlib
+import json
+import logging
+from datetime import date, datetime, timezone
+
+from app.calendar_api import build_event_body
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_ID = '-//school-calendar-app//School Print Calendar//JA'
+UID_DOMAIN = 'school-calendar-app'
+TIMEZONE_ID = 'Asia/Tokyo'
+
+# RFC 5545 の1行の上限（改行を除くオクテット数）
+MAX_LINE_OCTETS = 75
+
+# 日本標準時（夏時間なし）の定義
+VTIMEZONE_LINES = [
+    'BEGIN:VTIMEZONE',
+    f'TZID:{TIMEZONE_ID}',
+    'BEGIN:STANDARD',
+    'DTSTART:19700101T000000',
+    'TZOFFSETFROM:+0900',
+    'TZOFFSETTO:+0900',
+    'TZNAME:JST',
+    'END:STANDARD',
+    'END:VTIMEZONE',
+]
+
+
+def escape_text(value):
+    """
+    TEXT型の値をエスケープする
+    """
+    return (str(value or '')
+            .replace('\\', '\\\\')
+            .replace(';', '\\;')
+            .replace(',', '\\,')
+            .replace('\r\n', '\\n')
+            .replace('\n', '\\n')
+            .replace('\r', ''))
+
+
+def fold_line(line):
+    """
+    1行を75オクテットごとに折り返し、CRLFを付けて返す
+    UTF-8の文字の途中では折り返さない
+    """
+    if len(line.encode('utf-8')) <= MAX_LINE_OCTETS:
+        return line + '\r\n'
+
+    parts = []
+    current = []
+    size = 0
+    for char in line:
+        octets = len(char.encode('utf-8'))
+        if size + octets > MAX_LINE_OCTETS:
+            parts.append(''.join(current))
+            current = []
+            size = 1  # 継続行の先頭の空白
+        current.append(char)
+        size += octets
+    parts.append(''.join(current))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _format_date(value):
+    """
+    Calendar APIの日付（'2025-04-08'）をiCalendarの形式に変換する
+
+    Raises:
+        ValueError: 日付として解釈できない場合
+    """
+    return date.fromisoformat(value).strftime('%Y%m%d')
+
+
+def _format_datetime(value):
+    """
+    Calendar APIの日時（'2025-04-08T13:30:00'）をiCalendarの形式に変換する
+
+    Raises:
+        ValueError: 日時として解釈できない場合
+    """
+    return datetime.fromisoformat(value).strftime('%Y%m%dT%H%M%S')
+
+
+def event_uid(body):
+    """
+    予定の内容からUIDを求める
+    同じ予定を再度書き出して取り込んだ場合に、重複ではなく更新として扱われるようにする
+    """
+    digest = hashlib.sha1(json.dumps(body, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return f"{digest}@{UID_DOMAIN}"
+
+
+def event_to_vevent(event_data, dtstamp):
+    """
+    1件の予定をVEVENTの文字列に変換する
+
+    Args:
+        event_data: イベント情報（抽出・編集された形式）
+        dtstamp: 出力日時（UTC、'YYYYMMDDTHHMMSSZ'形式）
+
+    Returns:
+        VEVENTの文字列（CRLF区切り）
+    """
+    body = build_event_body(event_data)
+
+    lines = ['BEGIN:VEVENT', f"UID:{event_uid(body)}", f"DTSTAMP:{dtstamp}"]
+    if 'date' in body['start']:
+        # 終日イベント（終了日は翌日で、登録時と同じ規則）
+        lines.append(f"DTSTART;VALUE=DATE:{_format_date(body['start']['date'])}")
+        lines.append(f"DTEND;VALUE=DATE:{_format_date(body['end']['date'])}")
+    else:
+        lines.append(f"DTSTART;TZID={TIMEZONE_ID}:{_format_datetime(body['start']['dateTime'])}")
+        lines.append(f"DTEND;TZID={TIMEZONE_ID}:{_format_datetime(body['end']['dateTime'])}")
+    # 繰り返し予定のRRULEとEXDATEはCalendar APIと同じ行をそのまま出力する
+    lines.extend(body.get('recurrence', []))
+    lines.append(f"SUMMARY:{escape_text(body['summary'])}")
+    if body.get('description'):
+        lines.append(f"DESCRIPTION:{escape_text(body['description'])}")
+    if body.get('location'):
+        lines.append(f"LOCATION:{escape_text(body['location'])}")
+    lines.append('END:VEVENT')
+
+    return ''.join(fold_line(line) for line in lines)
+
+
+def generate_ics(events, calendar_name='学校プリント'):
+    """
+    予定のリストからiCalendarファイルを少しずつ生成する
+    予定1件ごとに文字列を返すため、件数が多くてもファイル全体をメモリに保持しない
+
+    Args:
+        events: イベント情報のリスト（またはイテレータ）
+        calendar_name: カレンダー名
+
+    Yields:
+        iCalendarファイルの断片（UTF-8の文字列）
+    """
+    dtstamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+    header = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODUCT_ID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{escape_text(calendar_name)}",
+        f'X-WR-TIMEZONE:{TIMEZONE_ID}',
+    ] + VTIMEZONE_LINES
+    yield ''.join(fold_line(line) for line in header)
+
+    exported = 0
+    skipped = 0
+    for event_data in events:
+        try:
+            vevent = event_to_vevent(event_data, dtstamp)
+        except (KeyError, ValueError) as e:
+            # 日付が不正な予定は飛ばし、他の予定は出力する
+            logger.warning(f"ICSに出力できない予定を除外しました: {e}")
+            skipped += 1
+            continue
+        exported += 1
+        yield vevent
+
+    yield fold_line('END:VCALENDAR')
+    logger.info(f"ICSファイルを出力しました: {exported}件（除外: {skipped}件）")
@@ -0,0 +1,93 @@
+"""
+レイアウト情報モジュール
+Vision APIの full_text_annotation から単語ごとの文字列と位置を取り出し、
+Protocol Buffersのオブジェクトを保持せずに配列でコンパクトに保持します
+"""
+import sys
+from array import array
+
+
+class WordLayout:
+    """
+    単語ごとの文字列・ページ番号・外接矩形を配列で保持するクラス
+
+    座標はページの左上を原点とした絶対値（画像はピクセル、PDFはポイント）で、
+    同じページ内であれば縦横の長さを比較できます。
+    i番目の単語の文字列は text[offsets[i]:offsets[i + 1]] です。
+    """
+
+    __slots__ = ('text', 'offsets', 'pages', 'x0', 'y0', 'x1', 'y1')
+
+    def __init__(self):
+        self.text = ''
+        self.offsets = array('I', [0])
+        self.pages = array('H')
+        self.x0 = array('f')
+        self.y0 = array('f')
+        self.x1 = array('f')
+        self.y1 = array('f')
+
+    def __len__(self):
+        return len(self.pages)
+
+    def word(self, index):
+        """
+        単語の文字列を返す
+        """
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def nbytes(self):
+        """
+        保持しているデータのおおよそのバイト数
+        """
+        arrays = (self.offsets, self.pages, self.x0, self.y0, self.x1, self.y1)
+        return sys.getsizeof(self.text) + sum(a.itemsize * len(a) for a in arrays)
+
+    @classmethod
+    def from_annotations(cls, annotations):
+        """
+        Vision APIの full_text_annotation（TextAnnotation）から単語の配置を取り出す
+
+        Args:
+            annotations: TextAnnotationのリスト（PDFはページごとに1つずつ）
+
+        Returns:
+            WordLayout
+        """
+        layout = cls()
+        parts = []
+        length = 0
+        page_index = 0
+        for annotation in annotations:
+            # proto-plusのラッパーは属性の参照が遅いため、Protocol Buffersのメッセージを直接読む
+            pb = getattr(type(annotation), 'pb', None)
+            if pb is not None:
+                annotation = pb(annotation)
+            for page in annotation.pages:
+                width = page.width or 1
+                height = page.height or 1
+                for block in page.blocks:
+                    for paragraph in block.paragraphs:
+                        for word in paragraph.words:
+                            text = ''.join(symbol.text for symbol in word.symbols)
+                            box = word.bounding_box
+                            # 画像はピクセル単位、PDFはページに対する割合で返される
+                            if box.normalized_vertices:
+                                xs = [v.x * width for v in box.normalized_vertices]
+                                ys = [v.y * height for v in box.normalized_vertices]
+                            else:
+                                xs = [v.x for v in box.vertices]
+                                ys = [v.y for v in box.vertices]
+                            if not text or not xs:
+                                continue
+                            parts.append(text)
+                            length += len(text)
+                            layout.offsets.append(length)
+                            layout.pages.append(page_index)
+                            layout.x0.append(min(xs))
+                            layout.y0.append(min(ys))
+                            layout.x1.append(max(xs))
+                            layout.y1.append(max(ys))
+                page_index += 1
+        layout.text = ''.join(parts)
+        return layout
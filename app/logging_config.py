@@ -1,60 +1,158 @@
 """
 ロギング設定モジュール
+ログ出力はQueueHandler経由でキューに積み、プロセスごとに1つの
+バックグラウンドスレッド（QueueListener）がファイル・標準出力へ書き込みます
 """
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from app.config import LOG_LEVEL, LOG_DIR
+from app.tracing import RequestIdFilter
 
-def setup_logging(app):
+TRACE_LOGGER_NAME = 'app.tracing'
+
+# プロセス内で共有するログキューとリスナー
+_log_queue = None
+_listener = None
+_listener_pid = None
+
+
+class _TraceRecordFilter(logging.Filter):
     """
-    アプリケーションのロギング設定を行います
-    
-    Args:
-        app: Flaskアプリケーションインスタンス
+    スパンログ（app.tracing）のみ、またはそれ以外のみを通すフィルタ
+    """
+    def __init__(self, trace_only):
+        super().__init__()
+        self.trace_only = trace_only
+
+    def filter(self, record):
+        is_trace = record.name == TRACE_LOGGER_NAME or record.name.startswith(TRACE_LOGGER_NAME + '.')
+        return is_trace == self.trace_only
+
+
+def _build_handlers(log_dir, log_level):
+    """
+    バックグラウンドスレッドで実行される出力先ハンドラを作成する
     """
-    # ログレベルの設定
-    log_level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
-    
     # ログフォーマットの設定
     log_format = logging.Formatter(
-        '%(asctime)s [%(levelname)s] %(name)s - %(message)s'
+        '%(asctime)s [%(levelname)s] [%(request_id)s] %(name)s - %(message)s'
     )
-    
-    # ルートロガーの設定
-    root_logger = logging.getLogger()
-    root_logger.setLevel(log_level)
-    
-    # 既存のハンドラをクリア
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-    
+    app_only = _TraceRecordFilter(trace_only=False)
+    trace_only = _TraceRecordFilter(trace_only=True)
+
     # 標準出力ハンドラの設定
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(log_format)
     console_handler.setLevel(log_level)
-    root_logger.addHandler(console_handler)
-    
+    console_handler.addFilter(app_only)
+
     # ファイル出力ハンドラの設定
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
-    
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
     # 1つのファイルは10MBまで、最大5ファイルをローテーション
     file_handler = RotatingFileHandler(
-        os.path.join(LOG_DIR, 'app.log'),
+        os.path.join(log_dir, 'app.log'),
         maxBytes=10 * 1024 * 1024,  # 10MB
         backupCount=5
     )
     file_handler.setFormatter(log_format)
     file_handler.setLevel(log_level)
-    root_logger.addHandler(file_handler)
-    
-    # Flaskアプリのロガーをセットアップされたロガーにリンクさせる
-    app.logger.handlers = root_logger.handlers
-    
+    file_handler.addFilter(app_only)
+
+    # スパンログはJSONL形式で専用ファイルに出力（app.logには混ぜない）
+    trace_handler = RotatingFileHandler(
+        os.path.join(log_dir, 'trace.log'),
+        maxBytes=10 * 1024 * 1024,  # 10MB
+        backupCount=5
+    )
+    trace_handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_handler.addFilter(trace_only)
+
+    return [console_handler, file_handler, trace_handler]
+
+
+def start_log_listener():
+    """
+    現在のプロセスでログ書き込み用のバックグラウンドスレッドを開始する
+    gunicornのpreload時など、fork後の子プロセスで呼び出し直す必要があります
+    """
+    global _listener, _listener_pid
+
+    if _listener is None or _listener_pid == os.getpid():
+        return
+
+    # fork後の子プロセスではリスナースレッドが存在しないため作り直す
+    _listener = QueueListener(_log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+@atexit.register
+def stop_log_listener():
+    """
+    キューに残っているログを書き出してからバックグラウンドスレッドを停止する
+    """
+    global _listener_pid
+
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener_pid = None
+
+
+def setup_logging(app, log_dir=None):
+    """
+    アプリケーションのロギング設定を行います
+
+    Args:
+        app: Flaskアプリケーションインスタンス
+        log_dir: ログの出力先ディレクトリ（Noneの場合は設定ファイルの値）
+    """
+    global _log_queue, _listener, _listener_pid
+
+    # ログレベルの設定
+    log_level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
+
+    # 再設定時は既存のリスナーを停止
+    stop_log_listener()
+
+    # ルートロガーの設定
+    root_logger = logging.getLogger()
+    root_logger.setLevel(log_level)
+
+    # 既存のハンドラをクリア
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+
+    # リクエストスレッドではキューに積むだけにする
+    # リクエストIDはコンテキスト変数なので、キューに積む前に付与する
+    _log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(_log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    root_logger.addHandler(queue_handler)
+
+    # スパンログはデバッグ設定に関係なく出力する
+    logging.getLogger(TRACE_LOGGER_NAME).setLevel(logging.INFO)
+
+    _listener = QueueListener(
+        _log_queue,
+        *_build_handlers(log_dir or LOG_DIR, log_level),
+        respect_handler_level=True
+    )
+    _listener.start()
+    _listener_pid = os.getpid()
+
+    # Flaskアプリのロガーはルートロガーに伝播させる
+    app.logger.handlers = []
+    app.logger.propagate = True
+
     # Werkzeugロガーの設定（フラスクの内部ロガー）
     werkzeug_logger = logging.getLogger('werkzeug')
     werkzeug_logger.setLevel(log_level)
-    werkzeug_logger.handlers = root_logger.handlers
-    
+    werkzeug_logger.handlers = []
+    werkzeug_logger.propagate = True
+
     app.logger.info("ロギングの設定が完了しました")
@@ -4,31 +4,49 @@
 """
 import os
 import json
+import math
+import hashlib
 import logging
 import uuid
 import tempfile
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import (
+    Flask, render_template, request, redirect, url_for, flash, session, jsonify,
+    Response, stream_with_context, make_response
+)
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from datetime import datetime
-from google_auth_oauthlib.flow import Flow  # Flow クラスのインポートを追加
 from flask_session import Session  # Flask-Sessionをインポート
 
 # 自作モジュールのインポート
 from app.config import (
-    SECRET_KEY, UPLOAD_FOLDER, ALLOWED_EXTENSIONS, GOOGLE_APPLICATION_CREDENTIALS,
-    VISION_API_ENABLED, GEMINI_API_KEY, GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, SCOPES, APP_BASE_URL,
-    SESSION_TYPE, PERMANENT_SESSION_LIFETIME
+    SECRET_KEY, UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_CONTENT_LENGTH, SCOPES,
+    SESSION_TYPE, PERMANENT_SESSION_LIFETIME,
+    REQUIRE_LOGIN_FOR_UPLOAD, CONFIRM_PAGE_SIZE, EVENTS_API_MAX_LIMIT, HISTORY_PAGE_SIZE,
+    RECURRENCE_DETECTION_ENABLED, REGISTRATION_POLL_INTERVAL_MS, MEMORY_PROFILING_ENABLED,
+    PDF_MAX_PAGES, REGISTRATION_CONCURRENCY
 )
 from app.logging_config import setup_logging
-from app.ocr import OCRProcessor
-from app.text_analysis import TextAnalyzer
-from app.calendar_api import CalendarService
+from app.tracing import start_trace, end_trace, span, current_request_id, set_attribute
+from app.warmup import start_warmup, readiness
+from app.ics import generate_ics
+from app.recurrence import collapse_recurring, expand_recurring
+from app import assets, metrics, memory_profile
+from app.event_store import VersionConflict
+from app.history_store import RUNNING
+from app.registration import start_registration
+from app.upload_validation import validate_upload, UploadRejected
+from app.admission import AdmissionRejected, upload_admission, registration_admission
+from app.services import (
+    get_ocr_processor, get_text_analyzer, get_calendar_service, get_event_store, get_history_store,
+    get_print_index, preload_shared_state
+)
 
 # Flaskアプリケーションの初期化
 app = Flask(__name__)
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 # セッション設定
 app.config['SESSION_TYPE'] = SESSION_TYPE
@@ -43,14 +61,19 @@ Session(app)
 setup_logging(app)
 logger = logging.getLogger(__name__)
 
+# メモリプロファイリング（追跡は各ワーカーで最初のリクエストの処理時に開始する）
+if MEMORY_PROFILING_ENABLED:
+    memory_profile.start()
+
 # セッションディレクトリの作成
 os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
 logger.info(f"セッションディレクトリ: {app.config['SESSION_FILE_DIR']}")
 
-# サービスの初期化
-ocr_processor = None
-text_analyzer = None
-calendar_service = None
+# ワーカー間で共有できる状態を読み込む（外部APIのクライアントは各ワーカーで遅延初期化）
+preload_shared_state()
+
+# 静的ファイルのハッシュを含む名前のコピーと圧縮したファイルの作成（テンプレートでは asset_url を使う）
+assets.init_app(app)
 
 def allowed_file(filename):
     """
@@ -58,38 +81,50 @@ def allowed_file(filename):
     """
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def init_services():
+@app.before_request
+def start_request_trace():
     """
-    各種サービスを初期化する
+    リクエストごとのトレースを開始する
     """
-    global ocr_processor, text_analyzer, calendar_service
-    
-    try:
-        # OCRサービスの初期化
-        if VISION_API_ENABLED:
-            ocr_processor = OCRProcessor(GOOGLE_APPLICATION_CREDENTIALS)
-        
-        # テキスト解析サービスの初期化
-        if GEMINI_API_KEY:
-            text_analyzer = TextAnalyzer(GEMINI_API_KEY)
-        
-        # カレンダーサービスの初期化
-        if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET:
-            redirect_uri = f"{APP_BASE_URL}/auth/callback"
-            calendar_service = CalendarService(
-                GOOGLE_CLIENT_ID, 
-                GOOGLE_CLIENT_SECRET, 
-                redirect_uri, 
-                SCOPES
-            )
-        
-        logger.info("サービスの初期化が完了しました")
-        
-    except Exception as e:
-        logger.error(f"サービスの初期化中にエラーが発生しました: {e}")
+    # 静的ファイルとロードバランサーからのヘルスチェックはトレースしない
+    if request.endpoint in ('static', 'asset', 'healthz', 'readyz', 'metrics_endpoint'):
+        return
+    start_trace(
+        f"{request.method} {request.path}",
+        request_id=request.headers.get('X-Request-ID'),
+        method=request.method,
+        path=request.path,
+        request_bytes=request.content_length or 0
+    )
 
-# アプリケーション起動時にサービスを初期化
-init_services()
+@app.after_request
+def record_response_trace(response):
+    """
+    レスポンス情報をトレースに記録し、リクエストIDをヘッダーで返す
+    """
+    request_id = current_request_id()
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+        set_attribute('status', response.status_code)
+        set_attribute('response_bytes', response.calculate_content_length())
+    return response
+
+@app.after_request
+def redirect_for_fetch(response):
+    """
+    script.js が fetch で送信したフォームには、リダイレクトの代わりに移動先をJSONで返す
+    （fetch がリダイレクト先を読み込むと、フラッシュメッセージが表示される前に消費されるため）
+    """
+    if request.headers.get('X-Requested-With') == 'fetch' and response.status_code in (301, 302, 303, 307, 308):
+        return jsonify(redirect=response.location)
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    """
+    リクエストごとのトレースを終了する
+    """
+    end_trace(error)
 
 @app.route('/')
 def index():
@@ -102,53 +137,228 @@ def index():
     
     return render_template('index.html', authenticated=True)
 
-@app.route('/upload', methods=['POST'])
-def upload():
+def _admission_user():
     """
-    ファイルアップロードとOCR処理
-    画像とPDFの両方に対応
+    受け付け制御でユーザーを区別する識別子（GoogleアカウントのOAuthのsub。ログイン前はセッションか接続元）
+    """
+    user_sub = session.get('user_sub')
+    if user_sub:
+        return user_sub
+    sid = getattr(session, 'sid', None)
+    return f"session:{sid}" if sid else f"addr:{request.remote_addr}"
+
+def _upload_cost(info):
+    """
+    アップロードの処理の大きさ（PDFはページ数、ページ数が読み取れないPDFは上限のページ数、画像は1）
+    """
+    if info.kind == 'pdf':
+        return info.pages or PDF_MAX_PAGES
+    return 1
+
+def _get_upload_file():
+    """
+    アップロードリクエストを検証する
+    
+    Returns:
+        (アップロードされたファイル, 検証したファイルの情報, エラー時のレスポンス)
     """
     # 認証チェック
-    if 'credentials' not in session:
+    if REQUIRE_LOGIN_FOR_UPLOAD and 'credentials' not in session:
         flash('Googleアカウントでの認証が必要です', 'error')
-        return redirect(url_for('index'))
+        return None, None, redirect(url_for('index'))
     
     if 'file' not in request.files:
         flash('ファイルがアップロードされていません', 'error')
-        return redirect(url_for('index'))
+        return None, None, redirect(url_for('index'))
     
     file = request.files['file']
     
     if file.filename == '':
         flash('ファイルが選択されていません', 'error')
-        return redirect(url_for('index'))
+        return None, None, redirect(url_for('index'))
     
     if not allowed_file(file.filename):
+        _reject_upload('extension')
         flash('このファイル形式はサポートされていません', 'error')
-        return redirect(url_for('index'))
+        return None, None, redirect(url_for('index'))
     
+    # 保存・画像の展開・APIの呼び出しの前に、ヘッダーだけを読んで処理できないファイルを拒否する
     try:
-        # 一意のファイル名を生成
-        filename = secure_filename(file.filename)
-        file_ext = filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}.{file_ext}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        
-        # ファイルを保存
+        with span('upload.validate') as validate_span:
+            info = validate_upload(file.stream, file.filename.rsplit('.', 1)[1].lower())
+            validate_span.set_attribute('kind', info.kind)
+            validate_span.set_attribute('payload_bytes', info.size)
+    except UploadRejected as e:
+        logger.warning(f"アップロードを拒否しました（{e.reason}）: {e}")
+        _reject_upload(e.reason)
+        flash(str(e), 'error')
+        return None, None, redirect(url_for('index'))
+    
+    return file, info, None
+
+def _reject_upload(reason):
+    """
+    アップロードを拒否した回数を理由ごとに数える
+    """
+    metrics.increment('upload.rejected')
+    metrics.increment(f'upload.rejected.{reason}')
+    set_attribute('rejected', reason)
+
+def _save_upload(file):
+    """
+    アップロードされたファイルを一意の名前で保存する
+    
+    Returns:
+        (保存先のパス, 拡張子)
+    """
+    # 一意のファイル名を生成
+    filename = secure_filename(file.filename)
+    file_ext = filename.rsplit('.', 1)[1].lower()
+    unique_filename = f"{uuid.uuid4().hex}.{file_ext}"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+    
+    # ファイルを保存
+    with span('upload.save') as save_span:
         file.save(file_path)
-        logger.info(f"ファイルが保存されました: {file_path}")
+        save_span.set_attribute('payload_bytes', os.path.getsize(file_path))
+    logger.info(f"ファイルが保存されました: {file_path}")
+    _track_reupload(file_path)
+    return file_path, file_ext
+
+def _track_reupload(file_path):
+    """
+    前回のアップロードで予定を抽出できなかった後の再アップロードを数える
+    （OCRと解析をもう一度行うことになるため、抽出の失敗によって生じた無駄な処理とみなす）
+    """
+    # ファイル全体をメモリに読み込まないよう、64KBずつハッシュを計算する
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            sha256.update(block)
+    digest = sha256.hexdigest()
+    
+    metrics.increment('upload.received')
+    failed_digest = session.get('failed_upload_digest')
+    if failed_digest:
+        metrics.increment('upload.reupload_after_failure')
+        if failed_digest == digest:
+            metrics.increment('upload.reupload_same_file')
+    # 予定を抽出できた時点で消す（途中で失敗した場合も次のアップロードで数えられる）
+    session['failed_upload_digest'] = digest
+
+def _find_known_print(file_path, owner):
+    """
+    前処理した画像と同じプリントを以前に読み取っていれば、その抽出結果を返す
+    （撮り直した画像はバイト列が異なるため、知覚ハッシュで探す）
+    
+    Args:
+        file_path: 前処理した画像のパス
+        owner: アップロードしたユーザーの識別子（識別できない場合は探さない）
+    
+    Returns:
+        (画像の特徴, PrintMatch)（探さなかった場合や見つからない場合は PrintMatch がNone。
+        特徴を求められなかった場合は (None, None)）
+    """
+    print_index = get_print_index()
+    if print_index is None or not owner:
+        return None, None
+    from app.print_index import fingerprint  # PILは最初のアップロードまで読み込まない
+    try:
+        image_fingerprint = fingerprint(file_path)
+    except Exception as e:
+        logger.warning(f"画像の特徴を求められませんでした: {e}")
+        return None, None
+    return image_fingerprint, print_index.find(owner, image_fingerprint)
+
+def _remember_print(image_fingerprint, owner, extracted_text, events):
+    """
+    予定を抽出できたプリントをプリント索引に追加する
+    """
+    if image_fingerprint is None or not events:
+        return
+    try:
+        get_print_index().add(owner, image_fingerprint, extracted_text, events)
+    except Exception as e:
+        logger.warning(f"プリント索引への追加に失敗しました: {e}")
+
+def _store_known_print(known_print, file_path):
+    """
+    以前に読み取ったプリントの抽出結果を保存し、確認ページへリダイレクトする
+    """
+    set_attribute('print_reused', known_print.print_id)
+    flash('以前に読み取ったプリントと同じ内容のため、前回の読み取り結果を表示しています', 'info')
+    return _store_extraction(known_print.extracted_text, known_print.events, file_path)
+
+def _store_extraction(extracted_text, events, file_path):
+    """
+    抽出結果をセッションに保存し、確認ページへリダイレクトする
+    """
+    if not events:
+        flash('予定情報を抽出できませんでした', 'error')
+        return redirect(url_for('index'))
+    
+    # 毎週・毎月の同じ予定は繰り返し予定1件にまとめる（確認ページで解除できる）
+    if RECURRENCE_DETECTION_ENABLED:
+        collapsed = collapse_recurring(events)
+        if collapsed.series:
+            metrics.increment('recurrence.series', collapsed.series)
+            metrics.increment('recurrence.folded', collapsed.folded)
+            set_attribute('recurrence_folded', collapsed.folded)
+        events = collapsed.events
+    
+    # 抽出結果は予定ストアに保存し、セッションにはジョブIDだけを保持する
+    # （抽出に失敗した場合に備えて記録したファイルのハッシュは、登録履歴の記録に使う）
+    upload_hash = session.pop('failed_upload_digest', None)
+    job_id = get_event_store().create_job(extracted_text, events, file_path, upload_hash=upload_hash)
+    session['job_id'] = job_id
+    set_attribute('job_id', job_id)
+    
+    # 確認ページへリダイレクト
+    return redirect(url_for('confirm'))
+
+def _current_job():
+    """
+    セッションのジョブIDに対応する抽出結果を返す
+    
+    Returns:
+        (ジョブID, ジョブの情報)（抽出結果がない場合や期限切れの場合は (None, None)）
+    """
+    job_id = session.get('job_id')
+    job = get_event_store().get_job(job_id) if job_id else None
+    if job is None:
+        return None, None
+    return job_id, job
+
+@app.route('/upload', methods=['POST'])
+def upload():
+    """
+    ファイルアップロードとOCR処理
+    画像とPDFの両方に対応
+    """
+    file, info, error_response = _get_upload_file()
+    if error_response:
+        return error_response
+    
+    # OCRとGemini APIの処理の同時実行数を制限する（空きがなければ AdmissionRejected で503を返す）
+    ticket = upload_admission.acquire(_admission_user(), _upload_cost(info))
+    try:
+        file_path, file_ext = _save_upload(file)
         
         # OCR処理
+        ocr_processor = get_ocr_processor()
         if not ocr_processor:
             flash('OCRサービスが設定されていません', 'error')
             return redirect(url_for('index'))
         
         # ファイル形式によって処理を分岐
         extracted_text = ""
-        if file_ext.lower() == 'pdf':
+        layout = None
+        owner = session.get('user_sub')
+        image_fingerprint = known_print = None
+        if file_ext == 'pdf':
             try:
                 # PDFファイルの処理
-                extracted_text = ocr_processor.process_pdf(file_path)
+                extracted_text, layout = ocr_processor.process_pdf_layout(file_path)
             except ValueError as ve:
                 # PDFのページ数制限などのバリデーションエラー
                 flash(str(ve), 'error')
@@ -158,52 +368,64 @@ def upload():
             # 必要に応じて画像の前処理
             try:
                 file_path = ocr_processor.preprocess_image(file_path)
-                # OCRでテキスト抽出
-                extracted_text = ocr_processor.process_image(file_path)
+                # 撮り直した同じプリントであれば、OCRと解析を行わずに前回の結果を使う
+                image_fingerprint, known_print = _find_known_print(file_path, owner)
+                if known_print is None:
+                    # OCRでテキスト抽出
+                    extracted_text, layout = ocr_processor.process_image_layout(file_path)
             except Exception as e:
                 logger.error(f"画像処理中にエラーが発生しました: {str(e)}")
                 flash(f'画像処理中にエラーが発生しました: {str(e)}', 'error')
                 return redirect(url_for('index'))
         
+        if known_print is not None:
+            return _store_known_print(known_print, file_path)
+        
         if not extracted_text:
             flash('テキストを抽出できませんでした', 'error')
             return redirect(url_for('index'))
         
         # テキスト解析
+        text_analyzer = get_text_analyzer()
         if not text_analyzer:
             flash('テキスト解析サービスが設定されていません', 'error')
             return redirect(url_for('index'))
         
-        events = text_analyzer.extract_events(extracted_text)
-        
-        if not events:
-            flash('予定情報を抽出できませんでした', 'error')
-            return redirect(url_for('index'))
-        
-        # セッションにデータを保存
-        session['extracted_text'] = extracted_text
-        session['events'] = events
-        session['file_path'] = file_path
-        
-        # 確認ページへリダイレクト
-        return redirect(url_for('confirm'))
+        events = text_analyzer.extract_events(extracted_text, layout=layout)
+        _remember_print(image_fingerprint, owner, extracted_text, events)
+        return _store_extraction(extracted_text, events, file_path)
         
     except Exception as e:
         logger.error(f"処理中にエラーが発生しました: {e}")
         flash(f'エラーが発生しました: {str(e)}', 'error')
         return redirect(url_for('index'))
+    finally:
+        ticket.release()
 
 @app.route('/confirm')
 def confirm():
     """
     予定情報の確認ページ
     """
-    # セッションデータのチェック
-    if 'events' not in session or 'extracted_text' not in session:
+    # 抽出結果のチェック
+    # 予定とOCRテキストはページの表示後に /api/events と /api/extracted_text から読み込む
+    job_id, job = _current_job()
+    if job is None:
         flash('処理されたデータがありません', 'error')
         return redirect(url_for('index'))
     
+    # ログインしていない場合はICSファイルへの書き出しのみ行える
+    if 'credentials' not in session:
+        return render_template(
+            'confirm.html',
+            event_count=job['event_count'],
+            page_size=CONFIRM_PAGE_SIZE,
+            calendars=[],
+            calendar_available=False
+        )
+    
     # カレンダーリストの取得
+    calendar_service = get_calendar_service()
     if not calendar_service:
         flash('カレンダーサービスが設定されていません', 'error')
         return redirect(url_for('index'))
@@ -218,9 +440,11 @@ def confirm():
         
         return render_template(
             'confirm.html',
-            events=session['events'],
-            extracted_text=session['extracted_text'],
-            calendars=calendars
+            event_count=job['event_count'],
+            page_size=CONFIRM_PAGE_SIZE,
+            calendars=[{'id': cal['id'], 'summary': cal['summary'], 'primary': cal.get('primary', False)}
+                       for cal in calendars],
+            calendar_available=True
         )
         
     except Exception as e:
@@ -228,133 +452,213 @@ def confirm():
         flash(f'エラーが発生しました: {str(e)}', 'error')
         return redirect(url_for('index'))
 
-@app.route('/register', methods=['POST'])
-def register():
+EDITABLE_FIELDS = (
+    'title', 'description', 'start_date', 'end_date',
+    'start_time', 'end_time', 'location', 'all_day', 'calendar_id', 'recurring'
+)
+
+def _registration_changes():
     """
-    Googleカレンダーへの予定登録
+    確認ページから送られた変更内容を取り出す
+    
+    JSONの本文、またはフォームの changes 項目（JSON文字列）として次の形式で受け取る。
+    予定の項目の変更は /api/update_event で保存済みのため、通常は登録先カレンダーの指定と
+    選択を外した予定だけが含まれる
+        {"default_calendar_id": "...", "excluded": [除外する予定のインデックス, ...],
+         "events": {"インデックス": {"項目": 値, ...}, ...}}
+    
+    Returns:
+        変更内容の辞書（形式が正しくない場合はNone）
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is None:
+        try:
+            data = json.loads(request.form.get('changes') or '{}')
+        except ValueError:
+            return None
+        data.setdefault('default_calendar_id', request.form.get('default_calendar_id'))
+    if not isinstance(data, dict) or not isinstance(data.get('events', {}), dict):
+        return None
+    return data
+
+def _collect_selected_events(require_calendar=True):
+    """
+    確認ページから送られた変更内容を予定ストアの予定に適用し、登録対象のイベントを取り出す
+    
+    Args:
+        require_calendar: デフォルトカレンダーの選択を必須にするか（ICS出力では不要）
+    
+    Returns:
+        (選択されたイベントのリスト, デフォルトカレンダーID, エラー時のレスポンス)
     """
-    # セッションデータのチェック
-    if 'events' not in session:
+    # 抽出結果のチェック
+    job_id, job = _current_job()
+    if job is None:
         flash('登録するイベントがありません', 'error')
-        return redirect(url_for('index'))
+        return None, None, redirect(url_for('index'))
+    
+    changes = _registration_changes()
+    if changes is None:
+        flash('無効なリクエストデータです', 'error')
+        return None, None, redirect(url_for('confirm'))
     
     # デフォルトカレンダーIDの取得
-    default_calendar_id = request.form.get('default_calendar_id')
-    if not default_calendar_id:
+    default_calendar_id = changes.get('default_calendar_id')
+    if require_calendar and not default_calendar_id:
         flash('デフォルトカレンダーが選択されていません', 'error')
-        return redirect(url_for('confirm'))
+        return None, None, redirect(url_for('confirm'))
     
-    # イベントの選択状態を取得
-    events = session['events']
-    selected_indices = request.form.getlist('selected_events')
+    # 変更された項目だけを反映する
+    events, _ = get_event_store().list_events(job_id)
+    for key, fields in changes.get('events', {}).items():
+        try:
+            event = events[int(key)]
+        except (ValueError, IndexError):
+            continue
+        if isinstance(fields, dict):
+            event.update({field: value for field, value in fields.items() if field in EDITABLE_FIELDS})
     
-    # 修正されたイベント情報を取得
+    # 選択を外した予定を除き、繰り返しを解除した予定は1回ずつの予定に戻す
+    excluded = {str(i) for i in changes.get('excluded', [])}
+    selected_events = []
     for i, event in enumerate(events):
-        str_i = str(i)
-        if str_i in selected_indices:
-            event['title'] = request.form.get(f'title_{i}', event.get('title', ''))
-            event['description'] = request.form.get(f'description_{i}', event.get('description', ''))
-            event['start_date'] = request.form.get(f'start_date_{i}', event.get('start_date', ''))
-            event['end_date'] = request.form.get(f'end_date_{i}', event.get('end_date', ''))
-            event['start_time'] = request.form.get(f'start_time_{i}', event.get('start_time', ''))
-            event['end_time'] = request.form.get(f'end_time_{i}', event.get('end_time', ''))
-            event['location'] = request.form.get(f'location_{i}', event.get('location', ''))
-            event['all_day'] = f'all_day_{i}' in request.form
-            
-            # 個別カレンダーIDを取得
-            event['calendar_id'] = request.form.get(f'calendar_id_{i}', '')
-    
-    # 選択されたイベントのみを抽出
-    selected_events = [events[int(i)] for i in selected_indices]
+        if str(i) in excluded:
+            continue
+        if event.get('recurrence') and str(event.get('recurring', True)).lower() == 'false':
+            selected_events.extend(expand_recurring(event))
+        else:
+            selected_events.append(event)
     
     if not selected_events:
         flash('登録するイベントが選択されていません', 'error')
+        return None, None, redirect(url_for('confirm'))
+    
+    return selected_events, default_calendar_id, None
+
+@app.route('/register', methods=['POST'])
+def register():
+    """
+    Googleカレンダーへの予定登録
+    登録はバックグラウンドのジョブとして開始し、すぐに結果ページへリダイレクトする
+    （結果ページは /api/registrations/<ジョブID> から進捗と結果を受け取る）
+    """
+    selected_events, default_calendar_id, error_response = _collect_selected_events()
+    if error_response:
+        return error_response
+    
+    calendar_service = get_calendar_service()
+    if not calendar_service:
+        flash('カレンダーサービスが設定されていません', 'error')
         return redirect(url_for('confirm'))
     
+    job_id, job = _current_job()
+    history_store = get_history_store()
+    
+    # 同じ抽出結果の登録が実行中の場合は、重複して登録せずに進捗を表示する
+    _, progress = history_store.progress(job_id, limit=0)
+    if progress and progress['status'] == RUNNING:
+        flash('この予定は登録中です', 'info')
+        return redirect(url_for('result_detail', job_id=job_id))
+    
+    # 実行中・実行待ちの登録ジョブの数を制限する（実行枠はジョブの終了時に解放される）
+    ticket = registration_admission.acquire(
+        _admission_user(), math.ceil(len(selected_events) / REGISTRATION_CONCURRENCY)
+    )
+    
+    # 結果は1件ずつ登録履歴に保存し、セッションには結果ページのジョブIDだけを保持する
     try:
-        # カレンダーサービスの再構築
-        credentials_dict = session['credentials']
-        credentials = calendar_service.credentials_from_dict(credentials_dict)
-        calendar_service.build_service(credentials)
-        
-        # カレンダー毎にイベントを件数を管理するディクショナリを初期化
-        calendar_count = {}
-        # カレンダーリストを取得して表示名をキャッシュ
-        calendars = calendar_service.get_calendar_list()
-        calendar_names = {cal['id']: cal['summary'] for cal in calendars}
-        
-        results = []
-        # イベントをカレンダー対象別に振り分け
-        for event in selected_events:
-            # カレンダーIDが設定されている場合はそれを使用、なければデフォルトを使用
-            calendar_id = event.get('calendar_id', '') or default_calendar_id
-            
-            # カレンダー名を記録
-            event['calendar_name'] = calendar_names.get(calendar_id, '不明なカレンダー')
-            
-            # イベント登録
-            try:
-                created_event = calendar_service.create_event(calendar_id, event)
-                if created_event:
-                    results.append({
-                        'success': True,
-                        'event': created_event,
-                        'original_data': event
-                    })
-                    # カレンダー別の登録件数をカウント
-                    if calendar_id in calendar_count:
-                        calendar_count[calendar_id] += 1
-                    else:
-                        calendar_count[calendar_id] = 1
-                else:
-                    results.append({
-                        'success': False,
-                        'error': 'イベントの作成に失敗しました',
-                        'original_data': event
-                    })
-            except Exception as e:
-                logger.error(f"個別イベント登録中にエラーが発生しました: {e}")
-                results.append({
-                    'success': False,
-                    'error': str(e),
-                    'original_data': event
-                })
-        
-        # 結果をセッションに保存
-        session['register_results'] = results
-        session['calendar_names'] = calendar_names
-        
-        # 成功数をカウント
-        success_count = sum(1 for r in results if r['success'])
-        
-        # カレンダー別の登録状況をメッセージに追加
-        calendar_info = '\n'.join([f"{calendar_names.get(cal_id, '不明なカレンダー')}: {count}件" for cal_id, count in calendar_count.items()])
-        flash(f'{len(selected_events)}件中{success_count}件のイベントが登録されました\n{calendar_info}', 'success')
-        
-        return redirect(url_for('result'))
-        
-    except Exception as e:
-        logger.error(f"イベント登録処理中にエラーが発生しました: {e}", exc_info=True)
-        flash(f'エラーが発生しました: {str(e)}', 'error')
-        return redirect(url_for('confirm'))
+        batch_id = history_store.start(session.get('user_sub'), job_id, job['upload_hash'], selected_events)
+        start_registration(
+            batch_id, calendar_service, session['credentials'], default_calendar_id, selected_events,
+            history_store, request_id=current_request_id(), ticket=ticket
+        )
+    except Exception:
+        ticket.release()
+        raise
+    session['result_job_id'] = job_id
+    set_attribute('events', len(selected_events))
+    
+    return redirect(url_for('result_detail', job_id=job_id))
+
+@app.route('/export.ics', methods=['POST'])
+def export_ics():
+    """
+    選択された予定をiCalendar（.ics）ファイルとして書き出す
+    Calendar APIは呼び出さず、予定1件ずつ生成しながら送信する
+    """
+    selected_events, _, error_response = _collect_selected_events(require_calendar=False)
+    if error_response:
+        return error_response
+    
+    set_attribute('events', len(selected_events))
+    filename = f"school-events-{datetime.now().strftime('%Y%m%d')}.ics"
+    return Response(
+        stream_with_context(generate_ics(selected_events)),
+        mimetype='text/calendar',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @app.route('/result')
 def result():
     """
     登録結果ページ
     """
-    # セッションデータのチェック
-    if 'register_results' not in session:
+    # 最後に登録した結果のページへ
+    job_id = session.get('result_job_id')
+    if not job_id:
+        flash('登録結果がありません', 'error')
+        return redirect(url_for('index'))
+    return redirect(url_for('result_detail', job_id=job_id))
+
+def _registration_progress(job_id, after=0):
+    """
+    登録の進捗と結果を返す（登録したアカウントまたは登録したセッション以外にはNone）
+    """
+    owner, progress = get_history_store().progress(job_id, after)
+    
+    # 登録したアカウント以外には表示しない（アカウントを識別できない場合は登録したセッションのみ）
+    user_sub = session.get('user_sub')
+    if not progress or not ((owner and owner == user_sub) or job_id == session.get('result_job_id')):
+        return None
+    return progress
+
+@app.route('/result/<job_id>')
+def result_detail(job_id):
+    """
+    登録履歴から1回の登録の結果を表示する（登録中の場合は進捗を確認しながら結果を追加する）
+    """
+    progress = _registration_progress(job_id)
+    if progress is None:
         flash('登録結果がありません', 'error')
         return redirect(url_for('index'))
     
-    # カレンダー情報をセッションから取得
-    calendar_names = session.get('calendar_names', {})
+    return render_template(
+        'result.html',
+        job_id=job_id,
+        records=progress['records'],
+        progress=progress,
+        poll_interval=REGISTRATION_POLL_INTERVAL_MS
+    )
+
+@app.route('/history')
+def history():
+    """
+    登録履歴ページ（新しい順にページ単位で表示する）
+    """
+    user_sub = session.get('user_sub')
+    if not user_sub:
+        flash('登録履歴を表示するにはGoogleアカウントでログインしてください', 'error')
+        return redirect(url_for('index'))
     
+    page = max(request.args.get('page', 1, type=int), 1)
+    total, entries = get_history_store().history(user_sub, (page - 1) * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE)
+    for entry in entries:
+        entry['registered_at'] = datetime.fromtimestamp(entry['registered_at']).strftime('%Y-%m-%d %H:%M')
     return render_template(
-        'result.html', 
-        results=session['register_results'],
-        calendar_names=calendar_names
+        'history.html',
+        entries=entries,
+        page=page,
+        page_count=max((total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE, 1)
     )
 
 @app.route('/auth')
@@ -362,6 +666,7 @@ def auth():
     """
     Google認証の開始
     """
+    calendar_service = get_calendar_service()
     if not calendar_service:
         flash('カレンダーサービスが設定されていません', 'error')
         return redirect(url_for('index'))
@@ -411,7 +716,8 @@ def auth_callback():
         redirect_uri = session['redirect_uri']
         scopes = session['scopes']  # session に保存された scopes を使用
         
-        # フローを作成
+        # フローを作成（起動時間短縮のため使用時に読み込む）
+        from google_auth_oauthlib.flow import Flow
         flow = Flow.from_client_secrets_file(
             client_secrets_file=client_secrets_file,
             scopes=scopes
@@ -419,11 +725,19 @@ def auth_callback():
         flow.redirect_uri = redirect_uri
         
         # 認証情報を取得
+        calendar_service = get_calendar_service()
         credentials = calendar_service.get_credentials_from_code(flow, code)
         
         # 認証情報をセッションに保存
         session['credentials'] = calendar_service.credentials_to_dict(credentials)
         
+        # 登録履歴をアカウントごとに記録するため、アカウントの識別子を保存
+        try:
+            session['user_sub'] = calendar_service.user_id_from_credentials(credentials)
+        except Exception as e:
+            logger.warning(f"IDトークンからアカウントを識別できませんでした: {e}")
+            session.pop('user_sub', None)
+        
         flash('Googleアカウントでの認証が完了しました', 'success')
         return redirect(url_for('index'))
         
@@ -440,6 +754,8 @@ def logout():
     # 認証情報をセッションから削除
     if 'credentials' in session:
         del session['credentials']
+    session.pop('user_sub', None)
+    session.pop('result_job_id', None)
     
     flash('ログアウトしました', 'success')
     return redirect(url_for('index'))
@@ -455,6 +771,7 @@ def api_calendars():
     
     try:
         # カレンダーサービスの再構築
+        calendar_service = get_calendar_service()
         credentials_dict = session['credentials']
         credentials = calendar_service.credentials_from_dict(credentials_dict)
         calendar_service.build_service(credentials)
@@ -468,13 +785,66 @@ def api_calendars():
         logger.error(f"カレンダーリスト取得中にエラーが発生しました: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/events')
+def api_events():
+    """
+    抽出された予定をページ単位で返すAPI（確認ページの予定一覧の読み込みに使用）
+    
+    Query Parameters:
+        offset: 先頭から読み飛ばす件数
+        limit: 返す件数（上限は EVENTS_API_MAX_LIMIT）
+    """
+    job_id, job = _current_job()
+    if job is None:
+        return jsonify({'error': 'イベントデータがありません'}), 400
+    
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', CONFIRM_PAGE_SIZE, type=int), 1), EVENTS_API_MAX_LIMIT)
+    events, versions = get_event_store().list_events(job_id, offset, limit)
+    return jsonify({
+        'total': job['event_count'],
+        'offset': offset,
+        'events': [
+            {'index': offset + i, 'version': version, 'event': event}
+            for i, (event, version) in enumerate(zip(events, versions))
+        ]
+    })
+
+@app.route('/api/extracted_text')
+def api_extracted_text():
+    """
+    OCRで抽出されたテキストを返すAPI（確認ページで表示するときだけ読み込む）
+    """
+    _, job = _current_job()
+    if job is None:
+        return jsonify({'error': 'イベントデータがありません'}), 400
+    return Response(job['extracted_text'], mimetype='text/plain')
+
+@app.route('/api/registrations/<job_id>')
+def api_registration_progress(job_id):
+    """
+    登録の進捗と、まだ受け取っていない登録結果を返すAPI（結果ページの進捗表示に使用）
+    
+    Query Parameters:
+        after: 取得済みの結果の件数（これより後の結果だけを返す）
+    """
+    progress = _registration_progress(job_id, max(request.args.get('after', 0, type=int), 0))
+    if progress is None:
+        return jsonify({'error': '登録結果がありません'}), 404
+    
+    progress['records'] = [
+        dict(record._asdict(), all_day=bool(record.all_day)) for record in progress.pop('records')
+    ]
+    return jsonify(progress)
+
 @app.route('/api/update_event', methods=['POST'])
 def api_update_event():
     """
     イベント情報を更新するAPI
     """
-    # セッションデータのチェック
-    if 'events' not in session:
+    # 抽出結果のチェック
+    job_id, job = _current_job()
+    if job is None:
         return jsonify({'error': 'イベントデータがありません'}), 400
     
     # リクエストデータの取得
@@ -485,38 +855,110 @@ def api_update_event():
     try:
         # イベント情報の更新
         index = int(data['index'])
-        events = session['events']
         
-        if index < 0 or index >= len(events):
+        if index < 0 or index >= job['event_count']:
             return jsonify({'error': '無効なイベントインデックスです'}), 400
         
         # 更新可能なフィールド
         update_fields = [
             'title', 'description', 'start_date', 'end_date', 
-            'start_time', 'end_time', 'location', 'all_day'
+            'start_time', 'end_time', 'location', 'all_day', 'recurring'
         ]
+        fields = {field: data[field] for field in update_fields if field in data}
+        
+        # 変更された予定1件だけを検証して保存する（versionを指定すると他の更新との競合を検出する）
+        validator = get_text_analyzer()
+        try:
+            event, version, errors = get_event_store().update_event(
+                job_id, index, fields,
+                expected_version=data.get('version'),
+                validate=validator.validate_event if validator else None
+            )
+        except VersionConflict as e:
+            return jsonify({'error': str(e), 'event': e.event, 'version': e.version}), 409
         
-        # フィールドの更新
-        for field in update_fields:
-            if field in data:
-                events[index][field] = data[field]
-        
-        # バリデーション
-        validator = text_analyzer
-        is_valid, errors = validator.validate_event(events[index])
-        
-        if not is_valid:
+        if errors:
             return jsonify({'error': 'バリデーションエラー', 'details': errors}), 400
         
-        # 更新したイベントリストをセッションに保存
-        session['events'] = events
-        
-        return jsonify({'success': True, 'event': events[index]})
+        return jsonify({'success': True, 'event': event, 'version': version})
         
     except Exception as e:
         logger.error(f"イベント更新中にエラーが発生しました: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/healthz')
+def healthz():
+    """
+    死活監視用のエンドポイント（プロセスが応答できれば成功）
+    """
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """
+    準備完了の確認用エンドポイント
+    外部APIへの接続の準備が終わるまでは503を返し、ロードバランサーが振り分けないようにする
+    """
+    # gunicorn以外で起動した場合は最初の確認時にウォームアップを開始する
+    start_warmup()
+    state = readiness()
+    return jsonify(state), (200 if state['ready'] else 503)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    現在のワーカープロセスのメトリクスを返す
+    """
+    data = metrics.snapshot()
+    counters = data['counters']
+    parsed = sum(counters.get(f"analysis.parse.{status}", 0) for status in ('ok', 'salvaged', 'failed'))
+    malformed = counters.get('analysis.parse.salvaged', 0) + counters.get('analysis.parse.failed', 0)
+    uploads = counters.get('upload.received', 0)
+    rejected = counters.get('upload.rejected', 0)
+    routed = counters.get('analysis.routing.accepted', 0) + counters.get('analysis.routing.escalated', 0)
+    data['rates'] = {
+        # 不正なJSONのうち、予定を取り出せた割合
+        'salvage_rate': counters.get('analysis.parse.salvaged', 0) / malformed if malformed else None,
+        'parse_failure_rate': counters.get('analysis.parse.failed', 0) / parsed if parsed else None,
+        'reupload_after_failure_rate': counters.get('upload.reupload_after_failure', 0) / uploads if uploads else None,
+        # 保存する前に拒否したアップロードの割合（理由ごとの内訳は upload.rejected.<理由>）
+        'upload_rejection_rate': rejected / (uploads + rejected) if uploads + rejected else None,
+        # 高速なモデルで抽出したうち、上位モデルで抽出し直した割合
+        'escalation_rate': counters.get('analysis.routing.escalated', 0) / routed if routed else None,
+    }
+    # 同時実行数の上限に達して断った割合（理由ごとの内訳は admission.<処理>.rejected.<理由>）
+    for admission in (upload_admission, registration_admission):
+        admitted = counters.get(f'admission.{admission.name}.admitted', 0)
+        shed = counters.get(f'admission.{admission.name}.rejected', 0)
+        data['rates'][f'{admission.name}_shed_rate'] = shed / (admitted + shed) if admitted + shed else None
+    data['admission'] = {admission.name: admission.snapshot()
+                         for admission in (upload_admission, registration_admission)}
+    return jsonify(data)
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_entity_too_large(e):
+    """
+    アップロードのサイズが MAX_CONTENT_LENGTH を超えた場合のエラーハンドラ
+    """
+    _reject_upload('too_large')
+    flash(f'ファイルが大きすぎます（最大{MAX_CONTENT_LENGTH // (1024 * 1024)}MB）', 'error')
+    return redirect(url_for('index'))
+
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(e):
+    """
+    同時実行数が上限に達して処理を断った場合のエラーハンドラ（503と Retry-After を返す）
+    script.js からの送信にはJSONを返し、Retry-After を基に間隔を延ばしながら再送信させる
+    """
+    message = '混み合っているため、いまは処理できません。しばらくしてからもう一度お試しください'
+    if request.headers.get('X-Requested-With') == 'fetch':
+        response = jsonify(error=message, retry_after=e.retry_after)
+    else:
+        response = make_response(render_template('error.html', error=message))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.errorhandler(404)
 def page_not_found(e):
     """
@@ -0,0 +1,315 @@
+"""
+メモリプロファイリングモジュール
+MEMORY_PROFILING_ENABLED=true の場合、tracemalloc でPythonのメモリ確保を追跡し、
+トレースのスパン（処理段階）ごとに、開始時から増えたメモリの最大値（ピーク）を記録します。
+
+- スパンの属性: mem_peak_kb（ピーク）、mem_retained_kb（終了時に残っていた増加分）、
+  rss_hwm_increase_kb（プロセスの最大常駐メモリ（RSS）が増えた量）
+- メトリクス: memory.peak_kb.<スパン名>（ルートスパンはトレース名）、memory.request.peak_kb、memory.rss_high_water_kb
+- ピークが MEMORY_REPORT_MIN_KB 以上のリクエストは、確保した場所の上位を memory_profile レコードとして出力します
+
+tracemalloc の値はプロセス全体で1つのため、1つのワーカーで複数のリクエストを同時に処理する
+（gthreadワーカー・バックグラウンド登録）と、同時に処理しているリクエストの確保が含まれたり、
+他のスレッドがピークをリセットしてピークが小さく記録されたりします。正確な値はsyncワーカー（GUNICORN_THREADS=1）で計測してください。
+PILの画素やgRPCのバッファなど、C拡張が直接確保するメモリは tracemalloc では追跡されないため、
+最大常駐メモリの増加量もあわせて記録します。
+"""
+import contextvars
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+from app.config import (
+    MEMORY_PROFILING_FRAMES, MEMORY_SAMPLE_INTERVAL_MS, MEMORY_REPORT_MIN_KB, MEMORY_REPORT_TOP_SITES
+)
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_APP_DIR = os.path.join(_ROOT, 'app') + os.sep
+# 確保した場所を記録し直す、記録したうち最大のメモリからの増加の割合
+SNAPSHOT_GROWTH = 1.2
+# 記録したうち最大のメモリに対してこの割合以上であれば、SNAPSHOT_INTERVAL 秒ごとに記録し直す
+# （先に記録したメモリが解放された後で、同じくらいのメモリを別の処理段階が確保する場合のため）
+SNAPSHOT_TOLERANCE = 0.9
+SNAPSHOT_INTERVAL = 0.5
+# 確保した場所の比較の基準（リクエストを処理していない間の状態）を取り直す間隔（秒）
+BASELINE_MAX_AGE = 60
+# 確保した場所から除くもの（tracemalloc自身とモジュールの読み込み）
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+# 現在のコンテキストで計測中のスパンの _Frame（外側から順）
+_stack = contextvars.ContextVar('memory_stack', default=())
+_lock = threading.Lock()
+_active = set()  # 処理中のリクエストのルートスパンの _Frame
+_baseline = None
+_baseline_at = 0.0
+_depth = None  # start で指定した呼び出し元の深さ（Noneの場合は無効）
+_started_pid = None
+
+
+class _Frame:
+    """
+    計測中のスパン1つ分のメモリの記録
+    """
+    __slots__ = ('base', 'peak', 'rss', 'token', 'level', 'snapshot', 'sampled', 'sampled_at')
+
+    def __init__(self, base, rss):
+        self.base = base          # 開始時に確保されていたメモリ（バイト）
+        self.peak = base          # 開始後に確保されていたメモリの最大値（バイト）
+        self.rss = rss            # 開始時のプロセスの最大常駐メモリ（KB）
+        self.token = None
+        # 以下はルートスパンのみ
+        self.level = base         # 確保した場所を記録したときのメモリの最大値
+        self.snapshot = None      # 最後に記録した確保した場所
+        self.sampled = base       # 最後に記録したときのメモリ
+        self.sampled_at = 0.0
+
+
+def start(frames=MEMORY_PROFILING_FRAMES):
+    """
+    メモリプロファイリングを有効にする（アプリの読み込み時に呼び出す）
+
+    追跡はプロセスごとに最初のスパンの開始時に始めます。モジュールの読み込みで確保されたメモリまで追跡すると、
+    確保した場所の記録（スナップショット）に数秒かかるためです。
+    """
+    global _depth
+    _depth = frames
+
+
+def is_enabled():
+    return _depth is not None
+
+
+def _ensure_started():
+    """
+    このプロセスでメモリ確保の追跡と、確保した場所を記録するスレッドを開始する
+    （forkしたワーカーではスレッドが引き継がれないため、プロセスごとに開始する）
+    """
+    global _started_pid
+
+    if _started_pid == os.getpid():
+        return
+    with _lock:
+        if _started_pid == os.getpid():
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(_depth)
+        _active.clear()
+        _take_baseline()
+        threading.Thread(target=_sample, name='memory-sampler', daemon=True).start()
+        _started_pid = os.getpid()
+    logger.info(f"メモリ確保の追跡を開始しました（呼び出し元の深さ: {_depth}, pid: {os.getpid()}）")
+
+
+def _rss_high_water_kb():
+    # Linuxでは ru_maxrss はKB単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _record_peak(frames, peak):
+    for frame in frames:
+        if peak > frame.peak:
+            frame.peak = peak
+
+
+def begin_span():
+    """
+    スパンの開始時のメモリを記録する
+
+    tracemalloc のピークはプロセスで1つのため、外側のスパンに現在までのピークを反映してからリセットし、
+    このスパンの開始後のピークを計れるようにします。
+
+    Returns:
+        _Frame（追跡していない場合はNone）
+    """
+    if _depth is None:
+        return None
+    _ensure_started()
+    current, peak = tracemalloc.get_traced_memory()
+    stack = _stack.get()
+    _record_peak(stack, peak)
+    tracemalloc.reset_peak()
+    frame = _Frame(current, _rss_high_water_kb())
+    frame.token = _stack.set(stack + (frame,))
+    return frame
+
+
+def end_span(frame, name):
+    """
+    スパンの終了時にピークを求め、メトリクスに記録する
+
+    Args:
+        frame: begin_span が返した _Frame
+        name: スパン名（メトリクス名に使う）
+
+    Returns:
+        スパンに付与する属性の辞書
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    stack = _stack.get()
+    _record_peak(stack, peak)
+    _record_peak((frame,), peak)
+    tracemalloc.reset_peak()
+    try:
+        _stack.reset(frame.token)
+    except (ValueError, RuntimeError):
+        # 開始したコンテキストと異なるコンテキストで終了した場合
+        _stack.set(tuple(f for f in stack if f is not frame))
+
+    peak_kb = round((frame.peak - frame.base) / 1024, 1)
+    metrics.observe(f"memory.peak_kb.{name}", peak_kb)
+    return {
+        'mem_peak_kb': peak_kb,
+        'mem_retained_kb': round((current - frame.base) / 1024, 1),
+        'rss_hwm_increase_kb': _rss_high_water_kb() - frame.rss,
+    }
+
+
+def _take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def _take_baseline():
+    global _baseline, _baseline_at
+    _baseline = _take_snapshot()
+    _baseline_at = time.time()
+
+
+def _sample():
+    """
+    処理中のリクエストのメモリが増えたときに、確保した場所を記録する（ワーカーごとのスレッドで実行）
+
+    ピークの瞬間の確保した場所は tracemalloc から取得できないため、MEMORY_SAMPLE_INTERVAL_MS ごとに
+    確保されているメモリを確認し、リクエストの開始時から MEMORY_REPORT_MIN_KB 以上増えていて、
+    これまでに記録した最大のメモリに近い場合にスナップショットを取ります。
+    ファイルの内容やAPIのリクエストのように、外部APIの呼び出し中に保持されるメモリは確実に記録されますが、
+    MEMORY_SAMPLE_INTERVAL_MS より短い間だけ確保されるメモリは記録されないことがあります。
+    """
+    min_bytes = MEMORY_REPORT_MIN_KB * 1024
+    while tracemalloc.is_tracing():
+        time.sleep(MEMORY_SAMPLE_INTERVAL_MS / 1000)
+        current = tracemalloc.get_traced_memory()[0]
+        with _lock:
+            active = list(_active)
+        if not active:
+            if time.time() - _baseline_at >= BASELINE_MAX_AGE:
+                _take_baseline()
+            continue
+        now = time.time()
+        targets = []
+        for frame in active:
+            used, level = current - frame.base, frame.level - frame.base
+            if used < min_bytes:
+                continue
+            if used >= level * SNAPSHOT_GROWTH or (
+                    used >= level * SNAPSHOT_TOLERANCE and now - frame.sampled_at >= SNAPSHOT_INTERVAL):
+                targets.append(frame)
+        if targets:
+            snapshot = _take_snapshot()
+            for frame in targets:
+                frame.snapshot, frame.sampled, frame.sampled_at = snapshot, current, now
+                frame.level = max(frame.level, current)
+
+
+def begin_request(frame):
+    """
+    リクエストのルートスパンを、確保した場所の記録の対象にする
+
+    Args:
+        frame: ルートスパンの _Frame（追跡していない場合はNone）
+    """
+    if frame is None:
+        return
+    with _lock:
+        _active.add(frame)
+
+
+def _short_path(filename):
+    if filename.startswith(_ROOT + os.sep):
+        return os.path.relpath(filename, _ROOT)
+    marker = f"{os.sep}site-packages{os.sep}"
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return filename
+
+
+def _top_sites(snapshot):
+    """
+    スナップショットで基準より増えていたメモリを、確保した場所（呼び出し元の並び）ごとに大きい順に返す
+
+    Returns:
+        [{'site': 確保した行, 'caller': その呼び出し元のうちapp内の行, 'size_kb', 'count'}, ...]
+    """
+    if snapshot is None:
+        return []
+    stats = snapshot.compare_to(_baseline, 'traceback') if _baseline else snapshot.statistics('traceback')
+    sites = []
+    for stat in stats:
+        size = getattr(stat, 'size_diff', stat.size)
+        if size <= 0:
+            continue
+        frames = list(stat.traceback)  # 古い呼び出し元から順
+        caller = next((f for f in reversed(frames)
+                       if f.filename.startswith(_APP_DIR) and f.filename != __file__), None)
+        sites.append({
+            'site': f"{_short_path(frames[-1].filename)}:{frames[-1].lineno}",
+            'caller': f"{_short_path(caller.filename)}:{caller.lineno}" if caller else None,
+            'size_kb': round(size / 1024, 1),
+            'count': getattr(stat, 'count_diff', stat.count),
+        })
+        if len(sites) >= MEMORY_REPORT_TOP_SITES:
+            break
+    return sites
+
+
+def request_report(trace):
+    """
+    終了したリクエストのメモリの記録をメトリクスに加え、ピークが大きい場合はレポートを作成する
+
+    Args:
+        trace: 終了したトレース（ルートスパンは finish 済み）
+
+    Returns:
+        memory_profile レコードの辞書（ピークが MEMORY_REPORT_MIN_KB 未満の場合や追跡していない場合はNone）
+    """
+    root = trace.root
+    frame = root.memory
+    if frame is None:
+        return None
+    with _lock:
+        _active.discard(frame)
+
+    peak_kb = root.attributes['mem_peak_kb']
+    metrics.observe('memory.request.peak_kb', peak_kb)
+    metrics.observe('memory.rss_high_water_kb', _rss_high_water_kb())
+    if peak_kb < MEMORY_REPORT_MIN_KB:
+        return None
+
+    stages = [
+        {'name': s.name, 'span_id': s.span_id, 'peak_kb': s.attributes['mem_peak_kb'],
+         'retained_kb': s.attributes['mem_retained_kb'], 'rss_hwm_increase_kb': s.attributes['rss_hwm_increase_kb']}
+        for s in trace.spans if s is not root and 'mem_peak_kb' in s.attributes
+    ]
+    stages.sort(key=lambda stage: stage['peak_kb'], reverse=True)
+    return {
+        'type': 'memory_profile',
+        'request_id': trace.request_id,
+        'trace': trace.name,
+        'duration_ms': root.duration_ms,
+        'peak_kb': peak_kb,
+        'retained_kb': root.attributes['mem_retained_kb'],
+        'rss_hwm_increase_kb': root.attributes['rss_hwm_increase_kb'],
+        'stages': stages,
+        'sampled_kb': round((frame.sampled - frame.base) / 1024, 1),
+        'top_sites': _top_sites(frame.snapshot),
+    }
@@ -0,0 +1,75 @@
+"""
+メトリクスモジュール
+プロセス内のカウンターと処理時間の集計を保持し、/metrics から参照できるようにします
+gunicornではワーカーごとに集計されるため、全体の値は各ワーカーの値を合計して求めてください
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+_started_at = time.time()
+
+
+def increment(name, value=1):
+    """
+    カウンターを加算する
+
+    Args:
+        name: カウンター名（'analysis.parse.ok' のようにドット区切り）
+        value: 加算する値
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, value):
+    """
+    計測値（ミリ秒など）を記録する（件数・合計・最大値のみを保持する）
+
+    Args:
+        name: 計測値の名前
+        value: 計測値
+    """
+    with _lock:
+        timing = _timings.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0})
+        timing['count'] += 1
+        timing['sum'] += value
+        timing['max'] = max(timing['max'], value)
+
+
+def snapshot():
+    """
+    現在のプロセスのメトリクスを返す
+
+    Returns:
+        {'pid', 'uptime_seconds', 'counters', 'timings'} の辞書
+        （timingsには件数・合計・最大値に加えて平均値を含む）
+    """
+    with _lock:
+        counters = dict(_counters)
+        timings = {
+            name: dict(timing, mean=timing['sum'] / timing['count'] if timing['count'] else 0.0)
+            for name, timing in _timings.items()
+        }
+    return {
+        'pid': os.getpid(),
+        'uptime_seconds': round(time.time() - _started_at, 3),
+        'counters': counters,
+        'timings': timings,
+    }
+
+
+def reset():
+    """
+    メトリクスを初期化する（gunicornのpost_forkフックやベンチマークから呼び出す）
+    """
+    global _started_at
+
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+        _started_at = time.time()
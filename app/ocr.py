@@ -2,15 +2,27 @@
 OCR処理モジュール
 Google Cloud Vision APIを使用して画像やPDFファイルからテキストを抽出します
 """
+import importlib
 import logging
 import os
 from google.cloud import vision
 from PIL import Image
 import io
 
+from app.config import TABLE_PARSER_ENABLED, UPLOAD_MAX_IMAGE_PIXELS, PDF_MAX_PAGES
+from app.tracing import traced, set_attribute, mark_error, payload_size
+from app import recording
+from app.layout import WordLayout
+
 logger = logging.getLogger(__name__)
 
+# アップロード時の検証をすり抜けた巨大な画像もPILで展開しない（上限の2倍を超えると例外になる）
+Image.MAX_IMAGE_PIXELS = UPLOAD_MAX_IMAGE_PIXELS
+
 class OCRProcessor:
+    # 単語の配置（表の読み取りに使う）を取り出すか
+    collect_layout = TABLE_PARSER_ENABLED
+    
     def __init__(self, credentials_path=None):
         """
         OCR処理クラスの初期化
@@ -22,13 +34,31 @@ class OCRProcessor:
             os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
         
         self.client = None
+        
+        # 再生モードではAPIに接続せず、フィクスチャコーパスから応答する
+        if recording.is_replay():
+            self.client = recording.ReplayVisionClient(recording.get_corpus())
+            logger.info("Vision APIをフィクスチャから再生します")
+            return
+        
         try:
-            self.client = vision.ImageAnnotatorClient()
+            self.client = recording.wrap_vision_client(vision.ImageAnnotatorClient())
             logger.info("Vision APIクライアントの初期化に成功しました")
         except Exception as e:
             logger.error(f"Vision APIクライアントの初期化に失敗しました: {e}")
             raise
     
+    def warm_up(self, timeout):
+        """
+        Vision APIへのgRPCチャネルを接続し、PDF処理用のモジュールを読み込んでおく
+        
+        Args:
+            timeout: 接続確認のタイムアウト（秒）
+        """
+        importlib.import_module('fitz')  # PyMuPDF
+        from app.warmup import wait_for_grpc_channel
+        wait_for_grpc_channel(self.client, timeout)
+    
     def process_image(self, image_path):
         """
         画像からテキストを抽出する
@@ -39,14 +69,28 @@ class OCRProcessor:
         Returns:
             抽出されたテキスト
         """
+        return self.process_image_layout(image_path)[0]
+    
+    @traced('ocr.process_image')
+    def process_image_layout(self, image_path):
+        """
+        画像からテキストと単語の配置を抽出する
+        
+        Args:
+            image_path: 処理する画像のパス
+            
+        Returns:
+            (抽出されたテキスト, WordLayout（collect_layoutが無効な場合や取り出せない場合はNone）)
+        """
         if not self.client:
             logger.error("Vision APIクライアントが初期化されていません")
-            return ""
+            return "", None
         
         try:
             # 画像ファイルの読み込み
             with open(image_path, "rb") as image_file:
                 content = image_file.read()
+            set_attribute('payload_bytes', len(content))
             
             # Vision APIで解析するためのリクエスト作成
             image = vision.Image(content=content)
@@ -57,23 +101,27 @@ class OCRProcessor:
             
             if not texts:
                 logger.warning("画像からテキストが検出されませんでした")
-                return ""
+                return "", None
             
             # 最初の要素は画像全体のテキスト
             full_text = texts[0].description
             logger.info(f"テキスト抽出に成功しました: {len(full_text)} 文字")
+            set_attribute('text_chars', len(full_text))
             
             # エラーチェック
             if response.error.message:
                 logger.error(f"テキスト検出中にエラーが発生しました: {response.error.message}")
-                return ""
+                mark_error(response.error.message)
+                return "", None
             
-            return full_text
+            return full_text, self._build_layout([response.full_text_annotation])
         
         except Exception as e:
             logger.error(f"テキスト抽出中にエラーが発生しました: {e}")
-            return ""
+            mark_error(e)
+            return "", None
     
+    @traced('ocr.process_image_bytes')
     def process_image_bytes(self, image_bytes):
         """
         画像のバイトデータからテキストを抽出する
@@ -89,6 +137,8 @@ class OCRProcessor:
             return ""
         
         try:
+            set_attribute('payload_bytes', payload_size(image_bytes))
+            
             # Vision APIで解析するためのリクエスト作成
             image = vision.Image(content=image_bytes)
             
@@ -103,18 +153,22 @@ class OCRProcessor:
             # 最初の要素は画像全体のテキスト
             full_text = texts[0].description
             logger.info(f"テキスト抽出に成功しました: {len(full_text)} 文字")
+            set_attribute('text_chars', len(full_text))
             
             # エラーチェック
             if response.error.message:
                 logger.error(f"テキスト検出中にエラーが発生しました: {response.error.message}")
+                mark_error(response.error.message)
                 return ""
             
             return full_text
         
         except Exception as e:
             logger.error(f"テキスト抽出中にエラーが発生しました: {e}")
+            mark_error(e)
             return ""
     
+    @traced('ocr.preprocess_image')
     def preprocess_image(self, image_path, output_path=None):
         """
         OCR前に画像を前処理する
@@ -144,6 +198,7 @@ class OCRProcessor:
                 
         except Exception as e:
             logger.error(f"画像の前処理中にエラーが発生しました: {e}")
+            mark_error(e)
             return image_path  # エラー時は元の画像を返す
             
     def process_pdf(self, pdf_path):
@@ -157,12 +212,28 @@ class OCRProcessor:
             str: 抽出されたテキスト
             
         Raises:
-            ValueError: PDFのページ数が5を超える場合
+            ValueError: PDFのページ数が PDF_MAX_PAGES を超える場合
             Exception: その他のエラー
         """
+        return self.process_pdf_layout(pdf_path)[0]
+    
+    @traced('ocr.process_pdf')
+    def process_pdf_layout(self, pdf_path):
+        """
+        PDFファイルからテキストと単語の配置を抽出する
+        
+        Args:
+            pdf_path (str): PDFファイルのパス
+            
+        Returns:
+            (抽出されたテキスト, WordLayout（collect_layoutが無効な場合や取り出せない場合はNone）)
+            
+        Raises:
+            ValueError: PDFのページ数が PDF_MAX_PAGES を超える場合
+        """
         if not self.client:
             logger.error("Vision APIクライアントが初期化されていません")
-            return ""
+            return "", None
             
         try:
             # PDFのページ数を確認（制限を超えるかチェック）
@@ -171,6 +242,7 @@ class OCRProcessor:
             # ファイルの内容を読み込む
             with open(pdf_path, 'rb') as pdf_file:
                 content = pdf_file.read()
+            set_attribute('payload_bytes', len(content))
             
             # リクエストの作成
             input_config = vision.InputConfig(
@@ -193,16 +265,19 @@ class OCRProcessor:
             
             # レスポンスから結果を取得
             result = ""
+            annotations = []
             for response_obj in response.responses:
                 for page in response_obj.responses:
                     result += page.full_text_annotation.text + "\n\n"
+                    annotations.append(page.full_text_annotation)
             
             if not result.strip():
                 logger.warning("PDFからテキストが検出されませんでした")
-                return ""
+                return "", None
                 
             logger.info(f"PDFからのテキスト抽出に成功しました: {len(result)} 文字")
-            return result
+            set_attribute('text_chars', len(result))
+            return result, self._build_layout(annotations)
         
         except ValueError as ve:
             # PDFページ数の制限エラーをそのまま伝播
@@ -210,7 +285,22 @@ class OCRProcessor:
             raise
         except Exception as e:
             logger.error(f"PDF処理中にエラーが発生しました: {str(e)}")
-            return ""
+            mark_error(e)
+            return "", None
+    
+    def _build_layout(self, annotations):
+        """
+        full_text_annotationから単語の配置を取り出す（失敗してもテキストの抽出は続ける）
+        """
+        if not self.collect_layout:
+            return None
+        try:
+            layout = WordLayout.from_annotations(annotations)
+        except Exception as e:
+            logger.warning(f"単語の配置を取り出せませんでした: {e}")
+            return None
+        set_attribute('layout_words', len(layout))
+        return layout
     
     def _check_pdf_page_count(self, pdf_path):
         """
@@ -220,7 +310,7 @@ class OCRProcessor:
             pdf_path (str): PDFファイルのパス
             
         Raises:
-            ValueError: PDFのページ数が5を超える場合
+            ValueError: PDFのページ数が PDF_MAX_PAGES を超える場合
         """
         try:
             import fitz  # PyMuPDF
@@ -230,9 +320,10 @@ class OCRProcessor:
             doc.close()
             
             logger.info(f"PDFのページ数: {page_count}")
+            set_attribute('pages', page_count)
             
-            if page_count > 5:
-                raise ValueError(f"PDFのページ数が制限を超えています（{page_count}ページ/最大5ページ）")
+            if page_count > PDF_MAX_PAGES:
+                raise ValueError(f"PDFのページ数が制限を超えています（{page_count}ページ/最大{PDF_MAX_PAGES}ページ）")
                 
             return page_count
         except ImportError:
@@ -0,0 +1,118 @@
+"""
+プロンプトの事前絞り込みモジュール
+OCRテキストの各行を日付・曜日・時刻・行事の手がかりで採点し、
+予定に関係する行とその前後の行だけをGemini APIに送ることでプロンプトを小さくします。
+APIを呼び出さずに正規表現だけで判定するため、1枚あたりの処理時間はごくわずかです。
+"""
+import logging
+import re
+import unicodedata
+from collections import namedtuple
+
+from app.config import PREFILTER_CONTEXT_LINES, PREFILTER_HEAD_LINES, PREFILTER_MIN_CHARS, PREFILTER_MIN_SCORE
+
+logger = logging.getLogger(__name__)
+
+# 採点に使う正規表現と点数（行はNFKC正規化してから判定するため、全角の数字・括弧も一致する）
+SIGNAL_PATTERNS = [
+    # 日付（4月8日、4/8、8日（火）など）
+    (re.compile(r'(?<!\d)\d{1,2}月\d{1,2}日|(?<![\d/])\d{1,2}/\d{1,2}(?![\d/])|(?<!\d)\d{1,2}日'), 3),
+    # 年・月（令和7年度、2025年、4月の予定など。相対日付や年の補完に必要）
+    (re.compile(r'(令和|平成)\s*(\d{1,2}|元)\s*年|(?<!\d)\d{4}\s*年|(?<!\d)\d{1,2}月'), 2),
+    # 曜日
+    (re.compile(r'\(\s*[月火水木金土日祝]\s*\)|[月火水木金土日]曜'), 2),
+    # 時刻（13:30、午後1時、9時半など）
+    (re.compile(r'(?<!\d)\d{1,2}\s*[:]\s*\d{2}|午前|午後|(?<!\d)\d{1,2}時'), 2),
+    # 相対的な日付表現
+    (re.compile(r'明日|明後日|本日|今日|当日|翌日|前日|今週|来週|再来週|今月|来月|毎週|毎月'), 2),
+    # 行事・手続きを表す語
+    (re.compile(r'行事|予定|日程|式|会|祭|参観|懇談|面談|検診|健診|測定|訓練|遠足|見学|旅行|宿泊|'
+                r'試験|テスト|授業|休業|休校|登校|下校|集金|提出|締切|締め切り|期限|延期|中止|雨天|持ち物'), 1),
+]
+
+# 絞り込みで省略した箇所に入れる印
+GAP_MARKER = '…'
+
+PrefilterResult = namedtuple('PrefilterResult', ['text', 'lines_total', 'lines_kept', 'applied'])
+
+
+def score_line(line):
+    """
+    1行の予定らしさを採点する
+
+    Args:
+        line: OCRテキストの1行
+
+    Returns:
+        手がかりごとの点数の合計（手がかりがなければ0）
+    """
+    normalized = unicodedata.normalize('NFKC', line)
+    return sum(points for pattern, points in SIGNAL_PATTERNS if pattern.search(normalized))
+
+
+def estimate_tokens(text):
+    """
+    テキストのトークン数を概算する（APIを呼び出さない推定値）
+    日本語はおおむね1文字1トークン、英数字は4文字で1トークンとして数える
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        推定トークン数
+    """
+    ascii_chars = sum(1 for char in text if char.isascii() and not char.isspace())
+    other_chars = sum(1 for char in text if not char.isascii() and not char.isspace())
+    return other_chars + (ascii_chars + 3) // 4
+
+
+def filter_text(text, context_lines=None, min_score=None, head_lines=None, min_chars=None):
+    """
+    予定に関係する行と前後の行だけを残したテキストを返す
+
+    短いテキストや、手がかりのある行が見つからないテキストはそのまま返す
+    （絞り込みで予定を取りこぼすより、プロンプトが大きい方が安全なため）
+
+    Args:
+        text: OCRで抽出されたテキスト
+        context_lines: 手がかりのある行の前後に残す行数（省略時は設定値）
+        min_score: 手がかりのある行とみなす点数の下限（省略時は設定値）
+        head_lines: 先頭から必ず残す行数（表題・発行日など、省略時は設定値）
+        min_chars: 絞り込みを行うテキストの最小文字数（省略時は設定値）
+
+    Returns:
+        PrefilterResult（text: 絞り込み後のテキスト, lines_total: 元の行数,
+        lines_kept: 残した行数, applied: 絞り込みを行ったか）
+    """
+    context_lines = PREFILTER_CONTEXT_LINES if context_lines is None else context_lines
+    min_score = PREFILTER_MIN_SCORE if min_score is None else min_score
+    head_lines = PREFILTER_HEAD_LINES if head_lines is None else head_lines
+    min_chars = PREFILTER_MIN_CHARS if min_chars is None else min_chars
+
+    lines = text.splitlines()
+    unchanged = PrefilterResult(text, len(lines), len(lines), False)
+    if len(text) < min_chars:
+        return unchanged
+
+    hits = [i for i, line in enumerate(lines) if line.strip() and score_line(line) >= min_score]
+    if not hits:
+        logger.debug("予定の手がかりが見つからないため、テキストを絞り込みません")
+        return unchanged
+
+    keep = set(range(min(head_lines, len(lines))))
+    for i in hits:
+        keep.update(range(max(0, i - context_lines), min(len(lines), i + context_lines + 1)))
+    if len(keep) == len(lines):
+        return unchanged
+
+    kept = []
+    previous = -1
+    for i in sorted(keep):
+        if i != previous + 1:
+            kept.append(GAP_MARKER)
+        kept.append(lines[i])
+        previous = i
+    if previous != len(lines) - 1:
+        kept.append(GAP_MARKER)
+
+    return PrefilterResult('\n'.join(kept), len(lines), len(keep), True)
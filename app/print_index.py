@@ -0,0 +1,303 @@
+"""
+プリント索引モジュール
+同じ紙のプリントを撮り直した画像は、ファイルの内容（バイト列）が毎回異なるためSHA-256では見分けられません。
+前処理後のグレースケール画像から知覚ハッシュ（dHash、64ビット）と縮小画像を求めて保存し、
+新しくアップロードされた画像のハッシュとのハミング距離が近いプリントを見つけた場合は、
+縮小画像どうしの差で同じプリントかを確かめてから、前回のOCRテキストと抽出した予定を再利用します。
+Vision APIとGemini APIの呼び出しを省くためです。
+
+ハッシュの検索にはユーザーごとの HammingIndex（ハッシュを分割した部分ごとの索引）を使い、
+プリントの件数によらず距離の近い候補だけを調べます。索引はプロセスごとにSQLiteの内容から作成し、
+他のワーカーが追加したプリントは検索のたびに差分だけを読み込みます。
+保持期間を過ぎたプリントは検索のたびに索引から取り除くため、索引は長く動くワーカーでも大きくなり続けません。
+"""
+import functools
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+from app.sqlite_store import SQLiteStore
+from app.tracing import traced, set_attribute
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# dHashの大きさ（横に隣り合う画素を比べるため、横は1画素多く縮小する）
+HASH_WIDTH = 8
+HASH_HEIGHT = 8
+# 同じプリントかを確かめるための縮小画像の大きさ（画素）
+THUMBNAIL_SIZE = 16
+# 文字や罫線とみなす画素の明るさの上限（コントラストを強調した後の値）
+INK_THRESHOLD = 128
+# 1回の検索で縮小画像を比べる候補の件数の上限
+MAX_CANDIDATES = 8
+
+# 画像の特徴（dhash: 64ビットの整数, thumbnail: THUMBNAIL_SIZE四方の各画素の文字や罫線の濃さのバイト列）
+Fingerprint = namedtuple('Fingerprint', ['dhash', 'thumbnail'])
+# 見つかったプリント（distance: ハッシュのハミング距離, difference: 縮小画像の画素の差の平均（0～255））
+PrintMatch = namedtuple('PrintMatch', ['print_id', 'distance', 'difference', 'extracted_text', 'events'])
+
+
+def fingerprint(image_path):
+    """
+    画像の知覚ハッシュと縮小画像を求める
+
+    Args:
+        image_path: 画像のパス（preprocess_image で前処理した画像）
+
+    Returns:
+        Fingerprint
+    """
+    with Image.open(image_path) as img:
+        # 明るさやコントラストの違いを打ち消すため、文字や罫線（黒）と紙（白）の2値にする
+        gray = ImageOps.autocontrast(img.convert('L'), cutoff=1)
+    ink = gray.point(lambda value: 0 if value < INK_THRESHOLD else 255)
+    # 撮り方による余白と位置の違いを打ち消すため、文字や罫線のある範囲だけを切り出す
+    bbox = ImageOps.invert(ink).getbbox()
+    if bbox:
+        ink = ink.crop(bbox)
+    small = ink.resize((HASH_WIDTH + 1, HASH_HEIGHT), Image.LANCZOS)
+    pixels = list(small.getdata())
+    dhash = 0
+    for y in range(HASH_HEIGHT):
+        row = pixels[y * (HASH_WIDTH + 1):(y + 1) * (HASH_WIDTH + 1)]
+        for left, right in zip(row, row[1:]):
+            dhash = (dhash << 1) | (left > right)
+    # 縮小画像は各画素が元の範囲の文字や罫線の濃さ（割合）を表す
+    thumbnail = ink.resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX).tobytes()
+    return Fingerprint(dhash, thumbnail)
+
+
+def hamming(a, b):
+    """
+    2つのハッシュのハミング距離を返す
+    """
+    return bin(a ^ b).count('1')
+
+
+def thumbnail_difference(a, b):
+    """
+    2つの縮小画像の画素の差の平均（0～255）を返す
+    """
+    size = (THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+    diff = ImageChops.difference(Image.frombytes('L', size, a), Image.frombytes('L', size, b))
+    return ImageStat.Stat(diff).mean[0]
+
+
+class HammingIndex:
+    """
+    ハミング距離でハッシュを検索する索引（multi-index hashing）
+
+    64ビットのハッシュを16ビットずつ4つに分け、それぞれの値ごとに項目を持ちます。
+    距離が max_distance 以内のハッシュは、4つのうち少なくとも1つの部分の距離が max_distance // 4 以内のため
+    （鳩の巣原理）、各部分についてその距離以内の値だけを引けば候補を漏れなく集められます。
+    引く値の数はハッシュの件数によらないため、件数が多くても全件と比べるより速く検索できます。
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self):
+        self._tables = [{} for _ in range(self.CHUNKS)]
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def _chunks(self, value):
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, value, item):
+        """
+        ハッシュと、それに対応する項目を追加する
+        """
+        self._values[item] = value
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            table.setdefault(chunk, []).append(item)
+
+    def remove(self, item):
+        """
+        項目を取り除く（存在しない場合は何もしない）
+        """
+        value = self._values.pop(item, None)
+        if value is None:
+            return
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            items = table[chunk]
+            items.remove(item)
+            if not items:
+                del table[chunk]
+
+    def search(self, value, max_distance):
+        """
+        ハミング距離が max_distance 以内の項目を返す
+
+        Returns:
+            [(距離, 項目), ...]（距離の近い順）
+        """
+        flips = _bit_flips(self.CHUNK_BITS, max_distance // self.CHUNKS)
+        seen = set()
+        found = []
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for flip in flips:
+                for item in table.get(chunk ^ flip, ()):
+                    if item in seen:
+                        continue
+                    seen.add(item)
+                    distance = hamming(value, self._values[item])
+                    if distance <= max_distance:
+                        found.append((distance, item))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+@functools.lru_cache(maxsize=None)
+def _bit_flips(bits, max_flips):
+    """
+    bitsビットの値のうち、立っているビットが max_flips 個以下のものをすべて返す
+    """
+    return tuple(
+        sum(1 << bit for bit in combination)
+        for flips in range(max_flips + 1)
+        for combination in itertools.combinations(range(bits), flips)
+    )
+
+
+class PrintIndex(SQLiteStore):
+    """
+    読み取ったプリントの特徴と抽出結果をSQLiteに保持し、近いプリントを検索するクラス
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS prints (
+        print_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        owner TEXT NOT NULL,
+        dhash TEXT NOT NULL,
+        thumbnail BLOB NOT NULL,
+        extracted_text TEXT NOT NULL,
+        events TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS prints_created_at ON prints (created_at);
+    """
+
+    def __init__(self, path, ttl, max_distance, max_difference):
+        """
+        初期化
+
+        Args:
+            path: SQLiteのデータベースファイルのパス
+            ttl: プリントを保持する秒数（これより古いプリントは再利用せず、新しいプリントの追加時に削除する）
+            max_distance: 候補とするハッシュのハミング距離の上限（0～64）
+            max_difference: 同じプリントとみなす縮小画像の画素の差の平均の上限（0～255）
+        """
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.max_difference = max_difference
+        self._indexes = {}
+        self._expiry = []  # 索引にあるプリントの (作成日時, print_id, ユーザー) のヒープ（古い順に取り除く）
+        self._last_id = 0
+        self._index_lock = threading.Lock()
+
+    def _sync(self, cutoff):
+        """
+        前回の読み込みより後に追加されたプリントを索引に追加し（他のワーカーが追加した分を含む）、
+        cutoff より前に作成されたプリントを索引から取り除く（self._index_lock を保持して呼び出す）
+        """
+        rows = self._connect().execute(
+            'SELECT print_id, owner, dhash, created_at FROM prints '
+            'WHERE print_id > ? AND created_at >= ? ORDER BY print_id',
+            (self._last_id, cutoff)
+        ).fetchall()
+        for print_id, owner, dhash, created_at in rows:
+            self._indexes.setdefault(owner, HammingIndex()).add(int(dhash, 16), print_id)
+            heapq.heappush(self._expiry, (created_at, print_id, owner))
+            self._last_id = print_id
+
+        # 期限切れのプリントはデータベースからも削除されるため、索引に残すと検索の候補を埋めてしまう
+        while self._expiry and self._expiry[0][0] < cutoff:
+            _, print_id, owner = heapq.heappop(self._expiry)
+            index = self._indexes[owner]
+            index.remove(print_id)
+            if not len(index):
+                del self._indexes[owner]
+
+    def warm_up(self, timeout=None):
+        """
+        データベースに接続し、ハッシュの索引を作成しておく（ウォームアップ用）
+        """
+        super().warm_up(timeout)
+        with self._index_lock:
+            self._sync(time.time() - self.ttl)
+
+    @traced('print_index.find')
+    def find(self, owner, image_fingerprint):
+        """
+        同じプリントを以前に読み取っていれば、その抽出結果を返す
+
+        Args:
+            owner: アップロードしたユーザーの識別子（他のユーザーのプリントは返さない）
+            image_fingerprint: アップロードされた画像の Fingerprint
+
+        Returns:
+            PrintMatch（見つからない場合はNone）
+        """
+        cutoff = time.time() - self.ttl
+        with self._index_lock:
+            self._sync(cutoff)
+            index = self._indexes.get(owner)
+            candidates = index.search(image_fingerprint.dhash, self.max_distance) if index else []
+        set_attribute('candidates', len(candidates))
+
+        conn = self._connect()
+        for distance, print_id in candidates[:MAX_CANDIDATES]:
+            # 索引を読み込んだ後に他のワーカーが削除したプリントは読み込めないため飛ばす
+            row = conn.execute(
+                'SELECT thumbnail, extracted_text, events FROM prints WHERE print_id = ? AND created_at >= ?',
+                (print_id, cutoff)
+            ).fetchone()
+            if row is None:
+                continue
+            difference = thumbnail_difference(image_fingerprint.thumbnail, row[0])
+            if difference <= self.max_difference:
+                metrics.increment('print_index.hit')
+                set_attribute('distance', distance)
+                logger.info(f"以前に読み取ったプリントと一致しました: print_id={print_id} "
+                            f"距離={distance} 差={difference:.1f}")
+                return PrintMatch(print_id, distance, difference, row[1], json.loads(row[2]))
+
+        # ハッシュは近いが縮小画像が異なる場合は、別のプリントとして読み取る
+        metrics.increment('print_index.rejected' if candidates else 'print_index.miss')
+        return None
+
+    def add(self, owner, image_fingerprint, extracted_text, events):
+        """
+        読み取ったプリントを追加する
+
+        Args:
+            owner: アップロードしたユーザーの識別子
+            image_fingerprint: 画像の Fingerprint
+            extracted_text: OCRで抽出されたテキスト
+            events: 抽出された予定のリスト（繰り返し予定にまとめる前のもの）
+
+        Returns:
+            プリントのID
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM prints WHERE created_at < ?', (now - self.ttl,))
+            cursor = conn.execute(
+                'INSERT INTO prints (owner, dhash, thumbnail, extracted_text, events, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (owner, f"{image_fingerprint.dhash:016x}", image_fingerprint.thumbnail, extracted_text,
+                 json.dumps(events, ensure_ascii=False), now)
+            )
+        return cursor.lastrowid
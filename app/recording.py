@@ -0,0 +1,304 @@
+"""
+API記録・再生モジュール
+Vision APIとGemini APIのリクエスト/レスポンスをフィクスチャコーパスに記録し、
+再生モードではネットワークに接続せずにコーパスから決定的に応答を返します
+
+コーパスの構成:
+    <FIXTURE_CORPUS_DIR>/<FIXTURE_CORPUS_VERSION>/
+        prints/<print_id>.<ext>    元のプリント（記録スクリプトでコピー）
+        prints/<print_id>.json     プリントのメタデータと正解の予定リスト
+        vision/<key>.json          Vision APIのレスポンス（送信した画像/PDFのSHA-256がキー）
+        gemini/<key>.json          Gemini APIのレスポンス（モデル名と正規化したプロンプトのSHA-256がキー）
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from app.config import (
+    API_RECORDING_MODE, FIXTURE_CORPUS_DIR, FIXTURE_CORPUS_VERSION, GEMINI_API_KEY, GOOGLE_CLIENT_SECRET
+)
+
+logger = logging.getLogger(__name__)
+
+# 記録前に取り除く秘匿情報のパターン
+SECRET_PATTERNS = [
+    re.compile(r'AIza[0-9A-Za-z_\-]{35}'),  # Google APIキー
+    re.compile(r'ya29\.[0-9A-Za-z_\-\.]+'),  # OAuthアクセストークン
+    re.compile(r'1//[0-9A-Za-z_\-]{20,}'),  # OAuthリフレッシュトークン
+    re.compile(r'GOCSPX-[0-9A-Za-z_\-]+'),  # OAuthクライアントシークレット
+]
+
+# プロンプト内の現在日付は記録時と再生時で異なるため、キーの計算から除外する
+PROMPT_DATE_PATTERN = re.compile(r'現在日付（[^）]*）')
+
+
+class FixtureNotFoundError(LookupError):
+    """
+    再生モードで対応するフィクスチャが見つからない場合のエラー
+    """
+
+
+def scrub_secrets(text):
+    """
+    文字列から認証情報などの秘匿情報を取り除く
+
+    Args:
+        text: 対象の文字列
+
+    Returns:
+        秘匿情報を置き換えた文字列
+    """
+    for secret in (GEMINI_API_KEY, GOOGLE_CLIENT_SECRET):
+        if secret:
+            text = text.replace(secret, '[REDACTED]')
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub('[REDACTED]', text)
+    return text
+
+
+def content_key(content):
+    """
+    Vision APIに送信するバイト列からフィクスチャのキーを求める
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def model_id(model_name):
+    """
+    モデル名から 'models/' の接頭辞を除く
+    """
+    return (model_name or '').rsplit('/', 1)[-1]
+
+
+def prompt_key(prompt, model_name=''):
+    """
+    Gemini APIに送信するプロンプトとモデル名からフィクスチャのキーを求める
+    （同じプロンプトでもモデルごとに応答が異なるため、モデル名もキーに含める）
+    """
+    normalized = PROMPT_DATE_PATTERN.sub('現在日付（）', prompt)
+    return hashlib.sha256(f"{model_id(model_name)}\n{normalized}".encode('utf-8')).hexdigest()
+
+
+class FixtureCorpus:
+    """
+    バージョン管理されたフィクスチャコーパス
+    """
+
+    def __init__(self, root=None, version=None):
+        self.version = version or FIXTURE_CORPUS_VERSION
+        self.path = os.path.join(root or FIXTURE_CORPUS_DIR, self.version)
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def _file(self, kind, name):
+        return os.path.join(self.path, kind, name)
+
+    def _write(self, kind, name, data):
+        path = self._file(kind, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        text = scrub_secrets(json.dumps(data, ensure_ascii=False, indent=2))
+        with self._lock:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+
+    def _read(self, kind, name):
+        cache_key = (kind, name)
+        if cache_key not in self._cache:
+            path = self._file(kind, name)
+            if not os.path.exists(path):
+                raise FixtureNotFoundError(f"フィクスチャが見つかりません: {kind}/{name}")
+            with open(path, encoding='utf-8') as f:
+                self._cache[cache_key] = json.load(f)
+        return self._cache[cache_key]
+
+    def save_vision(self, content, method, response_json):
+        self._write('vision', f"{content_key(content)}.json", {
+            'method': method,
+            'content_bytes': len(content),
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+            'response': json.loads(response_json)
+        })
+
+    def load_vision(self, content):
+        return self._read('vision', f"{content_key(content)}.json")
+
+    def save_gemini(self, prompt, prompt_version, model_name, response_text, latency_ms=None):
+        self._write('gemini', f"{prompt_key(prompt, model_name)}.json", {
+            'prompt_version': prompt_version,
+            'model': model_id(model_name),
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+            'latency_ms': latency_ms,
+            'prompt': prompt,
+            'response_text': response_text
+        })
+
+    def load_gemini(self, prompt, model_name=''):
+        return self.gemini_record(prompt_key(prompt, model_name))
+
+    def gemini_record(self, key):
+        """
+        キーを指定して記録済みのGeminiレスポンスを返す
+        """
+        return self._read('gemini', f"{key}.json")
+
+    def save_print(self, print_id, manifest):
+        self._write('prints', f"{print_id}.json", manifest)
+
+    def prints(self):
+        """
+        コーパスに含まれるプリントのメタデータを全て返す
+        """
+        directory = os.path.join(self.path, 'prints')
+        if not os.path.isdir(directory):
+            return []
+        manifests = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.json'):
+                manifest = dict(self._read('prints', name))
+                manifest['path'] = os.path.join(directory, manifest['file'])
+                manifests.append(manifest)
+        return manifests
+
+
+def _vision_types():
+    from google.cloud import vision
+    return vision
+
+
+class RecordingVisionClient:
+    """
+    Vision APIクライアントをラップし、レスポンスをコーパスに記録する
+    """
+
+    def __init__(self, client, corpus):
+        self._client = client
+        self.corpus = corpus
+
+    def text_detection(self, image=None, **kwargs):
+        response = self._client.text_detection(image=image, **kwargs)
+        self.corpus.save_vision(image.content, 'text_detection', type(response).to_json(response))
+        return response
+
+    def batch_annotate_files(self, requests=None, **kwargs):
+        response = self._client.batch_annotate_files(requests=requests, **kwargs)
+        content = requests[0].input_config.content
+        self.corpus.save_vision(content, 'batch_annotate_files', type(response).to_json(response))
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class ReplayVisionClient:
+    """
+    コーパスに記録されたVision APIのレスポンスを返すクライアント
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self._responses = {}
+
+    def _load(self, content, response_type):
+        key = content_key(content)
+        if key not in self._responses:
+            record = self.corpus.load_vision(content)
+            self._responses[key] = response_type.from_json(
+                json.dumps(record['response']), ignore_unknown_fields=True
+            )
+        return self._responses[key]
+
+    def text_detection(self, image=None, **kwargs):
+        return self._load(image.content, _vision_types().AnnotateImageResponse)
+
+    def batch_annotate_files(self, requests=None, **kwargs):
+        return self._load(requests[0].input_config.content, _vision_types().BatchAnnotateFilesResponse)
+
+
+class RecordingModel:
+    """
+    Geminiモデルをラップし、レスポンスをコーパスに記録する
+    """
+
+    def __init__(self, model, corpus, prompt_version):
+        self._model = model
+        self.corpus = corpus
+        self.prompt_version = prompt_version
+
+    def generate_content(self, prompt, **kwargs):
+        started = time.perf_counter()
+        response = self._model.generate_content(prompt, **kwargs)
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        model_name = getattr(self._model, 'model_name', '')
+        self.corpus.save_gemini(prompt, self.prompt_version, model_name, response.text, latency_ms)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class ReplayResponse:
+    """
+    再生時のGemini APIレスポンス
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+
+class ReplayModel:
+    """
+    コーパスに記録されたGemini APIのレスポンスを返すモデル
+    """
+
+    def __init__(self, corpus, model_name=''):
+        self.corpus = corpus
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        return ReplayResponse(self.corpus.load_gemini(prompt, self.model_name)['response_text'])
+
+
+def is_replay():
+    return API_RECORDING_MODE == 'replay'
+
+
+def is_recording():
+    return API_RECORDING_MODE == 'record'
+
+
+_corpus = None
+
+
+def get_corpus():
+    """
+    設定ファイルで指定されたコーパスを返す
+    """
+    global _corpus
+    if _corpus is None:
+        _corpus = FixtureCorpus()
+    return _corpus
+
+
+def wrap_vision_client(client):
+    """
+    記録モードの場合はVision APIクライアントを記録用にラップする
+    """
+    if is_recording():
+        logger.info(f"Vision APIのレスポンスを記録します: {get_corpus().path}")
+        return RecordingVisionClient(client, get_corpus())
+    return client
+
+
+def wrap_model(model, prompt_version):
+    """
+    記録モードの場合はGeminiモデルを記録用にラップする
+    """
+    if is_recording():
+        logger.info(f"Gemini APIのレスポンスを記録します: {get_corpus().path}")
+        return RecordingModel(model, get_corpus(), prompt_version)
+    return model
@@ -0,0 +1,312 @@
+"""
+繰り返し予定の検出モジュール
+抽出された予定のうち、同じ名前の予定が毎週・隔週・毎月（日付または第n曜日）の間隔で
+並んでいるものを、RRULEとEXDATEを持つ繰り返し予定1件にまとめます。
+「クラブ活動（毎週水曜日）」「集金日（毎月10日）」のようなプリントで、
+確認ページの予定の件数とCalendar APIの呼び出し回数を減らすためです。
+
+まとめた予定はCalendar APIのイベントリソースの recurrence と同じ形式の行を持ち、
+確認ページで繰り返しを解除した場合は expand_recurring で元の予定の並びに戻します。
+"""
+import json
+import logging
+import re
+import unicodedata
+from collections import namedtuple, OrderedDict
+from datetime import date, datetime, timedelta
+from math import gcd
+
+from dateutil.rrule import rrulestr
+
+from app.config import RECURRENCE_MIN_OCCURRENCES, RECURRENCE_MIN_COVERAGE
+
+logger = logging.getLogger(__name__)
+
+TIMEZONE_ID = 'Asia/Tokyo'
+WEEKDAYS = '月火水木金土日'
+RRULE_WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+# まとめる間隔の上限（これより間隔が広い予定は繰り返しとみなさない）
+MAX_WEEK_INTERVAL = 4
+MAX_MONTH_INTERVAL = 3
+# 繰り返し予定にだけ付ける項目（展開した予定からは取り除く）
+RECURRENCE_FIELDS = ('recurrence', 'recurrence_label', 'recurring')
+# まとめる予定の間で異なってよい項目（日付は規則で表し、確信度は最小値をとる）
+SERIES_VARYING_FIELDS = ('start_date', 'end_date', 'confidence')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# 検出した繰り返しの規則（expected: 規則から求めた日付のリスト）
+Rule = namedtuple('Rule', ['freq', 'interval', 'byday', 'expected', 'label'])
+CollapseResult = namedtuple('CollapseResult', ['events', 'series', 'folded'])
+
+
+def _is_all_day(event):
+    all_day = event.get('all_day', True)
+    if isinstance(all_day, str):
+        return all_day.lower() == 'true'
+    return bool(all_day)
+
+
+def _normalize_text(value):
+    """
+    OCRの読み取りで揺れやすい全角・半角と空白の違いをなくす（文字列以外はそのまま返す）
+    日本語の文中にはOCRが空白を入れたり落としたりするため、空白は詰めるのではなく取り除く
+    """
+    if not isinstance(value, str):
+        return value
+    return WHITESPACE_PATTERN.sub('', unicodedata.normalize('NFKC', value))
+
+
+def _series_key(event):
+    """
+    同じ繰り返しの予定とみなすためのキーを返す（まとめられない予定はNone）
+    日付と確信度以外の項目が、全角・半角と空白の違いを除いてすべて同じ予定だけをまとめ、
+    expand_recurring で元の予定に戻せるようにする
+    """
+    if event.get('recurrence'):
+        return None
+    try:
+        start = date.fromisoformat(event.get('start_date') or '')
+        if event.get('end_date') and date.fromisoformat(event['end_date']) != start:
+            return None  # 複数日にわたる予定はまとめない
+    except ValueError:
+        return None
+    return json.dumps({key: _normalize_text(value) for key, value in event.items()
+                       if key not in SERIES_VARYING_FIELDS},
+                      sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _interval(values):
+    """
+    連続する値の差の最大公約数を返す
+    """
+    result = 0
+    for a, b in zip(values, values[1:]):
+        result = gcd(result, b - a)
+    return result
+
+
+def _month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def _nth_weekday(month_index, weekday, nth):
+    """
+    月の第n曜日の日付を返す
+    """
+    first = date(month_index // 12, month_index % 12 + 1, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (nth - 1))
+
+
+def _weekly_rule(dates):
+    weekday = dates[0].weekday()
+    if any(d.weekday() != weekday for d in dates):
+        return None
+    weeks = _interval([d.toordinal() for d in dates]) // 7
+    if not 1 <= weeks <= MAX_WEEK_INTERVAL:
+        return None
+    span = (dates[-1] - dates[0]).days // (7 * weeks)
+    expected = [dates[0] + timedelta(weeks=weeks * i) for i in range(span + 1)]
+    if weeks == 1:
+        label = f"毎週{WEEKDAYS[weekday]}曜日"
+    elif weeks == 2:
+        label = f"隔週{WEEKDAYS[weekday]}曜日"
+    else:
+        label = f"{weeks}週ごとの{WEEKDAYS[weekday]}曜日"
+    return Rule('WEEKLY', weeks, None, expected, label)
+
+
+def _monthly_day_rule(dates):
+    day = dates[0].day
+    if day > 28 or any(d.day != day for d in dates):
+        return None  # 29日以降は月によって存在しないため扱わない
+    months = [_month_index(d) for d in dates]
+    interval = _interval(months)
+    if not 1 <= interval <= MAX_MONTH_INTERVAL:
+        return None
+    expected = [date(m // 12, m % 12 + 1, day) for m in range(months[0], months[-1] + 1, interval)]
+    label = f"毎月{day}日" if interval == 1 else f"{interval}か月ごとの{day}日"
+    return Rule('MONTHLY', interval, None, expected, label)
+
+
+def _monthly_weekday_rule(dates):
+    weekday = dates[0].weekday()
+    nth = (dates[0].day - 1) // 7 + 1
+    if nth > 4 or any(d.weekday() != weekday or (d.day - 1) // 7 + 1 != nth for d in dates):
+        return None
+    months = [_month_index(d) for d in dates]
+    interval = _interval(months)
+    if not 1 <= interval <= MAX_MONTH_INTERVAL:
+        return None
+    expected = [_nth_weekday(m, weekday, nth) for m in range(months[0], months[-1] + 1, interval)]
+    name = f"第{nth}{WEEKDAYS[weekday]}曜日"
+    label = f"毎月{name}" if interval == 1 else f"{interval}か月ごとの{name}"
+    return Rule('MONTHLY', interval, f"{nth}{RRULE_WEEKDAYS[weekday]}", expected, label)
+
+
+def detect_rule(dates, min_occurrences=None, min_coverage=None):
+    """
+    日付の並びに当てはまる繰り返しの規則を求める
+
+    Args:
+        dates: 重複のない日付（date）の昇順のリスト
+        min_occurrences: まとめる日付の件数の下限（省略時は設定値）
+        min_coverage: 規則の回数のうち実際に日付がある割合の下限（省略時は設定値）
+
+    Returns:
+        Rule（当てはまる規則がない場合はNone）。複数の規則が当てはまる場合は除外日が最も少ないもの
+    """
+    min_occurrences = RECURRENCE_MIN_OCCURRENCES if min_occurrences is None else min_occurrences
+    min_coverage = RECURRENCE_MIN_COVERAGE if min_coverage is None else min_coverage
+    if len(dates) < max(min_occurrences, 2):
+        return None
+
+    best = None
+    for detect in (_weekly_rule, _monthly_day_rule, _monthly_weekday_rule):
+        rule = detect(dates)
+        if rule is None or len(dates) / len(rule.expected) < min_coverage:
+            continue
+        if best is None or len(rule.expected) < len(best.expected):
+            best = rule
+    return best
+
+
+def recurrence_lines(rule, dates, event):
+    """
+    規則からCalendar APIの recurrence（RRULEとEXDATEの行）を作成する
+
+    Args:
+        rule: Rule
+        dates: 実際に予定がある日付のリスト
+        event: まとめる予定（時間指定の予定は除外日を開始時刻で指定する）
+    """
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval > 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.byday:
+        parts.append(f"BYDAY={rule.byday}")
+    parts.append(f"COUNT={len(rule.expected)}")
+    lines = ['RRULE:' + ';'.join(parts)]
+
+    excluded = sorted(set(rule.expected) - set(dates))
+    if excluded:
+        if _is_all_day(event):
+            lines.append('EXDATE;VALUE=DATE:' + ','.join(d.strftime('%Y%m%d') for d in excluded))
+        else:
+            start_time = (event.get('start_time') or '00:00').replace(':', '')
+            lines.append(f"EXDATE;TZID={TIMEZONE_ID}:"
+                         + ','.join(f"{d.strftime('%Y%m%d')}T{start_time}00" for d in excluded))
+    return lines
+
+
+def _collapse_group(members, min_occurrences, min_coverage):
+    """
+    同じキーの予定（(元の位置, 予定) のリスト）を繰り返し予定にまとめる
+
+    Returns:
+        [(元の位置, 予定, まとめた予定の位置のリスト), ...]（まとめられない予定はそのまま返す）
+    """
+    by_date = OrderedDict()
+    results = []
+    for position, event in sorted(members, key=lambda m: m[1]['start_date']):
+        day = date.fromisoformat(event['start_date'])
+        if day in by_date:
+            # 同じ日に重なった同じ予定は、展開したときに件数が変わらないようにまとめずに残す
+            results.append((position, event, None))
+        else:
+            by_date[day] = (position, event)
+    dates = list(by_date)
+
+    rule = detect_rule(dates, min_occurrences, min_coverage)
+    if rule is None:
+        # 曜日の異なる繰り返し（毎週月曜日と水曜日など）は曜日ごとに検出する
+        weekdays = {d.weekday() for d in dates}
+        if len(weekdays) == 1:
+            return [(position, event, None) for position, event in members]
+        for weekday in weekdays:
+            results.extend(_collapse_group(
+                [by_date[d] for d in dates if d.weekday() == weekday], min_occurrences, min_coverage
+            ))
+        return results
+
+    first_position, first = by_date[dates[0]]
+    event = dict(first)
+    event['end_date'] = event['start_date']
+    event['recurrence'] = recurrence_lines(rule, dates, first)
+    event['recurrence_label'] = f"{rule.label}（{len(dates)}回）"
+    event['recurring'] = True
+    confidences = [e['confidence'] for _, e in by_date.values() if e.get('confidence') is not None]
+    if confidences:
+        event['confidence'] = min(confidences)
+    folded = [position for position, _ in by_date.values()]
+    return [(first_position, event, folded)] + results
+
+
+def collapse_recurring(events, min_occurrences=None, min_coverage=None):
+    """
+    規則的に繰り返される予定を繰り返し予定1件にまとめる
+
+    Args:
+        events: 抽出された予定のリスト
+        min_occurrences: まとめる予定の件数の下限（省略時は設定値）
+        min_coverage: 繰り返しの回数のうち実際に予定がある割合の下限（省略時は設定値）
+
+    Returns:
+        CollapseResult（events: まとめた後の予定のリスト（元の順序を保つ）,
+        series: まとめた繰り返し予定の件数, folded: 繰り返し予定にまとめた元の予定の件数）
+    """
+    groups = OrderedDict()
+    for position, event in enumerate(events):
+        key = _series_key(event)
+        if key is not None:
+            groups.setdefault(key, []).append((position, event))
+
+    replaced = {}
+    removed = set()
+    series = 0
+    folded = 0
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        for position, event, positions in _collapse_group(members, min_occurrences, min_coverage):
+            if positions is None:
+                continue
+            replaced[position] = event
+            removed.update(p for p in positions if p != position)
+            series += 1
+            folded += len(positions)
+
+    if not series:
+        return CollapseResult(list(events), 0, 0)
+    collapsed = [replaced.get(i, event) for i, event in enumerate(events) if i not in removed]
+    logger.info(f"{folded}件の予定を{series}件の繰り返し予定にまとめました")
+    return CollapseResult(collapsed, series, folded)
+
+
+def expand_recurring(event):
+    """
+    繰り返し予定を1回ずつの予定に展開する（繰り返しとして登録しない場合に使用）
+
+    Args:
+        event: recurrence を持つ予定
+
+    Returns:
+        予定のリスト（recurrence を持たない予定はそのまま1件のリストで返す）
+    """
+    lines = event.get('recurrence') or []
+    rrule = next((line[len('RRULE:'):] for line in lines if line.startswith('RRULE:')), None)
+    if rrule is None:
+        return [event]
+
+    excluded = set()
+    for line in lines:
+        if line.startswith('EXDATE'):
+            excluded.update(value[:8] for value in line.split(':', 1)[1].split(','))
+
+    expanded = []
+    for occurrence in rrulestr(rrule, dtstart=datetime.strptime(event['start_date'], '%Y-%m-%d')):
+        if occurrence.strftime('%Y%m%d') in excluded:
+            continue
+        single = {key: value for key, value in event.items() if key not in RECURRENCE_FIELDS}
+        single['start_date'] = single['end_date'] = occurrence.strftime('%Y-%m-%d')
+        expanded.append(single)
+    return expanded
@@ -0,0 +1,176 @@
+"""
+バックグラウンド登録モジュール
+/register はカレンダーへの登録をジョブとして開始してすぐに応答し、登録はプロセスごとの
+スレッドプールで行います。1件登録するごとに結果と進捗を登録履歴ストアに書き込むため、
+結果ページは /api/registrations/<ジョブID> から進捗と結果を順に受け取れます。
+件数の多い登録でもWebワーカーを占有せず、gunicornのタイムアウトにかかりません。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import REGISTRATION_WORKERS, REGISTRATION_CONCURRENCY
+from app.tracing import start_trace, end_trace, set_attribute
+from app.async_support import gather_limited
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_registration_executor():
+    """
+    登録ジョブ用のスレッドプールを返す（プロセスごとに1つ）
+    fork後の子プロセスでは新しく作り直す
+    """
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=REGISTRATION_WORKERS,
+                    thread_name_prefix='registration'
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def shutdown(wait=True):
+    """
+    実行中の登録ジョブの終了を待ってスレッドプールを停止する（ワーカーの終了時に呼び出す）
+    """
+    global _executor
+
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None and _executor_pid == os.getpid():
+        executor.shutdown(wait=wait)
+
+
+def assign_calendar(event, default_calendar_id, calendar_names):
+    """
+    イベントの登録先カレンダーを決定し、カレンダー名を記録する
+
+    Returns:
+        登録先のカレンダーID
+    """
+    # カレンダーIDが設定されている場合はそれを使用、なければデフォルトを使用
+    calendar_id = event.get('calendar_id', '') or default_calendar_id
+
+    # カレンダー名を記録
+    event['calendar_name'] = calendar_names.get(calendar_id, '不明なカレンダー')
+    return calendar_id
+
+
+def registration_result(event, calendar_id, created_event=None, error=None):
+    """
+    1件分の登録結果を作成する
+    """
+    if created_event:
+        return {
+            'success': True,
+            'event': created_event,
+            'calendar_id': calendar_id,
+            'original_data': event
+        }
+    return {
+        'success': False,
+        'error': error or 'イベントの作成に失敗しました',
+        'calendar_id': calendar_id,
+        'original_data': event
+    }
+
+
+async def register_events(calendar_service, default_calendar_id, events, on_result, concurrency):
+    """
+    予定を concurrency 件ずつ並行してカレンダーに登録する
+
+    Args:
+        calendar_service: サービスを構築済みのCalendarService
+        default_calendar_id: 登録先が指定されていない予定のカレンダーID
+        events: 登録する予定のリスト
+        on_result: 1件登録するごとに (位置, 登録結果) で呼び出す関数
+        concurrency: 並行して行う登録の数
+
+    Returns:
+        登録結果のリスト（予定と同じ順序）
+    """
+    # カレンダーリストを取得して表示名をキャッシュ
+    calendars = await calendar_service.get_calendar_list_async()
+    calendar_names = {cal['id']: cal['summary'] for cal in calendars}
+
+    async def register_one(index, event):
+        calendar_id = assign_calendar(event, default_calendar_id, calendar_names)
+        try:
+            created_event = await calendar_service.create_event_async(calendar_id, event)
+            result = registration_result(event, calendar_id, created_event)
+        except Exception as e:
+            logger.error(f"個別イベント登録中にエラーが発生しました: {e}")
+            result = registration_result(event, calendar_id, error=str(e))
+        on_result(index, result)
+        return result
+
+    return await gather_limited([register_one(i, event) for i, event in enumerate(events)], concurrency)
+
+
+def run_registration(batch_id, calendar_service, credentials_dict, default_calendar_id, events, history_store,
+                     request_id=None, ticket=None):
+    """
+    登録ジョブの本体（登録ジョブ用のスレッドで実行する）
+
+    Args:
+        batch_id: 登録履歴ストアの登録のID
+        calendar_service: CalendarService
+        credentials_dict: セッションに保存された認証情報
+        default_calendar_id: デフォルトカレンダーID
+        events: 登録する予定のリスト
+        history_store: 結果と進捗を書き込む登録履歴ストア
+        request_id: ジョブを開始したリクエストのID（ログとトレースに引き継ぐ）
+        ticket: 受け付け制御の実行枠（ジョブの終了時に解放する）
+    """
+    start_trace('registration job', request_id=request_id, batch_id=batch_id, events=len(events))
+    started = time.perf_counter()
+    try:
+        # 認証情報とサービスはスレッドごとに保持されるため、ジョブのスレッドで構築する
+        credentials = calendar_service.credentials_from_dict(credentials_dict)
+        calendar_service.build_service(credentials)
+
+        results = asyncio.run(register_events(
+            calendar_service, default_calendar_id, events,
+            lambda index, result: history_store.add_result(batch_id, index, result),
+            REGISTRATION_CONCURRENCY
+        ))
+        history_store.finish(batch_id)
+        succeeded = sum(1 for result in results if result['success'])
+        logger.info(f"{len(events)}件中{succeeded}件のイベントが登録されました")
+        set_attribute('succeeded', succeeded)
+        metrics.increment('registration.completed')
+        end_trace()
+    except Exception as e:
+        logger.error(f"イベント登録処理中にエラーが発生しました: {e}", exc_info=True)
+        history_store.finish(batch_id, error=str(e))
+        metrics.increment('registration.failed')
+        end_trace(e)
+    finally:
+        metrics.observe('registration.job_ms', (time.perf_counter() - started) * 1000)
+        if ticket is not None:
+            ticket.release()
+
+
+def start_registration(batch_id, calendar_service, credentials_dict, default_calendar_id, events, history_store,
+                       request_id=None, ticket=None):
+    """
+    登録ジョブをバックグラウンドで開始する（引数は run_registration と同じ）
+    """
+    metrics.increment('registration.started')
+    get_registration_executor().submit(
+        run_registration, batch_id, calendar_service, credentials_dict, default_calendar_id, events,
+        history_store, request_id, ticket
+    )
@@ -0,0 +1,193 @@
+"""
+Gemini APIレスポンスの解析モジュール
+レスポンスから予定のJSON配列を取り出します。
+JSONとして解析できない場合も、完全な形で残っている予定のオブジェクトだけを取り出し、
+1件の不備でプリント全体の抽出結果が失われないようにします。
+"""
+import json
+import re
+from collections import namedtuple
+
+CODE_FENCE = '```'
+
+# 修復に使う正規表現
+TRAILING_COMMA_PATTERN = re.compile(r',\s*([}\]])')
+LINE_COMMENT_PATTERN = re.compile(r'^\s*//.*$', re.MULTILINE)
+# JSONの文字列（出力が途中で切れて閉じていないものを含む）。修復は文字列の外側にだけ行う
+STRING_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*(?:"|\Z)', re.DOTALL)
+PYTHON_LITERALS = [
+    (re.compile(r'(?<=[:\[,\s])True\b'), 'true'),
+    (re.compile(r'(?<=[:\[,\s])False\b'), 'false'),
+    (re.compile(r'(?<=[:\[,\s])None\b'), 'null'),
+]
+
+# 予定のオブジェクトとみなすキー（修復で取り出したオブジェクトのうち、いずれかを持つものだけを採用する）
+EVENT_KEYS = ('title', 'start_date')
+
+# status: 'ok'（JSONとして解析できた）, 'salvaged'（一部を修復して取り出した）, 'failed'（取り出せなかった）
+ParseResult = namedtuple('ParseResult', ['events', 'status', 'recovered', 'dropped'])
+
+
+def strip_code_fence(text):
+    """
+    コードブロックで囲まれている場合は中身だけを返す（閉じていない場合は末尾まで）
+    """
+    start = text.find(CODE_FENCE)
+    if start < 0:
+        return text.strip()
+    # 言語名（```json など）の行を飛ばす
+    newline = text.find('\n', start)
+    start = newline + 1 if newline >= 0 else start + len(CODE_FENCE)
+    end = text.find(CODE_FENCE, start)
+    return (text[start:end] if end >= 0 else text[start:]).strip()
+
+
+def _as_event_list(data):
+    """
+    解析結果を予定のリストに揃える（{"events": [...]} や単独のオブジェクトにも対応）
+    """
+    if isinstance(data, dict):
+        if isinstance(data.get('events'), list):
+            data = data['events']
+        elif any(key in data for key in EVENT_KEYS):
+            data = [data]
+        else:
+            raise ValueError('予定のオブジェクトではありません')
+    if not isinstance(data, list):
+        raise ValueError('予定の配列ではありません')
+    return [item for item in data if isinstance(item, dict)]
+
+
+def _balanced_objects(text):
+    """
+    テキスト中の対応の取れた最も外側の {...} を順に返す
+
+    Returns:
+        (オブジェクトの文字列のリスト, 末尾に残った閉じていないオブジェクトの開始位置（なければNone）)
+    """
+    objects = []
+    depth = 0
+    start = None
+    in_string = False
+    escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"' and depth > 0:
+            in_string = True
+        elif char == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == '}' and depth > 0:
+            depth -= 1
+            if depth == 0:
+                objects.append(text[start:i + 1])
+    return objects, (start if depth > 0 else None)
+
+
+def _repair_outside_string(text):
+    """
+    文字列の外側の部分の末尾のカンマとPythonのリテラルを修復する
+    """
+    text = TRAILING_COMMA_PATTERN.sub(r'\1', text)
+    for pattern, replacement in PYTHON_LITERALS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def repair_json(text):
+    """
+    LLMの出力によくあるJSONの崩れ（末尾のカンマ、行コメント、Pythonのリテラル）を修復する
+    文字列の中（"None of the above" など）は変更しない
+    """
+    text = LINE_COMMENT_PATTERN.sub('', text)
+    parts = []
+    position = 0
+    for match in STRING_PATTERN.finditer(text):
+        parts.append(_repair_outside_string(text[position:match.start()]))
+        parts.append(match.group())
+        position = match.end()
+    parts.append(_repair_outside_string(text[position:]))
+    return ''.join(parts)
+
+
+def _salvage(text):
+    """
+    JSONとして解析できないテキストから予定のオブジェクトを取り出す
+
+    Returns:
+        (取り出した予定のリスト, 取り出せなかったオブジェクトの数)
+    """
+    events = []
+    dropped = 0
+    objects, unclosed_start = _balanced_objects(text)
+    for chunk in objects:
+        try:
+            data = json.loads(repair_json(chunk))
+        except json.JSONDecodeError:
+            # 外側（{"events": [...]} など）が壊れている場合は内側のオブジェクトを探す
+            inner_events, inner_dropped = _salvage_inner(chunk[1:-1])
+            events.extend(inner_events)
+            dropped += inner_dropped
+            continue
+        candidates = data['events'] if isinstance(data, dict) and isinstance(data.get('events'), list) else [data]
+        for item in candidates:
+            if isinstance(item, dict) and any(key in item for key in EVENT_KEYS):
+                events.append(item)
+            else:
+                dropped += 1
+    if unclosed_start is not None:
+        # 出力が途中で切れた最後のオブジェクト（内側に完全な予定が残っていれば取り出す）
+        inner_events, inner_dropped = _salvage_inner(text[unclosed_start + 1:])
+        events.extend(inner_events)
+        dropped += inner_dropped
+    return events, dropped
+
+
+def _salvage_inner(text):
+    """
+    壊れたオブジェクトの内側から予定を取り出す（取り出せなければそのオブジェクト1件を失敗として数える）
+    """
+    events, dropped = _salvage(text)
+    return (events, dropped) if events else ([], 1)
+
+
+def parse_events(response_text):
+    """
+    Gemini APIのレスポンスから予定情報のリストを取り出す
+
+    Args:
+        response_text: Gemini APIのレスポンステキスト
+
+    Returns:
+        ParseResult（events: 予定のリスト, status: 'ok' / 'salvaged' / 'failed',
+        recovered: 修復して取り出した件数, dropped: 取り出せなかったオブジェクトの数）
+    """
+    text = strip_code_fence(response_text or '')
+    try:
+        events = _as_event_list(json.loads(text))
+        return ParseResult(events, 'ok', 0, 0)
+    except ValueError:
+        pass
+
+    # 前後の説明文や末尾のカンマだけの崩れは、配列全体を修復して解析する
+    start, end = text.find('['), text.rfind(']')
+    if 0 <= start < end:
+        try:
+            events = _as_event_list(json.loads(repair_json(text[start:end + 1])))
+            return ParseResult(events, 'salvaged', len(events), 0)
+        except ValueError:
+            pass
+
+    # それ以外は完全な形で残っているオブジェクトを1件ずつ取り出す
+    events, dropped = _salvage(text)
+    if events:
+        return ParseResult(events, 'salvaged', len(events), dropped)
+    return ParseResult([], 'failed', 0, dropped)
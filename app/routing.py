@@ -0,0 +1,82 @@
+"""
+モデル振り分けモジュール
+予定の抽出を高速なモデルで先に行い、結果の確信度・バリデーション・テキストの複雑さが
+設定した基準を満たさない場合だけ上位モデル（pro）で抽出し直すための判定を行います
+"""
+import copy
+
+from app.config import (
+    PREFILTER_MIN_SCORE, ROUTING_MIN_CONFIDENCE, ROUTING_MAX_INVALID_RATIO,
+    ROUTING_MAX_TEXT_CHARS, ROUTING_MAX_SCHEDULE_LINES
+)
+from app.prefilter import score_line
+
+FAST = 'fast'
+PRO = 'pro'
+TIERS = (FAST, PRO)
+
+
+def schedule_lines(text):
+    """
+    日付・時刻などの日程の手がかりがある行の数を返す（テキストの複雑さの目安）
+    """
+    return sum(1 for line in text.splitlines() if line.strip() and score_line(line) >= PREFILTER_MIN_SCORE)
+
+
+def initial_tier(text, max_text_chars=None, max_schedule_lines=None):
+    """
+    最初に使うモデルを決める
+
+    Args:
+        text: OCRで抽出されたテキスト
+        max_text_chars: 高速なモデルに任せるテキストの最大文字数（省略時は設定値）
+        max_schedule_lines: 高速なモデルに任せる日程の行数の上限（省略時は設定値）
+
+    Returns:
+        (FAST または PRO, PROを選んだ理由（FASTの場合はNone）)
+    """
+    max_text_chars = ROUTING_MAX_TEXT_CHARS if max_text_chars is None else max_text_chars
+    max_schedule_lines = ROUTING_MAX_SCHEDULE_LINES if max_schedule_lines is None else max_schedule_lines
+
+    if len(text) > max_text_chars:
+        return PRO, 'long_text'
+    if schedule_lines(text) > max_schedule_lines:
+        return PRO, 'many_schedule_lines'
+    return FAST, None
+
+
+def _confidence(event):
+    try:
+        return float(event.get('confidence'))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def escalation_reason(events, validate, min_confidence=None, max_invalid_ratio=None):
+    """
+    高速なモデルの抽出結果を上位モデルで抽出し直すべきか判定する
+
+    Args:
+        events: 高速なモデルの抽出結果（解析に失敗した場合はNone）
+        validate: 予定1件を検証する関数（TextAnalyzer.validate_event）
+        min_confidence: 確信度の下限（省略時は設定値）
+        max_invalid_ratio: バリデーションに失敗した予定の割合の上限（省略時は設定値）
+
+    Returns:
+        抽出し直す理由（'parse_failed', 'no_events', 'low_confidence', 'invalid_events'）、
+        抽出結果を採用してよい場合はNone
+    """
+    min_confidence = ROUTING_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    max_invalid_ratio = ROUTING_MAX_INVALID_RATIO if max_invalid_ratio is None else max_invalid_ratio
+
+    if events is None:
+        return 'parse_failed'
+    if not events:
+        return 'no_events'
+    if min(_confidence(event) for event in events) < min_confidence:
+        return 'low_confidence'
+    # validate_eventは既定値を書き込むため、抽出結果そのものは変更しない
+    invalid = sum(1 for event in events if not validate(copy.deepcopy(event))[0])
+    if invalid / len(events) > max_invalid_ratio:
+        return 'invalid_events'
+    return None
@@ -0,0 +1,192 @@
+"""
+サービス管理モジュール
+外部APIのクライアントを持つサービスをプロセスごとに遅延初期化します
+
+gRPCチャネルなどはfork後の子プロセスでは使えないため、gunicornの --preload で
+親プロセスがアプリを読み込む場合でも、クライアントは各ワーカーで最初に使われた時点で作成されます。
+fork前に共有してよいのは設定、コンパイル済みの正規表現、ディスカバリドキュメントなどの
+接続を持たない状態だけです（preload_shared_stateを参照）。
+"""
+import importlib
+import logging
+import os
+import threading
+
+from app.config import (
+    GOOGLE_APPLICATION_CREDENTIALS, VISION_API_ENABLED, GEMINI_API_KEY,
+    GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, SCOPES, APP_BASE_URL,
+    EVENT_STORE_PATH, PERMANENT_SESSION_LIFETIME, HISTORY_STORE_PATH,
+    PRINT_DEDUP_ENABLED, PRINT_INDEX_PATH, PRINT_INDEX_TTL_DAYS, PRINT_DEDUP_MAX_DISTANCE, PRINT_DEDUP_MAX_DIFFERENCE
+)
+
+logger = logging.getLogger(__name__)
+
+_services = {}
+_services_pid = None
+# _services と _init_locks を保護するロック（サービスの作成中は保持しない）
+_lock = threading.Lock()
+# サービス名 -> 作成中に保持するロック（時間のかかる作成が他のサービスの取得を待たせないようにする）
+_init_locks = {}
+
+
+def _create_ocr_processor():
+    if not VISION_API_ENABLED:
+        return None
+    from app.ocr import OCRProcessor
+    return OCRProcessor(GOOGLE_APPLICATION_CREDENTIALS)
+
+
+def _create_text_analyzer():
+    if not GEMINI_API_KEY:
+        return None
+    from app.text_analysis import TextAnalyzer
+    return TextAnalyzer(GEMINI_API_KEY)
+
+
+def _create_calendar_service():
+    if not (GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET):
+        return None
+    from app.calendar_api import CalendarService
+    redirect_uri = f"{APP_BASE_URL}/auth/callback"
+    return CalendarService(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, redirect_uri, SCOPES)
+
+
+def _create_event_store():
+    from app.event_store import EventStore
+    return EventStore(EVENT_STORE_PATH, ttl=PERMANENT_SESSION_LIFETIME)
+
+
+def _create_history_store():
+    from app.history_store import HistoryStore
+    return HistoryStore(HISTORY_STORE_PATH)
+
+
+def _create_print_index():
+    if not PRINT_DEDUP_ENABLED:
+        return None
+    from app.print_index import PrintIndex
+    return PrintIndex(PRINT_INDEX_PATH, ttl=PRINT_INDEX_TTL_DAYS * 86400,
+                      max_distance=PRINT_DEDUP_MAX_DISTANCE, max_difference=PRINT_DEDUP_MAX_DIFFERENCE)
+
+
+_FACTORIES = {
+    'ocr_processor': _create_ocr_processor,
+    'text_analyzer': _create_text_analyzer,
+    'calendar_service': _create_calendar_service,
+    'event_store': _create_event_store,
+    'history_store': _create_history_store,
+    'print_index': _create_print_index,
+}
+
+SERVICE_NAMES = tuple(_FACTORIES)
+
+# fork前に読み込むモジュール（Google SDKを読み込まず、コンパイル済みの正規表現を持つもの）
+PRELOAD_MODULES = (
+    'app.event_validation', 'app.prefilter', 'app.response_parser', 'app.routing', 'app.table_parser',
+)
+
+
+def _check_process():
+    """
+    fork後の子プロセスでは親プロセスが作成したサービスを破棄する
+    """
+    global _services_pid
+
+    if _services_pid != os.getpid():
+        _services.clear()
+        # 親プロセスで作成中だったロックは保持されたまま引き継がれることがあるため作り直す
+        _init_locks.clear()
+        _services_pid = os.getpid()
+
+
+def get_service(name):
+    """
+    現在のプロセスのサービスを返す（初回呼び出し時に作成する）
+
+    Args:
+        name: サービス名（'ocr_processor', 'text_analyzer', 'calendar_service', 'event_store', 'history_store'）
+
+    Returns:
+        サービスのインスタンス（設定されていない場合や初期化に失敗した場合はNone）
+    """
+    with _lock:
+        _check_process()
+        if name in _services:
+            return _services[name]
+        init_lock = _init_locks.setdefault(name, threading.Lock())
+
+    with init_lock:
+        with _lock:
+            _check_process()
+            if name in _services:
+                return _services[name]
+        # 初期化の失敗はプロセス内で一度だけ記録し、リクエストごとに再試行しない
+        try:
+            instance = _FACTORIES[name]()
+            if instance is not None:
+                logger.info(f"サービスを初期化しました: {name} (pid: {os.getpid()})")
+        except Exception as e:
+            logger.error(f"サービスの初期化中にエラーが発生しました: {name}: {e}")
+            instance = None
+        with _lock:
+            _check_process()
+            return _services.setdefault(name, instance)
+
+
+def get_ocr_processor():
+    return get_service('ocr_processor')
+
+
+def get_text_analyzer():
+    return get_service('text_analyzer')
+
+
+def get_calendar_service():
+    return get_service('calendar_service')
+
+
+def get_event_store():
+    return get_service('event_store')
+
+
+def get_history_store():
+    return get_service('history_store')
+
+
+def get_print_index():
+    return get_service('print_index')
+
+
+def set_service(name, instance):
+    """
+    現在のプロセスのサービスを差し替える（ベンチマークなどで偽クライアントを使う場合）
+    """
+    if name not in _FACTORIES:
+        raise KeyError(f"未知のサービスです: {name}")
+    with _lock:
+        _check_process()
+        _services[name] = instance
+
+
+def reset_services():
+    """
+    現在のプロセスのサービスを破棄する
+    gunicornのpost_forkフックから呼び出し、親プロセスの状態を引き継がないようにします
+    """
+    global _services_pid
+
+    with _lock:
+        _services.clear()
+        _init_locks.clear()
+        _services_pid = os.getpid()
+
+
+def preload_shared_state():
+    """
+    fork前に読み込んで子プロセスと共有してよい状態を準備する
+    ネットワーク接続やスレッドを持つオブジェクトはここで作成しないこと
+    """
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+    from app import calendar_api
+    calendar_api.get_discovery_document()
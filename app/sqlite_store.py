@@ -0,0 +1,51 @@
+"""
+SQLiteストアの共通処理
+スレッドごとの接続の管理とスキーマの作成を行います
+"""
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """
+    SQLiteのデータベースファイルを使うストアの基底クラス
+
+    サブクラスは SCHEMA にテーブルとインデックスを作成するSQLを定義します。
+    接続はスレッドごとに作成し、スレッド間やプロセス間（fork後）では共有しません。
+    """
+
+    SCHEMA = ''
+
+    def __init__(self, path):
+        """
+        初期化
+
+        Args:
+            path: SQLiteのデータベースファイルのパス
+        """
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        """
+        スレッドごとの接続を返す（sqlite3の接続はスレッド間で共有しない）
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def warm_up(self, timeout=None):
+        """
+        データベースに接続できることを確認する（ウォームアップ用）
+        """
+        self._connect().execute('SELECT 1').fetchone()
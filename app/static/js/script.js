@@ -9,8 +9,13 @@ document.addEventListener('DOMContentLoaded', function() {
     const forms = document.querySelectorAll('form');
     forms.forEach(form => {
         form.addEventListener('submit', function(e) {
+            // ファイルのダウンロードはページ遷移しないため、処理中表示を行わない
+            if (e.submitter && e.submitter.hasAttribute('data-download')) {
+                return;
+            }
+            
             // 送信ボタンのdisabled属性がある場合は処理しない
-            const submitButton = form.querySelector('button[type="submit"]');
+            const submitButton = e.submitter || form.querySelector('button[type="submit"]');
             if (submitButton && submitButton.hasAttribute('disabled')) {
                 return;
             }
@@ -19,33 +24,19 @@ document.addEventListener('DOMContentLoaded', function() {
             if (form.getAttribute('enctype') === 'multipart/form-data') {
                 const fileInput = form.querySelector('input[type="file"]');
                 if (fileInput && fileInput.files.length > 0) {
+                    e.preventDefault();
                     showLoading('処理中...');
-                    
-                    // 送信ボタンを無効化
-                    if (submitButton) {
-                        submitButton.setAttribute('disabled', 'disabled');
-                        const originalText = submitButton.innerHTML;
-                        submitButton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> 処理中...';
-                        
-                        // フォーム送信完了後に元に戻す（念のため）
-                        setTimeout(() => {
-                            submitButton.removeAttribute('disabled');
-                            submitButton.innerHTML = originalText;
-                        }, 30000); // 30秒後
-                    }
+                    const restore = disableButton(submitButton, '処理中...');
+                    submitWithBackoff(form, e.submitter, '処理中...', restore);
                 }
             }
             
-            // イベント登録フォームの場合も処理中表示
+            // イベント登録フォームの場合も処理中表示（登録はバックグラウンドで行われ、進捗は結果ページに表示される）
             if (form.id === 'eventForm') {
-                showLoading('カレンダーに登録中...');
-                
-                // 送信ボタンを無効化
-                if (submitButton) {
-                    submitButton.setAttribute('disabled', 'disabled');
-                    const originalText = submitButton.innerHTML;
-                    submitButton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> 登録中...';
-                }
+                e.preventDefault();
+                showLoading('登録を開始しています...');
+                const restore = disableButton(submitButton, '登録中...');
+                submitWithBackoff(form, e.submitter, '登録を開始しています...', restore);
             }
         });
     });
@@ -133,6 +124,136 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+// 混雑時（503）に再送信する回数と、再送信までの待ち時間の上限（秒）
+const RETRY_MAX_ATTEMPTS = 5;
+const RETRY_MAX_DELAY = 60;
+
+/**
+ * 送信ボタンを無効化して処理中の表示にする
+ * @param {HTMLElement|null} button - 送信ボタン
+ * @param {string} label - 処理中の表示
+ * @return {Function} ボタンを元に戻す関数
+ */
+function disableButton(button, label) {
+    if (!button) return () => {};
+    const originalText = button.innerHTML;
+    button.setAttribute('disabled', 'disabled');
+    button.innerHTML = `<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> ${label}`;
+    return () => {
+        button.removeAttribute('disabled');
+        button.innerHTML = originalText;
+    };
+}
+
+/**
+ * 再送信までの待ち時間（秒）を求める
+ * Retry-Afterの秒数から回数ごとに倍にし、同時に断られた利用者が同時に再送信しないようにばらつかせる
+ * @param {string|null} retryAfter - Retry-Afterヘッダーの値
+ * @param {number} attempt - これまでに再送信した回数
+ * @return {number} 待ち時間（秒）
+ */
+function backoffDelay(retryAfter, attempt) {
+    const base = parseInt(retryAfter, 10) || 5;
+    const delay = Math.min(base * Math.pow(2, attempt), RETRY_MAX_DELAY);
+    return Math.max(1, Math.round(delay * (0.75 + Math.random() * 0.5)));
+}
+
+/**
+ * ページの先頭にメッセージを表示する
+ * @param {string} message - 表示するメッセージ
+ */
+function showAlert(message) {
+    const container = document.querySelector('body > .container');
+    if (!container) {
+        window.alert(message);
+        return;
+    }
+    const alert = document.createElement('div');
+    alert.className = 'alert alert-warning alert-dismissible fade show';
+    alert.setAttribute('role', 'alert');
+    alert.textContent = message;
+    const closeButton = document.createElement('button');
+    closeButton.type = 'button';
+    closeButton.className = 'btn-close';
+    closeButton.setAttribute('data-bs-dismiss', 'alert');
+    closeButton.setAttribute('aria-label', '閉じる');
+    alert.appendChild(closeButton);
+    container.prepend(alert);
+    window.scrollTo(0, 0);
+}
+
+/**
+ * フォームをfetchで送信する
+ * サーバーが混雑していて503を返した場合は、Retry-Afterを基に間隔を延ばしながら自動で再送信する
+ * それ以外の場合は、サーバーが返した移動先（リダイレクトの代わりのJSON）へ移動する
+ * @param {HTMLFormElement} form - 送信するフォーム
+ * @param {HTMLElement|null} submitter - 押された送信ボタン
+ * @param {string} message - 処理中の表示
+ * @param {Function} restore - 送信ボタンを元に戻す関数
+ */
+async function submitWithBackoff(form, submitter, message, restore) {
+    // 他のsubmitイベントの処理（確認ページの変更内容の書き込みなど）が終わってから送信内容を作る
+    await new Promise(resolve => setTimeout(resolve, 0));
+    const body = new FormData(form);
+    if (submitter && submitter.name) {
+        body.append(submitter.name, submitter.value);
+    }
+    const action = (submitter && submitter.getAttribute('formaction')) || form.action;
+    
+    const fail = (text) => {
+        hideLoading();
+        restore();
+        showAlert(text);
+    };
+    
+    for (let attempt = 0; ; attempt++) {
+        let response;
+        try {
+            response = await fetch(action, {
+                method: 'POST',
+                body: body,
+                credentials: 'same-origin',
+                headers: { 'X-Requested-With': 'fetch' }
+            });
+        } catch (error) {
+            fail('通信エラーが発生しました。接続を確認してもう一度お試しください');
+            return;
+        }
+        
+        const text = await response.text();
+        let data = null;
+        try {
+            data = JSON.parse(text);
+        } catch (error) {
+            // JSON以外（エラーページなど）
+        }
+        
+        if (data && data.redirect) {
+            window.location.href = data.redirect;
+            return;
+        }
+        if (response.status === 503) {
+            if (attempt >= RETRY_MAX_ATTEMPTS) {
+                fail((data && data.error) || '混み合っているため処理できませんでした。しばらくしてからもう一度お試しください');
+                return;
+            }
+            // 待ち時間を表示しながら再送信を待つ
+            for (let remaining = backoffDelay(response.headers.get('Retry-After'), attempt); remaining > 0; remaining--) {
+                showLoading(`混み合っています。${remaining}秒後にもう一度送信します（${attempt + 1}/${RETRY_MAX_ATTEMPTS}回目）`);
+                await new Promise(resolve => setTimeout(resolve, 1000));
+            }
+            showLoading(message);
+            continue;
+        }
+        
+        // それ以外の応答（サーバーエラーのページなど）はそのまま表示する
+        document.open();
+        document.write(text);
+        document.close();
+        return;
+    }
+}
+
 /**
  * ローディングオーバーレイを表示
  * @param {string} message - 表示するメッセージ
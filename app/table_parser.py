@@ -0,0 +1,394 @@
+"""
+行事予定表の読み取りモジュール
+単語の配置（WordLayout）から行と列を組み立て直し、「日・曜日・行事」の表形式のページを
+Gemini APIを使わずに予定の行へ変換します。
+OCRの平文では表の行の順序が崩れやすく、LLMでの組み立て直しに時間がかかるためです。
+"""
+import logging
+import re
+import statistics
+import unicodedata
+from collections import namedtuple
+from datetime import date
+
+from app.config import TABLE_MIN_ROWS, TABLE_EVENT_CONFIDENCE
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = '月火水木金土日'
+
+# 表の1行目のセル（「8」「8日」「8(火)」「8日 始業式」など。セルはNFKC正規化済み）
+DAY_CELL_PATTERN = re.compile(rf'^(\d{{1,2}})日?\s*(?:\(([{WEEKDAYS}])(?:曜日?)?\))?(?:\s+(.*))?$')
+WEEKDAY_CELL_PATTERN = re.compile(rf'^\(?([{WEEKDAYS}])(?:曜日?)?\)?(?:\s+(.*))?$')
+# 列見出し（予定が書かれた列を特定する）
+EVENT_COLUMN_PATTERN = re.compile(r'行事|予定|内容')
+DATE_COLUMN_PATTERN = re.compile(r'^(月日|日付|日|曜日?)$')
+# 表の上の見出しから年・月を読み取る
+MONTH_PATTERN = re.compile(r'(?<!\d)(\d{1,2})\s*月')
+YEAR_PATTERN = re.compile(r'(20\d{2})\s*年')
+REIWA_PATTERN = re.compile(r'令和\s*(\d{1,2}|元)\s*年(度)?')
+TIME_RANGE_PATTERN = re.compile(r'(\d{1,2}):(\d{2})\s*(?:[~〜\-ー－]\s*(\d{1,2}):(\d{2}))?')
+# 行の組み立ての閾値（行の文字の高さに対する比率）
+CELL_GAP_RATIO = 1.5  # これより広い間隔は別のセル
+SPACE_GAP_RATIO = 0.25  # これより広い間隔はセル内の空白
+
+TableResult = namedtuple('TableResult', ['events', 'rows', 'coverage', 'remaining_text'])
+
+
+class _Row:
+    """
+    同じ高さに並んだ単語をまとめた1行
+    """
+
+    def __init__(self, page, words):
+        self.page = page
+        self.words = words  # (x0, y0, x1, y1, 文字列) のリスト（左から順）
+        self.top = min(w[1] for w in words)
+        self.bottom = max(w[3] for w in words)
+        self.height = statistics.median(w[3] - w[1] for w in words) or 1.0
+        self.cells = self._split_cells()
+
+    def _split_cells(self):
+        """
+        単語の間隔からセル（x0, x1, 文字列）に分ける
+        """
+        cells = []
+        x0, x1, parts = None, None, []
+        for wx0, _, wx1, _, text in self.words:
+            gap = wx0 - x1 if x1 is not None else None
+            if gap is not None and gap > CELL_GAP_RATIO * self.height:
+                cells.append((x0, x1, ''.join(parts)))
+                x0, parts = None, []
+            elif gap is not None and gap > SPACE_GAP_RATIO * self.height:
+                parts.append(' ')
+            if x0 is None:
+                x0 = wx0
+            parts.append(text)
+            x1 = wx1 if x1 is None else max(x1, wx1)
+        cells.append((x0, x1, ''.join(parts)))
+        return [(cx0, cx1, unicodedata.normalize('NFKC', text).strip()) for cx0, cx1, text in cells]
+
+    @property
+    def text(self):
+        return ' '.join(cell[2] for cell in self.cells)
+
+
+def build_rows(layout):
+    """
+    単語を上から順に行へまとめる
+
+    Returns:
+        _Rowのリスト（ページ順・上から順）
+    """
+    order = sorted(range(len(layout)),
+                   key=lambda i: (layout.pages[i], (layout.y0[i] + layout.y1[i]) / 2))
+    rows = []
+    current = []
+    page = None
+    center = height = 0.0
+    for i in order:
+        word = (layout.x0[i], layout.y0[i], layout.x1[i], layout.y1[i], layout.word(i))
+        word_center = (word[1] + word[3]) / 2
+        word_height = max(word[3] - word[1], 1.0)
+        if current and layout.pages[i] == page and abs(word_center - center) <= 0.5 * min(height, word_height):
+            current.append(word)
+            # 行の中心は単語の中心の平均
+            center += (word_center - center) / len(current)
+            continue
+        if current:
+            rows.append(_Row(page, sorted(current)))
+        current = [word]
+        page = layout.pages[i]
+        center, height = word_center, word_height
+    if current:
+        rows.append(_Row(page, sorted(current)))
+    return rows
+
+
+def _split_day_segments(row):
+    """
+    行を日付のセルごとの区間に分ける（1行に前半・後半の2か月分が並ぶ表にも対応する）
+
+    Returns:
+        [(日, 曜日またはNone, 予定のセルのリスト), ...]（日付で始まらない行は空のリスト）
+    """
+    segments = []
+    cells = row.cells
+    i = 0
+    while i < len(cells):
+        match = DAY_CELL_PATTERN.match(cells[i][2])
+        # 2つ目以降の区間は日付だけのセルで始まるものに限る（予定の文中の数字と区別する）
+        if match and 1 <= int(match.group(1)) <= 31 and (not segments or not match.group(3)):
+            day, weekday, rest = int(match.group(1)), match.group(2), match.group(3)
+            if weekday is None and rest:
+                # 「8 火 始業式」のように曜日が括弧なしで同じセルにある場合
+                weekday_match = WEEKDAY_CELL_PATTERN.match(rest)
+                if weekday_match:
+                    weekday, rest = weekday_match.group(1), weekday_match.group(2)
+            event_cells = []
+            if rest:
+                event_cells.append((cells[i][0], cells[i][1], rest))
+            i += 1
+            if weekday is None and i < len(cells):
+                weekday_match = WEEKDAY_CELL_PATTERN.match(cells[i][2])
+                if weekday_match:
+                    weekday = weekday_match.group(1)
+                    if weekday_match.group(2):
+                        event_cells.append((cells[i][0], cells[i][1], weekday_match.group(2)))
+                    i += 1
+            segments.append((day, weekday, event_cells))
+            continue
+        if not segments:
+            return []
+        segments[-1][2].append(cells[i])
+        i += 1
+    return segments
+
+
+def _event_columns(header_row):
+    """
+    列見出しの行から、予定が書かれた列の中心位置を返す（見出しがない場合はNone）
+    """
+    if header_row is None or len(header_row.cells) < 2:
+        return None
+    # 表題（「4月 行事予定」など）と区別するため、日付・曜日の列見出しがある行に限る
+    if not any(DATE_COLUMN_PATTERN.match(text) for _, _, text in header_row.cells):
+        return None
+    # 日付・曜日のセルは行の読み取りで取り除かれているため、それ以外の列だけを比べる
+    columns = [((x0 + x1) / 2, bool(EVENT_COLUMN_PATTERN.search(text)))
+               for x0, x1, text in header_row.cells if not DATE_COLUMN_PATTERN.match(text)]
+    if not any(is_event for _, is_event in columns):
+        return None
+    return columns
+
+
+def _in_event_column(cell, columns):
+    if columns is None:
+        return True
+    center = (cell[0] + cell[1]) / 2
+    return min(columns, key=lambda column: abs(column[0] - center))[1]
+
+
+def _heading_year_month(rows):
+    """
+    表の上の見出しから (年またはNone, 月またはNone) を読み取る
+    """
+    year = month = None
+    for row in rows:
+        text = row.text
+        if month is None:
+            match = MONTH_PATTERN.search(text)
+            if match and 1 <= int(match.group(1)) <= 12:
+                month = int(match.group(1))
+        if year is None:
+            match = YEAR_PATTERN.search(text)
+            if match:
+                year = int(match.group(1))
+            else:
+                match = REIWA_PATTERN.search(text)
+                if match:
+                    number = 1 if match.group(1) == '元' else int(match.group(1))
+                    # 年度の場合は1～3月を翌年として扱うため、年度の開始年を記録する
+                    year = (2018 + number, bool(match.group(2)))
+    return year, month
+
+
+def _dates_for_year(year, entries, start_month):
+    """
+    日付の並びから (年, 月, 日) の列を求める（日が前の行より小さくなったら翌月とする）
+    """
+    dates = []
+    month, current_year, previous = start_month, year, 0
+    for day, _, _ in entries:
+        if day < previous:
+            month += 1
+            if month > 12:
+                month, current_year = 1, current_year + 1
+        previous = day
+        try:
+            dates.append(date(current_year, month, day))
+        except ValueError:
+            dates.append(None)
+    return dates
+
+
+def _weekday_matches(dates, entries):
+    """
+    曜日が書かれた行のうち、日付の曜日と一致する行数と、曜日が書かれた行数を返す
+    """
+    checked = matched = 0
+    for value, (_, weekday, _) in zip(dates, entries):
+        if weekday is None:
+            continue
+        checked += 1
+        if value is not None and WEEKDAYS[value.weekday()] == weekday:
+            matched += 1
+    return matched, checked
+
+
+def _resolve_dates(entries, heading_year, month, today):
+    """
+    見出しの年と曜日の一致から、各行の日付を決める
+
+    Returns:
+        日付のリスト（曜日が一致しない場合はNone）
+    """
+    if isinstance(heading_year, tuple):
+        start_year, fiscal = heading_year
+        candidates = [start_year + 1 if fiscal and month <= 3 else start_year]
+    elif heading_year:
+        candidates = [heading_year]
+    else:
+        # 年が書かれていない場合は曜日が最も一致し、今日に近い年とする
+        candidates = [today.year - 1, today.year, today.year + 1]
+
+    best = None
+    for year in candidates:
+        dates = _dates_for_year(year, entries, month)
+        matched, checked = _weekday_matches(dates, entries)
+        first = next((d for d in dates if d), None)
+        distance = abs((first - today).days) if first else float('inf')
+        score = (matched, -distance)
+        if best is None or score > best[0]:
+            best = (score, dates, matched, checked)
+    _, dates, matched, checked = best
+
+    # 曜日の大半が一致しない場合は、月の読み取りを誤っている可能性が高い
+    if checked >= 3 and matched < 0.8 * checked:
+        logger.info(f"表の曜日が日付と一致しないため、表として扱いません（{matched}/{checked}）")
+        return None
+    return dates
+
+
+def _cell_events(text, start_date):
+    """
+    1つのセルの文字列から予定を作成する（「、」区切りの複数の予定にも対応する）
+    """
+    events = []
+    for part in text.split('、'):
+        start_time = end_time = ''
+        match = TIME_RANGE_PATTERN.search(part)
+        if match:
+            start_time = f"{int(match.group(1)):02d}:{match.group(2)}"
+            if match.group(3):
+                end_time = f"{int(match.group(3)):02d}:{match.group(4)}"
+            part = part[:match.start()] + part[match.end():]
+        title = part.strip(' ・:()')
+        if not title:
+            continue
+        day = start_date.isoformat()
+        events.append({
+            'title': title,
+            'description': '',
+            'start_date': day,
+            'start_time': start_time,
+            'end_date': day,
+            'end_time': end_time,
+            'all_day': not start_time,
+            'location': '',
+            'confidence': TABLE_EVENT_CONFIDENCE
+        })
+    return events
+
+
+def _parse_page(rows, today, min_rows):
+    """
+    1ページ分の行から表を読み取る
+
+    Returns:
+        (予定のリスト, 表に含まれる行のインデックスの集合)（表がない場合は ([], 空集合)）
+    """
+    parsed = [(index, _split_day_segments(row)) for index, row in enumerate(rows)]
+    day_rows = [index for index, segments in parsed if segments]
+    if len(day_rows) < min_rows:
+        return [], set()
+
+    first = day_rows[0]
+    header_row = rows[first - 1] if first > 0 else None
+    columns = _event_columns(header_row)
+    heading_year, month = _heading_year_month(rows[:first])
+    if month is None:
+        logger.info("表の月を読み取れないため、表として扱いません")
+        return [], set()
+
+    table_rows = set(day_rows)
+    if columns is not None:
+        table_rows.add(first - 1)
+
+    # 予定の列の左端（日付のない行を、直前の日の続きとみなすかの判定に使う）
+    event_left = min((cell[0] for _, segments in parsed for _, _, cells in segments for cell in cells),
+                     default=None)
+
+    # 区間（前半・後半）ごとに上から順に並べる
+    entries = []
+    previous = None
+    for index, segments in parsed:
+        row = rows[index]
+        if segments:
+            for segment_index, (day, weekday, cells) in enumerate(segments):
+                entries.append(((segment_index, row.top), (day, weekday, list(cells))))
+            previous = (index, len(segments))
+            continue
+        # 日付のない行が直前の行のすぐ下で予定の列から始まっている場合は、前の日の予定の続き
+        if previous is None or event_left is None or index != previous[0] + 1 or previous[1] != 1:
+            previous = None
+            continue
+        if row.cells[0][0] >= event_left - row.height and row.top - rows[previous[0]].bottom < row.height:
+            entries[-1][1][2].extend(row.cells)
+            table_rows.add(index)
+            previous = (index, 1)
+        else:
+            previous = None
+
+    entries = [entry for _, entry in sorted(entries, key=lambda item: item[0])]
+    dates = _resolve_dates(entries, heading_year, month, today)
+    if dates is None:
+        return [], set()
+
+    events = []
+    for value, (_, _, cells) in zip(dates, entries):
+        if value is None:
+            continue
+        for cell in cells:
+            if _in_event_column(cell, columns):
+                events.extend(_cell_events(cell[2], value))
+    return events, table_rows
+
+
+def parse_table(layout, today=None, min_rows=None):
+    """
+    単語の配置から行事予定表を読み取る
+
+    Args:
+        layout: WordLayout
+        today: 年が書かれていない場合の基準日（省略時は今日）
+        min_rows: 表とみなす日付の行数の下限（省略時は設定値）
+
+    Returns:
+        TableResult（events: 予定のリスト, rows: 表の行数, coverage: 表に含まれる単語の割合,
+        remaining_text: 表以外の行のテキスト）。表が見つからない場合はNone
+    """
+    if layout is None or not len(layout):
+        return None
+    today = today or date.today()
+    min_rows = TABLE_MIN_ROWS if min_rows is None else min_rows
+
+    rows = build_rows(layout)
+    events = []
+    table_words = 0
+    table_row_count = 0
+    remaining = []
+    for page in sorted({row.page for row in rows}):
+        page_rows = [row for row in rows if row.page == page]
+        page_events, table_rows = _parse_page(page_rows, today, min_rows)
+        events.extend(page_events)
+        table_row_count += len(table_rows)
+        for index, row in enumerate(page_rows):
+            if index in table_rows:
+                table_words += len(row.words)
+            else:
+                remaining.append(row.text)
+
+    if not table_row_count:
+        return None
+    return TableResult(events, table_row_count, table_words / len(layout), '\n'.join(remaining))
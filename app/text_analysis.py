@@ -5,37 +5,143 @@ Google Gemini APIを使用してOCRで抽出されたテキストから
 """
 import logging
 import json
+import time
 import google.generativeai as genai
 from datetime import datetime, timedelta
 import pytz
-import re
+
+from app.config import (
+    PREFILTER_ENABLED, MODEL_ROUTING_ENABLED, GEMINI_FAST_MODEL, GEMINI_PRO_MODEL,
+    TABLE_PARSER_ENABLED, TABLE_SKIP_LLM_COVERAGE
+)
+from app.event_validation import validate_event
+from app.prefilter import filter_text, estimate_tokens
+from app.response_parser import parse_events
+from app.routing import FAST, PRO, initial_tier, escalation_reason
+from app.table_parser import parse_table
+from app import metrics
+from app.tracing import traced, span, set_attribute, mark_error, payload_size
+from app import recording
 
 logger = logging.getLogger(__name__)
 
+# プロンプトのバージョン（build_promptの内容を変更した場合は更新する）
+PROMPT_VERSION = 'v2'
+
+# 抽出結果のJSONスキーマ（extract_eventsの戻り値の形式）
+EVENT_LIST_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'description': {'type': 'string'},
+            'start_date': {'type': 'string', 'description': 'YYYY-MM-DD'},
+            'start_time': {'type': 'string', 'description': 'HH:MM（24時間形式、なければ空文字）'},
+            'end_date': {'type': 'string', 'description': 'YYYY-MM-DD'},
+            'end_time': {'type': 'string', 'description': 'HH:MM（24時間形式、なければ空文字）'},
+            'all_day': {'type': 'boolean'},
+            'location': {'type': 'string'},
+            'confidence': {'type': 'number'},
+        },
+        'required': ['title', 'start_date', 'all_day', 'confidence'],
+    },
+}
+
+def structured_output_config():
+    """
+    JSON形式での出力を指定する生成設定を返す
+    インストールされているSDKが対応していない場合はNone（プロンプトでの指定のみになる）
+    """
+    import google.ai.generativelanguage as glm
+    fields = glm.GenerationConfig.meta.fields
+    if 'response_mime_type' not in fields:
+        return None
+    config = {'response_mime_type': 'application/json'}
+    if 'response_schema' in fields:
+        config['response_schema'] = EVENT_LIST_SCHEMA
+    return config
+
+
+def merge_events(primary, secondary):
+    """
+    2つの抽出結果をまとめる（タイトルと開始日が同じ予定は先の結果を優先する）
+    """
+    seen = {(event.get('title'), event.get('start_date')) for event in primary}
+    return list(primary) + [
+        event for event in secondary
+        if isinstance(event, dict) and (event.get('title'), event.get('start_date')) not in seen
+    ]
+
+
 class TextAnalyzer:
-    def __init__(self, api_key):
+    def __init__(self, api_key, models=None):
         """
         テキスト解析クラスの初期化
         
         Args:
             api_key: Google Gemini APIのAPIキー
+            models: 振り分け先ごとのモデル（{'fast': モデル, 'pro': モデル}、省略時はAPIに接続するモデルを作成）
         """
         self.api_key = api_key
+        self.prefilter_enabled = PREFILTER_ENABLED
+        # 絞り込みの有無でプロンプトが変わるため、記録・評価では別のバージョンとして扱う
+        self.prompt_version = PROMPT_VERSION + ('+prefilter' if self.prefilter_enabled else '')
+        self.generation_config = structured_output_config()
+        self.routing_enabled = MODEL_ROUTING_ENABLED
+        self.model_names = {FAST: GEMINI_FAST_MODEL, PRO: GEMINI_PRO_MODEL}
+        
+        if models is not None:
+            self.models = models
+            return
+        
+        # 再生モードではAPIに接続せず、フィクスチャコーパスから応答する
+        if recording.is_replay():
+            corpus = recording.get_corpus()
+            self.models = {tier: recording.ReplayModel(corpus, name) for tier, name in self.model_names.items()}
+            logger.info("Gemini APIをフィクスチャから再生します")
+            return
         
         try:
             genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-pro')
+            self.models = {
+                tier: recording.wrap_model(genai.GenerativeModel(name), self.tier_version(tier))
+                for tier, name in self.model_names.items()
+            }
             logger.info("Gemini APIの初期化に成功しました")
         except Exception as e:
             logger.error(f"Gemini APIの初期化に失敗しました: {e}")
             raise
 
-    def extract_events(self, text):
+    def tier_version(self, tier):
+        """
+        記録・評価で使うプロンプトバージョンとモデルの組み合わせの名前（'v2@gemini-1.5-flash' など）
+        """
+        return f"{self.prompt_version}@{self.model_names[tier]}"
+
+    def warm_up(self, timeout):
+        """
+        Gemini APIへのgRPCチャネルを接続しておく
+        （GenerativeModelは初回呼び出し時に既定のクライアントを取得するため、同じチャネルが使われる）
+        
+        Args:
+            timeout: 接続確認のタイムアウト（秒）
+        """
+        if recording.is_replay():
+            return
+        from google.generativeai import client as genai_client
+        from app.warmup import wait_for_grpc_channel
+        wait_for_grpc_channel(genai_client.get_default_generative_client(), timeout)
+
+    @traced('analysis.extract_events')
+    def extract_events(self, text, tier=None, layout=None):
         """
         テキストから予定情報を抽出する
         
         Args:
             text: 解析するテキスト
+            tier: 使用するモデル（'fast' / 'pro'）。省略時は振り分けの設定に従う
+            layout: OCRで取り出した単語の配置（WordLayout）。行事予定表はここから直接読み取る
             
         Returns:
             抽出された予定情報のリスト
@@ -58,9 +164,163 @@ class TextAnalyzer:
             logger.warning("解析するテキストが空です")
             return []
         
+        set_attribute('text_chars', len(text))
+        
         try:
-            # プロンプトの作成
-            prompt = f"""
+            # 行事予定表は単語の配置から直接読み取り、表以外の部分だけをGemini APIで解析する
+            table = self._parse_table(layout)
+            table_events = table.events if table else []
+            if table:
+                if table.coverage >= TABLE_SKIP_LLM_COVERAGE or not table.remaining_text.strip():
+                    metrics.increment('analysis.table.llm_skipped')
+                    logger.info(f"行事予定表から{len(table_events)}件のイベントを読み取りました（Gemini APIは使用しません）")
+                    set_attribute('events', len(table_events))
+                    return table_events
+                metrics.increment('analysis.table.llm_shrunk')
+                text = table.remaining_text
+            
+            # プロンプトの作成（予定に関係する行だけに絞り込む）
+            prompt = self.build_prompt(self.prepare_text(text))
+            
+            if tier is None and self.routing_enabled:
+                events = self._extract_routed(text, prompt)
+            else:
+                set_attribute('model_tier', tier or PRO)
+                events = self._generate_events(tier or PRO, prompt)
+            
+            if events is None:
+                mark_error('レスポンスから予定情報を取り出せませんでした')
+                return table_events
+            events = merge_events(table_events, events)
+            logger.info(f"{len(events)}件のイベントが抽出されました")
+            set_attribute('events', len(events))
+            return events
+                
+        except Exception as e:
+            logger.error(f"テキスト解析中にエラーが発生しました: {e}")
+            mark_error(e)
+            return []
+
+    def _parse_table(self, layout):
+        """
+        単語の配置から行事予定表を読み取る（表がない場合や無効な場合はNone）
+        """
+        if layout is None or not TABLE_PARSER_ENABLED:
+            return None
+        started = time.perf_counter()
+        with span('table.parse', words=len(layout)) as table_span:
+            table = parse_table(layout)
+            if table:
+                table_span.set_attribute('rows', table.rows)
+                table_span.set_attribute('coverage', round(table.coverage, 3))
+        metrics.observe('analysis.table.parse_ms', (time.perf_counter() - started) * 1000)
+        if table:
+            metrics.increment('analysis.table.detected')
+        return table
+
+    def _extract_routed(self, text, prompt):
+        """
+        高速なモデルで抽出し、基準を満たさない場合だけ上位モデルで抽出し直す
+        
+        Returns:
+            予定情報のリスト（解析に失敗した場合はNone）
+        """
+        tier, reason = initial_tier(text)
+        if tier == FAST:
+            try:
+                events = self._generate_events(FAST, prompt)
+                reason = escalation_reason(events, self.validate_event)
+            except Exception as e:
+                logger.warning(f"高速なモデルでの抽出に失敗しました: {e}")
+                reason = 'error'
+            if reason is None:
+                metrics.increment('analysis.routing.accepted')
+                set_attribute('model_tier', FAST)
+                return events
+            metrics.increment('analysis.routing.escalated')
+            logger.info(f"上位モデルで抽出し直します（理由: {reason}）")
+        else:
+            metrics.increment('analysis.routing.direct')
+        
+        metrics.increment(f"analysis.routing.reason.{reason}")
+        set_attribute('model_tier', PRO)
+        set_attribute('routing_reason', reason)
+        return self._generate_events(PRO, prompt)
+
+    def _generate_events(self, tier, prompt):
+        """
+        指定したモデルでプロンプトを送信し、レスポンスから予定情報を取り出す
+        
+        Returns:
+            予定情報のリスト（解析に失敗した場合はNone）
+            
+        Raises:
+            Exception: API呼び出しに失敗した場合
+        """
+        model = self.models[tier]
+        started = time.perf_counter()
+        with span('gemini.generate_content', prompt_bytes=payload_size(prompt),
+                  model=self.model_names[tier]) as gemini_span:
+            if self.generation_config:
+                response = model.generate_content(prompt, generation_config=self.generation_config)
+            else:
+                response = model.generate_content(prompt)
+            response_text = response.text
+            gemini_span.set_attribute('response_bytes', payload_size(response_text))
+        metrics.increment(f"analysis.model.{tier}.calls")
+        metrics.observe(f"analysis.model.{tier}.latency_ms", (time.perf_counter() - started) * 1000)
+        
+        # JSON文字列からデータを解析（壊れている場合は取り出せる予定だけを取り出す）
+        started = time.perf_counter()
+        result = parse_events(response_text)
+        metrics.observe('analysis.parse_ms', (time.perf_counter() - started) * 1000)
+        metrics.increment(f"analysis.parse.{result.status}")
+        metrics.increment('analysis.parse.objects_dropped', result.dropped)
+        set_attribute('parse_status', result.status)
+        
+        if result.status == 'failed':
+            logger.error(f"レスポンスから予定情報を取り出せませんでした（{self.model_names[tier]}）")
+            logger.debug("解析対象文字列: %s", response_text)
+            return None
+        if result.status == 'salvaged':
+            logger.warning(f"不完全なJSONから{result.recovered}件の予定を取り出しました"
+                           f"（取り出せなかったオブジェクト: {result.dropped}件）")
+        return result.events
+
+    def prepare_text(self, text):
+        """
+        プロンプトに埋め込むテキストを用意する（絞り込みが有効な場合は関係する行だけを残す）
+        
+        Args:
+            text: OCRで抽出されたテキスト
+            
+        Returns:
+            プロンプトに埋め込むテキスト
+        """
+        if not self.prefilter_enabled:
+            return text
+        
+        result = filter_text(text)
+        if result.applied:
+            tokens_before = estimate_tokens(self.build_prompt(text))
+            tokens_after = estimate_tokens(self.build_prompt(result.text))
+            set_attribute('prompt_tokens_before', tokens_before)
+            set_attribute('prompt_tokens_after', tokens_after)
+            logger.info(f"プロンプトを絞り込みました: {result.lines_kept}/{result.lines_total}行, "
+                        f"推定トークン数 {tokens_before} → {tokens_after}")
+        return result.text
+
+    def build_prompt(self, text):
+        """
+        予定抽出用のプロンプトを作成する
+        
+        Args:
+            text: OCRで抽出されたテキスト
+            
+        Returns:
+            Gemini APIに送信するプロンプト
+        """
+        return f"""
             あなたは学校のプリントから日程情報を抽出するAIアシスタントです。
             以下のOCRで読み取られたテキストから、カレンダーに登録すべきイベント・予定を全て特定してください。
 
@@ -72,8 +332,8 @@ class TextAnalyzer:
             - 時間がない場合は終日イベントと判断
 
             # 出力形式：
-            - JSONフォーマットで出力
-            - 次のキーを持つオブジェクトの配列: title, description, start_date, start_time, end_date, end_time, all_day, location, confidence
+            - 次のJSONスキーマに従う配列のみを出力（コードブロック、コメント、末尾のカンマは付けない）
+            {json.dumps(EVENT_LIST_SCHEMA, ensure_ascii=False)}
             - 日付は'YYYY-MM-DD'形式（例: 2025-03-21）
             - 時間は'HH:MM'の24時間形式（例: 13:30）
             - all_dayは時間指定がなければtrue、あればfalse
@@ -86,35 +346,28 @@ class TextAnalyzer:
 
             JSONデータのみを出力してください。説明や前置きは不要です。
             """
+
+    def parse_response(self, response_text):
+        """
+        Gemini APIのレスポンスから予定情報のリストを取り出す
+        
+        Args:
+            response_text: Gemini APIのレスポンステキスト
             
-            # Gemini APIでテキスト解析
-            response = self.model.generate_content(prompt)
-            response_text = response.text
-            
-            # JSONデータの抽出（余分なテキストがある場合に対応）
-            json_match = re.search(r'```json\n([\s\S]*?)\n```', response_text)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_str = response_text.strip()
+        Returns:
+            予定情報のリスト
             
-            # JSON文字列からデータを解析
-            try:
-                events = json.loads(json_str)
-                logger.info(f"{len(events)}件のイベントが抽出されました")
-                return events
-            except json.JSONDecodeError as e:
-                logger.error(f"JSONパースエラー: {e}")
-                logger.debug(f"解析対象文字列: {json_str}")
-                return []
-                
-        except Exception as e:
-            logger.error(f"テキスト解析中にエラーが発生しました: {e}")
-            return []
+        Raises:
+            ValueError: 予定を1件も取り出せなかった場合
+        """
+        result = parse_events(response_text)
+        if result.status == 'failed':
+            raise ValueError('レスポンスから予定情報を取り出せませんでした')
+        return result.events
 
     def validate_event(self, event):
         """
-        抽出されたイベント情報のバリデーションを行う
+        抽出されたイベント情報のバリデーションを行う（app/event_validation.py）
         
         Args:
             event: バリデーションするイベント情報
@@ -122,56 +375,4 @@ class TextAnalyzer:
         Returns:
             バリデーション結果（True/False）とエラーメッセージ
         """
-        errors = []
-        
-        # 必須フィールドのチェック
-        required_fields = ['title', 'start_date']
-        for field in required_fields:
-            if field not in event or not event[field]:
-                errors.append(f"{field}は必須項目です")
-        
-        # 日付フォーマットのチェック
-        date_fields = ['start_date', 'end_date']
-        date_pattern = re.compile(r'^\d{4}-\d{2}-\d{2}$')
-        for field in date_fields:
-            if field in event and event[field]:
-                if not date_pattern.match(event[field]):
-                    errors.append(f"{field}は'YYYY-MM-DD'形式である必要があります")
-                else:
-                    try:
-                        datetime.strptime(event[field], '%Y-%m-%d')
-                    except ValueError:
-                        errors.append(f"{field}が無効な日付です")
-        
-        # 時間フォーマットのチェック
-        time_fields = ['start_time', 'end_time']
-        time_pattern = re.compile(r'^\d{2}:\d{2}$')
-        for field in time_fields:
-            if field in event and event[field]:
-                if not time_pattern.match(event[field]):
-                    errors.append(f"{field}は'HH:MM'形式である必要があります")
-                else:
-                    try:
-                        datetime.strptime(event[field], '%H:%M')
-                    except ValueError:
-                        errors.append(f"{field}が無効な時間です")
-        
-        # 終了日付のチェック（開始日付以降であること）
-        if 'end_date' in event and event['end_date'] and 'start_date' in event and event['start_date']:
-            try:
-                start = datetime.strptime(event['start_date'], '%Y-%m-%d')
-                end = datetime.strptime(event['end_date'], '%Y-%m-%d')
-                if end < start:
-                    errors.append("終了日は開始日以降である必要があります")
-            except ValueError:
-                # 日付フォーマットのエラーは上記で既にチェック済み
-                pass
-        
-        # オプションフィールドのデフォルト値設定
-        if 'all_day' not in event:
-            event['all_day'] = 'start_time' not in event or not event['start_time']
-        
-        if 'end_date' not in event or not event['end_date']:
-            event['end_date'] = event['start_date']
-        
-        return len(errors) == 0, errors
+        return validate_event(event)
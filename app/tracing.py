@@ -0,0 +1,305 @@
+"""
+リクエストトレーシングモジュール
+リクエストIDとスパンを管理し、構造化JSON形式のスパンログを出力します
+"""
+import contextvars
+import functools
+import json
+import logging
+import time
+import uuid
+
+from app.config import TRACE_ENABLED, TRACE_SLOW_REQUEST_MS
+from app import memory_profile
+
+# スパンログ専用のロガー（logging_configでJSONL形式のファイルに出力される）
+logger = logging.getLogger(__name__)
+app_logger = logging.getLogger('app')
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """
+    トレース内の1区間（処理単位）を表すクラス
+    """
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.outcome = 'ok'
+        self.error = None
+        # メモリプロファイリングが有効な場合の開始時のメモリの記録
+        self.memory = memory_profile.begin_span()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def mark_error(self, error):
+        self.outcome = 'error'
+        self.error = str(error)
+
+    def finish(self):
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+            if self.memory is not None:
+                self.attributes.update(memory_profile.end_span(self.memory, self.name))
+
+    def to_dict(self):
+        return {
+            'type': 'span',
+            'request_id': self.trace.request_id,
+            'trace': self.trace.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start_time,
+            'duration_ms': self.duration_ms,
+            'outcome': self.outcome,
+            'error': self.error,
+            'attributes': self.attributes
+        }
+
+
+class _NoopSpan:
+    """
+    トレースが開始されていない場合に使用する何もしないスパン
+    """
+    def set_attribute(self, key, value):
+        pass
+
+    def mark_error(self, error):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """
+    1リクエスト分のスパンをまとめるクラス
+    """
+
+    def __init__(self, request_id, name):
+        self.request_id = request_id
+        self.name = name
+        self.spans = []
+        self.root = None
+
+    def span_tree(self):
+        """
+        スパンを親子関係のツリー構造に変換する
+
+        Returns:
+            ルートスパンを頂点とするツリー（辞書）
+        """
+        nodes = {}
+        for s in self.spans:
+            node = s.to_dict()
+            node['children'] = []
+            nodes[s.span_id] = node
+
+        roots = []
+        for s in self.spans:
+            node = nodes[s.span_id]
+            parent = nodes.get(s.parent_id)
+            if parent is not None:
+                parent['children'].append(node)
+            else:
+                roots.append(node)
+        return roots[0] if len(roots) == 1 else roots
+
+
+def _emit(record):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def start_trace(name, request_id=None, **attributes):
+    """
+    新しいトレースを開始し、ルートスパンを現在のコンテキストに設定する
+
+    Args:
+        name: トレース名（例: "POST /upload"）
+        request_id: リクエストID（Noneの場合は自動生成）
+        **attributes: ルートスパンに付与する属性
+
+    Returns:
+        開始したトレース（トレース無効時はNone）
+    """
+    if not TRACE_ENABLED:
+        return None
+
+    trace = Trace(request_id or uuid.uuid4().hex, name)
+    root = Span(trace, name, attributes=attributes)
+    trace.root = root
+    trace.spans.append(root)
+    memory_profile.begin_request(root.memory)
+    _current_trace.set(trace)
+    _current_span.set(root)
+    return trace
+
+
+def end_trace(error=None):
+    """
+    現在のトレースを終了し、ルートスパンを出力する
+    処理時間が閾値を超えた場合はスパンツリー全体を、メモリ確保のピークが閾値を超えた場合は
+    確保した場所の上位（memory_profile レコード）を出力する
+
+    Args:
+        error: リクエスト処理中に発生した例外（ある場合）
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+
+    root = trace.root
+    if error is not None:
+        root.mark_error(error)
+    root.finish()
+    _emit(root.to_dict())
+
+    if TRACE_SLOW_REQUEST_MS and root.duration_ms >= TRACE_SLOW_REQUEST_MS:
+        _emit({
+            'type': 'slow_request',
+            'request_id': trace.request_id,
+            'trace': trace.name,
+            'duration_ms': root.duration_ms,
+            'threshold_ms': TRACE_SLOW_REQUEST_MS,
+            'tree': trace.span_tree()
+        })
+        app_logger.warning(
+            f"低速なリクエストを検出しました: {trace.name} "
+            f"({root.duration_ms}ms, request_id={trace.request_id})"
+        )
+
+    report = memory_profile.request_report(trace)
+    if report is not None:
+        _emit(report)
+        app_logger.warning(
+            f"メモリ使用量の多いリクエストを検出しました: {trace.name} "
+            f"(ピーク {report['peak_kb'] / 1024:.1f}MB, request_id={trace.request_id})"
+        )
+
+    _current_trace.set(None)
+    _current_span.set(None)
+
+
+class span:
+    """
+    子スパンを計測するコンテキストマネージャ
+
+    使用例:
+        with span('ocr.process_image', payload_bytes=len(content)) as s:
+            ...
+            s.set_attribute('text_chars', len(text))
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        trace = _current_trace.get()
+        if trace is None:
+            return _NOOP_SPAN
+        parent = _current_span.get()
+        self._span = Span(trace, self.name, parent.span_id if parent else None, self.attributes)
+        trace.spans.append(self._span)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is None:
+            return False
+        if exc is not None:
+            self._span.mark_error(f"{exc_type.__name__}: {exc}")
+        self._span.finish()
+        _current_span.reset(self._token)
+        _emit(self._span.to_dict())
+        return False
+
+
+def traced(name):
+    """
+    関数呼び出しをスパンとして計測するデコレータ
+
+    Args:
+        name: スパン名
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """
+    現在のスパンを返す（トレース外の場合は何もしないスパン）
+    """
+    return _current_span.get() or _NOOP_SPAN
+
+
+def set_attribute(key, value):
+    """
+    現在のスパンに属性を設定する
+    """
+    current_span().set_attribute(key, value)
+
+
+def mark_error(error):
+    """
+    現在のスパンを失敗として記録する
+    """
+    current_span().mark_error(error)
+
+
+def current_request_id():
+    """
+    現在のリクエストIDを返す（トレース外の場合はNone）
+    """
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+def payload_size(value):
+    """
+    スパン属性用にペイロードのサイズを求める
+
+    Args:
+        value: bytes、文字列、リストなど
+
+    Returns:
+        バイト数（文字列はUTF-8換算）、リストは要素数
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    ログレコードに現在のリクエストIDを付与するフィルタ
+    """
+    def filter(self, record):
+        record.request_id = current_request_id() or '-'
+        return True
@@ -0,0 +1,253 @@
+"""
+アップロード検証モジュール
+アップロードされたファイルを保存する前に、先頭のバイト列（マジックバイト）と画像のヘッダー、
+PDFのページ数をストリームから読み取り、処理できないファイルを早い段階で拒否します。
+
+壊れたファイル、拡張子と内容が異なるファイル、展開すると巨大になる画像（解凍爆弾）は、
+以前はディスクへの保存・PILでの読み込み・Vision APIの呼び出しの後に失敗していました。
+ここでは画像の画素を展開せず、ヘッダーの数十～数百バイトだけを読みます。
+"""
+import re
+import struct
+from collections import namedtuple
+
+from app.config import UPLOAD_MAX_IMAGE_PIXELS, UPLOAD_MAX_IMAGE_SIDE, PDF_MAX_PAGES
+
+# ファイルの種類ごとの先頭のバイト列
+MAGIC_BYTES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'%PDF-', 'pdf'),
+)
+# 拡張子とファイルの種類の対応
+EXTENSION_KINDS = {'png': 'png', 'jpg': 'jpeg', 'jpeg': 'jpeg', 'gif': 'gif', 'pdf': 'pdf'}
+# PNGの最後のチャンク（IEND）の種類とCRC
+PNG_IEND = b'IEND\xaeB`\x82'
+# JPEGの画像の大きさを持つマーカー（SOF0～SOF15。DHT・JPG・DACは除く）
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# JPEGの長さを持たないマーカー（TEM・RST0～RST7）
+JPEG_STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xD8)))
+# JPEGの画像の終端のマーカー
+JPEG_EOI = b'\xff\xd9'
+# JPEGのヘッダーを探す範囲の上限（Exifなどのメタデータを含む）
+JPEG_HEADER_LIMIT = 1024 * 1024
+# PNG・JPEGの終端やPDFのページ数を探すときに1回に読む大きさと、読み取りの境界をまたぐ記述のための重なり
+SCAN_CHUNK_SIZE = 1024 * 1024
+PDF_CHUNK_OVERLAP = 256
+# ページツリーの節（/Type /Pages）の辞書に書かれたページ数
+PDF_PAGES_COUNT = re.compile(
+    rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b'
+)
+# PDFの末尾を探す範囲（%%EOFの後に改行などが続くことがある）
+PDF_TRAILER_SEARCH = 2048
+
+# 検証したファイルの情報（pagesはPDFのページ数。ストリームから読み取れない場合はNone）
+UploadInfo = namedtuple('UploadInfo', ['kind', 'size', 'width', 'height', 'pages'])
+
+
+class UploadRejected(ValueError):
+    """
+    アップロードされたファイルを処理できない場合の例外（reason はメトリクスに使う理由）
+    """
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def sniff_kind(head):
+    """
+    先頭のバイト列からファイルの種類を判定する（判定できない場合はNone）
+    """
+    for magic, kind in MAGIC_BYTES:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise UploadRejected('corrupt', 'ファイルが途中で終わっています。もう一度アップロードしてください')
+    return data
+
+
+def _png_size(stream):
+    header = _read_exact(stream, 24)
+    if header[12:16] != b'IHDR':
+        raise UploadRejected('corrupt', 'PNGファイルのヘッダーが壊れています')
+    return struct.unpack('>II', header[16:24])
+
+
+def _gif_size(stream):
+    header = _read_exact(stream, 10)
+    return struct.unpack('<HH', header[6:10])
+
+
+def _jpeg_size(stream):
+    """
+    JPEGのセグメントを順に読み、SOFマーカーから画像の大きさを読み取る
+    （ストリームの位置は画像データ（SOSマーカーのセグメント）の先頭になる）
+    """
+    stream.seek(2)
+    size = None
+    while stream.tell() < JPEG_HEADER_LIMIT:
+        if _read_exact(stream, 1) != b'\xff':
+            break
+        marker = _read_exact(stream, 1)[0]
+        while marker == 0xFF:  # マーカーの前の詰め物
+            marker = _read_exact(stream, 1)[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker == 0xDA:
+            # 画像データの前にヘッダーがすべてそろっている
+            if size is not None:
+                return size
+            break
+        if marker == 0xD9:
+            break
+        length = struct.unpack('>H', _read_exact(stream, 2))[0]
+        if length < 2:
+            break
+        if marker in JPEG_SOF_MARKERS:
+            segment = _read_exact(stream, 5)
+            height, width = struct.unpack('>HH', segment[1:5])
+            if height == 0:
+                break  # 高さをDNLマーカーで後から指定する形式には対応しない
+            size = (width, height)
+            stream.seek(length - 7, 1)
+        else:
+            stream.seek(length - 2, 1)
+    raise UploadRejected('corrupt', 'JPEGファイルのヘッダーが壊れています')
+
+
+def _contains(stream, needle):
+    """
+    ストリームの現在の位置から後に needle があるかを、少しずつ読みながら調べる
+    """
+    tail = b''
+    while True:
+        chunk = stream.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            return False
+        data = tail + chunk
+        if needle in data:
+            return True
+        tail = data[-(len(needle) - 1):]
+
+
+def _check_image(kind, stream):
+    """
+    画像のヘッダーから大きさを読み取り、画素数の上限を確認する
+
+    Returns:
+        (幅, 高さ)
+    """
+    stream.seek(0)
+    if kind == 'png':
+        width, height = _png_size(stream)
+        # 編集ソフトなどが後ろにバイト列を付けたファイルがあるため、ファイルの末尾ではなくヘッダーの後を探す
+        if not _contains(stream, PNG_IEND):
+            raise UploadRejected('corrupt', 'PNGファイルが途中で終わっています。もう一度アップロードしてください')
+    elif kind == 'gif':
+        width, height = _gif_size(stream)
+    else:
+        width, height = _jpeg_size(stream)
+        # 画像データの中の0xFFは0x00を続けて書かれるため、終端（EOI）がなければ途中で終わっている
+        # （動画などが後ろに付いた写真があるため、ファイルの末尾ではなく画像データの後を探す）
+        if not _contains(stream, JPEG_EOI):
+            raise UploadRejected('corrupt', 'JPEGファイルが途中で終わっています。もう一度アップロードしてください')
+
+    if width == 0 or height == 0:
+        raise UploadRejected('corrupt', '画像の大きさが0です')
+    if max(width, height) > UPLOAD_MAX_IMAGE_SIDE or width * height > UPLOAD_MAX_IMAGE_PIXELS:
+        raise UploadRejected(
+            'image_too_large',
+            f"画像が大きすぎます（{width}×{height}画素）。"
+            f"{UPLOAD_MAX_IMAGE_PIXELS / 10000:.0f}万画素以下に縮小してからアップロードしてください"
+        )
+    return width, height
+
+
+def count_pdf_pages(stream):
+    """
+    PDFのページツリーに書かれたページ数をストリームから読み取る
+
+    ページツリーの節はページ数（/Count）を持ち、最上位の節の値が全体のページ数になるため、最大の値を返します。
+    ページツリーが圧縮されたオブジェクトストリームの中にある場合は読み取れません。
+
+    Returns:
+        ページ数（読み取れない場合はNone）
+    """
+    stream.seek(0)
+    pages = None
+    tail = b''
+    while True:
+        chunk = stream.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            break
+        data = tail + chunk
+        for match in PDF_PAGES_COUNT.finditer(data):
+            count = int(match.group(1) or match.group(2))
+            pages = count if pages is None else max(pages, count)
+        tail = data[-PDF_CHUNK_OVERLAP:]
+    return pages
+
+
+def _check_pdf(stream):
+    """
+    PDFの末尾とページ数を確認する
+
+    Returns:
+        ページ数（読み取れない場合はNone）
+    """
+    stream.seek(0, 2)
+    size = stream.tell()
+    stream.seek(max(0, size - PDF_TRAILER_SEARCH))
+    if b'%%EOF' not in stream.read():
+        raise UploadRejected('corrupt', 'PDFファイルが途中で終わっています。もう一度アップロードしてください')
+
+    pages = count_pdf_pages(stream)
+    if pages is not None and pages > PDF_MAX_PAGES:
+        raise UploadRejected('too_many_pages',
+                             f"PDFのページ数が制限を超えています（{pages}ページ/最大{PDF_MAX_PAGES}ページ）")
+    return pages
+
+
+def validate_upload(stream, file_ext):
+    """
+    アップロードされたファイルを保存する前に検証する（終了後はストリームの位置を先頭に戻す）
+
+    Args:
+        stream: アップロードされたファイルのストリーム（シーク可能なもの）
+        file_ext: ファイル名の拡張子（小文字）
+
+    Returns:
+        UploadInfo
+
+    Raises:
+        UploadRejected: 処理できないファイルの場合
+    """
+    try:
+        stream.seek(0)
+        head = stream.read(16)
+        if not head:
+            raise UploadRejected('empty', 'ファイルが空です')
+
+        kind = sniff_kind(head)
+        if kind is None:
+            raise UploadRejected('unknown_type', 'PNG・JPEG・GIF・PDF以外のファイルはアップロードできません')
+        if EXTENSION_KINDS.get(file_ext) != kind:
+            raise UploadRejected('type_mismatch',
+                                 f"ファイルの内容（{kind.upper()}）が拡張子（.{file_ext}）と一致しません")
+
+        stream.seek(0, 2)
+        size = stream.tell()
+        if kind == 'pdf':
+            return UploadInfo(kind, size, None, None, _check_pdf(stream))
+        width, height = _check_image(kind, stream)
+        return UploadInfo(kind, size, width, height, None)
+    finally:
+        stream.seek(0)
@@ -0,0 +1,142 @@
+"""
+ウォームアップモジュール
+ワーカーの起動直後にサービスを作成して外部APIへの接続を準備し、
+準備が完了するまでは /readyz が失敗を返すようにします。
+準備完了後は、アイドル中の接続が切れないよう定期的に接続を確認します。
+"""
+import logging
+import os
+import threading
+import time
+
+from app.config import WARMUP_ENABLED, WARMUP_TIMEOUT, WARMUP_RETRY_INTERVAL, KEEPALIVE_INTERVAL
+from app import services
+
+logger = logging.getLogger(__name__)
+
+_state = {}
+_state_pid = None
+_lock = threading.Lock()
+
+
+def wait_for_grpc_channel(client, timeout):
+    """
+    gRPCクライアントのチャネルが接続済みになるまで待つ（RPCは送信しない）
+
+    Args:
+        client: transport.grpc_channel を持つGoogle APIクライアント
+        timeout: タイムアウト（秒）
+
+    Returns:
+        接続を確認した場合True、gRPCチャネルを持たないクライアントの場合False
+
+    Raises:
+        grpc.FutureTimeoutError: タイムアウトまでに接続できなかった場合
+    """
+    transport = getattr(client, 'transport', None)
+    channel = getattr(transport, 'grpc_channel', None)
+    if channel is None:
+        return False
+
+    import grpc
+    grpc.channel_ready_future(channel).result(timeout=timeout)
+    return True
+
+
+def warm_up_services():
+    """
+    現在のプロセスのサービスを作成し、外部APIへの接続を準備する
+
+    Returns:
+        サービス名ごとの状態（'warm' または 'unavailable'）
+
+    Raises:
+        Exception: 接続の準備に失敗した場合
+    """
+    results = {}
+    for name in services.SERVICE_NAMES:
+        service = services.get_service(name)
+        if service is None:
+            # 未設定または初期化に失敗したサービスは再試行しても変わらないため待たない
+            results[name] = 'unavailable'
+            continue
+        started = time.perf_counter()
+        service.warm_up(WARMUP_TIMEOUT)
+        results[name] = 'warm'
+        logger.debug("ウォームアップ完了: %s (%.0fms)", name, (time.perf_counter() - started) * 1000)
+    return results
+
+
+def _run():
+    """
+    ウォームアップ用のバックグラウンドスレッドの本体
+    """
+    # 準備が完了するまで再試行する
+    while True:
+        try:
+            _state['services'] = warm_up_services()
+            _state['error'] = None
+            _state['ready_at'] = time.time()
+            _state['ready'] = True
+            logger.info(f"ウォームアップが完了しました (pid: {os.getpid()}, "
+                        f"{_state['ready_at'] - _state['started_at']:.2f}秒)")
+            break
+        except Exception as e:
+            _state['error'] = str(e)
+            logger.warning(f"ウォームアップに失敗しました。{WARMUP_RETRY_INTERVAL}秒後に再試行します: {e}")
+            time.sleep(WARMUP_RETRY_INTERVAL)
+
+    if KEEPALIVE_INTERVAL <= 0:
+        return
+
+    # アイドル中にチャネルが切断されても、次のリクエストで接続し直さずに済むようにする
+    # 上流が一時的に落ちても全ワーカーが振り分け対象外にならないよう、準備完了の状態は戻さない
+    while True:
+        time.sleep(KEEPALIVE_INTERVAL)
+        try:
+            warm_up_services()
+            _state['last_keepalive_at'] = time.time()
+            _state['error'] = None
+        except Exception as e:
+            _state['error'] = str(e)
+            logger.warning(f"接続の維持に失敗しました: {e}")
+
+
+def start_warmup():
+    """
+    現在のプロセスでウォームアップを開始する（プロセスごとに1回だけ）
+    gunicornのpost_worker_initフックと /readyz から呼び出します。
+    fork前の親プロセスで接続を作らないよう、アプリの読み込み時には呼び出さないこと
+    """
+    global _state, _state_pid
+
+    if not WARMUP_ENABLED:
+        return
+
+    with _lock:
+        if _state_pid == os.getpid():
+            return
+        _state_pid = os.getpid()
+        _state = {
+            'ready': False,
+            'started_at': time.time(),
+            'ready_at': None,
+            'last_keepalive_at': None,
+            'services': {},
+            'error': None
+        }
+    threading.Thread(target=_run, name='warmup', daemon=True).start()
+
+
+def readiness():
+    """
+    現在のプロセスの準備状態を返す
+
+    Returns:
+        'ready' を含む状態の辞書
+    """
+    if not WARMUP_ENABLED:
+        return {'ready': True, 'warmup': 'disabled'}
+    if _state_pid != os.getpid():
+        return {'ready': False, 'warmup': 'not_started'}
+    return dict(_state, pid=os.getpid())
@@ -0,0 +1,90 @@
+"""
+一括取り込みのベンチマーク
+
+フォルダーに置いたプリントの画像を import_prints.py と同じ処理（app.bulk_import）で読み取り（OCRとGemini APIは偽クライアント）、
+1件ずつ処理した場合（Webの画面から1件ずつアップロードするのと同じ）と並行して処理した場合について次の値を出力します。
+- 処理時間と、1分あたりに処理したファイル数
+- Vision APIとGemini APIの同時呼び出し数の最大値
+
+あわせて、同じチェックポイントで再実行したときに読み取り直したファイルの数を確認します。
+
+同時呼び出し数が上限を超えた場合や、再実行時に処理済みのファイルを読み取り直した場合は終了コード1で終了します。
+
+実行方法:
+    python -m benchmarks.bench_bulk_import --files 40 --workers 8 --ocr-concurrency 4 --llm-concurrency 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app import services
+from app.bulk_import import extract_all, file_digest, find_prints, load_checkpoint, DONE_STATUSES
+from benchmarks.fakes import FakeGeminiModel, FakeOCRProcessor, FakeTextAnalyzer, FakeVisionClient, Latency
+from benchmarks.load_test import make_print_image
+
+
+def run_import(root, output, workers, ocr_concurrency, llm_concurrency, ocr_latency, llm_latency):
+    """
+    チェックポイントに記録されていないファイルを読み取る
+
+    Returns:
+        (読み取ったファイル数, 処理時間（秒）, Vision APIの同時呼び出し数の最大値, Gemini APIの同時呼び出し数の最大値)
+    """
+    vision = FakeVisionClient(Latency(ocr_latency))
+    gemini = FakeGeminiModel(Latency(llm_latency))
+    services.set_service('ocr_processor', FakeOCRProcessor(vision))
+    services.set_service('text_analyzer', FakeTextAnalyzer(gemini))
+
+    extracted, _ = load_checkpoint(output)
+    keys = [(rel_path, file_digest(os.path.join(root, rel_path))) for rel_path in find_prints(root)]
+    pending = [key for key in keys if key not in extracted or extracted[key]['status'] not in DONE_STATUSES]
+    started = time.perf_counter()
+    with open(output, 'a', encoding='utf-8') as checkpoint:
+        results = extract_all(root, pending, checkpoint, workers, ocr_concurrency, llm_concurrency)
+    return len(results), time.perf_counter() - started, vision.max_inflight, gemini.max_inflight
+
+
+def main():
+    parser = argparse.ArgumentParser(description='一括取り込みのベンチマーク')
+    parser.add_argument('--files', type=int, default=40, help='取り込むプリントの画像の数')
+    parser.add_argument('--workers', type=int, default=8, help='並行して処理するファイルの数')
+    parser.add_argument('--ocr-concurrency', type=int, default=4, help='Vision APIの同時呼び出し数の上限')
+    parser.add_argument('--llm-concurrency', type=int, default=4, help='Gemini APIの同時呼び出し数の上限')
+    parser.add_argument('--ocr-latency', default='fixed:300', help='Vision APIの応答時間')
+    parser.add_argument('--llm-latency', default='fixed:600', help='Gemini APIの応答時間')
+    args = parser.parse_args()
+
+    failures = []
+    image_bytes = make_print_image()
+    print(f"files={args.files} ocr={args.ocr_latency} llm={args.llm_latency} "
+          f"ocr_concurrency={args.ocr_concurrency} llm_concurrency={args.llm_concurrency}")
+    print(f"{'mode':<12}{'files':>7}{'seconds':>9}{'files/min':>11}{'vision max':>12}{'gemini max':>12}")
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as out_dir:
+        for i in range(args.files):
+            with open(os.path.join(root, f"print-{i:03d}.png"), 'wb') as f:
+                f.write(image_bytes)
+
+        runs = (
+            ('sequential', 1, 1, 1, 'sequential.jsonl'),
+            ('parallel', args.workers, args.ocr_concurrency, args.llm_concurrency, 'parallel.jsonl'),
+            ('resume', args.workers, args.ocr_concurrency, args.llm_concurrency, 'parallel.jsonl'),
+        )
+        for mode, workers, ocr_concurrency, llm_concurrency, output in runs:
+            processed, seconds, vision_max, gemini_max = run_import(
+                root, os.path.join(out_dir, output), workers, ocr_concurrency, llm_concurrency,
+                args.ocr_latency, args.llm_latency
+            )
+            print(f"{mode:<12}{processed:>7}{seconds:>9.2f}{processed / seconds * 60 if processed else 0:>11.1f}"
+                  f"{vision_max:>12}{gemini_max:>12}")
+            if vision_max > ocr_concurrency or gemini_max > llm_concurrency:
+                failures.append(f"{mode}: 上流APIの同時呼び出し数が上限を超えました")
+            if mode == 'resume' and processed:
+                failures.append(f"再実行時に処理済みのファイルを{processed}件読み取り直しました")
+
+    if failures:
+        raise SystemExit('FAIL: ' + '\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
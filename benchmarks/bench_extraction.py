@@ -0,0 +1,157 @@
+"""
+抽出処理のベンチマーク（フィクスチャ再生）
+
+フィクスチャコーパスからVision API・Gemini APIの応答を再生し、ネットワークの影響なしに
+自前のコード（前処理、OCRレスポンスの処理、プロンプト作成・JSON解析、バリデーション）の
+CPU時間を計測します。あわせて、記録済みのプロンプトバージョンごとに予定抽出の精度を算出します。
+
+実行方法:
+    python -m benchmarks.bench_extraction --iterations 20 --corpus-version v1
+"""
+import argparse
+import copy
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+from collections import defaultdict
+
+STAGES = ('preprocess', 'ocr', 'analysis', 'validation')
+
+
+def normalize_title(title):
+    return ''.join(unicodedata.normalize('NFKC', title or '').split()).lower()
+
+
+def event_key(event):
+    return normalize_title(event.get('title')), event.get('start_date') or ''
+
+
+def score_events(predicted, expected):
+    """
+    予定単位の適合率・再現率を求める（タイトルと開始日が一致したものを正解とする）
+
+    Returns:
+        (一致件数, 予測件数, 正解件数)
+    """
+    predicted_keys = {event_key(e) for e in predicted if isinstance(e, dict)}
+    expected_keys = {event_key(e) for e in expected}
+    return len(predicted_keys & expected_keys), len(predicted_keys), len(expected_keys)
+
+
+class StageTimer:
+    def __init__(self):
+        self.cpu = defaultdict(float)
+        self.wall = defaultdict(float)
+
+    def measure(self, stage, func, *args):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        result = func(*args)
+        self.cpu[stage] += time.process_time() - cpu_start
+        self.wall[stage] += time.perf_counter() - wall_start
+        return result
+
+
+def run_print(manifest, ocr_processor, text_analyzer, timer, work_dir):
+    """
+    1枚のプリントを /upload と同じ順序で処理する
+    """
+    ext = manifest['file'].rsplit('.', 1)[-1].lower()
+    work_path = os.path.join(work_dir, manifest['file'])
+    shutil.copyfile(manifest['path'], work_path)
+
+    if ext == 'pdf':
+        text, layout = timer.measure('ocr', ocr_processor.process_pdf_layout, work_path)
+    else:
+        work_path = timer.measure('preprocess', ocr_processor.preprocess_image, work_path)
+        text, layout = timer.measure('ocr', ocr_processor.process_image_layout, work_path)
+
+    events = timer.measure('analysis', text_analyzer.extract_events, text, None, layout) if text else []
+
+    def validate_all():
+        return [text_analyzer.validate_event(copy.deepcopy(e)) for e in events]
+    timer.measure('validation', validate_all)
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抽出処理のベンチマーク（フィクスチャ再生）')
+    parser.add_argument('--iterations', type=int, default=20, help='コーパス全体を処理する回数')
+    parser.add_argument('--corpus-version', default=None, help='使用するコーパスバージョン')
+    args = parser.parse_args()
+
+    # app.configの読み込み前に再生モードを有効にする
+    os.environ['API_RECORDING_MODE'] = 'replay'
+    if args.corpus_version:
+        os.environ['FIXTURE_CORPUS_VERSION'] = args.corpus_version
+
+    from app import recording
+    from app.ocr import OCRProcessor
+    from app.text_analysis import TextAnalyzer
+
+    logging.basicConfig(level=logging.ERROR)
+    corpus = recording.get_corpus()
+    prints = corpus.prints()
+    if not prints:
+        sys.exit(f"コーパスにプリントがありません: {corpus.path}")
+
+    ocr_processor = OCRProcessor()
+    text_analyzer = TextAnalyzer(api_key=None)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 1回目はフィクスチャの読み込みと逆シリアライズを済ませるため計測しない
+        warmup = StageTimer()
+        current = {m['print_id']: run_print(m, ocr_processor, text_analyzer, warmup, work_dir) for m in prints}
+
+        timer = StageTimer()
+        for _ in range(args.iterations):
+            for manifest in prints:
+                run_print(manifest, ocr_processor, text_analyzer, timer, work_dir)
+
+    runs = args.iterations * len(prints)
+    print(f"corpus={corpus.path} prints={len(prints)} iterations={args.iterations} "
+          f"prompt_version={text_analyzer.prompt_version}")
+    print(f"{'stage':<12}{'cpu/print(ms)':>15}{'wall/print(ms)':>16}")
+    for stage in STAGES:
+        print(f"{stage:<12}{timer.cpu[stage] / runs * 1000:>15.3f}{timer.wall[stage] / runs * 1000:>16.3f}")
+    print(f"{'total':<12}{sum(timer.cpu.values()) / runs * 1000:>15.3f}{sum(timer.wall.values()) / runs * 1000:>16.3f}")
+
+    # プロンプトバージョンごとの精度（記録済みレスポンスを現在の解析コードで評価）
+    # 正解データが未確認のプリントは記録結果そのものなので評価対象外とする
+    reviewed = [m for m in prints if m.get('reviewed')]
+    totals = defaultdict(lambda: [0, 0, 0, 0])
+    for manifest in reviewed:
+        expected = manifest.get('expected_events', [])
+        for version, key in manifest.get('gemini', {}).items():
+            try:
+                record = corpus.gemini_record(key)
+                predicted = text_analyzer.parse_response(record['response_text'])
+            except (recording.FixtureNotFoundError, ValueError):
+                predicted = []
+            matched, n_pred, n_exp = score_events(predicted, expected)
+            totals[version][0] += matched
+            totals[version][1] += n_pred
+            totals[version][2] += n_exp
+            totals[version][3] += 1
+    # 現在のコードで再生した結果
+    for manifest in reviewed:
+        matched, n_pred, n_exp = score_events(current[manifest['print_id']], manifest.get('expected_events', []))
+        totals['replay'][0] += matched
+        totals['replay'][1] += n_pred
+        totals['replay'][2] += n_exp
+        totals['replay'][3] += 1
+
+    print(f"accuracy (reviewed prints: {len(reviewed)}/{len(prints)})")
+    print(f"{'prompt':<32}{'prints':>8}{'precision':>11}{'recall':>9}{'f1':>7}")
+    for version, (matched, n_pred, n_exp, count) in sorted(totals.items()):
+        precision = matched / n_pred if n_pred else 0.0
+        recall = matched / n_exp if n_exp else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        print(f"{version:<32}{count:>8}{precision:>11.3f}{recall:>9.3f}{f1:>7.3f}")
+
+
+if __name__ == '__main__':
+    main()
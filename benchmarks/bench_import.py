@@ -0,0 +1,135 @@
+"""
+起動時のインポート時間の計測
+
+新しいインタープリタで `python -X importtime` を使って app.main を読み込み、
+トップページと静的ファイルを1回ずつ返すまでの時間と、パッケージ別のインポート時間を報告します。
+この時点でGoogle SDKなどの重いモジュールが読み込まれていた場合は失敗として終了コード1を返すため、
+インポートの遅延が崩れていないかの回帰チェックとして使用できます。
+
+実行方法:
+    python -m benchmarks.bench_import --repeat 5 --max-import-ms 400
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# 最初のリクエストまでに読み込まれてはならないモジュール（使用時に読み込む）
+HEAVY_MODULES = (
+    'google.cloud.vision',
+    'google.generativeai',
+    'googleapiclient.discovery',
+    'google_auth_oauthlib',
+    'google.oauth2.credentials',
+    'grpc',
+    'PIL',
+    'fitz',
+)
+
+# 子プロセスで実行するスクリプト
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+client = app.main.app.test_client()
+statuses = [client.get('/').status_code, client.get('/static/css/style.css').status_code]
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (served - started) * 1000,
+    'statuses': statuses,
+    'heavy_loaded': [m for m in %r if m in sys.modules],
+}))
+"""
+
+IMPORTTIME_PATTERN = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def package_of(module):
+    """
+    集計用のパッケージ名（google配下は2階層目まで）
+    """
+    parts = module.split('.')
+    if parts[0] == 'google' and len(parts) > 1:
+        return '.'.join(parts[:2])
+    return parts[0]
+
+
+def run_once():
+    """
+    新しいプロセスで1回計測する
+
+    Returns:
+        (子プロセスの計測結果, プロセス起動から終了までの秒数, パッケージ別のインポート時間(μs))
+    """
+    env = dict(os.environ, LOG_LEVEL='WARNING')
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT % (HEAVY_MODULES,)],
+        capture_output=True, text=True, env=env
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"計測用プロセスが失敗しました:\n{proc.stderr[-2000:]}")
+
+    self_times = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            self_times[package_of(match.group(4))] += int(match.group(1))
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result, wall, self_times
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='起動時のインポート時間の計測')
+    parser.add_argument('--repeat', type=int, default=5, help='計測回数（中央値を報告）')
+    parser.add_argument('--top', type=int, default=15, help='表示するパッケージ数')
+    parser.add_argument('--max-import-ms', type=float, default=None, help='app.mainのインポート時間の上限')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.repeat)]
+    results = [r for r, _, _ in runs]
+    import_ms = median([r['import_ms'] for r in results])
+    first_response_ms = median([r['first_response_ms'] for r in results])
+    process_ms = median([wall * 1000 for _, wall, _ in runs])
+
+    print(f"repeat={args.repeat} python={sys.version.split()[0]}")
+    print(f"import app.main={import_ms:.0f}ms first_response={first_response_ms:.0f}ms "
+          f"process_total={process_ms:.0f}ms statuses={results[-1]['statuses']}")
+
+    totals = defaultdict(list)
+    for _, _, self_times in runs:
+        for package, us in self_times.items():
+            totals[package].append(us)
+    ranked = sorted(((median(v), p) for p, v in totals.items()), reverse=True)[:args.top]
+    print(f"{'package':<32}{'self(ms)':>10}")
+    for us, package in ranked:
+        print(f"{package:<32}{us / 1000:>10.1f}")
+
+    # 回帰チェック
+    violations = []
+    heavy = sorted({m for r in results for m in r['heavy_loaded']})
+    if heavy:
+        violations.append(f"最初のリクエストまでに読み込まれたモジュール: {', '.join(heavy)}")
+    if any(status >= 400 for r in results for status in r['statuses']):
+        violations.append(f"トップページまたは静的ファイルの取得に失敗しました: {results[-1]['statuses']}")
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        violations.append(f"import app.main {import_ms:.0f}ms > {args.max_import_ms:.0f}ms")
+    for violation in violations:
+        print(f"FAIL: {violation}")
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == '__main__':
+    main()
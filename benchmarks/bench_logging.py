@@ -0,0 +1,127 @@
+"""
+ロギングのオーバーヘッド計測ベンチマーク
+
+1リクエスト分のログ出力（INFOログ、DEBUGペイロード、スパンログ）を模擬し、
+リクエストスレッドで消費される時間を以下の構成で比較します
+  - sync : 従来の構成（ハンドラをルートロガーに直接接続し、リクエストスレッドでファイルI/O）
+  - queue: QueueHandler/QueueListener構成（setup_logging）
+
+実行方法:
+    python -m benchmarks.bench_logging --requests 2000
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from flask import Flask
+
+from app import logging_config
+from app.tracing import RequestIdFilter, start_trace, end_trace, span
+
+logger = logging.getLogger('app.bench')
+
+# create_eventのデバッグログに渡される程度の大きさのペイロード
+EVENT_PAYLOAD = {
+    'title': '授業参観・学級懇談会',
+    'description': '5校時に授業参観、その後各教室で学級懇談会を行います。' * 4,
+    'start_date': '2025-04-18',
+    'end_date': '2025-04-18',
+    'start_time': '13:30',
+    'end_time': '15:00',
+    'all_day': False,
+    'location': '各教室',
+    'confidence': 0.92
+}
+
+
+def setup_sync_logging(log_dir):
+    """
+    従来と同じく、出力先ハンドラをルートロガーに直接接続する
+    """
+    logging_config.stop_log_listener()
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    for handler in logging_config._build_handlers(log_dir, logging.INFO):
+        handler.addFilter(RequestIdFilter())
+        root_logger.addHandler(handler)
+    root_logger.setLevel(logging.INFO)
+
+
+def simulate_request(eager_debug):
+    """
+    /uploadの1リクエスト分に相当するログ出力を行う
+    """
+    start_trace('POST /upload', path='/upload')
+    logger.info("ファイルが保存されました: /app/app/uploads/example.png")
+    with span('ocr.process_image', payload_bytes=2_000_000):
+        logger.info("画像の前処理が完了しました")
+        logger.info("テキスト抽出に成功しました: 1532 文字")
+    with span('analysis.extract_events'):
+        with span('gemini.generate_content'):
+            pass
+        logger.info("12件のイベントが抽出されました")
+    for _ in range(5):
+        with span('calendar.create_event'):
+            if eager_debug:
+                logger.debug(f"イベント作成データ: {EVENT_PAYLOAD}")
+            else:
+                logger.debug("イベント作成データ: %s", EVENT_PAYLOAD)
+            logger.info("イベントが作成されました: abc123")
+    end_trace()
+
+
+def run(mode, requests, eager_debug, gap_ms):
+    durations = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        simulate_request(eager_debug)
+        durations.append((time.perf_counter() - start) * 1_000_000)
+        # 実際のリクエストではAPI待ちの間にバックグラウンドスレッドが書き込む
+        if gap_ms:
+            time.sleep(gap_ms / 1000)
+    drain_start = time.perf_counter()
+    logging_config.stop_log_listener()
+    drain = (time.perf_counter() - drain_start) * 1000
+    durations.sort()
+    return {
+        'mode': mode,
+        'mean_us': statistics.mean(durations),
+        'p50_us': durations[len(durations) // 2],
+        'p99_us': durations[int(len(durations) * 0.99) - 1],
+        'drain_ms': drain
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ロギングのオーバーヘッド計測')
+    parser.add_argument('--requests', type=int, default=2000, help='模擬するリクエスト数')
+    parser.add_argument('--gap-ms', type=float, default=1.0, help='リクエスト間の待ち時間（API待ちの模擬、計測対象外）')
+    parser.add_argument('--eager-debug', action='store_true', help='DEBUGペイロードをf文字列で事前に整形する')
+    args = parser.parse_args()
+
+    # 標準出力への書き込みはベンチマーク結果を汚すため捨てる
+    real_stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+
+    results = []
+    with tempfile.TemporaryDirectory() as log_dir:
+        setup_sync_logging(log_dir)
+        results.append(run('sync', args.requests, args.eager_debug, args.gap_ms))
+
+        logging_config.setup_logging(Flask('bench'), log_dir=log_dir)
+        results.append(run('queue', args.requests, args.eager_debug, args.gap_ms))
+
+    sys.stderr = real_stderr
+    print(f"requests={args.requests} gap_ms={args.gap_ms} eager_debug={args.eager_debug}")
+    print(f"{'mode':<8}{'mean(us)':>12}{'p50(us)':>12}{'p99(us)':>12}{'drain(ms)':>12}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['mean_us']:>12.1f}{r['p50_us']:>12.1f}{r['p99_us']:>12.1f}{r['drain_ms']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Gemini APIレスポンス解析のベンチマーク
+
+LLMの出力によくある崩れ方（前後の説明文、末尾のカンマ、Pythonのリテラル、途中での打ち切りなど）を
+再現したレスポンスを生成し、崩れ方ごとに1回あたりの解析時間と取り出せた予定の割合を、
+従来の解析方法（```json のコードブロックを正規表現で取り出してjson.loads）と比較します。
+
+実行方法:
+    python -m benchmarks.bench_parse --events 8 --iterations 2000
+"""
+import argparse
+import json
+import re
+import time
+
+from app.response_parser import parse_events
+from benchmarks.fakes import sample_events
+
+LEGACY_JSON_BLOCK_PATTERN = re.compile(r'```json\n([\s\S]*?)\n```')
+
+
+def legacy_parse(response_text):
+    """
+    従来の解析方法（解析できない場合は予定なし）
+    """
+    match = LEGACY_JSON_BLOCK_PATTERN.search(response_text)
+    json_str = match.group(1) if match else response_text.strip()
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        return []
+
+
+def corrupted_responses(events):
+    """
+    崩れ方ごとのレスポンスと、そのレスポンスから取り出せるべき予定の件数を返す
+    """
+    body = json.dumps(events, ensure_ascii=False, indent=2)
+    truncated = body[:body.rindex('{')] + '{"title": "途中で'
+    return {
+        'clean': (body, len(events)),
+        'fenced': (f"```json\n{body}\n```", len(events)),
+        'prose': (f"抽出した予定は以下のとおりです。\n{body}\n以上です。", len(events)),
+        'trailing_comma': (body.replace('\n  }', ',\n  }').replace('}\n]', '},\n]'), len(events)),
+        'python_literal': (body.replace('true', 'True').replace('false', 'False'), len(events)),
+        'truncated': (f"```json\n{truncated}", len(events) - 1),
+        'wrapped': (json.dumps({'events': events}, ensure_ascii=False), len(events)),
+        'bad_object': (body.replace('"location"', '"location" "x"', 1), len(events) - 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gemini APIレスポンス解析のベンチマーク')
+    parser.add_argument('--events', type=int, default=8, help='1レスポンスあたりの予定の件数')
+    parser.add_argument('--iterations', type=int, default=2000, help='崩れ方ごとの解析回数')
+    args = parser.parse_args()
+
+    print(f"events={args.events} iterations={args.iterations}")
+    print(f"{'case':<16}{'status':>10}{'legacy':>8}{'parsed':>8}{'expected':>10}"
+          f"{'legacy(us)':>12}{'parse(us)':>11}")
+    salvaged = malformed = 0
+    for case, (text, expected) in corrupted_responses(sample_events(args.events)).items():
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            legacy = legacy_parse(text)
+        legacy_us = (time.perf_counter() - started) / args.iterations * 1e6
+
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            result = parse_events(text)
+        parse_us = (time.perf_counter() - started) / args.iterations * 1e6
+
+        if result.status != 'ok':
+            malformed += 1
+            salvaged += result.status == 'salvaged'
+        print(f"{case:<16}{result.status:>10}{len(legacy):>8}{len(result.events):>8}{expected:>10}"
+              f"{legacy_us:>12.1f}{parse_us:>11.1f}")
+        if len(result.events) != expected:
+            raise SystemExit(f"FAIL: {case} で取り出せた予定が {len(result.events)}件です（期待値: {expected}件）")
+    print(f"salvage rate: {salvaged}/{malformed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+プロンプトの事前絞り込みのベンチマーク
+
+フィクスチャコーパスのOCRテキスト（Vision APIの応答を再生）に絞り込みを適用し、
+プリントごとのプロンプトのトークン数を絞り込みの前後で比較します。
+あわせて、確認済みのプリントの正解の予定について、日付とタイトルの記述が絞り込み後の
+テキストに残っている割合（再現率）を求め、--min-recall を下回った場合は終了コード1で終了します。
+コーパスにプリントがない場合は、組み込みのサンプルのプリントで計測します。
+
+トークン数は既定ではAPIを呼び出さない推定値です。--count-tokens を指定すると
+Gemini APIのcount_tokensで実際のトークン数を数えます（GEMINI_API_KEYが必要）。
+
+実行方法:
+    python -m benchmarks.bench_prefilter --corpus-version v1 --min-recall 1.0
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+
+
+def normalize(text):
+    return ''.join(unicodedata.normalize('NFKC', text or '').split())
+
+
+def date_evidence_patterns(start_date):
+    """
+    開始日の記述として探す正規表現を優先度の高い順に返す（月日、M/D、日のみ）
+    """
+    _, month, day = (int(part) for part in start_date.split('-'))
+    return [
+        re.compile(rf'(?<!\d){month}月{day}日'),
+        re.compile(rf'(?<![\d/]){month}/{day}(?![\d/])'),
+        re.compile(rf'(?<!\d){day}日'),
+    ]
+
+
+def covered_events(original, filtered, expected):
+    """
+    正解の予定のうち、元のテキストにある記述が絞り込み後も残っている件数を求める
+
+    元のテキストで見つかった最も具体的な日付の記述と、タイトル（元のテキストに含まれる場合）が
+    どちらも絞り込み後のテキストに残っていれば、その予定は抽出可能とみなす
+
+    Returns:
+        (残っている件数, 元のテキストに記述がある件数)
+    """
+    original_text, filtered_text = normalize(original), normalize(filtered)
+    covered = total = 0
+    for event in expected:
+        try:
+            patterns = date_evidence_patterns(event.get('start_date') or '')
+        except ValueError:
+            continue
+        pattern = next((p for p in patterns if p.search(original_text)), None)
+        if pattern is None:
+            continue
+        total += 1
+        title = normalize(event.get('title'))
+        title_ok = title not in original_text or title in filtered_text
+        if pattern.search(filtered_text) and title_ok:
+            covered += 1
+    return covered, total
+
+
+def load_corpus_texts(corpus_version):
+    """
+    フィクスチャコーパスの各プリントのOCRテキストを再生して返す
+
+    Returns:
+        [(プリントID, OCRテキスト, 正解の予定（未確認の場合はNone）), ...]
+    """
+    from app import recording
+    from app.ocr import OCRProcessor
+
+    corpus = recording.get_corpus()
+    ocr_processor = OCRProcessor()
+    texts = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for manifest in corpus.prints():
+            ext = manifest['file'].rsplit('.', 1)[-1].lower()
+            work_path = os.path.join(work_dir, manifest['file'])
+            shutil.copyfile(manifest['path'], work_path)
+            if ext == 'pdf':
+                text = ocr_processor.process_pdf(work_path)
+            else:
+                text = ocr_processor.process_image(ocr_processor.preprocess_image(work_path))
+            expected = manifest.get('expected_events', []) if manifest.get('reviewed') else None
+            texts.append((manifest['print_id'], text or '', expected))
+    return corpus.path, texts
+
+
+def api_token_counter(model):
+    """
+    Gemini APIの count_tokens でプロンプトのトークン数を数える関数を返す
+    """
+    def count_tokens(prompt):
+        return model.count_tokens(prompt).total_tokens
+    return count_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description='プロンプトの事前絞り込みのベンチマーク')
+    parser.add_argument('--corpus-version', default=None, help='使用するコーパスバージョン')
+    parser.add_argument('--sample', action='store_true', help='コーパスを使わずサンプルのプリントで計測する')
+    parser.add_argument('--context-lines', type=int, default=None, help='手がかりのある行の前後に残す行数')
+    parser.add_argument('--min-score', type=int, default=None, help='手がかりのある行とみなす点数の下限')
+    parser.add_argument('--min-recall', type=float, default=1.0, help='許容する再現率の下限')
+    parser.add_argument('--count-tokens', action='store_true', help='Gemini APIで実際のトークン数を数える')
+    args = parser.parse_args()
+
+    # app.configの読み込み前に再生モードを有効にする
+    os.environ['API_RECORDING_MODE'] = 'replay'
+    if args.corpus_version:
+        os.environ['FIXTURE_CORPUS_VERSION'] = args.corpus_version
+
+    from app.config import GEMINI_API_KEY
+    from app.prefilter import filter_text, estimate_tokens
+    from app.text_analysis import TextAnalyzer
+    from benchmarks.fakes import sample_newsletter_text, sample_print_text
+
+    logging.basicConfig(level=logging.ERROR)
+
+    source, texts = ('sample', [])
+    if not args.sample:
+        source, texts = load_corpus_texts(args.corpus_version)
+    if not texts:
+        if not args.sample:
+            print(f"コーパスにプリントがないため、サンプルのプリントで計測します: {source}")
+        newsletter, newsletter_events = sample_newsletter_text()
+        source, texts = 'sample', [('newsletter', newsletter, newsletter_events),
+                                   ('short', sample_print_text(), None)]
+
+    count_tokens = estimate_tokens
+    token_kind = 'estimated'
+    if args.count_tokens:
+        if not GEMINI_API_KEY:
+            sys.exit('--count-tokens にはGEMINI_API_KEYが必要です')
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        count_tokens = api_token_counter(genai.GenerativeModel('gemini-1.5-pro'))
+        token_kind = 'count_tokens'
+
+    text_analyzer = TextAnalyzer(api_key=None)
+    print(f"source={source} prints={len(texts)} tokens={token_kind}")
+    print(f"{'print':<18}{'lines':>7}{'kept':>6}{'tokens before':>15}{'tokens after':>14}"
+          f"{'saved':>8}{'filter(ms)':>12}{'events':>8}")
+
+    total_before = total_after = 0
+    total_covered = total_expected = 0
+    for print_id, text, expected in texts:
+        started = time.perf_counter()
+        result = filter_text(text, context_lines=args.context_lines, min_score=args.min_score)
+        elapsed = time.perf_counter() - started
+
+        before = count_tokens(text_analyzer.build_prompt(text))
+        after = count_tokens(text_analyzer.build_prompt(result.text))
+        total_before += before
+        total_after += after
+
+        events = '-'
+        if expected is not None:
+            covered, n_expected = covered_events(text, result.text, expected)
+            total_covered += covered
+            total_expected += n_expected
+            events = f"{covered}/{n_expected}"
+        saved = 1 - after / before if before else 0.0
+        print(f"{print_id[:16]:<18}{result.lines_total:>7}{result.lines_kept:>6}{before:>15}{after:>14}"
+              f"{saved:>8.1%}{elapsed * 1000:>12.3f}{events:>8}")
+
+    recall = total_covered / total_expected if total_expected else 1.0
+    saved = 1 - total_after / total_before if total_before else 0.0
+    print(f"{'total':<18}{'':>13}{total_before:>15}{total_after:>14}{saved:>8.1%}")
+    print(f"evidence recall (reviewed prints): {total_covered}/{total_expected} = {recall:.3f}")
+    if recall < args.min_recall:
+        raise SystemExit(f"FAIL: 再現率 {recall:.3f} が下限 {args.min_recall:.3f} を下回りました")
+
+
+if __name__ == '__main__':
+    main()
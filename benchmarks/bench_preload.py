@@ -0,0 +1,107 @@
+"""
+gunicornのpreload有無によるワーカー起動時間とメモリ使用量の比較
+
+gunicorn.conf.py の設定でサーバーを起動し、全ワーカーの準備が完了するまでの時間と、
+各ワーカーのRSS・PSS（共有ページをプロセス数で按分したメモリ量）を計測します。
+preloadが有効な場合、読み込み済みのモジュールは親プロセスと共有されるため、PSSが小さくなります。
+
+実行方法:
+    python -m benchmarks.bench_preload --workers 4 --repeat 3
+"""
+import argparse
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+READY_PATTERN = re.compile(r'ワーカーの起動が完了しました \(pid: (\d+)\)')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory_kb(pid):
+    """
+    プロセスのRSSとPSSをKB単位で返す
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                values[key] = int(rest.split()[0])
+    return values.get('Rss', 0), values.get('Pss', 0)
+
+
+def boot_once(workers, preload, timeout):
+    """
+    サーバーを1回起動して計測し、停止する
+
+    Returns:
+        (全ワーカー準備完了までの秒数, [(RSS, PSS), ...]（ワーカーごと）, 親プロセスの(RSS, PSS))
+    """
+    # 外部APIへの接続準備による読み込みを含めないよう、ウォームアップは無効にする
+    env = dict(os.environ, GUNICORN_PRELOAD='true' if preload else 'false', WARMUP_ENABLED='false')
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+         '--bind', f"127.0.0.1:{free_port()}", '--workers', str(workers), 'app.main:app'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env, text=True
+    )
+    ready = []
+    all_ready = threading.Event()
+
+    def read_log():
+        for line in proc.stderr:
+            match = READY_PATTERN.search(line)
+            if match:
+                ready.append((time.perf_counter() - started, int(match.group(1))))
+                if len(ready) == workers:
+                    all_ready.set()
+
+    reader = threading.Thread(target=read_log, daemon=True)
+    reader.start()
+    try:
+        if not all_ready.wait(timeout):
+            raise RuntimeError(f"{timeout}秒以内にワーカーが起動しませんでした（準備完了: {len(ready)}/{workers}）")
+        # 起動直後の一時的な確保が落ち着くのを待つ
+        time.sleep(0.5)
+        worker_memory = [memory_kb(pid) for _, pid in ready]
+        master_memory = memory_kb(proc.pid)
+        return max(t for t, _ in ready), worker_memory, master_memory
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gunicornのpreload有無による起動時間とメモリの比較')
+    parser.add_argument('--workers', type=int, default=4, help='起動するワーカー数')
+    parser.add_argument('--repeat', type=int, default=3, help='各構成の起動回数')
+    parser.add_argument('--timeout', type=float, default=60, help='起動待ちのタイムアウト（秒）')
+    args = parser.parse_args()
+
+    print(f"workers={args.workers} repeat={args.repeat}")
+    print(f"{'preload':<9}{'boot(s)':>9}{'worker RSS(MB)':>16}{'worker PSS(MB)':>16}{'total PSS(MB)':>15}")
+    for preload in (False, True):
+        boots, rss, pss, totals = [], [], [], []
+        for _ in range(args.repeat):
+            boot, worker_memory, master_memory = boot_once(args.workers, preload, args.timeout)
+            boots.append(boot)
+            rss.extend(r for r, _ in worker_memory)
+            pss.extend(p for _, p in worker_memory)
+            totals.append(master_memory[1] + sum(p for _, p in worker_memory))
+        print(f"{'on' if preload else 'off':<9}{sum(boots) / len(boots):>9.2f}"
+              f"{sum(rss) / len(rss) / 1024:>16.1f}{sum(pss) / len(pss) / 1024:>16.1f}"
+              f"{sum(totals) / len(totals) / 1024:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+モデル振り分けの評価（フィクスチャ再生）
+
+フィクスチャコーパスに記録された高速なモデルと上位モデルの両方の応答を使い、
+振り分けの基準（確信度の下限など）ごとに、上位モデルで抽出し直す割合（escalation）、
+確認済みのプリントに対する抽出精度、記録時のAPI応答時間から求めたレイテンシの中央値・p95を比較します。
+APIを呼び出さずに基準を調整できます（両方のモデルの応答は record_corpus で記録されます）。
+
+--max-f1-drop を指定すると、現在の設定での振り分けのF1が上位モデルのみの場合より
+指定値を超えて低下したときに終了コード1で終了します。
+
+実行方法:
+    python -m benchmarks.bench_routing --corpus-version v1 --confidences 0.5,0.6,0.7,0.8,0.9
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+
+def replay_ocr_text(manifest, ocr_processor, work_dir):
+    """
+    プリントのOCRテキストを記録から再生する
+    """
+    ext = manifest['file'].rsplit('.', 1)[-1].lower()
+    work_path = os.path.join(work_dir, manifest['file'])
+    shutil.copyfile(manifest['path'], work_path)
+    if ext == 'pdf':
+        return ocr_processor.process_pdf(work_path) or ''
+    return ocr_processor.process_image(ocr_processor.preprocess_image(work_path)) or ''
+
+
+def summarize(name, outcomes, percentile, score_events):
+    """
+    1つの方針の結果を集計して表の1行を出力する
+
+    Args:
+        outcomes: [(予測した予定, 正解の予定, レイテンシ(ms)またはNone, 抽出し直したか), ...]
+
+    Returns:
+        F1
+    """
+    matched = n_pred = n_exp = 0
+    for predicted, expected, _, _ in outcomes:
+        m, p, e = score_events(predicted or [], expected)
+        matched, n_pred, n_exp = matched + m, n_pred + p, n_exp + e
+    precision = matched / n_pred if n_pred else 0.0
+    recall = matched / n_exp if n_exp else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    latencies = [latency for _, _, latency, _ in outcomes if latency is not None]
+    escalated = sum(1 for *_, escalated in outcomes if escalated) / len(outcomes)
+    print(f"{name:<22}{escalated:>11.1%}{precision:>11.3f}{recall:>9.3f}{f1:>7.3f}"
+          f"{percentile(latencies, 50):>10.0f}{percentile(latencies, 95):>10.0f}")
+    return f1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='モデル振り分けの評価（フィクスチャ再生）')
+    parser.add_argument('--corpus-version', default=None, help='使用するコーパスバージョン')
+    parser.add_argument('--confidences', default='0.5,0.6,0.7,0.8,0.9', help='比較する確信度の下限（カンマ区切り）')
+    parser.add_argument('--max-invalid-ratio', type=float, default=None, help='バリデーションに失敗した予定の割合の上限')
+    parser.add_argument('--max-f1-drop', type=float, default=None, help='上位モデルのみと比べて許容するF1の低下幅')
+    args = parser.parse_args()
+
+    # app.configの読み込み前に再生モードを有効にする
+    os.environ['API_RECORDING_MODE'] = 'replay'
+    if args.corpus_version:
+        os.environ['FIXTURE_CORPUS_VERSION'] = args.corpus_version
+
+    from app import recording
+    from app.config import ROUTING_MIN_CONFIDENCE
+    from app.ocr import OCRProcessor
+    from app.response_parser import parse_events
+    from app.routing import FAST, PRO, initial_tier, escalation_reason
+    from app.text_analysis import TextAnalyzer
+    from benchmarks.bench_extraction import score_events
+    from benchmarks.load_test import percentile
+
+    logging.basicConfig(level=logging.ERROR)
+    corpus = recording.get_corpus()
+    text_analyzer = TextAnalyzer(api_key=None)
+    ocr_processor = OCRProcessor()
+
+    # 確認済みで、両方のモデルの応答が記録されているプリントだけを評価する
+    prints = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for manifest in corpus.prints():
+            if not manifest.get('reviewed'):
+                continue
+            records = {}
+            for tier in (FAST, PRO):
+                key = manifest.get('gemini', {}).get(text_analyzer.tier_version(tier))
+                try:
+                    records[tier] = corpus.gemini_record(key) if key else None
+                except recording.FixtureNotFoundError:
+                    records[tier] = None
+            if None in records.values():
+                continue
+            text = replay_ocr_text(manifest, ocr_processor, work_dir)
+            results = {}
+            for tier, record in records.items():
+                result = parse_events(record['response_text'])
+                results[tier] = (None if result.status == 'failed' else result.events, record.get('latency_ms'))
+            prints.append((text, manifest.get('expected_events', []), results))
+
+    if not prints:
+        sys.exit(f"両方のモデルの応答が記録された確認済みのプリントがありません: {corpus.path}")
+
+    print(f"corpus={corpus.path} prints={len(prints)} "
+          f"fast={text_analyzer.model_names[FAST]} pro={text_analyzer.model_names[PRO]}")
+    print(f"{'policy':<22}{'escalation':>11}{'precision':>11}{'recall':>9}{'f1':>7}{'p50(ms)':>10}{'p95(ms)':>10}")
+
+    def single(tier):
+        return [(results[tier][0], expected, results[tier][1], tier == PRO) for _, expected, results in prints]
+
+    summarize(f"{FAST} only", single(FAST), percentile, score_events)
+    pro_f1 = summarize(f"{PRO} only", single(PRO), percentile, score_events)
+
+    confidences = sorted({float(c) for c in args.confidences.split(',')} | {ROUTING_MIN_CONFIDENCE})
+    configured_f1 = None
+    for min_confidence in confidences:
+        outcomes = []
+        reasons = Counter()
+        for text, expected, results in prints:
+            fast_events, fast_latency = results[FAST]
+            pro_events, pro_latency = results[PRO]
+            tier, reason = initial_tier(text)
+            if tier == FAST:
+                reason = escalation_reason(fast_events, text_analyzer.validate_event,
+                                           min_confidence=min_confidence, max_invalid_ratio=args.max_invalid_ratio)
+            if reason is None:
+                outcomes.append((fast_events, expected, fast_latency, False))
+                continue
+            reasons[reason] += 1
+            # 高速なモデルで抽出した後に抽出し直した場合は、両方の応答時間がかかる
+            latency = None
+            if pro_latency is not None and (tier == PRO or fast_latency is not None):
+                latency = pro_latency + (fast_latency if tier == FAST else 0)
+            outcomes.append((pro_events, expected, latency, True))
+        marker = '*' if min_confidence == ROUTING_MIN_CONFIDENCE else ''
+        f1 = summarize(f"routed conf>={min_confidence:g}{marker}", outcomes, percentile, score_events)
+        if marker:
+            configured_f1 = f1
+            configured_reasons = reasons
+
+    print(f"* 現在の設定（ROUTING_MIN_CONFIDENCE={ROUTING_MIN_CONFIDENCE:g}）の抽出し直しの理由: "
+          + (', '.join(f"{reason}={count}" for reason, count in configured_reasons.most_common()) or 'なし'))
+    if args.max_f1_drop is not None and pro_f1 - configured_f1 > args.max_f1_drop:
+        raise SystemExit(f"FAIL: 振り分けのF1 {configured_f1:.3f} が上位モデルのみ（{pro_f1:.3f}）から"
+                         f"{args.max_f1_drop:.3f}を超えて低下しました")
+
+
+if __name__ == '__main__':
+    main()
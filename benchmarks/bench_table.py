@@ -0,0 +1,173 @@
+"""
+行事予定表の読み取りのベンチマーク
+
+Vision APIの型（vision.TextAnnotation）で月間の行事予定表（「日・曜・行事予定」の表）を組み立て、
+単語の配置の取り出し（WordLayout）と表の読み取りにかかる時間、Protocol Buffersのまま保持する場合との
+メモリ量の比較、読み取れた予定の件数と正解との一致、Gemini APIの呼び出しを省略できるかを出力します。
+表の前後にお知らせの文章がある場合は、Gemini APIに送るテキストのトークン数の削減量を出力します。
+読み取った予定が正解と一致しない場合は終了コード1で終了します。
+
+実行方法:
+    python -m benchmarks.bench_table --rows 20 --iterations 50
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from google.cloud import vision
+
+from app.config import TABLE_SKIP_LLM_COVERAGE
+from app.layout import WordLayout
+from app.prefilter import estimate_tokens
+from app.table_parser import parse_table
+
+WEEKDAYS = '月火水木金土日'
+PAGE_WIDTH, PAGE_HEIGHT = 2480, 3508  # A4・300dpi
+CHAR_WIDTH, LINE_HEIGHT = 40, 44
+DAY_X, WEEKDAY_X, EVENT_X = 200, 360, 520
+
+EVENT_TITLES = [
+    ('始業式', ''), ('入学式', '10:00'), ('身体測定', ''), ('避難訓練', '10:30'),
+    ('授業参観', '13:30'), ('PTA総会', '14:30'), ('遠足', ''), ('家庭訪問', ''),
+    ('委員会活動', '14:45'), ('クラブ活動', '14:45'), ('歯科検診', ''), ('交通安全教室', '09:00'),
+]
+LETTER_LINES = [
+    '保護者の皆様へ',
+    '新年度が始まりました。本年度もどうぞよろしくお願いいたします。',
+    '登校時は交通ルールを守り、集団で安全に登校するようご家庭でもお声かけください。',
+    '持ち物には必ず記名をお願いします。上履きは毎週金曜日に持ち帰ります。',
+    '欠席・遅刻の連絡は朝8時までに連絡帳または電話でお願いいたします。',
+    'ご不明な点がありましたら担任までお問い合わせください。',
+]
+
+
+def _word(text, x, y, page, normalized):
+    """
+    1単語分のvision.Wordを作成する（1文字ずつのSymbolを持つ）
+    """
+    x1, y1 = x + CHAR_WIDTH * len(text), y + LINE_HEIGHT
+    corners = [(x, y), (x1, y), (x1, y1), (x, y1)]
+    if normalized:
+        box = vision.BoundingPoly(normalized_vertices=[
+            vision.NormalizedVertex(x=cx / PAGE_WIDTH, y=cy / PAGE_HEIGHT) for cx, cy in corners
+        ])
+    else:
+        box = vision.BoundingPoly(vertices=[vision.Vertex(x=cx, y=cy) for cx, cy in corners])
+    page.append(vision.Word(symbols=[vision.Symbol(text=c) for c in text], bounding_box=box))
+
+
+def _cell(text, x, y, page, normalized):
+    """
+    セルの文字列を2～3文字ずつの単語に分けて並べる（Vision APIの日本語の単語の区切り方に近づける）
+    """
+    for part in text.split(' '):
+        for start in range(0, len(part), 3):
+            chunk = part[start:start + 3]
+            _word(chunk, x, y, page, normalized)
+            x += CHAR_WIDTH * len(chunk)
+        x += CHAR_WIDTH // 2
+
+
+def build_annotation(rows, with_letter, normalized, year=2026, month=4):
+    """
+    行事予定表のページを作成する
+
+    Returns:
+        (vision.TextAnnotation, 正解の予定 [(タイトル, 開始日, 開始時刻), ...])
+    """
+    words = []
+    expected = []
+    y = 150
+    _cell(f"令和{year - 2018}年度 {month}月 行事予定", 700, y, words, normalized)
+    y += LINE_HEIGHT * 2
+    if with_letter:
+        for line in LETTER_LINES:
+            _cell(line, 200, y, words, normalized)
+            y += LINE_HEIGHT * 3 // 2
+        y += LINE_HEIGHT
+    _cell('日', DAY_X, y, words, normalized)
+    _cell('曜', WEEKDAY_X, y, words, normalized)
+    _cell('行事予定', EVENT_X + 400, y, words, normalized)
+    y += LINE_HEIGHT * 2
+
+    day = date(year, month, 6)
+    for i in range(rows):
+        _cell(str(day.day), DAY_X, y, words, normalized)
+        _cell(WEEKDAYS[day.weekday()], WEEKDAY_X, y, words, normalized)
+        titles = [EVENT_TITLES[i % len(EVENT_TITLES)]]
+        if i % 4 == 1:
+            titles.append(EVENT_TITLES[(i + 5) % len(EVENT_TITLES)])
+        cell = '、'.join(f"{title} {start_time}" if start_time else title for title, start_time in titles)
+        _cell(cell, EVENT_X, y, words, normalized)
+        expected.extend((title, day.isoformat(), start_time) for title, start_time in titles)
+        # 3行ごとに、前の日の予定の続きを次の行に書く
+        if i % 3 == 2:
+            y += LINE_HEIGHT * 5 // 4
+            _cell('下校指導', EVENT_X, y, words, normalized)
+            expected.append(('下校指導', day.isoformat(), ''))
+        y += LINE_HEIGHT * 2
+        day += timedelta(days=1 if day.weekday() < 4 else 3)
+
+    if with_letter:
+        y += LINE_HEIGHT
+        for line in LETTER_LINES[1:]:
+            _cell(line, 200, y, words, normalized)
+            y += LINE_HEIGHT * 3 // 2
+
+    paragraph = vision.Paragraph(words=words)
+    page = vision.Page(width=PAGE_WIDTH, height=PAGE_HEIGHT, blocks=[vision.Block(paragraphs=[paragraph])])
+    text = '\n'.join(''.join(s.text for s in w.symbols) for w in words)
+    return vision.TextAnnotation(pages=[page], text=text), expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description='行事予定表の読み取りのベンチマーク')
+    parser.add_argument('--rows', type=int, default=20, help='表の日付の行数')
+    parser.add_argument('--iterations', type=int, default=50, help='ケースごとの計測回数')
+    args = parser.parse_args()
+
+    print(f"rows={args.rows} iterations={args.iterations} skip_llm_coverage={TABLE_SKIP_LLM_COVERAGE:g}")
+    print(f"{'case':<14}{'words':>7}{'proto(KB)':>11}{'layout(KB)':>12}{'layout(ms)':>12}{'parse(ms)':>11}"
+          f"{'events':>8}{'expected':>10}{'coverage':>10}{'llm':>9}{'tokens':>14}")
+    cases = {
+        'image': dict(with_letter=False, normalized=False),
+        'pdf': dict(with_letter=False, normalized=True),
+        'with_letter': dict(with_letter=True, normalized=False),
+    }
+    for case, options in cases.items():
+        annotation, expected = build_annotation(args.rows, **options)
+        proto_bytes = vision.TextAnnotation.pb(annotation).ByteSize()
+
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            layout = WordLayout.from_annotations([annotation])
+        layout_ms = (time.perf_counter() - started) / args.iterations * 1000
+
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            result = parse_table(layout, today=date(2026, 4, 1))
+        parse_ms = (time.perf_counter() - started) / args.iterations * 1000
+
+        events = result.events if result else []
+        coverage = result.coverage if result else 0.0
+        if result is None:
+            llm = 'full'
+        elif coverage >= TABLE_SKIP_LLM_COVERAGE or not result.remaining_text.strip():
+            llm = 'skipped'
+        else:
+            llm = 'shrunk'
+        before = estimate_tokens(annotation.text)
+        after = 0 if llm == 'skipped' else estimate_tokens(result.remaining_text if result else annotation.text)
+        print(f"{case:<14}{len(layout):>7}{proto_bytes / 1024:>11.1f}{layout.nbytes() / 1024:>12.1f}"
+              f"{layout_ms:>12.2f}{parse_ms:>11.2f}{len(events):>8}{len(expected):>10}{coverage:>10.1%}"
+              f"{llm:>9}{f'{before}->{after}':>14}")
+
+        parsed = sorted((e['title'], e['start_date'], e['start_time']) for e in events)
+        if parsed != sorted(expected):
+            missing = sorted(set(expected) - set(parsed))[:3]
+            extra = sorted(set(parsed) - set(expected))[:3]
+            raise SystemExit(f"FAIL: {case} の読み取り結果が正解と一致しません（不足: {missing}, 余分: {extra}）")
+
+
+if __name__ == '__main__':
+    main()
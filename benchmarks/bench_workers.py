@@ -0,0 +1,101 @@
+"""
+ワーカーの種類ごとの処理能力のベンチマーク
+
+偽の上流API（benchmarks/fakes.py）を使い、1ワーカープロセスあたりの処理能力を次の2構成で比較します。
+    sync        syncワーカー（同時処理1件、GUNICORN_THREADS=1）
+    gthread     gthreadワーカー（同時処理 --threads 件、gunicorn.conf.py の既定）
+
+/register はどの構成でもバックグラウンドの登録ジョブを開始してすぐに応答するため、
+登録の開始から完了までの時間（registration）を比較します。上流APIの最大同時接続数もあわせて報告します。
+
+実行方法:
+    python -m benchmarks.bench_workers --users 16 --flows 48 --threads 8 \\
+        --ocr-latency lognormal:900:0.4 --llm-latency lognormal:4000:0.5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.load_test import WorkerPool, FlowRunner, install_fakes, make_print_image, percentile
+
+MODES = ('sync', 'gthread')
+
+
+def run_mode(main_module, mode, args, image_bytes):
+    """
+    1つの構成で負荷をかけ、結果を返す
+    """
+    app = main_module.app
+    upstreams = install_fakes(args)
+    slots = 1 if mode == 'sync' else args.threads
+    pool = WorkerPool(main_module.app.wsgi_app, slots)
+    app.wsgi_app = pool
+    runner = FlowRunner(app, image_bytes)
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.users) as executor:
+            outcomes = list(executor.map(runner.run_flow, range(args.flows)))
+    finally:
+        app.wsgi_app = pool.wsgi_app
+    wall = time.perf_counter() - started
+
+    return {
+        'mode': mode,
+        'slots': slots,
+        'wall': wall,
+        'succeeded': sum(1 for ok in outcomes if ok),
+        'flows': len(outcomes),
+        'latencies': runner.latencies,
+        'max_inflight': {u.name: u.max_inflight for u in upstreams}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ワーカーの種類ごとの処理能力のベンチマーク')
+    parser.add_argument('--users', type=int, default=16, help='同時に操作する仮想ユーザー数')
+    parser.add_argument('--flows', type=int, default=48, help='構成ごとに実行する操作フローの総数')
+    parser.add_argument('--threads', type=int, default=8, help='gthreadワーカーのスレッド数')
+    parser.add_argument('--modes', default=','.join(MODES), help='比較する構成（カンマ区切り）')
+    parser.add_argument('--ocr-latency', default='lognormal:900:0.4')
+    parser.add_argument('--llm-latency', default='lognormal:4000:0.5')
+    parser.add_argument('--calendar-latency', default='lognormal:250:0.3')
+    parser.add_argument('--ocr-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--calendar-error-rate', type=float, default=0.0)
+    parser.add_argument('--events-per-print', type=int, default=8)
+    args = parser.parse_args()
+
+    # ログ出力はベンチマークの結果表示の妨げになるため捨てる
+    real_stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    import app.main as main_module
+    sys.stderr = real_stderr
+
+    upload_dir = tempfile.TemporaryDirectory()
+    main_module.app.config['UPLOAD_FOLDER'] = upload_dir.name
+    image_bytes = make_print_image()
+
+    results = [run_mode(main_module, mode, args, image_bytes) for mode in args.modes.split(',')]
+    upload_dir.cleanup()
+
+    print(f"users={args.users} flows={args.flows} threads={args.threads} "
+          f"ocr={args.ocr_latency} llm={args.llm_latency} calendar={args.calendar_latency} "
+          f"events/print={args.events_per_print}")
+    print(f"{'mode':<9}{'slots':>6}{'flows/s':>9}{'ok':>7}"
+          f"{'upload p50':>12}{'p95':>8}{'registration p50':>18}{'p95':>8}  max in-flight")
+    for r in results:
+        upload = r['latencies'].get('/upload', [])
+        register = r['latencies'].get('registration', [])
+        inflight = ' '.join(f"{name}={count}" for name, count in r['max_inflight'].items())
+        print(f"{r['mode']:<9}{r['slots']:>6}{r['succeeded'] / r['wall']:>9.3f}"
+              f"{r['succeeded']:>4}/{r['flows']:<2}"
+              f"{percentile(upload, 50):>12.0f}{percentile(upload, 95):>8.0f}"
+              f"{percentile(register, 50):>18.0f}{percentile(register, 95):>8.0f}  {inflight}")
+
+
+if __name__ == '__main__':
+    main()
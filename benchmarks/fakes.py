@@ -0,0 +1,286 @@
+"""
+Google APIのローカル代替実装
+
+OCRProcessor・TextAnalyzer・CalendarServiceの外部API呼び出し部分だけを
+遅延分布とエラー率を設定可能な偽クライアントに差し替えます。
+前処理・JSON解析・イベント整形などの自前のコードはそのまま実行されます。
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from app.ocr import OCRProcessor
+from app.text_analysis import TextAnalyzer
+from app.calendar_api import CalendarService
+
+
+class Latency:
+    """
+    遅延分布の設定
+
+    指定形式:
+        fixed:MS            常にMSミリ秒
+        uniform:LO:HI       LO～HIミリ秒の一様分布
+        lognormal:MED:SIGMA 中央値MEDミリ秒、形状SIGMAの対数正規分布
+    """
+
+    def __init__(self, spec):
+        parts = spec.split(':')
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        if self.kind not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"未対応の遅延分布です: {spec}")
+        self.spec = spec
+
+    def sample_ms(self, rng):
+        if self.kind == 'fixed':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return rng.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        return rng.lognormvariate(0, sigma) * median
+
+    def __repr__(self):
+        return self.spec
+
+
+class FakeUpstream:
+    """
+    遅延とエラーを注入する偽APIの共通部分
+    """
+
+    def __init__(self, name, latency, error_rate=0.0, seed=None):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def call(self):
+        with self._lock:
+            self.calls += 1
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            wait_ms = self.latency.sample_ms(self._rng)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        try:
+            time.sleep(wait_ms / 1000)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+        if fail:
+            raise RuntimeError(f"{self.name}: 注入されたエラー")
+
+
+class FakeVisionClient(FakeUpstream):
+    """
+    vision.ImageAnnotatorClientの代替
+    """
+
+    def __init__(self, latency, error_rate=0.0, text=None, seed=None):
+        super().__init__('vision', latency, error_rate, seed)
+        self.text = text or sample_print_text()
+
+    def text_detection(self, image=None):
+        self.call()
+        return SimpleNamespace(
+            text_annotations=[SimpleNamespace(description=self.text)],
+            full_text_annotation=SimpleNamespace(text=self.text, pages=[]),
+            error=SimpleNamespace(message='')
+        )
+
+    def batch_annotate_files(self, requests=None):
+        self.call()
+        page = SimpleNamespace(full_text_annotation=SimpleNamespace(text=self.text, pages=[]))
+        return SimpleNamespace(responses=[SimpleNamespace(responses=[page])])
+
+
+class FakeGeminiModel(FakeUpstream):
+    """
+    genai.GenerativeModelの代替
+    """
+
+    def __init__(self, latency, error_rate=0.0, events_per_print=8, seed=None):
+        super().__init__('gemini', latency, error_rate, seed)
+        self.events_per_print = events_per_print
+
+    def generate_content(self, prompt, **kwargs):
+        self.call()
+        events = sample_events(self.events_per_print)
+        return SimpleNamespace(text=f"```json\n{json.dumps(events, ensure_ascii=False)}\n```")
+
+
+class _Request:
+    def __init__(self, upstream, result):
+        self._upstream = upstream
+        self._result = result
+
+    def execute(self, http=None):
+        self._upstream.call()
+        return self._result()
+
+
+class FakeCalendarAPI(FakeUpstream):
+    """
+    googleapiclientのCalendarサービスオブジェクトの代替
+    """
+
+    def __init__(self, latency, error_rate=0.0, seed=None):
+        super().__init__('calendar', latency, error_rate, seed)
+
+    def calendarList(self):
+        return SimpleNamespace(list=lambda: _Request(self, lambda: {'items': [
+            {'id': 'primary@example.com', 'summary': 'メイン', 'primary': True, 'accessRole': 'owner'},
+            {'id': 'school@group.calendar.google.com', 'summary': '学校行事', 'accessRole': 'owner'}
+        ]}))
+
+    def events(self):
+        def insert(calendarId=None, body=None):
+            return _Request(self, lambda: dict(body, id=uuid.uuid4().hex, htmlLink='https://calendar.google.com/event'))
+        return SimpleNamespace(insert=insert)
+
+
+class FakeOCRProcessor(OCRProcessor):
+    """
+    Vision APIクライアントだけを偽物に差し替えたOCRProcessor
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeTextAnalyzer(TextAnalyzer):
+    """
+    Geminiモデルだけを偽物に差し替えたTextAnalyzer
+    """
+
+    def __init__(self, model, fast_model=None):
+        super().__init__('fake', models={'fast': fast_model or model, 'pro': model})
+
+
+class FakeCalendarService(CalendarService):
+    """
+    Calendar APIだけを偽物に差し替えたCalendarService
+    """
+
+    def __init__(self, api):
+        super().__init__('fake-client-id', 'fake-client-secret', 'http://localhost/auth/callback', [])
+        self.api = api
+
+    def build_service(self, credentials):
+        self.credentials = credentials
+        self.service = self.api
+        return self.service
+
+
+FAKE_CREDENTIALS = {
+    'token': 'fake-token',
+    'refresh_token': 'fake-refresh-token',
+    'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'fake-client-id',
+    'client_secret': 'fake-client-secret',
+    'scopes': []
+}
+
+
+def sample_print_text():
+    """
+    典型的な学校プリントに近いOCRテキストを返す
+    """
+    return (
+        "令和7年度 4月 学年だより\n"
+        "保護者の皆様へ\n"
+        "新年度が始まりました。本年度もどうぞよろしくお願いいたします。\n"
+        "4月8日（火） 始業式 8:30登校\n"
+        "4月10日（木） 身体測定\n"
+        "4月18日（金） 授業参観・学級懇談会 13:30～15:00\n"
+        "4月23日（水） 避難訓練\n"
+        "4月25日（金） 遠足（雨天時は4月28日）\n"
+        "持ち物: 上履き、体操服、給食袋\n"
+    )
+
+
+def sample_newsletter_text():
+    """
+    本文が長い学校プリントに近いOCRテキストと、その正解の予定（タイトルと開始日）を返す
+    """
+    text = (
+        "令和7年度 5月 学年だより\n"
+        "○○市立△△小学校 第3学年\n"
+        "発行日 2025年4月28日\n"
+        "\n"
+        "新緑がまぶしい季節となりました。保護者の皆様には、日頃より本校の教育活動に\n"
+        "ご理解とご協力をいただき、誠にありがとうございます。\n"
+        "新しい学級にも慣れ、子どもたちは毎日元気に過ごしています。休み時間には\n"
+        "校庭で鬼ごっこやドッジボールをする姿が見られ、友達の輪が広がっています。\n"
+        "学習面では、算数でかけ算の復習から始め、理科では植物の観察に取り組んでいます。\n"
+        "ご家庭でも、お子さんの話にぜひ耳を傾けてあげてください。\n"
+        "\n"
+        "■ 生活面でのお願い\n"
+        "朝の支度に時間がかかり、始業に間に合わない児童が見られます。\n"
+        "前日のうちに翌日の準備を済ませる習慣づくりにご協力ください。\n"
+        "ハンカチ・ティッシュを毎日持たせてください。\n"
+        "名前の書かれていない落とし物が増えています。持ち物には記名をお願いします。\n"
+        "\n"
+        "■ 5月の主な予定\n"
+        "５月２日（金） 春の遠足（雨天時は５月７日）\n"
+        "5月9日(金) 内科検診\n"
+        "5月14日（水） 授業参観 5校時 13:40～14:25\n"
+        "　　　　　　　 学級懇談会 14:40～15:30\n"
+        "5月21日（水） 避難訓練（引き渡し訓練）\n"
+        "5月30日（金） 運動会の係決め\n"
+        "\n"
+        "■ 学習の様子\n"
+        "国語では「春風をたどって」を読み、登場人物の気持ちを考えました。\n"
+        "音楽ではリコーダーの練習が始まりました。家でも練習できるよう、\n"
+        "リコーダーは毎日持ち帰ります。\n"
+        "図工では絵の具を使って、春の風景を描いています。\n"
+        "\n"
+        "■ 集金について\n"
+        "教材費の引き落としは5月27日です。前日までに残高のご確認をお願いします。\n"
+        "\n"
+        "ご不明な点がありましたら、担任までお気軽にお問い合わせください。\n"
+    )
+    events = [
+        {'title': '春の遠足', 'start_date': '2025-05-02'},
+        {'title': '内科検診', 'start_date': '2025-05-09'},
+        {'title': '授業参観', 'start_date': '2025-05-14'},
+        {'title': '学級懇談会', 'start_date': '2025-05-14'},
+        {'title': '避難訓練', 'start_date': '2025-05-21'},
+        {'title': '運動会の係決め', 'start_date': '2025-05-30'},
+        {'title': '教材費の引き落とし', 'start_date': '2025-05-27'},
+    ]
+    return text, events
+
+
+def sample_events(count, start=None):
+    """
+    extract_eventsの出力形式に沿った予定を生成する
+    """
+    start = start or date.today()
+    events = []
+    for i in range(count):
+        day = (start + timedelta(days=i * 3)).isoformat()
+        timed = i % 3 == 0
+        events.append({
+            'title': f"行事{i + 1}",
+            'description': '学年だよりより',
+            'start_date': day,
+            'start_time': '13:30' if timed else '',
+            'end_date': day,
+            'end_time': '15:00' if timed else '',
+            'all_day': not timed,
+            'location': '体育館' if timed else '',
+            'confidence': 0.9
+        })
+    return events
@@ -0,0 +1,261 @@
+"""
+オフライン負荷試験ハーネス
+
+Google APIを偽クライアント（benchmarks/fakes.py）に差し替えたFlaskアプリに対して、
+複数の仮想ユーザーから /upload → /confirm → /register の一連の操作を並行して実行し、
+スループット、ルート別のレイテンシ（p50/p95/p99）、ワーカーの飽和度を報告します。
+/register はバックグラウンドの登録ジョブを開始してすぐに応答するため、結果ページと同じように
+/api/registrations/<ジョブID> で登録の完了を待ち、開始から完了までの時間を registration として報告します。
+
+gunicornのsyncワーカーを模擬するため、同時に処理できるリクエスト数を --workers に制限します。
+ワーカーの空きを待つ時間もレイテンシに含まれます。
+
+実行方法:
+    python -m benchmarks.load_test --users 8 --flows 20 --workers 2 \\
+        --ocr-latency lognormal:900:0.4 --llm-latency lognormal:4000:0.5
+
+パイプライン変更時の回帰チェックとして、閾値を超えた場合は終了コード1を返します:
+    python -m benchmarks.load_test --max-p95 /upload=6000 --max-error-rate 0.02
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from app import services
+from benchmarks.fakes import (
+    Latency, FakeVisionClient, FakeGeminiModel, FakeCalendarAPI,
+    FakeOCRProcessor, FakeTextAnalyzer, FakeCalendarService, FAKE_CREDENTIALS
+)
+
+
+class WorkerPool:
+    """
+    同時処理数をワーカー数に制限するWSGIミドルウェア
+    ワーカーの稼働時間と空き待ち時間を集計する
+    """
+
+    def __init__(self, wsgi_app, workers):
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+        self.busy_seconds = 0.0
+        self.queue_wait_seconds = 0.0
+        self.requests = 0
+        self.max_waiting = 0
+        self._waiting = 0
+
+    def __call__(self, environ, start_response):
+        queued_at = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+            self.max_waiting = max(self.max_waiting, self._waiting)
+        self._slots.acquire()
+        started_at = time.perf_counter()
+        with self._lock:
+            self._waiting -= 1
+        try:
+            # テストクライアントはレスポンス本体をすぐに読み切るため、ここで計測を閉じてよい
+            return list(self.wsgi_app(environ, start_response))
+        finally:
+            finished_at = time.perf_counter()
+            self._slots.release()
+            with self._lock:
+                self.requests += 1
+                self.busy_seconds += finished_at - started_at
+                self.queue_wait_seconds += started_at - queued_at
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def make_print_image(width=1240, height=1754):
+    """
+    A4・150dpi相当のPNG画像を生成する
+    """
+    img = Image.new('RGB', (width, height), 'white')
+    for y in range(100, height - 100, 40):
+        for x in range(100, width - 100, 8):
+            img.putpixel((x, y), (0, 0, 0))
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def install_fakes(args):
+    """
+    アプリのサービスを偽クライアントを使うものに差し替える
+    """
+    vision = FakeVisionClient(Latency(args.ocr_latency), args.ocr_error_rate, seed=1)
+    gemini = FakeGeminiModel(Latency(args.llm_latency), args.llm_error_rate, args.events_per_print, seed=2)
+    calendar = FakeCalendarAPI(Latency(args.calendar_latency), args.calendar_error_rate, seed=3)
+    services.set_service('ocr_processor', FakeOCRProcessor(vision))
+    services.set_service('text_analyzer', FakeTextAnalyzer(gemini))
+    services.set_service('calendar_service', FakeCalendarService(calendar))
+    return [vision, gemini, calendar]
+
+
+class FlowRunner:
+    """
+    仮想ユーザー1人分の /upload → /confirm → /register を実行する
+    """
+
+    def __init__(self, app, image_bytes, poll_interval=0.2):
+        self.app = app
+        self.image_bytes = image_bytes
+        self.poll_interval = poll_interval
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _record(self, route, elapsed, ok):
+        with self._lock:
+            self.latencies[route].append(elapsed * 1000)
+            if not ok:
+                self.failures[route] += 1
+
+    def _timed(self, route, func, expect_location=None):
+        start = time.perf_counter()
+        response = func()
+        elapsed = time.perf_counter() - start
+        ok = response.status_code < 400
+        if expect_location is not None:
+            ok = ok and expect_location in response.headers.get('Location', '')
+        self._record(route, elapsed, ok)
+        return ok, response
+
+    def _wait_registration(self, client, location):
+        """
+        登録ジョブの完了まで進捗APIを確認し、すべての予定が登録できたかを返す
+        """
+        url = f"/api/registrations/{location.rstrip('/').rsplit('/', 1)[1]}"
+        start = time.perf_counter()
+        received = 0
+        while True:
+            ok, response = self._timed('/api/registrations', lambda: client.get(f"{url}?after={received}"))
+            if not ok:
+                return False
+            progress = response.get_json()
+            received += len(progress['records'])
+            if progress['status'] != 'running':
+                break
+            time.sleep(self.poll_interval)
+        ok = progress['status'] == 'completed' and progress['succeeded'] == progress['total']
+        self._record('registration', time.perf_counter() - start, ok)
+        return ok
+
+    def run_flow(self, _):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['credentials'] = FAKE_CREDENTIALS
+
+        ok, _ = self._timed('/upload', lambda: client.post(
+            '/upload',
+            data={'file': (io.BytesIO(self.image_bytes), 'print.png')},
+            content_type='multipart/form-data'
+        ), expect_location='/confirm')
+        if not ok:
+            return False
+
+        ok, _ = self._timed('/confirm', lambda: client.get('/confirm'))
+        if not ok:
+            return False
+
+        # 確認ページは表示後に予定の最初のページを読み込む
+        ok, _ = self._timed('/api/events', lambda: client.get('/api/events'))
+        if not ok:
+            return False
+
+        # 確認ページからは変更内容だけをJSONで送る（すべての予定を登録する）
+        changes = {'default_calendar_id': 'primary@example.com', 'excluded': [], 'events': {}}
+        ok, response = self._timed('/register', lambda: client.post('/register', json=changes),
+                                   expect_location='/result/')
+        if not ok:
+            return False
+        return self._wait_registration(client, response.headers['Location'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='オフライン負荷試験')
+    parser.add_argument('--users', type=int, default=8, help='同時に操作する仮想ユーザー数')
+    parser.add_argument('--flows', type=int, default=20, help='実行する操作フローの総数')
+    parser.add_argument('--workers', type=int, default=2, help='模擬するgunicornのsyncワーカー数')
+    parser.add_argument('--ocr-latency', default='lognormal:900:0.4')
+    parser.add_argument('--llm-latency', default='lognormal:4000:0.5')
+    parser.add_argument('--calendar-latency', default='lognormal:250:0.3')
+    parser.add_argument('--ocr-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--calendar-error-rate', type=float, default=0.0)
+    parser.add_argument('--events-per-print', type=int, default=8)
+    parser.add_argument('--poll-interval-ms', type=int, default=200, help='登録の進捗を確認する間隔（ms）')
+    parser.add_argument('--max-p95', action='append', default=[], metavar='ROUTE=MS',
+                        help='ルート別のp95上限（超えた場合は失敗）')
+    parser.add_argument('--max-error-rate', type=float, default=None, help='フロー失敗率の上限')
+    args = parser.parse_args()
+
+    # ログ出力は負荷試験の結果表示の妨げになるため捨てる
+    real_stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    import app.main as main_module
+    sys.stderr = real_stderr
+
+    upstreams = install_fakes(args)
+    app = main_module.app
+    upload_dir = tempfile.TemporaryDirectory()
+    app.config['UPLOAD_FOLDER'] = upload_dir.name
+    pool = WorkerPool(app.wsgi_app, args.workers)
+    app.wsgi_app = pool
+
+    runner = FlowRunner(app, make_print_image(), args.poll_interval_ms / 1000)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        outcomes = list(executor.map(runner.run_flow, range(args.flows)))
+    wall = time.perf_counter() - started
+    upload_dir.cleanup()
+
+    succeeded = sum(1 for ok in outcomes if ok)
+    error_rate = 1 - succeeded / len(outcomes) if outcomes else 0.0
+    saturation = pool.busy_seconds / (pool.workers * wall) if wall else 0.0
+
+    print(f"users={args.users} flows={args.flows} workers={args.workers} "
+          f"ocr={args.ocr_latency} llm={args.llm_latency} calendar={args.calendar_latency}")
+    print(f"wall={wall:.2f}s throughput={succeeded / wall:.3f} flows/s "
+          f"succeeded={succeeded}/{len(outcomes)} error_rate={error_rate:.3f}")
+    print(f"worker_saturation={saturation:.2%} mean_queue_wait={pool.queue_wait_seconds / max(pool.requests, 1) * 1000:.0f}ms "
+          f"max_waiting={pool.max_waiting}")
+    print(f"{'route':<19}{'count':>7}{'fail':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for route in ('/upload', '/confirm', '/api/events', '/register', '/api/registrations', 'registration'):
+        values = runner.latencies.get(route, [])
+        print(f"{route:<19}{len(values):>7}{runner.failures.get(route, 0):>6}"
+              f"{percentile(values, 50):>10.0f}{percentile(values, 95):>10.0f}{percentile(values, 99):>10.0f}")
+    print('upstream calls: ' + ', '.join(f"{u.name}={u.calls} (errors {u.errors})" for u in upstreams))
+
+    # 回帰チェック
+    violations = []
+    for limit in args.max_p95:
+        route, _, ms = limit.partition('=')
+        p95 = percentile(runner.latencies.get(route, []), 95)
+        if p95 > float(ms):
+            violations.append(f"{route} p95 {p95:.0f}ms > {ms}ms")
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        violations.append(f"error_rate {error_rate:.3f} > {args.max_error_rate}")
+    for violation in violations:
+        print(f"FAIL: {violation}")
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == '__main__':
+    main()
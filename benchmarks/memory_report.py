@@ -0,0 +1,92 @@
+"""
+メモリ使用量の多いリクエストのレポート
+
+MEMORY_PROFILING_ENABLED=true で出力された trace.log を読み、次の値を出力します。
+- ピーク（tracemallocで追跡したメモリの開始時からの増加の最大値）の大きいリクエストの一覧
+- それぞれのリクエストの処理段階（スパン）ごとのピークと、確保した場所の上位
+- 一覧のリクエスト全体での、確保した場所ごとの合計
+
+--max-peak-mb を指定すると、ピークが上限を超えたリクエストがあった場合に終了コード1で終了します。
+
+実行方法:
+    python -m benchmarks.memory_report logs/trace.log logs/trace.log.1 --top 5
+"""
+import argparse
+import json
+import os
+from collections import defaultdict
+
+from app.config import LOG_DIR
+
+
+def load_profiles(paths):
+    """
+    ログファイルから memory_profile レコードを読み込む（span・slow_request などのレコードは飛ばす）
+    """
+    profiles = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if '"memory_profile"' not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('type') == 'memory_profile':
+                    profiles.append(record)
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='メモリ使用量の多いリクエストのレポート')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(LOG_DIR, 'trace.log')],
+                        help='trace.logのパス（複数指定可）')
+    parser.add_argument('--top', type=int, default=5, help='出力するリクエストの件数')
+    parser.add_argument('--sites', type=int, default=5, help='リクエストごとに出力する確保した場所の件数')
+    parser.add_argument('--max-peak-mb', type=float, default=None, help='リクエストのピークの上限（MB）')
+    args = parser.parse_args()
+
+    profiles = load_profiles(args.paths)
+    if not profiles:
+        print('memory_profile レコードがありません（MEMORY_PROFILING_ENABLED と MEMORY_REPORT_MIN_KB を確認してください）')
+        return
+    profiles.sort(key=lambda record: record['peak_kb'], reverse=True)
+    heaviest = profiles[:args.top]
+
+    print(f"profiles={len(profiles)}")
+    print(f"{'request_id':<34}{'trace':<28}{'peak MB':>9}{'retained MB':>13}{'rss+ MB':>9}{'ms':>10}")
+    for record in heaviest:
+        print(f"{record['request_id']:<34}{record['trace'][:27]:<28}{record['peak_kb'] / 1024:>9.1f}"
+              f"{record['retained_kb'] / 1024:>13.1f}{record['rss_hwm_increase_kb'] / 1024:>9.1f}"
+              f"{record['duration_ms'] or 0:>10.0f}")
+
+    totals = defaultdict(lambda: [0.0, 0])
+    for record in heaviest:
+        print()
+        print(f"== {record['trace']} request_id={record['request_id']} peak={record['peak_kb'] / 1024:.1f}MB")
+        for stage in record['stages']:
+            print(f"  stage {stage['name']:<32}{stage['peak_kb'] / 1024:>9.1f}MB"
+                  f"  rss+ {stage['rss_hwm_increase_kb'] / 1024:.1f}MB")
+        print(f"  top sites (sampled at {record['sampled_kb'] / 1024:.1f}MB)")
+        for site in record['top_sites'][:args.sites]:
+            print(f"  {site['size_kb'] / 1024:>8.1f}MB {site['count']:>7}  {site['site']}"
+                  + (f"  <- {site['caller']}" if site['caller'] and site['caller'] != site['site'] else ''))
+        for site in record['top_sites']:
+            total = totals[(site['site'], site['caller'])]
+            total[0] += site['size_kb']
+            total[1] += 1
+
+    print()
+    print(f"== sites across top {len(heaviest)} requests")
+    for (site, caller), (size_kb, requests) in sorted(totals.items(), key=lambda item: item[1][0],
+                                                      reverse=True)[:args.sites * 2]:
+        print(f"  {size_kb / 1024:>8.1f}MB {requests:>4} req  {site}" + (f"  <- {caller}" if caller else ''))
+
+    if args.max_peak_mb is not None and heaviest[0]['peak_kb'] / 1024 > args.max_peak_mb:
+        raise SystemExit(f"FAIL: ピークが{heaviest[0]['peak_kb'] / 1024:.1f}MBのリクエストがあります"
+                         f"（上限: {args.max_peak_mb:.1f}MB, request_id={heaviest[0]['request_id']}）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+フィクスチャコーパスの記録スクリプト
+
+ディレクトリ内の学校プリント（画像・PDF）を実際のVision API・Gemini APIで処理し、
+リクエスト/レスポンスを秘匿情報を除いた上でコーパスに記録します。
+抽出された予定は正解データ（expected_events）の初期値として保存されるため、
+内容を確認・修正した上で "reviewed": true にしてください。
+
+注意: コーパスにはプリント自体がコピーされます。共有して問題のないプリントのみを記録してください。
+
+実行方法:
+    python -m benchmarks.record_corpus path/to/prints --corpus-version v1
+"""
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+SUPPORTED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='フィクスチャコーパスの記録')
+    parser.add_argument('input_dir', help='プリントが置かれたディレクトリ')
+    parser.add_argument('--corpus-version', default=None, help='記録先のコーパスバージョン')
+    args = parser.parse_args()
+
+    # app.configの読み込み前に記録モードを有効にする
+    os.environ['API_RECORDING_MODE'] = 'record'
+    if args.corpus_version:
+        os.environ['FIXTURE_CORPUS_VERSION'] = args.corpus_version
+
+    from app.config import GOOGLE_APPLICATION_CREDENTIALS, GEMINI_API_KEY
+    from app import recording
+    from app.ocr import OCRProcessor
+    from app.text_analysis import TextAnalyzer
+    from app.routing import TIERS, PRO
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    if not GEMINI_API_KEY:
+        sys.exit('GEMINI_API_KEYが設定されていません')
+
+    corpus = recording.get_corpus()
+    ocr_processor = OCRProcessor(GOOGLE_APPLICATION_CREDENTIALS)
+    text_analyzer = TextAnalyzer(GEMINI_API_KEY)
+    prints_dir = os.path.join(corpus.path, 'prints')
+    os.makedirs(prints_dir, exist_ok=True)
+    existing = {m['print_id']: m for m in corpus.prints()}
+
+    for name in sorted(os.listdir(args.input_dir)):
+        ext = name.rsplit('.', 1)[-1].lower()
+        if '.' not in name or ext not in SUPPORTED_EXTENSIONS:
+            continue
+        source = os.path.join(args.input_dir, name)
+        with open(source, 'rb') as f:
+            print_id = hashlib.sha256(f.read()).hexdigest()[:16]
+        file_name = f"{print_id}.{ext}"
+        shutil.copyfile(source, os.path.join(prints_dir, file_name))
+
+        # 前処理は元画像を上書きするため一時ファイルで処理する
+        with tempfile.TemporaryDirectory() as work_dir:
+            work_path = os.path.join(work_dir, file_name)
+            shutil.copyfile(source, work_path)
+            if ext == 'pdf':
+                text = ocr_processor.process_pdf(work_path)
+            else:
+                text = ocr_processor.process_image(ocr_processor.preprocess_image(work_path))
+
+        # 振り分けの評価のため、各モデルの応答を全て記録する（正解データの初期値は上位モデルの結果）
+        tiers = TIERS if text_analyzer.routing_enabled else (PRO,)
+        events = []
+        for tier in tiers:
+            tier_events = text_analyzer.extract_events(text, tier=tier) if text else []
+            if tier == PRO:
+                events = tier_events
+
+        manifest = existing.get(print_id, {})
+        manifest.pop('path', None)
+        manifest.update({
+            'print_id': print_id,
+            'file': file_name,
+            'source_name': name,
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        manifest.setdefault('gemini', {})
+        if text:
+            prompt = text_analyzer.build_prompt(text_analyzer.prepare_text(text))
+            for tier in tiers:
+                manifest['gemini'][text_analyzer.tier_version(tier)] = recording.prompt_key(
+                    prompt, text_analyzer.model_names[tier])
+        # 確認済みの正解データは上書きしない
+        if not manifest.get('reviewed'):
+            manifest['expected_events'] = events
+            manifest['reviewed'] = False
+        corpus.save_print(print_id, manifest)
+        print(f"{name}: print_id={print_id} chars={len(text)} events={len(events)}")
+
+
+if __name__ == '__main__':
+    main()
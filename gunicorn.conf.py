@@ -0,0 +1,56 @@
+"""
+gunicornの設定ファイル
+
+preload_appを有効にすると、親プロセスでアプリを一度だけ読み込んでからワーカーをforkするため、
+ワーカーの起動が速くなり、読み込み済みのモジュールや共有状態のメモリをワーカー間で共有できます。
+外部APIのクライアント（gRPCチャネルなど）はfork後に使えないため、各ワーカーで遅延初期化されます（app/services.py）。
+
+ワーカーはgthreadで起動し、1プロセスで GUNICORN_THREADS 件のリクエストを同時に処理します
+（Vision API・Gemini APIの応答を待つ間も、同じプロセスで他のリクエストを処理できます）。
+GUNICORN_THREADS=1 にするとsyncワーカーで起動します。
+
+コマンドライン引数で個別に上書きできます:
+    gunicorn --worker-class sync app.main:app
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('APP_PORT', '3501')}"
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = 120
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def post_fork(server, worker):
+    """
+    fork直後のワーカーで、親プロセスから引き継いだ状態を作り直す
+    """
+    from app.logging_config import start_log_listener
+    from app.services import reset_services
+    from app import metrics
+
+    # ログ書き込みスレッドはforkで引き継がれないため、ワーカーで開始し直す
+    start_log_listener()
+    reset_services()
+    metrics.reset()
+
+
+def post_worker_init(worker):
+    """
+    アプリを読み込んだワーカーで、外部APIへの接続の準備をバックグラウンドで開始する
+    準備が終わるまで /readyz は503を返す
+    """
+    from app.warmup import start_warmup
+
+    start_warmup()
+    worker.log.info(f"ワーカーの起動が完了しました (pid: {worker.pid})")
+
+
+def worker_exit(server, worker):
+    """
+    ワーカーの終了時に、実行中の登録ジョブが終わるまで待つ（graceful_timeoutまで）
+    """
+    from app.registration import shutdown
+
+    shutdown(wait=True)
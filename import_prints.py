@@ -0,0 +1,15 @@
+"""
+フォルダー内のプリントの一括取り込み用スクリプト
+
+実行方法:
+    python import_prints.py prints/2024-term1 --output term1.jsonl --ics term1.ics
+"""
+from dotenv import load_dotenv
+
+# 環境変数の読み込み
+load_dotenv()
+
+from app.bulk_import import main  # noqa: E402
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+テストの共通設定
+
+アプリのモジュールは読み込み時に設定を確定するため、読み込む前に
+予定ストアなどのファイルの保存先を一時フォルダーに切り替えます。
+"""
+import os
+import tempfile
+
+_data_dir = tempfile.mkdtemp(prefix='school-calendar-tests-')
+os.environ.update({
+    'EVENT_STORE_PATH': os.path.join(_data_dir, 'events.sqlite3'),
+    'HISTORY_STORE_PATH': os.path.join(_data_dir, 'history.sqlite3'),
+    'PRINT_INDEX_PATH': os.path.join(_data_dir, 'prints.sqlite3'),
+    'ADMISSION_LOCK_DIR': os.path.join(_data_dir, 'admission'),
+    'ASSET_BUILD_DIR': os.path.join(_data_dir, 'assets'),
+    'REQUIRE_LOGIN_FOR_UPLOAD': 'false',
+    'VISION_API_ENABLED': 'false',
+    'GEMINI_API_KEY': '',
+})
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    from app.main import app as flask_app
+    flask_app.config.update(TESTING=True)
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def stop_registration_jobs():
+    yield
+    from app import registration
+    registration.shutdown(wait=True)
+
+
+@pytest.fixture
+def calendar_api():
+    """
+    遅延なしの偽のCalendar APIに差し替える（テストの終了時にサービスを作り直す）
+    """
+    from app import services
+    from benchmarks.fakes import FakeCalendarAPI, FakeCalendarService, Latency
+
+    api = FakeCalendarAPI(Latency('fixed:0'))
+    services.set_service('calendar_service', FakeCalendarService(api))
+    yield api
+    services.reset_services()
+
+
+@pytest.fixture
+def make_admission(tmp_path):
+    """
+    テスト用の受け付け制御を作成する関数を返す（ロックのファイルは一時フォルダーに置く）
+    """
+    from app.admission import Admission
+
+    def make(process_limit=1, global_limit=0, queue_size=1, queue_timeout=5, fair=True, user_limit=0,
+             user_queue_size=8):
+        return Admission('test', process_limit, global_limit, queue_size=queue_size, queue_timeout=queue_timeout,
+                         retry_after=7, lock_dir=str(tmp_path / 'admission'), enabled=True, fair=fair,
+                         user_limit=user_limit, user_queue_size=user_queue_size)
+
+    return make
+
+
+@pytest.fixture
+def wait_until_waiting():
+    """
+    受け付け制御の待ち行列の処理が指定の件数になるまで待つ関数を返す（他のスレッドが待ち始めるのを待つ）
+    """
+    import time
+
+    def wait(admission, waiting):
+        for _ in range(200):
+            if admission.snapshot()['waiting'] == waiting:
+                return
+            time.sleep(0.01)
+        raise AssertionError(f"待っている処理が{waiting}件になりません")
+
+    return wait
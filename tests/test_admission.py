@@ -0,0 +1,106 @@
+"""
+受け付け制御（app/admission.py）と /upload で断った場合の503のテスト
+"""
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+from app import main
+from app.admission import Admission, AdmissionRejected
+
+
+def _rejected_reason(admission, user=None):
+    with pytest.raises(AdmissionRejected) as excinfo:
+        admission.acquire(user)
+    return excinfo.value.reason
+
+
+def _acquire_in_thread(admission, user=None):
+    """
+    別のスレッドで実行枠を取る（取れたら result['ticket']、断られたら result['reason'] に入れる）
+    """
+    result = {}
+
+    def acquire():
+        try:
+            result['ticket'] = admission.acquire(user)
+        except AdmissionRejected as e:
+            result['reason'] = e.reason
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    return thread, result
+
+
+def test_acquire_within_limit_and_release(make_admission):
+    admission = make_admission(process_limit=2)
+
+    with admission.acquire('a'), admission.acquire('b'):
+        assert admission.snapshot()['running'] == 2
+
+    assert admission.snapshot()['running'] == 0
+
+
+def test_released_slot_is_given_to_waiter(make_admission, wait_until_waiting):
+    admission = make_admission()
+    ticket = admission.acquire('a')
+    thread, result = _acquire_in_thread(admission, 'b')
+    wait_until_waiting(admission, 1)
+
+    ticket.release()
+    thread.join(5)
+
+    assert 'ticket' in result
+    assert (admission.snapshot()['running'], admission.snapshot()['waiting']) == (1, 0)
+    result['ticket'].release()
+
+
+def test_request_beyond_queue_is_rejected_immediately(make_admission):
+    admission = make_admission(queue_size=0)
+
+    with admission.acquire('a'):
+        assert _rejected_reason(admission, 'b') == 'queue_full'
+
+
+def test_waiter_is_rejected_after_timeout(make_admission):
+    admission = make_admission(queue_timeout=0.1)
+
+    with admission.acquire('a'):
+        assert _rejected_reason(admission, 'b') == 'timeout'
+
+    assert admission.snapshot()['waiting'] == 0
+
+
+def test_global_limit_is_shared_between_processes(make_admission):
+    # 同じロックのディレクトリを使う2つのインスタンスを、別々のワーカープロセスとして扱う
+    first = make_admission(process_limit=2, global_limit=1, queue_size=0)
+    second = make_admission(process_limit=2, global_limit=1, queue_size=0)
+
+    with first.acquire('a'):
+        assert _rejected_reason(second, 'b') == 'queue_full'
+
+    with second.acquire('b'):
+        pass
+
+
+def test_disabled_admission_does_not_limit(tmp_path):
+    admission = Admission('test', 0, 0, queue_size=0, lock_dir=str(tmp_path), enabled=False)
+
+    with admission.acquire('a'):
+        pass
+
+
+def test_upload_is_rejected_with_503_and_retry_after(client, make_admission, monkeypatch):
+    monkeypatch.setattr(main, 'upload_admission', make_admission(process_limit=0, queue_size=0))
+    buffer = io.BytesIO()
+    Image.new('RGB', (60, 40), 'white').save(buffer, 'PNG')
+    buffer.seek(0)
+
+    response = client.post('/upload', data={'file': (buffer, 'print.png')},
+                           headers={'X-Requested-With': 'fetch'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+    assert response.get_json()['retry_after'] == 7
@@ -0,0 +1,85 @@
+"""
+静的ファイルのコピーと /assets の配信（app/assets.py）のテスト
+"""
+import gzip
+import hashlib
+import os
+import re
+
+from app import assets
+from app.config import ASSET_MAX_AGE
+
+
+def _static_folder(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'style.css').write_text('body { margin: 0; }\n' * 40)
+    (static / 'css' / 'small.css').write_text('p { color: red; }\n')
+    return static
+
+
+def _style_content(app):
+    with open(os.path.join(app.static_folder, 'css', 'style.css'), 'rb') as f:
+        return f.read()
+
+
+def _style_url(app):
+    with app.test_request_context():
+        return assets.asset_url('css/style.css')
+
+
+def test_build_assets_names_files_by_content_hash(tmp_path):
+    static = _static_folder(tmp_path)
+    content = (static / 'css' / 'style.css').read_bytes()
+
+    manifest, variants = assets.build_assets(str(static), str(tmp_path / 'build'))
+
+    built = f"css/style.{hashlib.sha256(content).hexdigest()[:assets.HASH_LENGTH]}.css"
+    assert manifest['css/style.css'] == built
+    assert 'gzip' in variants[built]
+    assert gzip.decompress((tmp_path / 'build' / f"{built}.gz").read_bytes()) == content
+    # 小さなファイルは圧縮しない
+    assert variants[manifest['css/small.css']] == set()
+
+
+def test_build_assets_keeps_existing_files(tmp_path):
+    static = _static_folder(tmp_path)
+    manifest, _ = assets.build_assets(str(static), str(tmp_path / 'build'))
+    built = tmp_path / 'build' / manifest['css/style.css']
+    mtime = built.stat().st_mtime_ns
+
+    assert assets.build_assets(str(static), str(tmp_path / 'build'))[0] == manifest
+    assert built.stat().st_mtime_ns == mtime
+
+
+def test_asset_url_contains_content_hash(app):
+    assert re.fullmatch(r'/assets/css/style\.[0-9a-f]{12}\.css', _style_url(app))
+
+
+def test_asset_url_falls_back_to_static(app):
+    with app.test_request_context():
+        assert assets.asset_url('css/missing.css') == '/static/css/missing.css'
+
+
+def test_asset_is_served_gzipped_with_immutable_cache(app, client):
+    response = client.get(_style_url(app), headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert response.cache_control.public
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == ASSET_MAX_AGE
+    assert gzip.decompress(response.data) == _style_content(app)
+
+
+def test_asset_without_accept_encoding_is_not_compressed(app, client):
+    response = client.get(_style_url(app), headers={'Accept-Encoding': 'identity'})
+
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+    assert response.data == _style_content(app)
+
+
+def test_unknown_asset_is_not_found(client):
+    assert client.get('/assets/css/style.000000000000.css').status_code == 404
@@ -0,0 +1,131 @@
+"""
+一括取り込み（app/bulk_import.py）のチェックポイントからの再開のテスト
+"""
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app import services
+from app.bulk_import import FAILED, OK, load_checkpoint, main
+from benchmarks.fakes import (
+    FAKE_CREDENTIALS, FakeCalendarAPI, FakeCalendarService, FakeGeminiModel, FakeOCRProcessor,
+    FakeTextAnalyzer, FakeVisionClient, Latency
+)
+from benchmarks.load_test import make_print_image
+
+
+class FailingCalendarAPI(FakeCalendarAPI):
+    """
+    予定の作成を最初の fail_next 件だけ失敗させる偽のCalendar API
+    """
+
+    def __init__(self):
+        super().__init__(Latency('fixed:0'))
+        self.fail_next = 0
+        self.inserted = 0
+        self._insert_lock = threading.Lock()
+
+    def events(self):
+        insert = super().events().insert
+
+        def failing_insert(calendarId=None, body=None):
+            with self._insert_lock:
+                self.inserted += 1
+                fail = self.fail_next > 0
+                self.fail_next -= fail
+            if fail:
+                raise RuntimeError('quota exceeded')
+            return insert(calendarId=calendarId, body=body)
+
+        return SimpleNamespace(insert=failing_insert)
+
+
+@pytest.fixture
+def prints(tmp_path):
+    root = tmp_path / 'prints'
+    (root / 'week2').mkdir(parents=True)
+    image = make_print_image(400, 560)
+    for name in ('a.png', 'b.png', 'week2/c.png'):
+        (root / name).write_bytes(image)
+    return root
+
+
+@pytest.fixture
+def upstreams():
+    """
+    遅延なしの偽のVision API・Gemini API・Calendar APIに差し替える
+    """
+    fakes = SimpleNamespace(vision=FakeVisionClient(Latency('fixed:0')),
+                            gemini=FakeGeminiModel(Latency('fixed:0'), events_per_print=3),
+                            calendar=FailingCalendarAPI())
+    services.set_service('ocr_processor', FakeOCRProcessor(fakes.vision))
+    services.set_service('text_analyzer', FakeTextAnalyzer(fakes.gemini))
+    services.set_service('calendar_service', FakeCalendarService(fakes.calendar))
+    yield fakes
+    services.reset_services()
+
+
+def _run(root, output, *args):
+    """
+    import_prints.py を実行する（失敗したファイルや予定がある場合は False を返す）
+    """
+    try:
+        main([str(root), '--output', str(output), '--workers', '2', *args])
+    except SystemExit as e:
+        assert e.code == 1
+        return False
+    return True
+
+
+def test_rerun_skips_unchanged_files(prints, upstreams, tmp_path):
+    output = tmp_path / 'out.jsonl'
+    assert _run(prints, output)
+    assert upstreams.vision.calls == 3
+
+    assert _run(prints, output)
+
+    assert upstreams.vision.calls == 3
+    extracted, _ = load_checkpoint(str(output))
+    assert sorted(path for path, _ in extracted) == ['a.png', 'b.png', 'week2/c.png']
+    assert {record['status'] for record in extracted.values()} == {OK}
+
+
+def test_failed_and_changed_files_are_read_again(prints, upstreams, tmp_path):
+    output = tmp_path / 'out.jsonl'
+    assert _run(prints, output)
+    (prints / 'b.png').write_bytes(make_print_image(420, 580))
+    upstreams.vision.error_rate = 1.0
+
+    assert not _run(prints, output)
+    assert upstreams.vision.calls == 4  # 内容が変わった b.png だけを読み取る
+    extracted, _ = load_checkpoint(str(output))
+    assert [path for (path, _), record in extracted.items() if record['status'] == FAILED] == ['b.png']
+
+    upstreams.vision.error_rate = 0.0
+    assert _run(prints, output)
+    assert upstreams.vision.calls == 5
+
+
+def test_events_that_failed_to_register_are_registered_again(prints, upstreams, tmp_path):
+    output = tmp_path / 'out.jsonl'
+    credentials = tmp_path / 'token.json'
+    credentials.write_text(json.dumps(FAKE_CREDENTIALS))
+    register = ('--register', 'primary@example.com', '--credentials', str(credentials))
+    upstreams.calendar.fail_next = 2
+
+    assert not _run(prints, output, *register)
+    extracted, registered = load_checkpoint(str(output))
+    total = sum(len(record['events']) for record in extracted.values())
+    assert upstreams.calendar.inserted == total
+    assert sum(len(failed) for failed in registered.values()) == 2
+
+    assert _run(prints, output, *register)
+    assert upstreams.calendar.inserted == total + 2
+    _, registered = load_checkpoint(str(output))
+    assert set(registered) == set(extracted)
+    assert all(not failed for failed in registered.values())
+
+    assert _run(prints, output, *register)
+    assert upstreams.calendar.inserted == total + 2
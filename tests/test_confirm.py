@@ -0,0 +1,93 @@
+"""
+確認ページの予定API（/api/events）と、変更内容だけを送る /register のテスト
+"""
+import time
+
+from app.services import get_event_store
+from benchmarks.fakes import FAKE_CREDENTIALS, sample_events
+
+
+def _login_with_job(client, events, credentials=True):
+    job_id = get_event_store().create_job('本文', events)
+    with client.session_transaction() as sess:
+        sess['job_id'] = job_id
+        if credentials:
+            sess['credentials'] = FAKE_CREDENTIALS
+    return job_id
+
+
+def _wait_registration(client, location, timeout=10):
+    url = f"/api/registrations/{location.rstrip('/').rsplit('/', 1)[1]}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        progress = client.get(url).get_json()
+        if progress['status'] != 'running':
+            return progress
+        time.sleep(0.01)
+    raise AssertionError('登録が完了しませんでした')
+
+
+def test_events_api_pages_through_events(client):
+    events = sample_events(7)
+    _login_with_job(client, events, credentials=False)
+
+    page = client.get('/api/events?offset=5&limit=5').get_json()
+
+    assert page['total'] == 7
+    assert page['offset'] == 5
+    assert [item['index'] for item in page['events']] == [5, 6]
+    assert [item['event'] for item in page['events']] == events[5:]
+    assert all(item['version'] == 1 for item in page['events'])
+
+
+def test_events_api_clamps_negative_offset(client):
+    _login_with_job(client, sample_events(3), credentials=False)
+
+    page = client.get('/api/events?offset=-4').get_json()
+
+    assert page['offset'] == 0
+    assert len(page['events']) == 3
+
+
+def test_events_api_without_job(client):
+    assert client.get('/api/events').status_code == 400
+
+
+def test_confirm_page_does_not_embed_events(client):
+    events = sample_events(3)
+    _login_with_job(client, events, credentials=False)
+
+    html = client.get('/confirm').get_data(as_text=True)
+
+    assert events[0]['title'] not in html
+
+
+def test_register_applies_json_changes(client, calendar_api):
+    events = sample_events(3)
+    _login_with_job(client, events)
+    changes = {
+        'default_calendar_id': 'primary@example.com',
+        'excluded': [1],
+        'events': {'0': {'calendar_id': 'school@group.calendar.google.com', 'title': '遠足（雨天延期）'}},
+    }
+
+    response = client.post('/register', json=changes)
+
+    assert response.status_code == 302
+    progress = _wait_registration(client, response.headers['Location'])
+    assert progress['status'] == 'completed'
+    assert progress['succeeded'] == progress['total'] == 2
+    registered = {(record['title'], record['calendar_id']) for record in progress['records']}
+    assert registered == {
+        ('遠足（雨天延期）', 'school@group.calendar.google.com'),
+        (events[2]['title'], 'primary@example.com'),
+    }
+
+
+def test_register_rejects_malformed_changes(client, calendar_api):
+    _login_with_job(client, sample_events(2))
+
+    response = client.post('/register', data={'changes': '{not json'})
+
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/confirm')
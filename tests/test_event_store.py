@@ -0,0 +1,88 @@
+"""
+予定ストア（app/event_store.py）と /api/update_event のテスト
+"""
+import pytest
+
+from app.event_store import EventStore, VersionConflict
+from app.event_validation import validate_event
+from app.services import get_event_store
+
+EVENTS = [
+    {'title': '始業式', 'start_date': '2025-04-08', 'all_day': True},
+    {'title': '遠足', 'start_date': '2025-05-09', 'all_day': True},
+    {'title': '運動会', 'start_date': '2025-05-24', 'all_day': True},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EventStore(str(tmp_path / 'events.sqlite3'))
+
+
+def test_create_job_and_list_events(store):
+    job_id = store.create_job('本文', EVENTS, upload_hash='abc')
+
+    assert store.get_job(job_id) == {
+        'extracted_text': '本文', 'file_path': None, 'upload_hash': 'abc', 'event_count': 3
+    }
+    events, versions = store.list_events(job_id, offset=1, limit=1)
+    assert events == [EVENTS[1]]
+    assert versions == [1]
+
+
+def test_expired_job_is_not_returned(tmp_path):
+    store = EventStore(str(tmp_path / 'events.sqlite3'), ttl=-1)
+
+    assert store.get_job(store.create_job('本文', EVENTS)) is None
+
+
+def test_update_event_changes_one_event_and_bumps_version(store):
+    job_id = store.create_job('本文', EVENTS)
+
+    event, version, errors = store.update_event(job_id, 1, {'location': '動物園'}, expected_version=1)
+
+    assert (version, errors) == (2, [])
+    assert event == dict(EVENTS[1], location='動物園')
+    assert store.get_event(job_id, 1) == (event, 2)
+    assert store.get_event(job_id, 0) == (EVENTS[0], 1)
+
+
+def test_update_with_stale_version_raises_conflict(store):
+    job_id = store.create_job('本文', EVENTS)
+    store.update_event(job_id, 0, {'title': '入学式'}, expected_version=1)
+
+    with pytest.raises(VersionConflict) as excinfo:
+        store.update_event(job_id, 0, {'title': '始業式（午前）'}, expected_version=1)
+
+    assert excinfo.value.version == 2
+    assert excinfo.value.event['title'] == '入学式'
+
+
+def test_invalid_update_is_not_saved(store):
+    job_id = store.create_job('本文', EVENTS)
+
+    _, version, errors = store.update_event(job_id, 0, {'start_date': '4月8日'}, validate=validate_event)
+
+    assert version is None
+    assert errors
+    assert store.get_event(job_id, 0) == (EVENTS[0], 1)
+
+
+def test_update_missing_event_returns_none(store):
+    job_id = store.create_job('本文', EVENTS)
+
+    assert store.update_event(job_id, 5, {'title': 'x'}) == (None, None, None)
+
+
+def test_api_update_event_reports_conflict(client):
+    job_id = get_event_store().create_job('本文', EVENTS)
+    with client.session_transaction() as sess:
+        sess['job_id'] = job_id
+
+    first = client.post('/api/update_event', json={'index': 2, 'location': '校庭', 'version': 1})
+    stale = client.post('/api/update_event', json={'index': 2, 'location': '体育館', 'version': 1})
+
+    assert first.status_code == 200
+    assert stale.status_code == 409
+    assert stale.get_json()['event']['location'] == '校庭'
+    assert stale.get_json()['version'] == 2
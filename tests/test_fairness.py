@@ -0,0 +1,87 @@
+"""
+受け付け制御（app/admission.py）のユーザーごとの公平な割り当てのテスト
+"""
+import queue
+import threading
+
+import pytest
+
+from app.admission import AdmissionRejected
+
+
+HEAVY_THEN_LIGHT = [('heavy', 5), ('heavy', 5), ('heavy', 5), ('light', 1)]
+
+
+@pytest.fixture
+def admission_order(make_admission, wait_until_waiting):
+    """
+    実行枠を1つ保持したまま jobs の (ユーザー, 費用) を順に待たせ、解放するたびに割り当てられた処理を記録する関数を返す
+    （キーワード引数は make_admission に渡す。関数は割り当てられた順の (ユーザー, 費用) のリストを返す）
+    """
+    def run(jobs, **kwargs):
+        admission = make_admission(queue_size=len(jobs), **kwargs)
+        granted = queue.Queue()
+
+        def acquire(user, cost):
+            granted.put(((user, cost), admission.acquire(user, cost)))
+
+        ticket = admission.acquire('holder')
+        threads = []
+        for i, (user, cost) in enumerate(jobs):
+            thread = threading.Thread(target=acquire, args=(user, cost))
+            thread.start()
+            threads.append(thread)
+            wait_until_waiting(admission, i + 1)
+
+        order = []
+        ticket.release()
+        for _ in jobs:
+            job, ticket = granted.get(timeout=5)
+            order.append(job)
+            ticket.release()
+        for thread in threads:
+            thread.join(5)
+        return order
+
+    return run
+
+
+def test_light_job_is_admitted_before_queued_heavy_jobs(admission_order):
+    order = admission_order(HEAVY_THEN_LIGHT)
+
+    assert order[0] == ('light', 1)
+    assert len(order) == 4
+
+
+def test_fifo_admits_in_arrival_order(admission_order):
+    order = admission_order(HEAVY_THEN_LIGHT, fair=False)
+
+    assert order == HEAVY_THEN_LIGHT
+
+
+def test_smaller_job_of_same_user_is_admitted_first(admission_order):
+    order = admission_order([('a', 5), ('a', 1)])
+
+    assert order == [('a', 1), ('a', 5)]
+
+
+def test_user_limit_leaves_slots_for_other_users(make_admission):
+    admission = make_admission(process_limit=2, user_limit=1, queue_timeout=0.1)
+
+    with admission.acquire('heavy'):
+        with pytest.raises(AdmissionRejected) as excinfo:
+            admission.acquire('heavy')
+        assert excinfo.value.reason == 'timeout'
+
+        with admission.acquire('light'):
+            assert admission.snapshot()['running'] == 2
+
+
+def test_user_queue_is_limited(make_admission):
+    admission = make_admission(user_queue_size=0)
+
+    with admission.acquire('light'):
+        with pytest.raises(AdmissionRejected) as excinfo:
+            admission.acquire('heavy', 5)
+
+    assert excinfo.value.reason == 'user_queue_full'
@@ -0,0 +1,113 @@
+"""
+登録履歴ストア（app/history_store.py）と登録結果の表示のテスト
+"""
+import pytest
+
+from app import history_store
+from app.history_store import COMPLETED, FAILED, INTERRUPTED, RUNNING, HistoryStore
+from app.services import get_history_store
+from benchmarks.fakes import sample_events
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / 'history.sqlite3'))
+
+
+def _result(event, success=True):
+    return {
+        'success': success,
+        'event': {'id': f"id-{event['title']}", 'htmlLink': 'https://calendar.google.com/event'} if success else None,
+        'calendar_id': 'primary@example.com',
+        'original_data': event,
+        'error': None if success else 'quota exceeded',
+    }
+
+
+def _register(store, owner, job_id, events, failures=()):
+    batch_id = store.start(owner, job_id, 'hash', events)
+    for index, event in enumerate(events):
+        store.add_result(batch_id, index, _result(event, success=index not in failures))
+    store.finish(batch_id)
+    return batch_id
+
+
+def test_progress_while_running(store):
+    events = sample_events(3)
+    batch_id = store.start('owner', 'job', 'hash', events)
+    store.add_result(batch_id, 0, _result(events[0]))
+
+    owner, progress = store.progress('job')
+
+    assert owner == 'owner'
+    assert (progress['status'], progress['total'], progress['done'], progress['succeeded']) == (RUNNING, 3, 1, 1)
+    assert [record.title for record in progress['records']] == [events[0]['title']]
+
+
+def test_progress_returns_only_records_after_offset(store):
+    events = sample_events(4)
+    _register(store, 'owner', 'job', events, failures={2})
+
+    _, progress = store.progress('job', after=2)
+
+    assert progress['status'] == COMPLETED
+    assert progress['succeeded'] == 3
+    assert [record.title for record in progress['records']] == [events[2]['title'], events[3]['title']]
+    assert progress['records'][0].error == 'quota exceeded'
+    assert progress['records'][1].event_id == f"id-{events[3]['title']}"
+
+
+def test_progress_without_records(store):
+    assert store.progress('unknown') == (None, None)
+
+
+def test_failed_registration_keeps_error(store):
+    batch_id = store.start('owner', 'job', 'hash', sample_events(2))
+    store.finish(batch_id, error='認証の有効期限が切れました')
+
+    _, progress = store.progress('job', limit=0)
+
+    assert (progress['status'], progress['error'], progress['records']) == (FAILED, '認証の有効期限が切れました', [])
+
+
+def test_stalled_registration_is_interrupted(store, monkeypatch):
+    store.start('owner', 'job', 'hash', sample_events(2))
+    monkeypatch.setattr(history_store, 'REGISTRATION_STALL_SECONDS', -1)
+
+    assert store.progress('job')[1]['status'] == INTERRUPTED
+
+
+def test_reregistration_shows_latest_batch(store):
+    _register(store, 'owner', 'job', sample_events(2))
+    latest = sample_events(1)
+    _register(store, 'owner', 'job', latest)
+
+    _, progress = store.progress('job')
+
+    assert progress['total'] == 1
+    assert [record.title for record in progress['records']] == [latest[0]['title']]
+
+
+def test_history_lists_owner_batches_newest_first(store):
+    _register(store, 'owner', 'job1', sample_events(2))
+    _register(store, 'other', 'job2', sample_events(1))
+    _register(store, 'owner', 'job3', sample_events(3))
+
+    total, batches = store.history('owner', limit=1)
+
+    assert total == 2
+    assert [batch['job_id'] for batch in batches] == ['job3']
+    assert batches[0]['total'] == batches[0]['succeeded'] == 3
+
+
+def test_registration_progress_is_hidden_from_other_users(client):
+    _register(get_history_store(), 'owner', 'shared-job', sample_events(1))
+    with client.session_transaction() as sess:
+        sess['user_sub'] = 'someone-else'
+
+    assert client.get('/api/registrations/shared-job').status_code == 404
+
+    with client.session_transaction() as sess:
+        sess['user_sub'] = 'owner'
+
+    assert client.get('/api/registrations/shared-job').get_json()['status'] == COMPLETED
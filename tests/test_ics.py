@@ -0,0 +1,86 @@
+"""
+iCalendar出力（app/ics.py と /export.ics）のテスト
+"""
+import json
+
+from app.ics import MAX_LINE_OCTETS, fold_line, generate_ics
+from app.services import get_event_store
+
+
+def _event(**fields):
+    event = {
+        'title': '遠足', 'description': '', 'start_date': '2025-05-09', 'start_time': '',
+        'end_date': '2025-05-09', 'end_time': '', 'all_day': True, 'location': '', 'confidence': 0.9,
+    }
+    event.update(fields)
+    return event
+
+
+def _unfold(text):
+    return text.replace('\r\n ', '')
+
+
+def test_generate_ics_yields_one_chunk_per_event():
+    events = [_event(title=f"行事{i}") for i in range(3)]
+
+    chunks = list(generate_ics(iter(events)))
+
+    # ヘッダー、予定ごとのVEVENT、フッターの順に生成する
+    assert len(chunks) == len(events) + 2
+    assert chunks[0].startswith('BEGIN:VCALENDAR\r\n')
+    assert all(chunk.startswith('BEGIN:VEVENT\r\n') for chunk in chunks[1:-1])
+    assert chunks[-1] == 'END:VCALENDAR\r\n'
+
+
+def test_generate_ics_skips_invalid_events():
+    chunks = list(generate_ics([_event(start_date='2025-13-40'), _event(title='始業式')]))
+
+    assert len(chunks) == 3
+    assert 'SUMMARY:始業式' in chunks[1]
+
+
+def test_all_day_event_ends_on_next_day():
+    vevent = list(generate_ics([_event()]))[1]
+
+    assert 'DTSTART;VALUE=DATE:20250509\r\n' in vevent
+    assert 'DTEND;VALUE=DATE:20250510\r\n' in vevent
+
+
+def test_timed_event_uses_local_time_zone():
+    vevent = list(generate_ics([_event(start_time='13:30', end_time='15:00', all_day=False)]))[1]
+
+    assert 'DTSTART;TZID=Asia/Tokyo:20250509T133000\r\n' in vevent
+    assert 'DTEND;TZID=Asia/Tokyo:20250509T150000\r\n' in vevent
+
+
+def test_text_is_escaped():
+    vevent = list(generate_ics([_event(description='持ち物: 水筒, 帽子;\n雨天時は延期')]))[1]
+
+    assert 'DESCRIPTION:持ち物: 水筒\\, 帽子\\;\\n雨天時は延期' in _unfold(vevent)
+
+
+def test_fold_line_keeps_multibyte_characters_whole():
+    line = 'DESCRIPTION:' + '運動会のお知らせ' * 20
+
+    folded = fold_line(line)
+
+    assert folded.endswith('\r\n')
+    for part in folded[:-2].split('\r\n'):
+        assert len(part.encode('utf-8')) <= MAX_LINE_OCTETS
+    assert _unfold(folded) == line + '\r\n'
+
+
+def test_export_streams_selected_events(client):
+    job_id = get_event_store().create_job('本文', [_event(title='遠足'), _event(title='始業式')])
+    with client.session_transaction() as sess:
+        sess['job_id'] = job_id
+
+    response = client.post('/export.ics', data={'changes': json.dumps({'excluded': [1]})})
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'text/calendar'
+    assert 'attachment' in response.headers['Content-Disposition']
+    body = response.get_data(as_text=True)
+    assert 'SUMMARY:遠足' in body
+    assert '始業式' not in body
@@ -0,0 +1,167 @@
+"""
+プリント索引（app/print_index.py）のテスト
+"""
+import io
+import random
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance
+
+from app import print_index
+from app.print_index import MAX_CANDIDATES, Fingerprint, HammingIndex, PrintIndex, fingerprint, hamming
+
+PAGE_SIZE = (620, 877)  # A4の縦横比
+EVENTS = [{'title': '遠足', 'start_date': '2025-05-09'}]
+
+
+def _print_image(seed):
+    """
+    表題と罫線の書式で、行ごとの文字（黒い帯）の並びが異なるプリント画像を作成する
+    """
+    rng = random.Random(seed)
+    img = Image.new('L', PAGE_SIZE, 250)
+    draw = ImageDraw.Draw(img)
+    width, height = PAGE_SIZE
+    draw.rectangle((width * 0.3, 40, width * 0.7, 70), fill=30)
+    top, bottom, rows = 140, height - 60, 20
+    row_height = (bottom - top) / rows
+    for i in range(rows + 1):
+        draw.line((40, top + i * row_height, width - 40, top + i * row_height), fill=60, width=2)
+    for i in range(rows):
+        y = top + i * row_height + row_height * 0.3
+        x = 120
+        for _ in range(rng.randint(0, 5)):
+            length = rng.randint(20, 110)
+            if x + length > width - 50:
+                break
+            draw.rectangle((x, y, x + length, y + row_height * 0.4), fill=rng.randint(20, 70))
+            x += length + rng.randint(8, 30)
+    return img
+
+
+def _reshoot(img):
+    """
+    同じプリントを撮り直した画像（わずかな回転・余白の違い・明るさ・JPEGの再圧縮）を作る
+    """
+    width, height = img.size
+    shot = img.rotate(0.8, resample=Image.BICUBIC, fillcolor=235)
+    shot = shot.crop((width * 0.02, height * 0.015, width * 0.97, height * 0.99)).resize((900, 1270))
+    shot = ImageEnhance.Brightness(shot).enhance(0.85)
+    buffer = io.BytesIO()
+    shot.save(buffer, 'JPEG', quality=70)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def _fingerprint(img, tmp_path, name):
+    path = tmp_path / f"{name}.png"
+    img.save(path)
+    return fingerprint(str(path))
+
+
+@pytest.fixture
+def index(tmp_path):
+    return PrintIndex(str(tmp_path / 'prints.sqlite3'), ttl=3600, max_distance=12, max_difference=11)
+
+
+def test_hamming_index_matches_brute_force():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(2000)]
+    # 距離の近い値が見つかるように、一部は既存の値のビットを反転したものにする
+    values += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in values[:200]]
+    hamming_index = HammingIndex()
+    for item, value in enumerate(values):
+        hamming_index.add(value, item)
+
+    for query in values[:50] + [rng.getrandbits(64) for _ in range(50)]:
+        expected = sorted((hamming(query, value), item) for item, value in enumerate(values)
+                          if hamming(query, value) <= 12)
+        assert sorted(hamming_index.search(query, 12)) == expected
+
+
+def test_hamming_index_finds_value_at_max_distance():
+    hamming_index = HammingIndex()
+    hamming_index.add(0, 'zero')
+    # 4つの部分に3ビットずつ散らした距離12の値も見つかる
+    value = sum(1 << (chunk * 16 + bit) for chunk in range(4) for bit in range(3))
+
+    assert hamming_index.search(value, 12) == [(12, 'zero')]
+    assert hamming_index.search(value, 11) == []
+
+
+def test_removed_value_is_not_found():
+    hamming_index = HammingIndex()
+    hamming_index.add(0, 'first')
+    hamming_index.add(1, 'second')
+
+    hamming_index.remove('first')
+    hamming_index.remove('missing')
+
+    assert len(hamming_index) == 1
+    assert hamming_index.search(0, 12) == [(1, 'second')]
+
+
+def test_reshot_print_is_found(index, tmp_path):
+    original = _print_image(1)
+    index.add('owner', _fingerprint(original, tmp_path, 'original'), '本文', EVENTS)
+
+    match = index.find('owner', _fingerprint(_reshoot(original), tmp_path, 'reshoot'))
+
+    assert match is not None
+    assert (match.extracted_text, match.events) == ('本文', EVENTS)
+
+
+def test_different_print_is_not_found(index, tmp_path):
+    index.add('owner', _fingerprint(_print_image(1), tmp_path, 'first'), '本文', EVENTS)
+
+    assert index.find('owner', _fingerprint(_print_image(2), tmp_path, 'second')) is None
+
+
+def test_close_hash_with_different_thumbnail_is_rejected(index):
+    index.add('owner', Fingerprint(0, bytes(256)), '本文', EVENTS)
+
+    assert index.find('owner', Fingerprint(1, bytes([255]) * 256)) is None
+
+
+def test_prints_of_other_users_are_not_returned(index):
+    image_fingerprint = Fingerprint(0x1234, bytes(256))
+    index.add('owner', image_fingerprint, '本文', EVENTS)
+
+    assert index.find('someone-else', image_fingerprint) is None
+
+
+def test_prints_added_by_another_worker_are_found(index, tmp_path):
+    image_fingerprint = Fingerprint(0x1234, bytes(256))
+    index.find('owner', image_fingerprint)  # 索引を作成しておく
+    other_worker = PrintIndex(index.path, ttl=3600, max_distance=12, max_difference=11)
+
+    other_worker.add('owner', image_fingerprint, '本文', EVENTS)
+
+    assert index.find('owner', image_fingerprint).events == EVENTS
+
+
+def test_expired_print_is_not_returned(tmp_path):
+    index = PrintIndex(str(tmp_path / 'prints.sqlite3'), ttl=-1, max_distance=12, max_difference=11)
+    image_fingerprint = Fingerprint(0x1234, bytes(256))
+    index.add('owner', image_fingerprint, '本文', EVENTS)
+
+    assert index.find('owner', image_fingerprint) is None
+
+
+def test_expired_near_duplicates_do_not_hide_live_match(index, monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(print_index, 'time', SimpleNamespace(time=lambda: clock[0]))
+    query = Fingerprint(0x1234, bytes(256))
+    # ハッシュが同じで縮小画像の異なるプリントを、候補の上限より多く索引に読み込ませる
+    for _ in range(MAX_CANDIDATES + 2):
+        index.add('owner', Fingerprint(query.dhash, bytes([255]) * 256), '別のプリント', [])
+    assert index.find('owner', query) is None
+
+    clock[0] += index.ttl / 2
+    index.add('owner', Fingerprint(query.dhash ^ 0b1111, query.thumbnail), '本文', EVENTS)
+    clock[0] += index.ttl / 2 + 1
+
+    match = index.find('owner', query)
+
+    assert match is not None
+    assert (match.distance, match.events) == (4, EVENTS)
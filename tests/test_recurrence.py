@@ -0,0 +1,122 @@
+"""
+繰り返し予定の検出（app/recurrence.py）のテスト
+"""
+from datetime import date, timedelta
+
+from app.recurrence import collapse_recurring, detect_rule, expand_recurring
+
+
+def _event(day, title='クラブ活動', **fields):
+    event = {
+        'title': title, 'description': '', 'start_date': day.isoformat(), 'start_time': '',
+        'end_date': day.isoformat(), 'end_time': '', 'all_day': True, 'location': '', 'confidence': 0.9,
+    }
+    event.update(fields)
+    return event
+
+
+def _weekly(start, weeks, skip=(), **fields):
+    return [_event(start + timedelta(weeks=i), **fields) for i in range(weeks) if i not in skip]
+
+
+def _expand_all(events):
+    return [single for event in events for single in expand_recurring(event)]
+
+
+def _without_confidence(events):
+    return sorted((tuple(sorted((k, v) for k, v in e.items() if k != 'confidence')) for e in events))
+
+
+def test_detect_weekly_rule():
+    dates = [date(2025, 4, 9) + timedelta(weeks=i) for i in (0, 1, 2, 4, 5)]
+
+    rule = detect_rule(dates, min_occurrences=3, min_coverage=0.75)
+
+    assert (rule.freq, rule.interval, rule.label) == ('WEEKLY', 1, '毎週水曜日')
+    assert len(rule.expected) == 6
+
+
+def test_detect_monthly_nth_weekday_rule():
+    dates = [date(2025, 4, 14), date(2025, 5, 12), date(2025, 6, 9), date(2025, 7, 14)]
+
+    rule = detect_rule(dates, min_occurrences=3, min_coverage=0.75)
+
+    assert (rule.freq, rule.byday, rule.label) == ('MONTHLY', '2MO', '毎月第2月曜日')
+
+
+def test_irregular_dates_are_not_a_rule():
+    dates = [date(2025, 4, 9), date(2025, 4, 11), date(2025, 4, 22)]
+
+    assert detect_rule(dates, min_occurrences=3, min_coverage=0.75) is None
+
+
+def test_collapse_weekly_events_with_exdate():
+    events = _weekly(date(2025, 4, 9), 8, skip={3})
+
+    result = collapse_recurring(events, min_occurrences=3, min_coverage=0.75)
+
+    assert (result.series, result.folded) == (1, 7)
+    [series] = result.events
+    assert series['recurrence'] == ['RRULE:FREQ=WEEKLY;COUNT=8', 'EXDATE;VALUE=DATE:20250430']
+    assert series['recurrence_label'] == '毎週水曜日（7回）'
+
+
+def test_expand_restores_collapsed_events():
+    events = _weekly(date(2025, 4, 9), 8, skip={3}, start_time='15:30', end_time='16:30', all_day=False)
+    events.append(_event(date(2025, 4, 18), title='避難訓練'))
+
+    result = collapse_recurring(events, min_occurrences=3, min_coverage=0.75)
+
+    assert len(result.events) == 2
+    assert _without_confidence(_expand_all(result.events)) == _without_confidence(events)
+
+
+def test_occurrence_with_different_fields_is_kept():
+    events = _weekly(date(2025, 4, 9), 6)
+    events[2]['description'] = '持ち物: 水筒'
+
+    result = collapse_recurring(events, min_occurrences=3, min_coverage=0.75)
+
+    assert result.folded == 5
+    assert [e['description'] for e in result.events if not e.get('recurrence')] == ['持ち物: 水筒']
+    assert _without_confidence(_expand_all(result.events)) == _without_confidence(events)
+
+
+def test_title_variants_in_width_and_whitespace_are_collapsed():
+    titles = ['ＰＴＡ 委員会', 'PTA委員会', 'PTA　委員会', ' PTA  委員会', 'ＰＴＡ委員会 ']
+    events = [_event(date(2025, 4, 9) + timedelta(weeks=i), title=title, location=' 会議室Ａ')
+              for i, title in enumerate(titles)]
+    events[1]['location'] = '会議室A'
+
+    result = collapse_recurring(events, min_occurrences=3, min_coverage=0.75)
+
+    assert (result.series, result.folded) == (1, 5)
+    [series] = result.events
+    assert series['title'] == titles[0]
+    assert len(_expand_all(result.events)) == len(events)
+
+
+def test_different_titles_are_not_collapsed_together():
+    events = _weekly(date(2025, 4, 9), 3, title='PTA委員会') + _weekly(date(2025, 4, 16), 2, title='PTA総会')
+
+    result = collapse_recurring(events, min_occurrences=3, min_coverage=0.75)
+
+    assert result.folded == 3
+    assert sorted(e['title'] for e in result.events if not e.get('recurrence')) == ['PTA総会', 'PTA総会']
+
+
+def test_same_day_duplicate_is_not_folded():
+    events = _weekly(date(2025, 4, 9), 4)
+    events.append(_event(date(2025, 4, 16)))
+
+    result = collapse_recurring(events, min_occurrences=3, min_coverage=0.75)
+
+    assert len(_expand_all(result.events)) == len(events)
+
+
+def test_too_few_occurrences_are_left_alone():
+    events = _weekly(date(2025, 4, 9), 2)
+
+    result = collapse_recurring(events, min_occurrences=3, min_coverage=0.75)
+
+    assert (result.series, result.events) == (0, events)
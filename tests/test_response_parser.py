@@ -0,0 +1,51 @@
+"""
+Gemini APIレスポンスの解析（app/response_parser.py）のテスト
+"""
+import json
+
+from app.response_parser import parse_events, repair_json
+
+EVENT = {'title': '遠足', 'start_date': '2025-05-09', 'all_day': True}
+
+
+def test_valid_array_is_ok():
+    result = parse_events(json.dumps([EVENT], ensure_ascii=False))
+
+    assert result.status == 'ok'
+    assert result.events == [EVENT]
+
+
+def test_single_event_object_is_accepted():
+    result = parse_events(json.dumps(EVENT, ensure_ascii=False))
+
+    assert result.status == 'ok'
+    assert result.events == [EVENT]
+
+
+def test_object_without_event_keys_is_not_an_event():
+    result = parse_events('{"error": "RESOURCE_EXHAUSTED"}')
+
+    assert result.status == 'failed'
+    assert result.events == []
+
+
+def test_python_literals_are_replaced_outside_strings_only():
+    text = '[{"title": "True or False? None", "all_day": True, "location": None,}]'
+
+    assert json.loads(repair_json(text)) == [{'title': 'True or False? None', 'all_day': True, 'location': None}]
+
+
+def test_escaped_quotes_do_not_end_a_string():
+    text = '[{"title": "\\"None\\" の日", "all_day": False}]'
+
+    assert json.loads(repair_json(text)) == [{'title': '"None" の日', 'all_day': False}]
+
+
+def test_truncated_response_keeps_complete_events():
+    text = '```json\n[{"title": "遠足", "start_date": "2025-05-09", "all_day": True}, {"title": "運動会", "start'
+
+    result = parse_events(text)
+
+    assert result.status == 'salvaged'
+    assert result.events == [EVENT]
+    assert result.dropped == 1
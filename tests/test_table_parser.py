@@ -0,0 +1,125 @@
+"""
+行事予定表の読み取り（app/table_parser.py）のテスト
+"""
+import random
+from datetime import date
+
+from app.layout import WordLayout
+from app.table_parser import build_rows, parse_table
+
+CHAR_WIDTH, LINE_HEIGHT = 40, 44
+DAY_X, WEEKDAY_X, EVENT_X, NOTE_X = 200, 360, 520, 1400
+TODAY = date(2025, 3, 20)
+
+
+def _layout(words):
+    """
+    (文字列, x, y[, ページ]) のリストから WordLayout を作成する（1文字の幅は CHAR_WIDTH）
+    """
+    layout = WordLayout()
+    parts = []
+    for word in words:
+        text, x, y = word[:3]
+        parts.append(text)
+        layout.offsets.append(layout.offsets[-1] + len(text))
+        layout.pages.append(word[3] if len(word) > 3 else 0)
+        layout.x0.append(x)
+        layout.y0.append(y)
+        layout.x1.append(x + CHAR_WIDTH * len(text))
+        layout.y1.append(y + LINE_HEIGHT)
+    layout.text = ''.join(parts)
+    return layout
+
+
+def _day_row(y, day, weekday, *events, note=None):
+    words = [(str(day), DAY_X, y), (weekday, WEEKDAY_X, y)]
+    x = EVENT_X
+    for event in events:
+        words.append((event, x, y))
+        x += CHAR_WIDTH * len(event) + 20  # 同じセルの中の空白
+    if note:
+        words.append((note, NOTE_X, y))
+    return words
+
+
+def _april_table(heading='2025年4月'):
+    return _layout(
+        [('保護者の皆様へ', 200, 20), (heading, 800, 100), ('行事予定', 1200, 100),
+         ('日', DAY_X, 200), ('曜', WEEKDAY_X, 200), ('行事', EVENT_X, 200), ('持ち物', NOTE_X, 200)]
+        + _day_row(300, 8, '火', '始業式')
+        + _day_row(380, 9, '水', '入学式', '10:00~11:30')
+        + _day_row(460, 10, '木', '身体測定')
+        # 日付のセルが2行にまたがり、2行目に同じ日の予定が続く
+        + [('心電図検査', EVENT_X, 516)]
+        + _day_row(620, 11, '金', '避難訓練、授業参観')
+        + [('14日(月)', DAY_X, 700), ('委員会活動', EVENT_X, 700)]
+        + _day_row(780, 15, '火', '遠足', note='弁当')
+    )
+
+
+def _summary(events):
+    return [(e['start_date'], e['title'], e['start_time'], e['end_time']) for e in events]
+
+
+def test_rows_are_clustered_by_height_and_ordered_left_to_right():
+    rng = random.Random(0)
+    words = [('8', DAY_X, 300), ('火', WEEKDAY_X, 303), ('始業式', EVENT_X, 298),
+             ('9', DAY_X, 380), ('水', WEEKDAY_X, 377), ('入学式', EVENT_X, 384)]
+    rng.shuffle(words)
+
+    rows = build_rows(_layout(words))
+
+    assert [[cell[2] for cell in row.cells] for row in rows] == [['8', '火', '始業式'], ['9', '水', '入学式']]
+
+
+def test_near_words_form_one_cell_and_wide_gaps_split_cells():
+    [row] = build_rows(_layout([('入学式', EVENT_X, 300), ('10:00', EVENT_X + 140, 300), ('弁当', NOTE_X, 300)]))
+
+    assert [cell[2] for cell in row.cells] == ['入学式 10:00', '弁当']
+
+
+def test_table_rows_become_events():
+    result = parse_table(_april_table(), today=TODAY)
+
+    assert _summary(result.events) == [
+        ('2025-04-08', '始業式', '', ''),
+        ('2025-04-09', '入学式', '10:00', '11:30'),
+        ('2025-04-10', '身体測定', '', ''),
+        ('2025-04-10', '心電図検査', '', ''),
+        ('2025-04-11', '避難訓練', '', ''),
+        ('2025-04-11', '授業参観', '', ''),
+        ('2025-04-14', '委員会活動', '', ''),
+        ('2025-04-15', '遠足', '', ''),
+    ]
+    assert all(e['all_day'] == (not e['start_time']) for e in result.events)
+
+
+def test_heading_rows_are_left_for_the_remaining_text():
+    result = parse_table(_april_table(), today=TODAY)
+
+    assert result.rows == 8  # 列見出し・日付の6行・続きの1行
+    assert result.remaining_text == '保護者の皆様へ\n2025年4月 行事予定'
+    assert 0 < result.coverage < 1
+
+
+def test_year_is_guessed_from_weekdays():
+    result = parse_table(_april_table(heading='4月'), today=TODAY)
+
+    assert result.events[0]['start_date'] == '2025-04-08'
+
+
+def test_weekdays_not_matching_the_month_are_not_a_table():
+    assert parse_table(_april_table(heading='2025年5月'), today=TODAY) is None
+
+
+def test_page_without_table_returns_none():
+    letter = _layout([('保護者の皆様へ', 200, 100), ('新年度が始まりました。', 200, 180),
+                      ('持ち物には必ず記名をお願いします。', 200, 260), ('担任', 1400, 340)])
+
+    assert parse_table(letter, today=TODAY) is None
+
+
+def test_too_few_day_rows_are_not_a_table():
+    layout = _layout([('2025年4月', 800, 100)] + _day_row(300, 8, '火', '始業式') + _day_row(380, 9, '水', '入学式'))
+
+    assert parse_table(layout, today=TODAY, min_rows=5) is None
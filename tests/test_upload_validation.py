@@ -0,0 +1,104 @@
+"""
+アップロード検証（app/upload_validation.py）と /upload での拒否のテスト
+"""
+import io
+import struct
+
+import pytest
+from PIL import Image
+
+from app import metrics, services
+from app.config import UPLOAD_MAX_IMAGE_PIXELS
+from app.upload_validation import UploadRejected, validate_upload
+from benchmarks.fakes import FakeOCRProcessor, FakeVisionClient, Latency
+
+
+def _image(kind, size=(60, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, kind)
+    return buffer.getvalue()
+
+
+def _pdf(pages):
+    kids = ' '.join(f"{3 + i} 0 R" for i in range(pages))
+    return (b'%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n'
+            + f"2 0 obj << /Type /Pages /Kids [{kids}] /Count {pages} >> endobj\n".encode()
+            + b'trailer << /Root 1 0 R >>\n%%EOF\n')
+
+
+def _rejected_reason(data, file_ext):
+    with pytest.raises(UploadRejected) as excinfo:
+        validate_upload(io.BytesIO(data), file_ext)
+    return excinfo.value.reason
+
+
+@pytest.mark.parametrize('kind, file_ext', [('PNG', 'png'), ('JPEG', 'jpg'), ('GIF', 'gif')])
+def test_valid_images_are_accepted(kind, file_ext):
+    info = validate_upload(io.BytesIO(_image(kind)), file_ext)
+
+    assert (info.width, info.height) == (60, 40)
+
+
+def test_pdf_page_count_is_read():
+    info = validate_upload(io.BytesIO(_pdf(3)), 'pdf')
+
+    assert (info.kind, info.pages) == ('pdf', 3)
+
+
+def test_png_with_trailing_bytes_is_accepted():
+    info = validate_upload(io.BytesIO(_image('PNG') + b'\x00' * 5000), 'png')
+
+    assert info.kind == 'png'
+
+
+def test_empty_file_is_rejected():
+    assert _rejected_reason(b'', 'png') == 'empty'
+
+
+def test_unknown_type_is_rejected():
+    assert _rejected_reason(b'PK\x03\x04 not an image', 'png') == 'unknown_type'
+
+
+def test_extension_mismatch_is_rejected():
+    assert _rejected_reason(_image('PNG'), 'jpg') == 'type_mismatch'
+
+
+@pytest.mark.parametrize('kind, file_ext', [('PNG', 'png'), ('JPEG', 'jpeg')])
+def test_truncated_images_are_rejected(kind, file_ext):
+    data = _image(kind, size=(300, 200))
+
+    assert _rejected_reason(data[:len(data) // 2], file_ext) == 'corrupt'
+
+
+def test_truncated_pdf_is_rejected():
+    assert _rejected_reason(_pdf(1).replace(b'%%EOF', b''), 'pdf') == 'corrupt'
+
+
+def test_decompression_bomb_is_rejected_from_header():
+    data = bytearray(_image('PNG'))
+    # IHDRの幅と高さだけを書き換える（画素は展開しないためCRCは確認されない）
+    side = int(UPLOAD_MAX_IMAGE_PIXELS ** 0.5) + 100
+    data[16:24] = struct.pack('>II', side, side)
+
+    assert _rejected_reason(bytes(data), 'png') == 'image_too_large'
+
+
+def test_pdf_with_too_many_pages_is_rejected():
+    assert _rejected_reason(_pdf(50), 'pdf') == 'too_many_pages'
+
+
+def test_rejected_upload_is_not_saved_or_sent_to_ocr(client, app, tmp_path, monkeypatch):
+    vision = FakeVisionClient(Latency('fixed:0'))
+    services.set_service('ocr_processor', FakeOCRProcessor(vision))
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    before = metrics.snapshot()['counters'].get('upload.rejected.corrupt', 0)
+    data = _image('PNG', size=(300, 200))
+    try:
+        response = client.post('/upload', data={'file': (io.BytesIO(data[:100]), 'print.png')})
+    finally:
+        services.reset_services()
+
+    assert response.status_code == 302
+    assert list(tmp_path.iterdir()) == []
+    assert vision.calls == 0
+    assert metrics.snapshot()['counters']['upload.rejected.corrupt'] == before + 1